@@ -9,8 +9,10 @@ from .models import (
     LogAuditoria,
     ControlePergunta, ControlePerguntaOpcao, HistoricoControleQualidade, RespostaControleQualidade,
     ConfiguracaoControleQualidade,
-    ConfiguracaoAPI, AgendamentoSincronizacao,
-    PedidoMestre, FormulaItem, HistoricoEtapaFormula, ChecklistExecucaoFormula
+    ConfiguracaoAPI, AgendamentoSincronizacao, ExecucaoSincronizacao, PaginaSincronizacao,
+    TravaDistribuida, LinhaBrutaAPI,
+    PedidoMestre, FormulaItem, HistoricoEtapaFormula, ChecklistExecucaoFormula,
+    ContadorTarefasFuncionario,
 )
 
 @admin.register(Etapa)
@@ -220,7 +222,19 @@ class ConfiguracaoAPIAdmin(admin.ModelAdmin):
             'fields': ('tipo_autenticacao', 'bearer_token', 'api_key', 'usuario', 'senha', 'headers_customizados')
         }),
         ('Configurações', {
-            'fields': ('timeout', 'criado_em', 'atualizado_em')
+            'fields': ('timeout', 'requisicoes_paralelas', 'criado_em', 'atualizado_em')
+        }),
+        ('Sincronização Incremental', {
+            'fields': ('sincronizacao_incremental', 'ultima_atualizacao_api')
+        }),
+        ('Resiliência', {
+            'fields': ('falhas_para_abrir_circuito', 'pausa_circuito_segundos', 'tentativas_por_execucao',
+                       'falhas_consecutivas', 'circuito_aberto_ate', 'requisicoes_condicionais', 'validadores_paginas'),
+            'description': 'Circuit breaker, novas tentativas por página e requisições condicionais (ETag/Last-Modified)'
+        }),
+        ('Cassetes', {
+            'fields': ('gravar_respostas',),
+            'description': 'Grava as respostas brutas da API para reprodução com: python manage.py sincronizar_formulas_api --replay CAMINHO'
         }),
     )
 
@@ -244,8 +258,8 @@ class AgendamentoSincronizacaoAdmin(admin.ModelAdmin):
             'fields': ('horario_execucao',)
         }),
         ('Paginações', {
-            'fields': ('paginacoes',),
-            'description': 'Lista de dicts: [{"pagina": 1, "tamanho": 50}]'
+            'fields': ('modo_paginacao', 'paginacoes', 'tamanho_pagina', 'limite_paginas'),
+            'description': 'Modo fixo: lista de dicts [{"pagina": 1, "tamanho": 50}]. Modo automático: usa tamanho_pagina até a API retornar página vazia'
         }),
         ('Status', {
             'fields': ('ativo', 'criado_em', 'atualizado_em')
@@ -253,22 +267,26 @@ class AgendamentoSincronizacaoAdmin(admin.ModelAdmin):
     )
     
     def recarregar_scheduler(self, request, queryset):
-        """Recarrega o scheduler para ativar mudanças nos agendamentos"""
+        """Reconcilia os jobs do scheduler com os agendamentos (no processo líder; nos demais o líder aplica sozinho)"""
         try:
+            from django.conf import settings
             from core.scheduler import AgendadorSincronizacao
             AgendadorSincronizacao.recarregar_agendamentos()
-            self.message_user(request, "[OK] Scheduler recarregado com sucesso! Novos agendamentos estao em vigor.")
+            self.message_user(
+                request,
+                f"[OK] Alteracoes enviadas ao scheduler: o lider aplica em ate {2 * settings.AGENDAMENTOS_DEBOUNCE_SEGUNDOS}s.",
+            )
         except Exception as e:
             self.message_user(request, f"[ERRO] Falha ao recarregar scheduler: {str(e)}", level=admin.messages.ERROR)
     recarregar_scheduler.short_description = "[>>] Recarregar scheduler com novos agendamentos"
     
     def sincronizar_agora(self, request, queryset):
-        """Sincroniza imediatamente os agendamentos selecionados"""
+        """Enfileira no worker a sincronização imediata dos agendamentos selecionados"""
         try:
-            from core.scheduler import AgendadorSincronizacao
+            from core.tasks import sincronizar_agendamentos_agora
             for agendamento in queryset:
-                AgendadorSincronizacao.sincronizar_agora(agendamento.id)
-            self.message_user(request, f"[OK] Sincronizacao iniciada para {queryset.count()} agendamento(s)!")
+                sincronizar_agendamentos_agora.delay(agendamento.id)
+            self.message_user(request, f"[OK] Sincronizacao enviada ao worker para {queryset.count()} agendamento(s)!")
         except Exception as e:
             self.message_user(request, f"[ERRO] Falha na sincronizacao: {str(e)}", level=admin.messages.ERROR)
     sincronizar_agora.short_description = "[>>] Sincronizar agora"
@@ -276,6 +294,66 @@ class AgendamentoSincronizacaoAdmin(admin.ModelAdmin):
 
 # ========== ADMIN PARA NOVOS MODELOS ==========
 
+class PaginaSincronizacaoInline(admin.TabularInline):
+    model = PaginaSincronizacao
+    extra = 0
+    can_delete = False
+    fields = ['pagina', 'sucesso', 'status_http', 'latencia_http_ms', 'bytes_recebidos', 'itens_recebidos',
+              'criados', 'atualizados', 'sem_mudancas', 'erros', 'antigos', 'tempo_gravacao_ms', 'erro']
+    readonly_fields = fields
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ExecucaoSincronizacao)
+class ExecucaoSincronizacaoAdmin(admin.ModelAdmin):
+    list_display = ['api', 'agendamento', 'status', 'iniciada_em', 'finalizada_em', 'total_paginas',
+                    'itens_recebidos', 'criados', 'atualizados', 'sem_mudancas', 'erros']
+    list_filter = ['status', 'api', 'iniciada_em']
+    date_hierarchy = 'iniciada_em'
+    inlines = [PaginaSincronizacaoInline]
+    readonly_fields = ['api', 'agendamento', 'status', 'iniciada_em', 'finalizada_em', 'total_paginas',
+                       'bytes_recebidos', 'itens_recebidos', 'criados', 'atualizados', 'sem_mudancas',
+                       'erros', 'antigos', 'tempo_http_ms', 'tempo_gravacao_ms', 'mensagem_erro']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(TravaDistribuida)
+class TravaDistribuidaAdmin(admin.ModelAdmin):
+    list_display = ['nome', 'dono', 'expira_em', 'renovada_em', 'adquirida_em']
+    readonly_fields = ['nome', 'dono', 'expira_em', 'renovada_em', 'adquirida_em']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ContadorTarefasFuncionario)
+class ContadorTarefasFuncionarioAdmin(admin.ModelAdmin):
+    list_display = ['funcionario', 'tarefas']
+    search_fields = ['funcionario__username']
+    readonly_fields = ['funcionario', 'tarefas']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(LinhaBrutaAPI)
+class LinhaBrutaAPIAdmin(admin.ModelAdmin):
+    list_display = ['id_api', 'nrorc', 'api', 'pagina', 'lote', 'recebida_em', 'mesclada_em']
+    list_filter = ['api', 'recebida_em']
+    search_fields = ['id_api', 'nrorc', 'lote']
+    list_select_related = ['api']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(PedidoMestre)
 class PedidoMestreAdmin(admin.ModelAdmin):
     list_display = ['nrorc', 'status', 'total_formulas', 'formulas_prontas', 'criado_em']
@@ -297,21 +375,33 @@ class PedidoMestreAdmin(admin.ModelAdmin):
             'fields': ('criado_em', 'atualizado_em', 'concluido_em')
         }),
     )
+    
+    def delete_model(self, request, obj):
+        # As fórmulas vão junto em cascata: devolve as vagas dos funcionários
+        ContadorTarefasFuncionario.recalcular_apos_excluir(FormulaItem.objects.filter(pedido_mestre=obj))
+        super().delete_model(request, obj)
+    
+    def delete_queryset(self, request, queryset):
+        ContadorTarefasFuncionario.recalcular_apos_excluir(FormulaItem.objects.filter(pedido_mestre__in=queryset))
+        super().delete_queryset(request, queryset)
 
 
 @admin.register(FormulaItem)
 class FormulaItemAdmin(admin.ModelAdmin):
-    list_display = ['pedido_mestre', 'status', 'etapa_atual', 'funcionario_na_etapa', 'criado_em', 'datetime_atualizacao_api']
-    list_filter = ['status', 'etapa_atual', 'criado_em', 'datetime_atualizacao_api']
+    list_display = ['pedido_mestre', 'forma', 'status', 'etapa_atual', 'funcionario_na_etapa', 'criado_em', 'datetime_atualizacao_api']
+    list_filter = ['status', 'forma', 'tipo_produto', 'etapa_atual', 'criado_em', 'datetime_atualizacao_api']
     search_fields = ['pedido_mestre__nrorc', 'descricao', 'id_api']
-    readonly_fields = ['criado_em', 'atualizado_em', 'concluido_em', 'id_api', 'datetime_atualizacao_api']
+    readonly_fields = ['criado_em', 'atualizado_em', 'concluido_em', 'id_api', 'datetime_atualizacao_api', 'hash_origem']
     
     fieldsets = (
         ('Pedido e Formula', {
             'fields': ('pedido_mestre', 'descricao', 'volume_ml', 'quantidade')
         }),
+        ('Atributos da Descrição', {
+            'fields': ('tipo_produto', 'forma', 'quantidade_unidades')
+        }),
         ('Dados da API', {
-            'fields': ('id_api', 'serieo', 'price_unit', 'price_total', 'data_criacao_api', 'data_atualizacao_api', 'datetime_atualizacao_api')
+            'fields': ('id_api', 'serieo', 'price_unit', 'price_total', 'data_criacao_api', 'data_atualizacao_api', 'datetime_atualizacao_api', 'hash_origem')
         }),
         ('Status e Fluxo', {
             'fields': ('status', 'etapa_atual', 'funcionario_na_etapa')
@@ -320,6 +410,24 @@ class FormulaItemAdmin(admin.ModelAdmin):
             'fields': ('criado_em', 'atualizado_em', 'concluido_em')
         }),
     )
+    
+    def save_model(self, request, obj, form, change):
+        anterior = form.initial.get('funcionario_na_etapa')
+        if 'funcionario_na_etapa' in form.changed_data:
+            # Chega ao novo funcionário como pendente: ele pode já ter uma tarefa ativa
+            obj.eh_tarefa_ativa = False
+        super().save_model(request, obj, form, change)
+        if {'funcionario_na_etapa', 'status'} & set(form.changed_data):
+            # Troca pelo admin não passa pelo UPDATE condicional: refaz o contador dos envolvidos
+            ContadorTarefasFuncionario.recalcular([anterior, obj.funcionario_na_etapa_id])
+    
+    def delete_model(self, request, obj):
+        ContadorTarefasFuncionario.recalcular_apos_excluir(FormulaItem.objects.filter(pk=obj.pk))
+        super().delete_model(request, obj)
+    
+    def delete_queryset(self, request, queryset):
+        ContadorTarefasFuncionario.recalcular_apos_excluir(queryset)
+        super().delete_queryset(request, queryset)
 
 
 @admin.register(HistoricoEtapaFormula)
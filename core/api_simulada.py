@@ -0,0 +1,207 @@
+"""
+Versão sintética do endpoint FC0M100 para testes de carga offline
+Serve NRORC, ID, DESCRICAOWEB, QUANT, PRUNI, VRTOT, DTALT e HRALT com a mesma
+semântica de pagina/tamanho da API real (página além do fim = "dados" vazio).
+
+Configurável: volume de itens, taxa de mudança entre rodadas (uma rodada começa a
+cada pedido da página 1), latência com variação, injeção de erros 503 e ETag/304.
+O corpo é gerado e enviado em blocos (chunked): páginas grandes não ocupam memória no servidor,
+e o pico de memória medido no mesmo processo é só o do cliente.
+Usado por servidor_api_simulada, benchmark_ingestao e benchmark_busca_paginas.
+"""
+
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CAMINHO_PADRAO = '/tabelas/FC0M100'
+
+# Descrições representativas das formas atendidas pelo classificador
+MODELOS_DESCRICAO = [
+    'VITAMINA D3 10.000UI | CAPSULA: {n}CAP',
+    'MAGNESIO DIMALATO 300MG | CAPSULA: {n}CAP',
+    'COLAGENO TIPO II 40MG + VIT C | SACHE | ENVELOPE: {n}ENV',
+    'VITAMINA A + TCM | {n}ML',
+    'XAROPE DE GUACO PEDIATRICO | {n}ML',
+    'CREME HIDRATANTE UREIA 10% | {n}G',
+    'POMADA CICATRIZANTE | {n}G',
+    'LOÇÃO CAPILAR MINOXIDIL 5% | {n}ML',
+    'SHAMPOO ANTICASPA CETOCONAZOL | {n}ML',
+    'SHOT ENERGETICO CAFEINA | {n} UNIDADES',
+    'ÓVULO VAGINAL BOROGLICONATO | {n} UNIDADES',
+    'PASTILHA SUBLINGUAL METILCOBALAMINA | {n} UNIDADES',
+    'OMEGA 3 OLEOSA 1000MG | {n} UNIDADES',
+    'GOMA MELATONINA 0,21MG | {n} UNIDADES',
+    'CHOCOLATE FUNCIONAL WHEY | {n} UNIDADES',
+    'FILME ORODISPERSIVEL B12 | {n} UNIDADES',
+]
+
+
+class DadosSimulados:
+    """Estado dos itens servidos; muda uma fração deles a cada nova rodada"""
+
+    def __init__(self, total_itens, taxa_mudanca=0.0, itens_por_pedido=3, semente=42):
+        self.total_itens = total_itens
+        self.taxa_mudanca = taxa_mudanca
+        self.itens_por_pedido = max(1, itens_por_pedido)
+        self.aleatorio = random.Random(semente)
+        self.rodada = 0
+        self.inicio = datetime(2026, 1, 5, 8, 0, 0)
+        self._lock = threading.Lock()
+
+        # Por item: (modelo, n, quant, preço em centavos, rodada da última alteração)
+        self.itens = [
+            [
+                self.aleatorio.randrange(len(MODELOS_DESCRICAO)),
+                self.aleatorio.choice([30, 60, 90, 120]),
+                self.aleatorio.randint(1, 3),
+                self.aleatorio.randint(1500, 25000),
+                0,
+            ]
+            for _ in range(total_itens)
+        ]
+
+    def nova_rodada(self):
+        """Aplica a taxa de mudança: altera quantidade/preço e DTALT de uma amostra"""
+        with self._lock:
+            self.rodada += 1
+            alterar = int(self.total_itens * self.taxa_mudanca)
+            for indice in self.aleatorio.sample(range(self.total_itens), alterar):
+                item = self.itens[indice]
+                item[2] = self.aleatorio.randint(1, 3)
+                item[3] = self.aleatorio.randint(1500, 25000)
+                item[4] = self.rodada
+            return alterar
+
+    def linha(self, indice):
+        modelo, n, quant, centavos, rodada = self.itens[indice]
+        alterado_em = self.inicio + timedelta(minutes=rodada * 10, seconds=indice % 600)
+        preco = centavos / 100
+        return {
+            'NRORC': 100000 + indice // self.itens_por_pedido,
+            'ID': f'SIM-{indice}',
+            'DESCRICAOWEB': MODELOS_DESCRICAO[modelo].format(n=n),
+            'QUANT': quant,
+            'PRUNI': preco,
+            'VRTOT': round(preco * quant, 2),
+            'SERIEO': str(indice % self.itens_por_pedido + 1),
+            'DTALT': alterado_em.strftime('%Y-%m-%d'),
+            'HRALT': alterado_em.strftime('%H:%M:%S'),
+        }
+
+    def indices(self, pagina, tamanho):
+        """Índices dos itens da página (1-based); vazio além do último item"""
+        inicio = (pagina - 1) * tamanho
+        return range(max(0, inicio), min(self.total_itens, inicio + tamanho))
+
+    def pagina(self, pagina, tamanho):
+        """Itens da página"""
+        with self._lock:
+            return [self.linha(i) for i in self.indices(pagina, tamanho)]
+
+    def etag(self, pagina, tamanho):
+        """ETag da página a partir do estado dos itens, sem montar o corpo"""
+        resumo = hashlib.sha1(f'{pagina}:{tamanho}'.encode())
+        with self._lock:
+            for i in self.indices(pagina, tamanho):
+                resumo.update(f'{i}:{self.itens[i]};'.encode())
+        return '"' + resumo.hexdigest() + '"'
+
+    def blocos_json(self, pagina, tamanho, itens_por_bloco=500):
+        """Corpo {"dados": [...]} da página em blocos de bytes"""
+        yield b'{"dados": ['
+        indices = self.indices(pagina, tamanho)
+        for inicio in range(0, len(indices), itens_por_bloco):
+            with self._lock:
+                linhas = [json.dumps(self.linha(i)) for i in indices[inicio:inicio + itens_por_bloco]]
+            yield (', ' if inicio else '').encode() + ', '.join(linhas).encode()
+        yield b']}'
+
+
+def criar_handler(dados, latencia=0.0, variacao_latencia=0.0, taxa_erro=0.0, semente=42):
+    """Handler HTTP que serve DadosSimulados com latência e erros configuráveis"""
+    aleatorio = random.Random(semente)
+    lock_aleatorio = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Permite keep-alive
+
+        def do_GET(self):
+            params = parse_qs(urlparse(self.path).query)
+            pagina = int(params.get('pagina', ['1'])[0])
+            tamanho = int(params.get('tamanho', ['50'])[0])
+
+            with lock_aleatorio:
+                espera = latencia + aleatorio.uniform(0, variacao_latencia)
+                falhar = aleatorio.random() < taxa_erro
+            if espera:
+                time.sleep(espera)
+
+            if falhar:
+                self._responder(503, b'{"erro": "indisponivel"}')
+                return
+
+            if pagina == 1:
+                dados.nova_rodada()
+
+            etag = dados.etag(pagina, tamanho)
+            if self.headers.get('If-None-Match') == etag:
+                self._responder(304, b'', etag)
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.send_header('ETag', etag)
+            self.end_headers()
+            for bloco in dados.blocos_json(pagina, tamanho):
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(bloco), bloco))
+            self.wfile.write(b'0\r\n\r\n')
+
+        def _responder(self, status, corpo, etag=None):
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(corpo)))
+            if etag:
+                self.send_header('ETag', etag)
+            self.end_headers()
+            if corpo:
+                self.wfile.write(corpo)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class ServidorSimulado:
+    """Servidor FC0M100 simulado numa thread; use como context manager"""
+
+    def __init__(self, dados, host='127.0.0.1', porta=0, **opcoes_handler):
+        self.dados = dados
+        self.servidor = ThreadingHTTPServer((host, porta), criar_handler(dados, **opcoes_handler))
+        self.servidor.daemon_threads = True
+
+    @property
+    def url_base(self):
+        host, porta = self.servidor.server_address[:2]
+        return f'http://{host}:{porta}{CAMINHO_PADRAO}'
+
+    def iniciar(self):
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        return self
+
+    def parar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.parar()
@@ -1,9 +1,58 @@
 """
 Helper para sincronização de dados da API com as fórmulas
 """
+import hashlib
+import json
 from datetime import datetime
 from django.utils import timezone
 
+# Campos da linha FC0M100 que alimentam PedidoMestre/FormulaItem
+CAMPOS_HASH_ORIGEM = ('NRORC', 'ID', 'DESCRICAOWEB', 'QUANT', 'SERIEO', 'PRUNI', 'VRTOT', 'DTALT', 'HRALT')
+
+
+def calcular_hash_origem(item):
+    """
+    Hash estável (sha1) da linha da API, usado para detectar itens sem mudanças
+    
+    Considera apenas os campos gravados na fórmula, normalizados como texto, para
+    que diferenças de tipo (80001 x "80001") ou de ordem das chaves não mudem o hash
+    
+    Returns:
+        str com 40 caracteres hexadecimais
+    """
+    normalizado = {
+        campo: '' if item.get(campo) is None else str(item.get(campo)).strip()
+        for campo in CAMPOS_HASH_ORIGEM
+    }
+    conteudo = json.dumps(normalizado, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(conteudo.encode('utf-8')).hexdigest()
+
+
+def converter_datetime_api(dtalt_str=None, hralt_str=None):
+    """
+    Converte DTALT + HRALT da API num datetime com timezone
+    
+    Args:
+        dtalt_str: Data no formato "YYYY-MM-DD" (ex: "2026-03-02")
+        hralt_str: Hora no formato "HH:MM:SS" (ex: "17:50:56")
+    
+    Returns:
+        datetime aware ou None se os valores estiverem ausentes/inválidos
+    """
+    if not dtalt_str or not hralt_str:
+        return None
+    
+    try:
+        # fromisoformat (em C) cobre o formato usual; strptime aceita variações como "2026-3-2"
+        try:
+            dt_api = datetime.fromisoformat(f"{dtalt_str} {hralt_str}")
+        except ValueError:
+            dt_api = datetime.strptime(f"{dtalt_str} {hralt_str}", "%Y-%m-%d %H:%M:%S")
+        return timezone.make_aware(dt_api)
+    except (ValueError, TypeError) as e:
+        print(f"Erro ao processar data/hora da API: {e}")
+        return None
+
 
 def sincronizar_datetime_api(formula, dtalt_str=None, hralt_str=None):
     """
@@ -17,25 +66,14 @@ def sincronizar_datetime_api(formula, dtalt_str=None, hralt_str=None):
     Returns:
         Booleano indicando se houve atualização
     """
-    if not dtalt_str or not hralt_str:
+    dt_api_aware = converter_datetime_api(dtalt_str, hralt_str)
+    if dt_api_aware is None:
         return False
     
-    try:
-        # Combinar data + hora
-        datetime_str = f"{dtalt_str} {hralt_str}"
-        dt_api = datetime.strptime(datetime_str, "%Y-%m-%d %H:%M:%S")
-        
-        # Converter para timezone aware (se usar timezone no Django)
-        dt_api_aware = timezone.make_aware(dt_api)
-        
-        # Atualizar se for diferente
-        if formula.datetime_atualizacao_api != dt_api_aware:
-            formula.datetime_atualizacao_api = dt_api_aware
-            formula.save(update_fields=['datetime_atualizacao_api'])
-            return True
-        
-        return False
+    # Atualizar se for diferente
+    if formula.datetime_atualizacao_api != dt_api_aware:
+        formula.datetime_atualizacao_api = dt_api_aware
+        formula.save(update_fields=['datetime_atualizacao_api'])
+        return True
     
-    except (ValueError, TypeError) as e:
-        print(f"Erro ao processar data/hora da API: {e}")
-        return False
+    return False
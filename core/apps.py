@@ -9,21 +9,14 @@ class CoreConfig(AppConfig):
     name = 'core'
     
     def ready(self):
-        """Inicializa o scheduler quando a app é carregada"""
-        try:
-            from core.scheduler import AgendadorSincronizacao
-            
-            # Apenas inicia se não estiver rodando em modo de migração
-            import sys
-            if 'migrate' not in sys.argv and 'makemigrations' not in sys.argv:
-                AgendadorSincronizacao.iniciar()
-                logger.info("Scheduler de sincronização iniciado automaticamente")
-        except Exception as e:
-            logger.error(f"Erro ao inicializar scheduler: {str(e)}")
-        
-        # Importar signals para ativar recarregamento automático
+        """
+        Registra os signals da app
+        O scheduler de sincronização não é iniciado aqui: ele roda no processo
+        dedicado `python manage.py sync_worker`, fora do servidor web
+        """
+        # Importar signals para invalidar caches de configuração
         try:
             import core.signals  # noqa
-            logger.info("Signals de agendamento registrados")
+            logger.info("Signals registrados")
         except Exception as e:
             logger.error(f"Erro ao registrar signals: {str(e)}")
@@ -0,0 +1,112 @@
+"""
+Cassetes de respostas da API: gravação e reprodução de páginas brutas
+Cada linha de um arquivo .jsonl.gz é uma página como veio da API (corpo original),
+com API, página, tamanho e instante da captura. Os arquivos ficam em
+settings.CASSETES_API_DIR/api_<id>/<AAAA-MM-DD>.jsonl.gz (um por API e dia).
+
+A reprodução (sincronizar_formulas_api --replay) passa o corpo pelo mesmo parser
+em streaming e pela mesma gravação da sincronização agendada.
+"""
+
+import codecs
+import gzip
+import json
+import os
+from glob import glob
+
+from django.conf import settings
+from django.utils import timezone
+
+
+def diretorio_cassetes():
+    return str(settings.CASSETES_API_DIR)
+
+
+def caminho_cassete(api_config, momento=None):
+    """Arquivo do dia para a API (criado sob demanda)"""
+    momento = timezone.localtime(momento or timezone.now())
+    return os.path.join(diretorio_cassetes(), f'api_{api_config.pk}', f'{momento:%Y-%m-%d}.jsonl.gz')
+
+
+def pedacos_texto(corpo, encoding, tamanho_bloco=64 * 1024):
+    """Texto do corpo em pedaços: str e bytes inteiros, arquivo lido em blocos do início"""
+    if isinstance(corpo, str):
+        yield corpo
+        return
+    if isinstance(corpo, bytes):
+        yield corpo.decode(encoding, errors='replace')
+        return
+    decodificador = codecs.getincrementaldecoder(encoding)(errors='replace')
+    corpo.seek(0)
+    for bloco in iter(lambda: corpo.read(tamanho_bloco), b''):
+        yield decodificador.decode(bloco)
+    yield decodificador.decode(b'', final=True)
+    corpo.seek(0)
+
+
+class GravadorCassete:
+    """
+    Acrescenta páginas ao cassete do dia da API
+    Cada execução abre um novo membro gzip no mesmo arquivo (gzip lê membros concatenados)
+    """
+
+    def __init__(self, api_config):
+        self.api_config = api_config
+        self.caminho = caminho_cassete(api_config)
+        self.arquivo = None
+        self.paginas = 0
+
+    def gravar(self, pagina, tamanho, status, corpo, encoding='utf-8'):
+        """
+        Grava uma página; corpo é o conteúdo bruto da resposta (bytes, str ou arquivo binário)
+        Um arquivo é copiado em blocos, sem carregar o corpo inteiro, e volta ao início
+        """
+        if self.arquivo is None:
+            os.makedirs(os.path.dirname(self.caminho), exist_ok=True)
+            self.arquivo = gzip.open(self.caminho, 'at', encoding='utf-8')
+
+        registro = {
+            'api_id': self.api_config.pk,
+            'api': self.api_config.nome,
+            'pagina': pagina,
+            'tamanho': tamanho,
+            'status': status,
+            'capturado_em': timezone.now().isoformat(),
+        }
+        # "corpo" por último: a string JSON é escrita em pedaços, que escapados e juntados dão a mesma linha
+        self.arquivo.write(json.dumps(registro, ensure_ascii=False)[:-1] + ', "corpo": "')
+        for pedaco in pedacos_texto(corpo, encoding or 'utf-8'):
+            self.arquivo.write(json.dumps(pedaco, ensure_ascii=False)[1:-1])
+        self.arquivo.write('"}\n')
+        self.paginas += 1
+
+    def fechar(self):
+        if self.arquivo is not None:
+            self.arquivo.close()
+            self.arquivo = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+
+def listar_cassetes(caminho):
+    """Arquivos .jsonl.gz de um caminho (arquivo único ou diretório, recursivo), em ordem"""
+    if os.path.isdir(caminho):
+        return sorted(glob(os.path.join(caminho, '**', '*.jsonl.gz'), recursive=True))
+    return [caminho]
+
+
+def ler_cassetes(caminho, api_id=None):
+    """Itera os registros de página gravados, na ordem de gravação"""
+    for arquivo in listar_cassetes(caminho):
+        with gzip.open(arquivo, 'rt', encoding='utf-8') as linhas:
+            for linha in linhas:
+                if not linha.strip():
+                    continue
+                registro = json.loads(linha)
+                if api_id is not None and registro.get('api_id') != api_id:
+                    continue
+                yield registro
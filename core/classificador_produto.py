@@ -0,0 +1,180 @@
+"""
+Classificador de tipo de produto a partir da DESCRICAOWEB da API
+Fonte única das palavras-chave usadas na sincronização, nos modelos e nos templates
+"""
+
+import re
+from functools import lru_cache
+from time import monotonic
+
+from django.conf import settings
+
+# Ordem = prioridade: o primeiro tipo com alguma palavra presente na descrição vence
+PADROES_TIPO_PRODUTO = [
+    ('capsula', ['CAPSULA', 'CAP']),
+    ('sache', ['SACHE', 'SACHÊ', 'ENVELOPE']),
+    ('liquido_pediatrico', ['ML', 'LIQUIDO', 'LÍQUIDO', 'XAROPE', 'TCM LIQUIDO']),
+    ('creme', ['CREME', 'POMADA', 'PENTRAVAN', 'GEL']),
+    ('lotion', ['LOÇÃO', 'LOCION']),
+    ('shampoo', ['SHAMPOO']),
+    ('shot', ['SHOT']),
+    ('ovulo', ['ÓVULO', 'OVULO']),
+    ('comprimido_sublingual', ['SUBLINGUAL', 'PASTILHA']),
+    ('capsula_oleosa', ['OLEOSA', 'OLEOSO']),
+    ('goma', ['GOMA', 'GUMMY']),
+    ('chocolate', ['CHOCOLATE']),
+    ('filme', ['FILME']),
+]
+
+# Rótulo curto exibido nas listagens (FormulaItem.get_tipo_forma)
+ROTULOS_FORMA = {
+    'capsula': 'Cápsula',
+    'sache': 'Sachê',
+    'liquido_pediatrico': 'Líquido',
+    'creme': 'Creme',
+    'lotion': 'Loção',
+    'shampoo': 'Shampoo',
+    'shot': 'Shot',
+    'ovulo': 'Óvulo',
+    'comprimido_sublingual': 'Comprimido',
+    'capsula_oleosa': 'Oleosa',
+    'goma': 'Goma',
+    'chocolate': 'Chocolate',
+    'filme': 'Filme',
+}
+
+TIPO_DESCONHECIDO = 'desconhecido'
+
+_TIPOS = [tipo for tipo, _ in PADROES_TIPO_PRODUTO]
+_PRIORIDADE_PALAVRA = {}
+for _prioridade, (_tipo, _palavras) in enumerate(PADROES_TIPO_PRODUTO):
+    for _palavra in _palavras:
+        _PRIORIDADE_PALAVRA.setdefault(_palavra, _prioridade)
+
+# Uma única alternação com todas as palavras; o lookahead encontra ocorrências
+# sobrepostas, preservando a semântica de "substring em qualquer posição"
+_REGEX_PALAVRAS = re.compile(
+    '(?=(' + '|'.join(
+        re.escape(p) for p in sorted(_PRIORIDADE_PALAVRA, key=len, reverse=True)
+    ) + '))'
+)
+
+_REGEX_UNIDADES_CAPSULA = re.compile(r'(\d+)\s*CAP(?:SULA)?')
+
+_cache_tipos_produto = None
+_cache_tipos_produto_carregado_em = 0.0
+
+
+@lru_cache(maxsize=8192)
+def classificar_tipo(descricao):
+    """
+    Retorna a chave do tipo de produto (ex: 'capsula') ou 'desconhecido'
+    Memoizado: a mesma descrição volta a cada sincronização da mesma página
+    """
+    if not descricao:
+        return TIPO_DESCONHECIDO
+
+    melhor = None
+    for match in _REGEX_PALAVRAS.finditer(descricao.upper()):
+        prioridade = _PRIORIDADE_PALAVRA[match.group(1)]
+        if melhor is None or prioridade < melhor:
+            melhor = prioridade
+            if melhor == 0:
+                break
+
+    return _TIPOS[melhor] if melhor is not None else TIPO_DESCONHECIDO
+
+
+def rotulo_forma(tipo_chave):
+    """Rótulo de exibição para a chave do tipo ('Outro' se não identificado)"""
+    return ROTULOS_FORMA.get(tipo_chave, 'Outro')
+
+
+def obter_tipo_produto(tipo_chave):
+    """
+    Retorna o TipoProduto da chave usando um cache em memória
+    O cache é carregado com uma consulta e invalidado pelos signals de TipoProduto neste processo;
+    nos demais (sync_worker, Celery) é recarregado após TIPOS_PRODUTO_CACHE_SEGUNDOS
+    """
+    global _cache_tipos_produto, _cache_tipos_produto_carregado_em
+    agora = monotonic()
+    if _cache_tipos_produto is None or agora - _cache_tipos_produto_carregado_em > settings.TIPOS_PRODUTO_CACHE_SEGUNDOS:
+        from core.models import TipoProduto
+        _cache_tipos_produto = {t.tipo: t for t in TipoProduto.objects.all()}
+        _cache_tipos_produto_carregado_em = agora
+    return _cache_tipos_produto.get(tipo_chave)
+
+
+def invalidar_cache_tipos_produto():
+    """Descarta o cache de TipoProduto (chamado ao salvar/excluir pelo admin)"""
+    global _cache_tipos_produto
+    _cache_tipos_produto = None
+
+
+def extrair_tipo_produto(descricao_web):
+    """Extrai o tipo de produto da descrição: (TipoProduto ou None, chave)"""
+    tipo_chave = classificar_tipo(descricao_web)
+    if tipo_chave == TIPO_DESCONHECIDO:
+        return None, TIPO_DESCONHECIDO
+    return obter_tipo_produto(tipo_chave), tipo_chave
+
+
+def extrair_quantidade_produto(descricao_web):
+    """
+    Extrai a quantidade de unidades do produto APENAS de CAPSULA e ENVELOPE
+    Busca pelos padrões: "CAPSULA: XXcap" ou "ENVELOPE: XXenv"
+    Retorna: int ou None se não encontrar
+    """
+    if not descricao_web:
+        return None
+    
+    descricao_upper = descricao_web.upper()
+    
+    # Padrão 1: "CAPSULA: XXcap" (apenas após a palavra CAPSULA:)
+    match = re.search(r'CAPSULA\s*:\s*(\d+)\s*CAP', descricao_upper)
+    if match:
+        try:
+            quantidade = int(match.group(1))
+            return quantidade if quantidade > 0 else None
+        except (ValueError, AttributeError):
+            return None
+    
+    # Padrão 2: "ENVELOPE: XXenv" (apenas após a palavra ENVELOPE:)
+    match = re.search(r'ENVELOPE\s*:\s*(\d+)\s*ENV', descricao_upper)
+    if match:
+        try:
+            quantidade = int(match.group(1))
+            return quantidade if quantidade > 0 else None
+        except (ValueError, AttributeError):
+            return None
+    
+    return None
+
+
+def extrair_unidades(descricao, tipo_chave):
+    """
+    Quantidade de unidades para exibição: "CAPSULA: 60CAP" / "ENVELOPE: 30ENV"
+    e, para cápsulas sem esse formato, o primeiro "NNCAP" da descrição
+    """
+    quantidade = extrair_quantidade_produto(descricao)
+    if quantidade is None and tipo_chave == 'capsula' and descricao:
+        match = _REGEX_UNIDADES_CAPSULA.search(descricao.upper())
+        if match:
+            quantidade = int(match.group(1)) or None
+    return quantidade
+
+
+def atributos_derivados(descricao):
+    """
+    Atributos de FormulaItem derivados da descrição, calculados uma vez na ingestão
+    Retorna dict com tipo_produto (TipoProduto ou None), forma e quantidade_unidades
+    """
+    if not descricao:
+        return {'tipo_produto': None, 'forma': 'Desconhecido', 'quantidade_unidades': None}
+
+    tipo_chave = classificar_tipo(descricao)
+    return {
+        'tipo_produto': obter_tipo_produto(tipo_chave) if tipo_chave != TIPO_DESCONHECIDO else None,
+        'forma': rotulo_forma(tipo_chave),
+        'quantidade_unidades': extrair_unidades(descricao, tipo_chave),
+    }
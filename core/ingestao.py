@@ -0,0 +1,655 @@
+"""
+Pipeline único de ingestão das páginas da API (PedidoMestre + FormulaItem)
+Usado pelo scheduler, pelo comando sincronizar_formulas_api (inclusive --replay)
+e pelas tasks Celery, para que todos gravem do mesmo jeito e com os mesmos contadores.
+
+Etapas (geradores encadeados, trocáveis em PipelineIngestao):
+    buscar      -> SincronizadorAPI.buscar_paginas ou paginas_de_cassetes (fonte das páginas)
+    decodificar -> itens_da_pagina: itens do corpo da página, decodificados em streaming
+    filtrar     -> descarta itens sem NRORC/ID e os anteriores à marca d'água
+    diferenciar -> uma consulta aos hashes gravados; itens idênticos param aqui
+    classificar -> normaliza e classifica só os itens novos ou alterados
+    gravar      -> bulk_create/bulk_update numa única transação por página (item a item se ela falhar)
+
+Cada etapa recebe o fluxo da anterior e o contexto da página (marca d'água e contadores).
+
+pipeline_staging troca diferenciar/classificar/gravar por preparar_linhas_brutas e
+gravar_via_staging: a página vai inteira para LinhaBrutaAPI (bulk insert) e é mesclada em
+PedidoMestre/FormulaItem por SQL (INSERT ... ON CONFLICT), sem diff no ORM. Para cargas grandes.
+
+Páginas muito grandes (INGESTAO_TAMANHO_LOTE): depois de filtrar, os itens seguem em lotes de
+tamanho fixo, sem separar itens seguidos do mesmo NRORC; cada lote passa pelas demais etapas,
+é gravado na sua própria transação e descartado. A memória fica limitada pelo lote, não pela página.
+"""
+
+import logging
+import re
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from time import perf_counter
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, connections, transaction
+from django.utils import timezone
+
+from core.api_sync_helpers import calcular_hash_origem, converter_datetime_api
+from core.cassetes_api import ler_cassetes
+from core.classificador_produto import atributos_derivados
+from core.json_stream import JSONInvalido, iterar_itens_json
+from core.models import Etapa, FormulaItem, LinhaBrutaAPI, PedidoMestre
+
+logger = logging.getLogger(__name__)
+
+# Blocos lidos do corpo guardado da página ao decodificá-lo
+TAMANHO_BLOCO_CORPO = 64 * 1024
+
+# Contadores de uma página (e, somados, de uma execução)
+CONTADORES = ('criados', 'atualizados', 'sem_mudancas', 'erros', 'antigos')
+
+
+def novos_contadores():
+    return {**{chave: 0 for chave in CONTADORES}, 'maior_atualizacao_api': None}
+
+
+def somar_contadores(total, parcial):
+    """Acumula os contadores de uma página em total (a maior data da API prevalece)"""
+    for chave in CONTADORES:
+        total[chave] += parcial.get(chave, 0)
+    maior = parcial.get('maior_atualizacao_api')
+    if maior is not None and (total['maior_atualizacao_api'] is None or maior > total['maior_atualizacao_api']):
+        total['maior_atualizacao_api'] = maior
+    return total
+
+
+def totalizar(resultados):
+    """Soma os contadores dos resultados por página de uma sincronização"""
+    total = {**novos_contadores(), 'paginas': 0, 'paginas_com_falha': 0, 'itens': 0}
+    for resultado in resultados or []:
+        total['paginas'] += 1
+        if not resultado.get('sucesso'):
+            total['paginas_com_falha'] += 1
+            continue
+        total['itens'] += resultado.get('items_recebidos', 0)
+        somar_contadores(total, resultado['processamento'])
+    return total
+
+
+def extrair_volume(descricao):
+    """Extrai o volume em ML da descrição (ex: '10ML' from 'VITAMINA A + TCM | 10ML')"""
+    if not descricao:
+        return None
+
+    match = re.search(r'(\d+)\s*ML', descricao.upper())
+    if match:
+        return f"{match.group(1)}ML"
+
+    return None
+
+
+def valores_formula_api(item, hash_origem=None):
+    """
+    Normaliza um item bruto da API nos valores usados por FormulaItem
+    Retorna None se o item não tiver ID
+    """
+    id_api = item.get('ID')
+    if not id_api:
+        return None
+
+    descricao = item.get('DESCRICAOWEB', '')
+    pruni = item.get('PRUNI')
+    vrtot = item.get('VRTOT')
+
+    return {
+        **atributos_derivados(descricao),
+        'id_api': str(id_api),
+        'descricao': descricao[:200] if descricao else '',
+        'quantidade': item.get('QUANT', 1),
+        'volume_ml': extrair_volume(descricao) if descricao else None,
+        'serieo': item.get('SERIEO', ''),
+        'price_unit': Decimal(str(pruni)) if pruni else None,
+        'price_total': Decimal(str(vrtot)) if vrtot else None,
+        'datetime_atualizacao_api': converter_datetime_api(item.get('DTALT'), item.get('HRALT')),
+        'hash_origem': hash_origem or calcular_hash_origem(item),
+    }
+
+
+def formula_mudou(formula, valores):
+    """Compara os campos vindos da API com os da fórmula existente"""
+    novo_descricao = valores['descricao'] or formula.descricao
+    return (
+        formula.descricao != novo_descricao
+        or formula.quantidade != valores['quantidade']
+        or formula.price_unit != valores['price_unit']
+        or formula.price_total != valores['price_total']
+        or formula.serieo != valores['serieo']
+        or formula.forma != valores['forma']
+        or (
+            valores['datetime_atualizacao_api'] is not None
+            and formula.datetime_atualizacao_api != valores['datetime_atualizacao_api']
+        )
+    )
+
+
+def etapa_inicial_triagem():
+    """Etapa de entrada das fórmulas novas (triagem)"""
+    etapa_inicial = Etapa.objects.filter(sequencia=1, ativa=True).first()
+    if not etapa_inicial:
+        etapa_inicial = Etapa.objects.filter(ativa=True).order_by('sequencia').first()
+    return etapa_inicial
+
+
+# --- Fonte e decodificação -------------------------------------------------
+
+def paginas_de_cassetes(caminho, api_id=None):
+    """Fonte de páginas gravadas em cassete, no formato de SincronizadorAPI.buscar_pagina"""
+    for registro in ler_cassetes(caminho, api_id=api_id):
+        yield {
+            'sucesso': True,
+            'status': registro.get('status', 200),
+            'api_id': registro.get('api_id'),
+            'pagina': registro.get('pagina'),
+            'tamanho': registro.get('tamanho'),
+            'corpo': registro['corpo'],
+            'latencia_ms': 0,
+            'bytes_recebidos': len(registro['corpo']),
+        }
+
+
+def itens_da_pagina(pagina_buscada):
+    """
+    Itens de uma página, decodificados em streaming do corpo: arquivo da busca HTTP
+    (lido em blocos) ou texto do cassete. 'itens' (fluxo já montado, ex: ColetorIds) tem
+    precedência; 'dados' ({'dados': [...]}) é aceito para páginas montadas em memória
+    """
+    if 'itens' in pagina_buscada:
+        return pagina_buscada['itens']
+    if 'dados' in pagina_buscada:
+        return iter(pagina_buscada['dados'].get('dados', []))
+    corpo = pagina_buscada['corpo']
+    if hasattr(corpo, 'read'):
+        blocos = iter(lambda: corpo.read(TAMANHO_BLOCO_CORPO), b'')
+        return iterar_itens_json(blocos, chave='dados', encoding=pagina_buscada.get('encoding') or 'utf-8')
+    return iterar_itens_json([corpo], chave='dados')
+
+
+def fechar_corpo(pagina_buscada):
+    """Descarta o arquivo com o corpo da página (busca HTTP), se houver"""
+    corpo = pagina_buscada.get('corpo')
+    if hasattr(corpo, 'close'):
+        corpo.close()
+
+
+# --- Etapas ----------------------------------------------------------------
+
+def filtrar(itens, contexto):
+    """Itens com NRORC e ID, não anteriores à marca d'água; registra a maior data vista"""
+    marca_dagua = contexto['marca_dagua']
+    contadores = contexto['contadores']
+    for item in itens:
+        contexto['itens'] += 1
+        if not item.get('NRORC') or not item.get('ID'):
+            continue
+        dt_api = converter_datetime_api(item.get('DTALT'), item.get('HRALT'))
+        if dt_api is not None:
+            maior = contadores['maior_atualizacao_api']
+            if maior is None or dt_api > maior:
+                contadores['maior_atualizacao_api'] = dt_api
+            # "<": DTALT/HRALT têm resolução de segundos; o ERP pode alterar outro item no mesmo
+            # segundo da marca depois da leitura. Os do próprio segundo voltam e o hash os descarta
+            if marca_dagua is not None and dt_api < marca_dagua:
+                contadores['antigos'] += 1
+                continue
+        yield str(item['ID']), item
+
+
+def diferenciar(fluxo, contexto):
+    """
+    Uma consulta para os hashes gravados da página; só segue o que é novo ou mudou
+    Um mesmo ID repetido na página vale pelo último item
+    """
+    itens_por_id = dict(fluxo)
+    hashes_gravados = dict(
+        FormulaItem.objects.filter(id_api__in=list(itens_por_id)).values_list('id_api', 'hash_origem')
+    ) if itens_por_id else {}
+    contexto['hashes_gravados'] = hashes_gravados
+
+    for id_api, item in itens_por_id.items():
+        hash_item = calcular_hash_origem(item)
+        if hashes_gravados.get(id_api) == hash_item:
+            contexto['contadores']['sem_mudancas'] += 1
+            continue
+        yield id_api, item, hash_item
+
+
+def classificar(fluxo, contexto):
+    """Normaliza e classifica cada item (tipo, forma, unidades); falhas contam como erro"""
+    for id_api, item, hash_item in fluxo:
+        try:
+            yield id_api, int(item['NRORC']), valores_formula_api(item, hash_item)
+        except Exception as e:
+            logger.error(f'Erro ao processar formula {id_api}: {str(e)}')
+            contexto['contadores']['erros'] += 1
+
+
+def gravar(fluxo, contexto):
+    """
+    Grava a página por conjunto, numa única transação: PedidoMestre e FormulaItem
+    existentes carregados com IN (...), diff em memória, bulk_create/bulk_update.
+    Se a transação falhar, grava item a item (uma transação por item): só os itens
+    que falham de novo contam como erro, e o resto da página é gravado
+    """
+    contadores = contexto['contadores']
+    valores_por_id = {}
+    nrorc_por_id = {}
+    for id_api, nrorc, valores in fluxo:
+        nrorc_por_id[id_api] = nrorc
+        valores_por_id[id_api] = valores
+    # Preenchido por diferenciar ao consumir o fluxo
+    hashes_gravados = contexto.get('hashes_gravados', {})
+
+    if not valores_por_id:
+        return
+
+    try:
+        gravados = gravar_conjunto(valores_por_id, nrorc_por_id, hashes_gravados)
+    except Exception as e:
+        logger.warning(f'Erro ao gravar página de pedidos, gravando item a item: {str(e)[:120]}')
+    else:
+        somar_contadores(contadores, gravados)
+        return
+
+    for id_api, valores in valores_por_id.items():
+        try:
+            gravados = gravar_conjunto({id_api: valores}, nrorc_por_id, hashes_gravados)
+        except IntegrityError as e:
+            logger.warning(f'Registro duplicado ao gravar formula {id_api}: {str(e)[:80]}')
+            contadores['erros'] += 1
+        except Exception as e:
+            logger.error(f'Erro ao gravar formula {id_api}: {str(e)}')
+            contadores['erros'] += 1
+        else:
+            somar_contadores(contadores, gravados)
+
+
+def gravar_conjunto(valores_por_id, nrorc_por_id, hashes_gravados):
+    """
+    Grava os itens dados numa transação (consultas fixas, qualquer que seja o número de itens)
+    Retorna os contadores criados/atualizados/sem_mudancas; exceções desfazem tudo e sobem
+    """
+    nrorcs = {nrorc_por_id[id_api] for id_api in valores_por_id}
+    with transaction.atomic():
+        # PedidoMestre: uma consulta para os existentes, um INSERT para os novos
+        existentes = set(
+            PedidoMestre.objects.filter(nrorc__in=nrorcs).values_list('nrorc', flat=True)
+        )
+        novos_pedidos = [
+            PedidoMestre(nrorc=nrorc, status='em_processamento')
+            for nrorc in nrorcs if nrorc not in existentes
+        ]
+        if novos_pedidos:
+            PedidoMestre.objects.bulk_create(novos_pedidos, ignore_conflicts=True)
+        pedidos = {
+            p.nrorc: p for p in PedidoMestre.objects.filter(nrorc__in=nrorcs)
+        }
+
+        # FormulaItem: uma consulta para as existentes que mudaram, diff em memória
+        ids_existentes = [id_api for id_api in valores_por_id if id_api in hashes_gravados]
+        formulas_existentes = FormulaItem.objects.in_bulk(ids_existentes, field_name='id_api') if ids_existentes else {}
+
+        etapa_inicial = None
+        if len(formulas_existentes) < len(valores_por_id):
+            etapa_inicial = etapa_inicial_triagem()
+
+        novas_formulas = []
+        formulas_alteradas = []
+        formulas_sem_hash = []
+        sem_mudancas_legado = 0
+        agora = timezone.now()
+        for id_api, valores in valores_por_id.items():
+            formula = formulas_existentes.get(id_api)
+            if formula is None:
+                novas_formulas.append(FormulaItem(
+                    pedido_mestre=pedidos[nrorc_por_id[id_api]],
+                    id_api=id_api,
+                    descricao=valores['descricao'] or f'Formula {id_api}',
+                    quantidade=valores['quantidade'],
+                    volume_ml=valores['volume_ml'] or '',
+                    serieo=valores['serieo'],
+                    price_unit=valores['price_unit'],
+                    price_total=valores['price_total'],
+                    datetime_atualizacao_api=valores['datetime_atualizacao_api'],
+                    tipo_produto=valores['tipo_produto'],
+                    forma=valores['forma'],
+                    quantidade_unidades=valores['quantidade_unidades'],
+                    hash_origem=valores['hash_origem'],
+                    status='em_triagem',
+                    etapa_atual=etapa_inicial,
+                ))
+            elif formula.hash_origem or formula_mudou(formula, valores):
+                formula.descricao = valores['descricao'] or formula.descricao
+                formula.quantidade = valores['quantidade']
+                formula.volume_ml = valores['volume_ml'] or formula.volume_ml
+                formula.serieo = valores['serieo']
+                formula.price_unit = valores['price_unit']
+                formula.price_total = valores['price_total']
+                formula.tipo_produto = valores['tipo_produto']
+                formula.forma = valores['forma']
+                formula.quantidade_unidades = valores['quantidade_unidades']
+                formula.datetime_atualizacao_api = (
+                    valores['datetime_atualizacao_api'] or formula.datetime_atualizacao_api
+                )
+                formula.hash_origem = valores['hash_origem']
+                formula.atualizado_em = agora
+                formulas_alteradas.append(formula)
+            else:
+                # Fórmula anterior ao hash e sem mudanças: grava só o hash
+                formula.hash_origem = valores['hash_origem']
+                formulas_sem_hash.append(formula)
+                sem_mudancas_legado += 1
+
+        if novas_formulas:
+            FormulaItem.objects.bulk_create(novas_formulas)
+        if formulas_alteradas:
+            FormulaItem.objects.bulk_update(
+                formulas_alteradas,
+                ['descricao', 'quantidade', 'volume_ml', 'serieo',
+                 'price_unit', 'price_total', 'tipo_produto', 'forma', 'quantidade_unidades',
+                 'datetime_atualizacao_api', 'hash_origem', 'atualizado_em'],
+            )
+        if formulas_sem_hash:
+            FormulaItem.objects.bulk_update(formulas_sem_hash, ['hash_origem'])
+
+    return {
+        'criados': len(novos_pedidos) + len(novas_formulas),
+        'atualizados': len(formulas_alteradas),
+        'sem_mudancas': sem_mudancas_legado,
+    }
+
+
+# --- Ingestão via staging (LinhaBrutaAPI) ------------------------------------
+
+# Colunas de LinhaBrutaAPI preenchidas pela ingestão, na ordem das tuplas de preparar_linhas_brutas
+COLUNAS_LINHA_BRUTA = (
+    'lote', 'api_id', 'pagina', 'dados', 'id_api', 'nrorc', 'hash_origem', 'descricao', 'quantidade',
+    'volume_ml', 'serieo', 'price_unit', 'price_total', 'datetime_atualizacao_api', 'tipo_produto_id',
+    'forma', 'quantidade_unidades', 'recebida_em',
+)
+
+
+def preparar_linhas_brutas(fluxo, contexto):
+    """
+    Normaliza cada item numa linha de LinhaBrutaAPI (tupla já adaptada ao banco)
+    Sem instâncias do ORM: a conversão por campo do bulk_create custaria mais que a mesclagem
+    Um mesmo ID repetido na página vale pelo último item
+    """
+    conexao = connections[DEFAULT_DB_ALIAS]
+    campo = LinhaBrutaAPI._meta.get_field
+    preparar_json = campo('dados').get_db_prep_save
+    preparar_decimal = campo('price_unit').get_db_prep_save
+    preparar_data = campo('recebida_em').get_db_prep_save
+    lote, api_id, pagina = contexto['lote'], contexto.get('api_id'), contexto.get('pagina')
+    recebida_em = preparar_data(timezone.now(), conexao)
+
+    linhas = {}
+    for id_api, item in fluxo:
+        try:
+            valores = valores_formula_api(item)
+            tipo_produto = valores['tipo_produto']
+            linhas[id_api] = (
+                lote, api_id, pagina, preparar_json(item, conexao), id_api, int(item['NRORC']),
+                valores['hash_origem'], valores['descricao'], valores['quantidade'],
+                valores['volume_ml'] or '', valores['serieo'],
+                preparar_decimal(valores['price_unit'], conexao),
+                preparar_decimal(valores['price_total'], conexao),
+                preparar_data(valores['datetime_atualizacao_api'], conexao),
+                tipo_produto.pk if tipo_produto else None,
+                valores['forma'], valores['quantidade_unidades'], recebida_em,
+            )
+        except Exception as e:
+            logger.error(f'Erro ao processar formula {id_api}: {str(e)}')
+            contexto['contadores']['erros'] += 1
+    yield from linhas.values()
+
+
+def gravar_via_staging(fluxo, contexto):
+    """
+    Grava o lote em LinhaBrutaAPI e o mescla por SQL, tudo numa transação:
+    1. INSERT das linhas do lote (executemany)
+    2. INSERT dos PedidoMestre que faltam (ON CONFLICT (nrorc) DO NOTHING)
+    3. INSERT ... ON CONFLICT (id_api) DO UPDATE das fórmulas, só onde o hash mudou
+    A sintaxe ON CONFLICT é a mesma no SQLite (3.24+) e no PostgreSQL
+    """
+    contadores = contexto['contadores']
+    linhas = list(fluxo)
+    if not linhas:
+        return
+
+    lote = contexto['lote']
+    q = connection.ops.quote_name
+    sem_mudancas_antes = contadores['sem_mudancas']
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"INSERT INTO {q(LinhaBrutaAPI._meta.db_table)} ({', '.join(q(c) for c in COLUNAS_LINHA_BRUTA)}) "
+                    f"VALUES ({', '.join(['%s'] * len(COLUNAS_LINHA_BRUTA))})",
+                    linhas,
+                )
+            criados, atualizados, sem_mudancas = mesclar_lote(lote)
+        contadores['criados'] += criados
+        contadores['atualizados'] += atualizados
+        contadores['sem_mudancas'] += sem_mudancas
+    except Exception as e:
+        logger.error(f'Erro ao mesclar lote {lote}: {str(e)}')
+        contadores['erros'] += len(linhas)
+        contadores['sem_mudancas'] = sem_mudancas_antes
+
+
+def mesclar_lote(lote):
+    """Mescla um lote de LinhaBrutaAPI; retorna (criados, atualizados, sem_mudancas)"""
+    q = connection.ops.quote_name
+    staging = q(LinhaBrutaAPI._meta.db_table)
+    pedidos = q(PedidoMestre._meta.db_table)
+    formulas = q(FormulaItem._meta.db_table)
+    agora = timezone.now()
+    etapa_inicial = etapa_inicial_triagem()
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT COUNT(*), COUNT(f.id)
+            FROM {staging} s LEFT JOIN {formulas} f ON f.id_api = s.id_api
+            WHERE s.lote = %s
+            """,
+            [lote],
+        )
+        total, existentes = cursor.fetchone()
+
+        cursor.execute(
+            f"""
+            INSERT INTO {pedidos} (nrorc, status, cliente, observacoes, criado_em, atualizado_em)
+            SELECT DISTINCT s.nrorc, 'em_processamento', '', '', %s, %s
+            FROM {staging} s
+            WHERE s.lote = %s
+            ON CONFLICT (nrorc) DO NOTHING
+            """,
+            [agora, agora, lote],
+        )
+        pedidos_criados = max(cursor.rowcount, 0)
+
+        # Descrição vazia: nova fórmula recebe 'Formula <ID>', existente mantém a sua
+        cursor.execute(
+            f"""
+            INSERT INTO {formulas} (
+                pedido_mestre_id, id_api, descricao, quantidade, volume_ml, serieo,
+                price_unit, price_total, datetime_atualizacao_api, tipo_produto_id, forma,
+                quantidade_unidades, hash_origem, status, etapa_atual_id, eh_tarefa_ativa,
+                criado_em, atualizado_em
+            )
+            SELECT
+                p.id, s.id_api, CASE WHEN s.descricao = '' THEN 'Formula ' || s.id_api ELSE s.descricao END,
+                s.quantidade, s.volume_ml, s.serieo,
+                s.price_unit, s.price_total, s.datetime_atualizacao_api, s.tipo_produto_id, s.forma,
+                s.quantidade_unidades, s.hash_origem, 'em_triagem', %s, %s,
+                %s, %s
+            FROM {staging} s JOIN {pedidos} p ON p.nrorc = s.nrorc
+            WHERE s.lote = %s
+            ON CONFLICT (id_api) DO UPDATE SET
+                descricao = CASE
+                    WHEN excluded.descricao = 'Formula ' || excluded.id_api THEN {formulas}.descricao
+                    ELSE excluded.descricao
+                END,
+                quantidade = excluded.quantidade,
+                volume_ml = CASE WHEN excluded.volume_ml = '' THEN {formulas}.volume_ml ELSE excluded.volume_ml END,
+                serieo = excluded.serieo,
+                price_unit = excluded.price_unit,
+                price_total = excluded.price_total,
+                datetime_atualizacao_api = COALESCE(excluded.datetime_atualizacao_api, {formulas}.datetime_atualizacao_api),
+                tipo_produto_id = excluded.tipo_produto_id,
+                forma = excluded.forma,
+                quantidade_unidades = excluded.quantidade_unidades,
+                hash_origem = excluded.hash_origem,
+                atualizado_em = excluded.atualizado_em
+            WHERE {formulas}.hash_origem <> excluded.hash_origem
+            """,
+            [etapa_inicial.pk if etapa_inicial else None, False, agora, agora, lote],
+        )
+        # rowcount = inseridas + atualizadas (conflitos com o mesmo hash não contam)
+        formulas_criadas = total - existentes
+        atualizados = max(cursor.rowcount, 0) - formulas_criadas
+
+    # As linhas ficam como registro do que a API enviou; limpar_linhas_brutas as apaga após a retenção
+    LinhaBrutaAPI.objects.filter(lote=lote).update(mesclada_em=agora)
+    return pedidos_criados + formulas_criadas, atualizados, existentes - atualizados
+
+
+def limpar_linhas_brutas(dias=None):
+    """Apaga as LinhaBrutaAPI mais antigas que a retenção (LINHAS_BRUTAS_RETENCAO_DIAS)"""
+    dias = settings.LINHAS_BRUTAS_RETENCAO_DIAS if dias is None else dias
+    removidas, _ = LinhaBrutaAPI.objects.filter(
+        recebida_em__lt=timezone.now() - timedelta(days=dias)
+    ).delete()
+    if removidas:
+        logger.info(f'[STAGING] {removidas} linha(s) bruta(s) com mais de {dias} dia(s) removida(s)')
+    return removidas
+
+
+# --- Lotes -----------------------------------------------------------------
+
+def lotes_por_nrorc(fluxo, tamanho_lote):
+    """
+    Agrupa o fluxo (id_api, item) em listas de pelo menos tamanho_lote itens, fechando o lote
+    só na troca de NRORC, para um pedido não ficar dividido entre lotes. Um NRORC com mais de
+    tamanho_lote itens seguidos é dividido assim mesmo, para o lote não crescer sem limite
+    (a gravação é idempotente: o pedido criado no primeiro lote é reaproveitado no seguinte)
+    """
+    lote = []
+    nrorc_anterior = None
+    for id_api, item in fluxo:
+        nrorc = item['NRORC']
+        if len(lote) >= tamanho_lote and (nrorc != nrorc_anterior or len(lote) >= 2 * tamanho_lote):
+            yield lote
+            lote = []
+        lote.append((id_api, item))
+        nrorc_anterior = nrorc
+    if lote:
+        yield lote
+
+
+# --- Pipeline --------------------------------------------------------------
+
+class PipelineIngestao:
+    """
+    Encadeia as etapas de uma página e devolve os contadores
+    etapas: geradores (fluxo, contexto) -> fluxo, na ordem; gravar: consome o último fluxo
+    tamanho_lote: com valor, só a primeira etapa (filtrar) vê a página inteira, em streaming;
+    as demais e a gravação rodam por lote (lotes_por_nrorc), cada um com seu contexto e transação
+    """
+
+    ETAPAS_PADRAO = (filtrar, diferenciar, classificar)
+
+    def __init__(self, etapas=None, gravar=gravar, tamanho_lote=None):
+        self.etapas = tuple(etapas) if etapas is not None else self.ETAPAS_PADRAO
+        self.gravar = gravar
+        self.tamanho_lote = tamanho_lote
+
+    def processar_itens(self, itens, marca_dagua=None, api_id=None, pagina=None):
+        """Passa os itens de uma página por todas as etapas; retorna os contadores da página"""
+        contexto = {
+            'marca_dagua': marca_dagua, 'contadores': novos_contadores(), 'itens': 0,
+            'api_id': api_id, 'pagina': pagina, 'lote': uuid.uuid4().hex,
+        }
+        if self.tamanho_lote:
+            primeira, *demais = self.etapas
+            for lote in lotes_por_nrorc(primeira(iter(itens), contexto), self.tamanho_lote):
+                self.gravar_fluxo(iter(lote), demais, {**contexto, 'lote': uuid.uuid4().hex})
+        else:
+            self.gravar_fluxo(iter(itens), self.etapas, contexto)
+
+        contadores = contexto['contadores']
+        logger.info(
+            f"[PROCESSAMENTO] Pedidos: {contadores['criados']} criados, {contadores['atualizados']} atualizados, "
+            f"{contadores['sem_mudancas']} sem mudancas, {contadores['antigos']} antigos, {contadores['erros']} erros"
+        )
+        return contadores, contexto['itens']
+
+    def gravar_fluxo(self, fluxo, etapas, contexto):
+        """Encadeia as etapas sobre o fluxo e grava o resultado"""
+        for etapa in etapas:
+            fluxo = etapa(fluxo, contexto)
+        self.gravar(fluxo, contexto)
+
+    def processar_pagina(self, pagina_buscada, marca_dagua=None):
+        """Grava uma página buscada (API ou cassete) e monta o resultado usado pelo ledger"""
+        if not pagina_buscada['sucesso']:
+            return pagina_buscada
+
+        # 304: nada a processar
+        inicio = perf_counter()
+        try:
+            if pagina_buscada.get('nao_modificada'):
+                contadores, itens = novos_contadores(), 0
+            else:
+                contadores, itens = self.processar_itens(
+                    itens_da_pagina(pagina_buscada), marca_dagua=marca_dagua,
+                    api_id=pagina_buscada.get('api_id'), pagina=pagina_buscada.get('pagina'),
+                )
+        except JSONInvalido as e:
+            # Os lotes anteriores ao erro ficam gravados (a gravação é idempotente); a página conta
+            # como falha, então a marca d'água e o validador não avançam e ela é lida de novo
+            logger.error(f"[ERRO] Corpo inválido na página {pagina_buscada.get('pagina')}: {str(e)}")
+            return {
+                'sucesso': False, 'erro': str(e), 'status': pagina_buscada.get('status'),
+                'pagina': pagina_buscada.get('pagina'), 'tamanho': pagina_buscada.get('tamanho'),
+                'latencia_ms': pagina_buscada.get('latencia_ms'),
+                'bytes_recebidos': pagina_buscada.get('bytes_recebidos', 0),
+            }
+        finally:
+            fechar_corpo(pagina_buscada)
+
+        return {
+            'sucesso': True,
+            'status': pagina_buscada['status'],
+            'pagina': pagina_buscada.get('pagina'),
+            'tamanho': pagina_buscada.get('tamanho'),
+            'nao_modificada': pagina_buscada.get('nao_modificada', False),
+            'validador': pagina_buscada.get('validador'),
+            'items_recebidos': itens,
+            'processamento': contadores,
+            'latencia_ms': pagina_buscada.get('latencia_ms'),
+            'bytes_recebidos': pagina_buscada.get('bytes_recebidos', 0),
+            'tempo_gravacao_ms': (perf_counter() - inicio) * 1000,
+            'timestamp': timezone.now().isoformat(),
+        }
+
+    def processar_paginas(self, paginas, marca_dagua=None):
+        """Grava uma sequência de páginas (fonte qualquer), devolvendo o resultado de cada uma"""
+        for pagina_buscada in paginas:
+            yield self.processar_pagina(pagina_buscada, marca_dagua=marca_dagua)
+
+
+pipeline_padrao = PipelineIngestao(tamanho_lote=settings.INGESTAO_TAMANHO_LOTE)
+pipeline_staging = PipelineIngestao(
+    etapas=(filtrar, preparar_linhas_brutas), gravar=gravar_via_staging, tamanho_lote=settings.INGESTAO_TAMANHO_LOTE,
+)
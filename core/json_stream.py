@@ -0,0 +1,118 @@
+"""
+Decodificação incremental de JSON
+Lê a resposta da API em blocos e entrega os itens da lista "dados" um a um,
+sem materializar o corpo inteiro nem o objeto JSON completo na memória
+"""
+
+import codecs
+import json
+
+ESPACOS = ' \t\n\r'
+CARACTERES_NUMERO = '0123456789.eE+-'
+
+
+class JSONInvalido(ValueError):
+    """Corpo que não é o objeto JSON esperado (truncado, malformado ou sem a estrutura de lista)"""
+
+
+class LeitorJSON:
+    """Mantém um buffer pequeno sobre um iterável de blocos (bytes ou str)"""
+
+    def __init__(self, blocos, encoding='utf-8'):
+        self.blocos = iter(blocos)
+        self.decodificador = codecs.getincrementaldecoder(encoding)()
+        self.json = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.fim = False
+
+    def _ler_mais(self):
+        """Acrescenta o próximo bloco ao buffer descartando o que já foi consumido"""
+        if self.fim:
+            return False
+        try:
+            bloco = next(self.blocos)
+        except StopIteration:
+            self.fim = True
+            bloco = self.decodificador.decode(b'', final=True)
+        else:
+            if isinstance(bloco, bytes):
+                bloco = self.decodificador.decode(bloco)
+        self.buffer = self.buffer[self.pos:] + bloco
+        self.pos = 0
+        return True
+
+    def proximo(self):
+        """Retorna o próximo caractere significativo sem consumi-lo ('' no fim)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ESPACOS:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._ler_mais():
+                return ''
+
+    def consumir(self, esperado):
+        """Consome o caractere esperado ou falha com JSON inválido"""
+        caractere = self.proximo()
+        if caractere != esperado:
+            raise JSONInvalido(f"JSON inválido: esperado '{esperado}', encontrado '{caractere or 'fim'}'")
+        self.pos += 1
+
+    def valor(self):
+        """Decodifica um valor JSON completo, lendo mais blocos até ele fechar"""
+        self.proximo()
+        while True:
+            try:
+                valor, fim_valor = self.json.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                if not self._ler_mais():
+                    raise JSONInvalido(f'JSON inválido: {e}') from e
+                continue
+            # Um número no fim do buffer pode continuar no próximo bloco ("2" + ".5", "1" + "e3")
+            if isinstance(valor, (int, float)) and not isinstance(valor, bool) and not self.fim:
+                fim_numero = fim_valor
+                while fim_numero < len(self.buffer) and self.buffer[fim_numero] in CARACTERES_NUMERO:
+                    fim_numero += 1
+                if fim_numero == len(self.buffer):
+                    self._ler_mais()
+                    continue
+            self.pos = fim_valor
+            return valor
+
+
+def iterar_itens_json(blocos, chave='dados', encoding='utf-8'):
+    """
+    Itera os elementos da lista `chave` de um objeto JSON lido em blocos
+    Ex: {"total": 2, "dados": [{...}, {...}]} -> {...}, {...}
+    As outras chaves do objeto são lidas e descartadas
+    """
+    leitor = LeitorJSON(blocos, encoding=encoding)
+    leitor.consumir('{')
+    if leitor.proximo() == '}':
+        return
+
+    while True:
+        chave_atual = leitor.valor()
+        leitor.consumir(':')
+
+        if chave_atual == chave and leitor.proximo() == '[':
+            leitor.consumir('[')
+            if leitor.proximo() == ']':
+                leitor.consumir(']')
+            else:
+                while True:
+                    yield leitor.valor()
+                    if leitor.proximo() == ',':
+                        leitor.consumir(',')
+                        continue
+                    leitor.consumir(']')
+                    break
+        else:
+            leitor.valor()
+
+        if leitor.proximo() == ',':
+            leitor.consumir(',')
+            continue
+        leitor.consumir('}')
+        return
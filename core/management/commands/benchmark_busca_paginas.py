@@ -0,0 +1,65 @@
+"""
+Benchmark da etapa de busca de páginas da API
+Compara a busca serial (requests.get sem sessão) com a busca paralela
+via SincronizadorAPI.buscar_paginas contra um endpoint local simulado
+Uso: python manage.py benchmark_busca_paginas --paginas 20 --latencia 0.2
+"""
+
+import time
+
+import requests
+from django.core.management.base import BaseCommand
+
+from core.api_simulada import DadosSimulados, ServidorSimulado
+from core.models import ConfiguracaoAPI
+from core.scheduler import SincronizadorAPI
+
+
+class Command(BaseCommand):
+    help = 'Mede o tempo de busca de N páginas: serial sem sessão x paralelo com sessão'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paginas', type=int, default=20, help='Quantidade de páginas')
+        parser.add_argument('--tamanho', type=int, default=50, help='Itens por página')
+        parser.add_argument('--latencia', type=float, default=0.2, help='Latência simulada por página (segundos)')
+        parser.add_argument('--paralelas', type=int, default=4, help='Requisições paralelas')
+
+    def handle(self, *args, **options):
+        dados = DadosSimulados(options['paginas'] * options['tamanho'])
+        servidor = ServidorSimulado(dados, latencia=options['latencia']).iniciar()
+        url_base = servidor.url_base
+
+        paginacoes = [
+            {'pagina': p, 'tamanho': options['tamanho']}
+            for p in range(1, options['paginas'] + 1)
+        ]
+
+        try:
+            # Antes: uma requisição por vez, sem sessão (nova conexão por página)
+            inicio = time.perf_counter()
+            for paginacao in paginacoes:
+                url = f"{url_base}?pagina={paginacao['pagina']}&tamanho={paginacao['tamanho']}"
+                requests.get(url, timeout=30).json()
+            tempo_serial = time.perf_counter() - inicio
+
+            # Depois: sessão com keep-alive e busca paralela limitada
+            api_config = ConfiguracaoAPI(
+                nome='benchmark', url_base=url_base, timeout=30,
+                requisicoes_paralelas=options['paralelas'],
+            )
+            inicio = time.perf_counter()
+            paginas = list(SincronizadorAPI.buscar_paginas(api_config, paginacoes))
+            tempo_paralelo = time.perf_counter() - inicio
+        finally:
+            servidor.parar()
+
+        falhas = sum(1 for p in paginas if not p['sucesso'])
+
+        self.stdout.write(self.style.HTTP_INFO(
+            f"{options['paginas']} páginas x {options['tamanho']} itens, latência {options['latencia']}s"
+        ))
+        self.stdout.write(f'  Serial (sem sessão):            {tempo_serial:.2f}s')
+        self.stdout.write(f"  Paralelo ({options['paralelas']} conexões, sessão): {tempo_paralelo:.2f}s")
+        self.stdout.write(self.style.SUCCESS(f'  Ganho: {tempo_serial / tempo_paralelo:.1f}x'))
+        if falhas:
+            self.stdout.write(self.style.WARNING(f'  Páginas com falha: {falhas}'))
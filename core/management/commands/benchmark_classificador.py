@@ -0,0 +1,96 @@
+"""
+Micro-benchmark do classificador de tipo de produto
+Compara a implementação antiga (substrings + TipoProduto.objects.get por item)
+com core.classificador_produto (regex compilada + cache de TipoProduto)
+Uso: python manage.py benchmark_classificador --quantidade 20000
+"""
+
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.classificador_produto import (
+    PADROES_TIPO_PRODUTO, classificar_tipo, extrair_tipo_produto,
+)
+from core.models import TipoProduto
+
+# Descrições no formato real de DESCRICAOWEB
+MODELOS_DESCRICAO = [
+    'VITAMINA D3 {dose}UI | CAPSULA: {qtd}CAP',
+    'MAGNESIO DIMALATO {dose}MG | ENVELOPE: {qtd}ENV',
+    'VITAMINA A + D3 + TCM | {qtd}ML',
+    'MINOXIDIL {dose}% LOÇÃO CAPILAR {qtd}ML',
+    'CREME HIDRATANTE UREIA {dose}% {qtd}G',
+    'SHAMPOO CETOCONAZOL {dose}% {qtd}G',
+    'MELATONINA {dose}MG PASTILHA SUBLINGUAL C/{qtd}',
+    'GUMMY VITAMINA C {dose}MG C/{qtd}',
+    'ÓVULO DE ACIDO BORICO {dose}MG C/{qtd}',
+    'CHOCOLATE FUNCIONAL {dose}MG C/{qtd}',
+    'FILME ORAL B12 {dose}MCG C/{qtd}',
+    'OMEGA 3 OLEOSA {dose}MG C/{qtd}',
+    'BASE PENTRAVAN {dose}G + DICLOFENACO {qtd}MG',
+    'COLAGENO VERISOL {dose}G + BIOTINA {qtd}MCG',
+]
+
+
+def extrair_tipo_produto_legado(descricao_web):
+    """Implementação anterior, mantida aqui apenas como referência de medição"""
+    if not descricao_web:
+        return None, 'desconhecido'
+
+    descricao_upper = descricao_web.upper()
+
+    for tipo_chave, palavras in PADROES_TIPO_PRODUTO:
+        for palavra in palavras:
+            if palavra in descricao_upper:
+                try:
+                    return TipoProduto.objects.get(tipo=tipo_chave), tipo_chave
+                except TipoProduto.DoesNotExist:
+                    return None, tipo_chave
+
+    return None, 'desconhecido'
+
+
+class Command(BaseCommand):
+    help = 'Mede classificações por segundo do classificador de tipo de produto'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quantidade', type=int, default=20000, help='Descrições a classificar')
+
+    def medir(self, funcao, descricoes):
+        inicio = time.perf_counter()
+        for descricao in descricoes:
+            funcao(descricao)
+        return len(descricoes) / (time.perf_counter() - inicio)
+
+    def handle(self, *args, **options):
+        aleatorio = random.Random(42)
+        descricoes = [
+            aleatorio.choice(MODELOS_DESCRICAO).format(
+                dose=aleatorio.randint(1, 50000), qtd=aleatorio.randint(1, 240)
+            )
+            for _ in range(options['quantidade'])
+        ]
+
+        divergencias = sum(
+            1 for d in descricoes
+            if extrair_tipo_produto_legado(d)[1] != extrair_tipo_produto(d)[1]
+        )
+
+        classificar_tipo.cache_clear()
+        legado = self.medir(extrair_tipo_produto_legado, descricoes)
+        classificar_tipo.cache_clear()
+        frio = self.medir(extrair_tipo_produto, descricoes)
+        # Re-sincronização: as mesmas páginas (e descrições) voltam a cada execução
+        repetidas = descricoes[:2000] * (len(descricoes) // 2000 or 1)
+        quente = self.medir(extrair_tipo_produto, repetidas)
+
+        self.stdout.write(self.style.HTTP_INFO(f'{len(descricoes)} descrições'))
+        self.stdout.write(f'  Antigo (substrings + consulta por item): {legado:>12,.0f} classificações/s')
+        self.stdout.write(f'  Novo, descrições inéditas:               {frio:>12,.0f} classificações/s')
+        self.stdout.write(f'  Novo, descrições repetidas (re-sync):    {quente:>12,.0f} classificações/s')
+        if divergencias:
+            self.stdout.write(self.style.WARNING(f'  Divergências de classificação: {divergencias}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('  Mesma classificação em todas as descrições'))
@@ -0,0 +1,158 @@
+"""
+Benchmark de concorrência do fluxo assumir -> abrir -> finalizar das fórmulas
+Vários funcionários (uma thread e um Client logado cada) passam fórmulas pelas views reais
+ao mesmo tempo; mede requisições/s, latência e falhas (ex: "database is locked") no banco
+do perfil configurado (DB_PERFIL)
+
+Uso:
+    python manage.py benchmark_fluxo_tarefas --funcionarios 8 --formulas 400
+    DB_PERFIL=postgres DATABASE_URL=postgres://... python manage.py benchmark_fluxo_tarefas
+
+Os dados criados (etapa, usuários, pedidos, fórmulas) são removidos ao final. Rodar numa
+cópia do banco: as requisições gravam de verdade, fora de transação.
+"""
+
+import json
+import threading
+import time
+from statistics import quantiles
+
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.models import Max
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from core.models import Etapa, FormulaItem, LogAuditoria, PedidoMestre
+
+PREFIXO = 'bench-fluxo'
+# Faixa de NRORC dos pedidos do benchmark, longe dos números reais
+NRORC_INICIAL = 9_900_000_000
+
+
+class Command(BaseCommand):
+    help = 'Mede requisições/s do fluxo assumir/finalizar com funcionários concorrentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--funcionarios', type=int, default=8, help='Funcionários (threads) simultâneos')
+        parser.add_argument('--formulas', type=int, default=400, help='Fórmulas passadas pelo fluxo')
+        parser.add_argument('--json', action='store_true', help='Imprime o resultado em JSON')
+
+    # O manifesto do whitenoise só existe depois do collectstatic; o benchmark mede o banco
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def handle(self, *args, **options):
+        funcionarios, total_formulas = options['funcionarios'], options['formulas']
+        usuarios, etapa = self.preparar(funcionarios, total_formulas)
+        try:
+            formulas = list(FormulaItem.objects.filter(id_api__startswith=PREFIXO).values_list('id', flat=True))
+            por_funcionario = [formulas[i::funcionarios] for i in range(funcionarios)]
+            medicoes = [[] for _ in usuarios]
+            falhas = [[] for _ in usuarios]
+
+            threads = [
+                threading.Thread(target=self.trabalhar, args=(usuario, ids, medicoes[i], falhas[i]))
+                for i, (usuario, ids) in enumerate(zip(usuarios, por_funcionario))
+            ]
+            inicio = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            duracao = time.perf_counter() - inicio
+
+            latencias = sorted(latencia for lista in medicoes for latencia in lista)
+            erros = [erro for lista in falhas for erro in lista]
+            concluidas = FormulaItem.objects.filter(id_api__startswith=PREFIXO, status='expedido').count()
+            percentis = quantiles(latencias, n=100) if len(latencias) > 1 else latencias * 99
+            resultado = {
+                'banco': connection.vendor,
+                'journal_mode': self.journal_mode(),
+                'funcionarios': funcionarios,
+                'formulas': total_formulas,
+                'concluidas': concluidas,
+                'requisicoes': len(latencias),
+                'falhas': len(erros),
+                'duracao_s': round(duracao, 2),
+                'requisicoes_por_s': round(len(latencias) / duracao, 1) if duracao else 0,
+                'latencia_p50_ms': round(percentis[49], 1) if percentis else None,
+                'latencia_p95_ms': round(percentis[94], 1) if percentis else None,
+                'exemplos_falhas': sorted(set(erros))[:5],
+            }
+        finally:
+            self.limpar(usuarios, etapa)
+
+        if options['json']:
+            self.stdout.write(json.dumps(resultado, ensure_ascii=False))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\n[OK] {resultado['banco']} ({resultado['journal_mode'] or '-'}), {funcionarios} funcionário(s)"
+        ))
+        self.stdout.write(f"   Fórmulas concluídas: {resultado['concluidas']} de {total_formulas}")
+        self.stdout.write(f"   Requisições: {resultado['requisicoes']} em {resultado['duracao_s']}s "
+                          f"({resultado['requisicoes_por_s']} req/s)")
+        self.stdout.write(f"   Latência p50/p95: {resultado['latencia_p50_ms']} / {resultado['latencia_p95_ms']} ms")
+        if erros:
+            self.stdout.write(self.style.WARNING(f"   Falhas: {len(erros)} ({'; '.join(resultado['exemplos_falhas'])})"))
+
+    def preparar(self, funcionarios, total_formulas):
+        """Etapa própria sem checklists (última e inativa: não vira próxima de nenhuma real), usuários e fórmulas"""
+        grupo, _ = Group.objects.get_or_create(name='Funcionário')
+        sequencia = (Etapa.objects.aggregate(maior=Max('sequencia'))['maior'] or 0) + 1000
+        etapa = Etapa.objects.create(nome=f'{PREFIXO} triagem', sequencia=sequencia, ativa=False)
+
+        usuarios = []
+        for i in range(funcionarios):
+            usuario = User.objects.create_user(f'{PREFIXO}-{i}', password=None)
+            usuario.groups.add(grupo)
+            usuarios.append(usuario)
+
+        pedidos = PedidoMestre.objects.bulk_create(
+            PedidoMestre(nrorc=NRORC_INICIAL + i, status='em_processamento') for i in range(total_formulas)
+        )
+        FormulaItem.objects.bulk_create(
+            FormulaItem(
+                pedido_mestre=pedido, id_api=f'{PREFIXO}-{i}', descricao=f'CAPSULA BENCHMARK {i}',
+                status='em_triagem', etapa_atual=etapa,
+            )
+            for i, pedido in enumerate(pedidos)
+        )
+        return usuarios, etapa
+
+    def trabalhar(self, usuario, formulas, latencias, falhas):
+        """Um funcionário: assume, abre e finaliza cada fórmula, uma por vez"""
+        cliente = Client()
+        cliente.force_login(usuario)
+        try:
+            for formula_id in formulas:
+                for metodo, rota in (
+                    ('get', 'dashboard:assumir_formula'),
+                    ('get', 'dashboard:detalhe_formula'),
+                    ('post', 'dashboard:finalizar_etapa_formula'),
+                ):
+                    inicio = time.perf_counter()
+                    try:
+                        resposta = getattr(cliente, metodo)(reverse(rota, args=[formula_id]))
+                        if resposta.status_code >= 400:
+                            falhas.append(f'HTTP {resposta.status_code}')
+                    except Exception as e:
+                        falhas.append(f'{type(e).__name__}: {str(e)[:60]}')
+                    latencias.append((time.perf_counter() - inicio) * 1000)
+        finally:
+            connections.close_all()
+
+    def limpar(self, usuarios, etapa):
+        """Remove tudo o que o benchmark criou (histórico e pontuações caem em cascata)"""
+        LogAuditoria.objects.filter(usuario__in=usuarios).delete()
+        PedidoMestre.objects.filter(nrorc__gte=NRORC_INICIAL, nrorc__lt=NRORC_INICIAL + 10_000_000).delete()
+        User.objects.filter(pk__in=[usuario.pk for usuario in usuarios]).delete()
+        etapa.delete()
+
+    @staticmethod
+    def journal_mode():
+        if connection.vendor != 'sqlite':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            return cursor.fetchone()[0]
@@ -0,0 +1,144 @@
+"""
+Benchmark de ingestão: SincronizadorAPI contra o FC0M100 simulado
+Busca todas as páginas (buscar_paginas) e grava cada uma (processar_pagina), por rodadas:
+a primeira é a carga inicial, as seguintes aplicam a taxa de mudança do servidor.
+Reporta itens/s, consultas por item e pico de memória (RSS) do processo.
+
+Por padrão tudo roda numa transação desfeita no final (o banco não é alterado).
+Uso: python manage.py benchmark_ingestao --itens 20000 --tamanho 200 --rodadas 3 --taxa-mudanca 0.02
+     python manage.py benchmark_ingestao --itens 100000 --tamanho 1000 --rodadas 2 --staging
+"""
+
+import json
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.api_simulada import DadosSimulados, ServidorSimulado
+from core.ingestao import pipeline_padrao, pipeline_staging
+from core.models import ConfiguracaoAPI
+from core.resiliencia_api import OrcamentoTentativas
+from core.scheduler import SincronizadorAPI
+
+
+def pico_rss_mb():
+    """Pico de RSS do processo em MB (ru_maxrss é KB no Linux e bytes no macOS)"""
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+
+@contextmanager
+def contar_consultas():
+    """Conta as consultas SQL desta thread sem guardar o texto (barato em cargas grandes)"""
+    contador = {'consultas': 0}
+
+    def contar(execute, sql, params, many, context):
+        contador['consultas'] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(contar):
+        yield contador
+
+
+class DesfazerTransacao(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Mede a ingestão (itens/s, consultas por item, pico de RSS) contra o FC0M100 simulado'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--itens', type=int, default=10000, help='Total de itens servidos')
+        parser.add_argument('--tamanho', type=int, default=100, help='Itens por página')
+        parser.add_argument('--rodadas', type=int, default=2, help='Sincronizações completas (1ª = carga inicial)')
+        parser.add_argument('--taxa-mudanca', type=float, default=0.02, help='Fração dos itens alterados por rodada')
+        parser.add_argument('--latencia', type=float, default=0.0, help='Latência simulada por página (segundos)')
+        parser.add_argument('--taxa-erro', type=float, default=0.0, help='Fração das requisições com 503')
+        parser.add_argument('--paralelas', type=int, default=4, help='Requisições paralelas')
+        parser.add_argument('--staging', action='store_true', help='Grava via LinhaBrutaAPI + mesclagem em SQL')
+        parser.add_argument('--manter-dados', action='store_true', help='Não desfaz a transação (mantém os itens gravados)')
+        parser.add_argument('--json', action='store_true', help='Imprime o resultado em JSON')
+
+    def handle(self, *args, **options):
+        dados = DadosSimulados(options['itens'], taxa_mudanca=options['taxa_mudanca'])
+        total_paginas = -(-options['itens'] // options['tamanho'])
+        paginacoes = [{'pagina': p, 'tamanho': options['tamanho']} for p in range(1, total_paginas + 1)]
+        rodadas = []
+        pipeline = pipeline_staging if options['staging'] else pipeline_padrao
+
+        with ServidorSimulado(dados, latencia=options['latencia'], taxa_erro=options['taxa_erro']) as servidor:
+            api_config = ConfiguracaoAPI(
+                nome='benchmark', url_base=servidor.url_base, timeout=30,
+                requisicoes_paralelas=options['paralelas'], requisicoes_condicionais=False,
+            )
+            try:
+                with transaction.atomic():
+                    for numero in range(1, options['rodadas'] + 1):
+                        rodadas.append(self.executar_rodada(numero, api_config, paginacoes, pipeline))
+                    if not options['manter_dados']:
+                        raise DesfazerTransacao()
+            except DesfazerTransacao:
+                pass
+
+        resultado = {
+            'itens': options['itens'],
+            'tamanho_pagina': options['tamanho'],
+            'taxa_mudanca': options['taxa_mudanca'],
+            'modo': 'staging' if options['staging'] else 'orm',
+            'rodadas': rodadas,
+            'pico_rss_mb': round(pico_rss_mb(), 1),
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(resultado, indent=2))
+            return
+
+        self.stdout.write(self.style.HTTP_INFO(
+            f"{options['itens']} itens em {total_paginas} páginas de {options['tamanho']}, "
+            f"mudança {options['taxa_mudanca']:.1%} por rodada, gravação {resultado['modo']}"
+        ))
+        for rodada in rodadas:
+            self.stdout.write(
+                f"  Rodada {rodada['rodada']}: {rodada['itens_por_segundo']:.0f} itens/s "
+                f"({rodada['segundos']:.2f}s), {rodada['consultas_por_item']:.3f} consultas/item, "
+                f"{rodada['criados']} criados, {rodada['atualizados']} atualizados, "
+                f"{rodada['sem_mudancas']} sem mudanças, {rodada['paginas_com_falha']} páginas com falha"
+            )
+        self.stdout.write(self.style.SUCCESS(f"  Pico de RSS: {resultado['pico_rss_mb']} MB"))
+
+    def executar_rodada(self, numero, api_config, paginacoes, pipeline):
+        """Uma sincronização completa: busca em paralelo, gravação em ordem nesta thread"""
+        totais = {'criados': 0, 'atualizados': 0, 'sem_mudancas': 0, 'erros': 0, 'paginas_com_falha': 0}
+        itens = 0
+        orcamento = OrcamentoTentativas(api_config.tentativas_por_execucao)
+
+        inicio = time.perf_counter()
+        with contar_consultas() as contador:
+            for pagina_buscada in SincronizadorAPI.buscar_paginas(api_config, paginacoes, orcamento=orcamento):
+                if not pagina_buscada['sucesso']:
+                    totais['paginas_com_falha'] += 1
+                    continue
+                resultado = SincronizadorAPI.processar_pagina(pagina_buscada, pipeline=pipeline)
+                # Página baixada mas ilegível (ex: JSON inválido) volta sem contagens
+                if not resultado['sucesso']:
+                    totais['paginas_com_falha'] += 1
+                    continue
+                itens += resultado.get('items_recebidos', 0)
+                processamento = resultado.get('processamento', {})
+                for chave in ('criados', 'atualizados', 'sem_mudancas', 'erros'):
+                    totais[chave] += processamento.get(chave, 0)
+        segundos = time.perf_counter() - inicio
+
+        return {
+            'rodada': numero,
+            'itens': itens,
+            'segundos': round(segundos, 3),
+            'itens_por_segundo': round(itens / segundos, 1) if segundos else 0,
+            'consultas': contador['consultas'],
+            'consultas_por_item': round(contador['consultas'] / itens, 4) if itens else 0,
+            **totais,
+        }
@@ -5,7 +5,7 @@ Comando para limpar dados do novo fluxo (PedidoMestre, FormulaItem)
 
 from django.core.management.base import BaseCommand
 from django.db import transaction
-from core.models import PedidoMestre, FormulaItem, HistoricoEtapaFormula, ChecklistExecucaoFormula
+from core.models import PedidoMestre, FormulaItem, HistoricoEtapaFormula, ChecklistExecucaoFormula, ContadorTarefasFuncionario
 import logging
 
 logger = logging.getLogger(__name__)
@@ -62,6 +62,7 @@ class Command(BaseCommand):
                 HistoricoEtapaFormula.objects.all().delete()
                 self.stdout.write(f'[OK] Deletados {total_historicos} HistoricoEtapaFormula')
 
+                ContadorTarefasFuncionario.recalcular_apos_excluir(FormulaItem.objects.all())
                 FormulaItem.objects.all().delete()
                 self.stdout.write(f'[OK] Deletados {total_formulas} FormulaItem')
 
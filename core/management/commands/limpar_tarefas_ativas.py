@@ -1,9 +1,9 @@
 from django.core.management.base import BaseCommand
-from core.models import FormulaItem
+from core.models import ContadorTarefasFuncionario, FormulaItem
 from django.contrib.auth.models import User
 
 class Command(BaseCommand):
-    help = 'Limpa tarefas ativas duplicadas, deixando apenas 1 por usuário'
+    help = 'Limpa tarefas ativas duplicadas, deixando apenas 1 por usuário, e recalcula o limite de tarefas'
 
     def handle(self, *args, **options):
         # Para cada usuário que tem fórmulas
@@ -54,3 +54,9 @@ class Command(BaseCommand):
             self.stdout.write(
                 self.style.SUCCESS('\n✅ Nenhuma tarefa duplicada encontrada. Sistema está OK!')
             )
+        
+        # Contador do limite de tarefas (usado pelo assumir/delegar)
+        contadores_corrigidos = ContadorTarefasFuncionario.recalcular()
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ {contadores_corrigidos} contador(es) de tarefas recalculado(s)')
+        )
@@ -0,0 +1,61 @@
+"""
+Comando para preencher os atributos derivados da descrição em fórmulas já existentes
+(tipo_produto, forma e quantidade_unidades), que a sincronização passou a gravar
+Também refaz as fórmulas gravadas sem tipo_produto cuja forma já tem TipoProduto (cadastrado
+depois da ingestão): o hash_origem delas não muda, então a sincronização não as recalcula
+Uso: python manage.py preencher_atributos_formulas [--todas] [--lote 500]
+"""
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from core.classificador_produto import ROTULOS_FORMA, atributos_derivados
+from core.models import FormulaItem, TipoProduto
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Preenche tipo_produto, forma e quantidade_unidades de FormulaItem a partir da descrição'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--todas',
+            action='store_true',
+            help='Recalcula todas as fórmulas (sem isso, apenas as sem forma ou sem tipo_produto)',
+        )
+        parser.add_argument('--lote', type=int, default=500, help='Fórmulas gravadas por UPDATE')
+
+    def handle(self, *args, **options):
+        formulas = FormulaItem.objects.only('id', 'descricao', 'tipo_produto', 'forma', 'quantidade_unidades')
+        if not options['todas']:
+            # Sem tipo_produto só é refeita a forma que hoje tem TipoProduto cadastrado
+            formas_cadastradas = [
+                ROTULOS_FORMA[tipo] for tipo in TipoProduto.objects.values_list('tipo', flat=True) if tipo in ROTULOS_FORMA
+            ]
+            formulas = formulas.filter(Q(forma='') | Q(tipo_produto__isnull=True, forma__in=formas_cadastradas))
+
+        total = formulas.count()
+        self.stdout.write(f'Fórmulas a processar: {total}')
+
+        campos = ['tipo_produto', 'forma', 'quantidade_unidades']
+        lote = []
+        atualizadas = 0
+
+        for formula in formulas.order_by('id').iterator(chunk_size=options['lote']):
+            for campo, valor in atributos_derivados(formula.descricao).items():
+                setattr(formula, campo, valor)
+            lote.append(formula)
+
+            if len(lote) >= options['lote']:
+                FormulaItem.objects.bulk_update(lote, campos)
+                atualizadas += len(lote)
+                lote = []
+                self.stdout.write(f'  {atualizadas}/{total}')
+
+        if lote:
+            FormulaItem.objects.bulk_update(lote, campos)
+            atualizadas += len(lote)
+
+        logger.info(f'[BACKFILL] Atributos derivados preenchidos em {atualizadas} fórmulas')
+        self.stdout.write(self.style.SUCCESS(f'[OK] {atualizadas} fórmulas atualizadas'))
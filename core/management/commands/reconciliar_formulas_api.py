@@ -0,0 +1,54 @@
+"""
+Reconciliação com o ERP: cancela as fórmulas em triagem que não estão mais na API
+Lê a listagem completa de todas as APIs ativas (gravando o que mudou, como uma sincronização
+normal) e cancela as ausentes. Não cancela nada se alguma leitura ficar incompleta.
+
+Uso:
+    python manage.py reconciliar_formulas_api --simular     # só conta as ausentes
+    python manage.py reconciliar_formulas_api --tamanho 1000
+"""
+
+from django.core.management.base import BaseCommand
+
+from core.reconciliacao import reconciliar_apis_ativas
+
+
+class Command(BaseCommand):
+    help = 'Cancela fórmulas em triagem que sumiram da API (leitura completa de todas as APIs ativas)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanho', type=int, default=500, help='Itens por página na leitura completa')
+        parser.add_argument('--limite-paginas', type=int, default=10000, help='Máximo de páginas lidas por API')
+        parser.add_argument('--simular', action='store_true', help='Apenas conta as fórmulas ausentes, sem cancelar')
+        parser.add_argument(
+            '--fracao-maxima',
+            type=float,
+            help='Aborta se a fração de abertas ausentes passar deste valor (padrão: RECONCILIACAO_FRACAO_MAXIMA)',
+        )
+
+    def handle(self, *args, **options):
+        resultado = reconciliar_apis_ativas(
+            tamanho_pagina=options['tamanho'],
+            limite_paginas=options['limite_paginas'],
+            simular=options['simular'],
+            fracao_maxima=options['fracao_maxima'],
+        )
+
+        for nome, leitura in resultado['apis'].items():
+            self.stdout.write(f"   {nome}: {leitura['paginas']} página(s), {leitura['ids']} IDs")
+
+        if resultado['motivo']:
+            self.stdout.write(self.style.WARNING(f"[IGNORADO] Reconciliação abortada: {resultado['motivo']}"))
+            return
+
+        cancelamento = resultado['cancelamento']
+        resumo = (
+            f"{resultado['ids_erp']} IDs no ERP, {cancelamento['abertas']} fórmulas abertas, "
+            f"{cancelamento['ausentes']} ausentes"
+        )
+        if cancelamento['abortada']:
+            self.stdout.write(self.style.ERROR(f'[ERRO] {resumo}: acima do limite, nada cancelado'))
+        elif options['simular']:
+            self.stdout.write(self.style.WARNING(f'[SIMULACAO] {resumo}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"[OK] {resumo}, {cancelamento['canceladas']} canceladas"))
@@ -1,10 +1,14 @@
 """
 Comando Django para gerenciar o scheduler de sincronização
 Uso: python manage.py scheduler [start|stop|status|agora]
+O scheduler em si roda no processo dedicado: python manage.py sync_worker
 """
 
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
-from core.scheduler import AgendadorSincronizacao, SincronizadorAPI
+from core.metricas_sincronizacao import resumo_execucoes
+from core.models import AgendamentoSincronizacao
+from core.scheduler import AgendadorSincronizacao
 import logging
 
 logger = logging.getLogger(__name__)
@@ -21,45 +25,93 @@ class Command(BaseCommand):
             choices=['start', 'stop', 'status', 'agora'],
             help='Ação a executar (start, stop, status, agora)'
         )
+        parser.add_argument(
+            '--execucoes',
+            type=int,
+            default=10,
+            help='Quantidade de execuções recentes exibidas no status'
+        )
     
     def handle(self, *args, **options):
         acao = options['acao']
         
         if acao == 'start':
-            self.stdout.write(self.style.SUCCESS('Iniciando scheduler...'))
-            AgendadorSincronizacao.iniciar()
-            self.stdout.write(self.style.SUCCESS('✓ Scheduler iniciado com sucesso!'))
+            # O scheduler só roda no processo dedicado, que fica em primeiro plano
+            self.stdout.write(self.style.SUCCESS('Iniciando scheduler (sync_worker)...'))
+            call_command('sync_worker')
             
         elif acao == 'stop':
-            self.stdout.write(self.style.WARNING('Parando scheduler...'))
-            AgendadorSincronizacao.parar()
-            self.stdout.write(self.style.SUCCESS('✓ Scheduler parado com sucesso!'))
+            self.stdout.write(self.style.WARNING(
+                'O scheduler roda no processo sync_worker: envie SIGTERM a ele '
+                '(a sincronização em andamento termina a página atual e para)'
+            ))
             
         elif acao == 'status':
             status = AgendadorSincronizacao.obter_status()
             self.stdout.write(self.style.HTTP_INFO('Status do Scheduler:'))
             
-            if status['ativo']:
+            lider_atual = status['lider_atual']
+            if lider_atual:
+                self.stdout.write(f"  Líder: {lider_atual['dono']} (lease até {lider_atual['expira_em'][:19]})")
+            else:
+                self.stdout.write(self.style.WARNING('  Líder: nenhum processo detém a liderança'))
+            
+            # Com líder ativo há um sync_worker executando os agendamentos
+            if lider_atual:
                 self.stdout.write(self.style.SUCCESS('  Status: ✓ ATIVO'))
-                self.stdout.write(f"\n  Jobs agendados ({len(status['jobs'])}):")
-                for job in status['jobs']:
-                    self.stdout.write(f"    • {job['nome']}")
-                    self.stdout.write(f"      ID: {job['id']}")
-                    self.stdout.write(f"      Próxima execução: {job['proxima_execucao']}")
-                    self.stdout.write(f"      Intervalo: {job['intervalo']}")
             else:
-                self.stdout.write(self.style.WARNING('  Status: ✗ INATIVO'))
+                self.stdout.write(self.style.WARNING('  Status: ✗ INATIVO (inicie com: python manage.py sync_worker)'))
             
-            # Mostra configuração atual
+            # Mostra configuração atual (agendamentos ativos no banco)
             self.stdout.write(f"\n  Configurações:")
-            self.stdout.write(f"    • URL Base: {SincronizadorAPI.CONFIG['url_base']}")
-            self.stdout.write(f"    • Intervalo: {SincronizadorAPI.CONFIG['intervalo_minutos']} minuto(s)")
-            self.stdout.write(f"    • Paginações: {len(SincronizadorAPI.CONFIG['paginacoes'])}")
-            for pag in SincronizadorAPI.CONFIG['paginacoes']:
-                self.stdout.write(f"      - Página {pag['pagina']}, Tamanho {pag['tamanho']}")
-            self.stdout.write(f"    • Ativo: {'Sim' if SincronizadorAPI.CONFIG['ativo'] else 'Não'}")
+            agendamentos = AgendamentoSincronizacao.objects.select_related('api').filter(ativo=True, api__ativa=True)
+            for agendamento in agendamentos:
+                self.stdout.write(f"    • {agendamento.api.nome} - {agendamento.nome}")
+                self.stdout.write(f"      URL Base: {agendamento.api.url_base}")
+                self.stdout.write(f"      Horário: {agendamento.horario_execucao:%H:%M}")
+                if agendamento.modo_paginacao == 'automatica':
+                    self.stdout.write(f"      Paginação: automática ({agendamento.tamanho_pagina} itens/página)")
+                else:
+                    self.stdout.write(f"      Paginações: {len(agendamento.obter_paginacoes())}")
+            if not agendamentos:
+                self.stdout.write("    • Nenhum agendamento ativo")
+            
+            self.exibir_execucoes(options['execucoes'])
             
         elif acao == 'agora':
             self.stdout.write(self.style.SUCCESS('Executando sincronização manual...'))
-            AgendadorSincronizacao.sincronizar_agora()
+            for resultado in AgendadorSincronizacao.sincronizar_agora():
+                if resultado['erro']:
+                    situacao = f"erro: {resultado['erro']}"
+                elif resultado['ignorada']:
+                    situacao = 'ignorada'
+                else:
+                    situacao = f"{resultado['totais']['itens']} itens, {resultado['totais']['paginas_com_falha']} página(s) com falha"
+                self.stdout.write(f"  • {resultado['api']}: {situacao} ({resultado['tempo_segundos']:.1f}s)")
             self.stdout.write(self.style.SUCCESS('✓ Sincronização concluída!'))
+    
+    def exibir_execucoes(self, limite):
+        """Mostra as últimas execuções e os percentis de latência HTTP x gravação"""
+        resumo = resumo_execucoes(limite)
+        self.stdout.write(f"\n  Últimas execuções ({resumo['quantidade']}, {resumo['paginas']} páginas):")
+        if not resumo['execucoes']:
+            self.stdout.write("    • Nenhuma execução registrada")
+            return
+        
+        http = resumo['latencia_http_ms']
+        gravacao = resumo['tempo_gravacao_ms']
+        self.stdout.write(f"    • Latência HTTP por página: p50 {http['p50']}ms, p95 {http['p95']}ms")
+        self.stdout.write(f"    • Gravação por página:      p50 {gravacao['p50']}ms, p95 {gravacao['p95']}ms")
+        
+        for execucao in resumo['execucoes']:
+            linha = (
+                f"    {execucao['iniciada_em'][:19]}  {execucao['api']}  [{execucao['status']}]  "
+                f"{execucao['paginas']} pág, {execucao['itens_recebidos']} itens: "
+                f"{execucao['criados']} criados, {execucao['atualizados']} atualizados, "
+                f"{execucao['sem_mudancas']} sem mudanças, {execucao['erros']} erros"
+            )
+            if execucao['duracao_segundos'] is not None:
+                linha += f" em {execucao['duracao_segundos']}s"
+            if execucao['itens_por_segundo'] is not None:
+                linha += f" ({execucao['itens_por_segundo']} itens/s)"
+            self.stdout.write(self.style.ERROR(linha) if execucao['status'] == 'falhou' else linha)
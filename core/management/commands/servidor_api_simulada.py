@@ -0,0 +1,58 @@
+"""
+Servidor local que imita o endpoint FC0M100 para testes de carga offline
+Uso: python manage.py servidor_api_simulada --porta 8765 --itens 50000 --taxa-mudanca 0.02 --latencia 0.15 --taxa-erro 0.01
+Depois aponte uma ConfiguracaoAPI para http://127.0.0.1:8765/tabelas/FC0M100
+"""
+
+from django.core.management.base import BaseCommand
+
+from core.api_simulada import DadosSimulados, ServidorSimulado
+
+
+class Command(BaseCommand):
+    help = 'Serve uma versão sintética do endpoint FC0M100 (volume, mudanças, latência e erros configuráveis)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Endereço de escuta')
+        parser.add_argument('--porta', type=int, default=8765, help='Porta de escuta')
+        parser.add_argument('--itens', type=int, default=10000, help='Total de itens servidos')
+        parser.add_argument('--itens-por-pedido', type=int, default=3, help='Itens (fórmulas) por NRORC')
+        parser.add_argument(
+            '--taxa-mudanca', type=float, default=0.02,
+            help='Fração dos itens alterados a cada rodada (cada pedido da página 1 inicia uma rodada)',
+        )
+        parser.add_argument('--latencia', type=float, default=0.0, help='Latência fixa por requisição (segundos)')
+        parser.add_argument('--variacao-latencia', type=float, default=0.0, help='Latência extra aleatória até este valor (segundos)')
+        parser.add_argument('--taxa-erro', type=float, default=0.0, help='Fração das requisições respondidas com 503')
+        parser.add_argument('--semente', type=int, default=42, help='Semente dos dados e das falhas (reprodutível)')
+
+    def handle(self, *args, **options):
+        dados = DadosSimulados(
+            options['itens'],
+            taxa_mudanca=options['taxa_mudanca'],
+            itens_por_pedido=options['itens_por_pedido'],
+            semente=options['semente'],
+        )
+        servidor = ServidorSimulado(
+            dados,
+            host=options['host'],
+            porta=options['porta'],
+            latencia=options['latencia'],
+            variacao_latencia=options['variacao_latencia'],
+            taxa_erro=options['taxa_erro'],
+            semente=options['semente'],
+        )
+
+        self.stdout.write(self.style.SUCCESS(f'[OK] FC0M100 simulado em {servidor.url_base}'))
+        self.stdout.write(
+            f"   {options['itens']} itens, mudança {options['taxa_mudanca']:.1%} por rodada, "
+            f"latência {options['latencia']}s (+{options['variacao_latencia']}s), erros {options['taxa_erro']:.1%}"
+        )
+        self.stdout.write('   Ctrl+C para encerrar')
+        try:
+            servidor.servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.servidor.server_close()
+            self.stdout.write('Servidor encerrado')
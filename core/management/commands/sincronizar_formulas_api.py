@@ -1,73 +1,27 @@
 """
 Sincronizador de API reformulado para o novo fluxo com PedidoMestre e FormulaItem
 Agrupa pedidos por NRORC ao invés de criar um Pedido por item
+Usa o mesmo pipeline de ingestão do scheduler (core.ingestao via SincronizadorAPI.sincronizar_api)
+
+Reprodução de cassetes gravados (ConfiguracaoAPI.gravar_respostas), sem chamar a API:
+    python manage.py sincronizar_formulas_api --replay cassetes_api/api_1/2026-03-02.jsonl.gz
+
+Cargas grandes (backfill): --staging grava as linhas em LinhaBrutaAPI e mescla cada página por SQL
+    python manage.py sincronizar_formulas_api --staging --replay cassetes_api/
 """
 
 import logging
-import requests
-import re
-from datetime import datetime
-from decimal import Decimal
+from time import perf_counter
 from django.core.management.base import BaseCommand
-from django.db import IntegrityError, transaction
-from django.utils import timezone
-from core.models import (
-    PedidoMestre, FormulaItem, Etapa, TipoProduto,
-    ConfiguracaoAPI, AgendamentoSincronizacao
+from core.models import ConfiguracaoAPI
+from core.ingestao import (
+    limpar_linhas_brutas, paginas_de_cassetes, pipeline_padrao, pipeline_staging, totalizar,
 )
-from core.api_sync_helpers import sincronizar_datetime_api
+from core.scheduler import SincronizadorAPI
 
 logger = logging.getLogger(__name__)
 
 
-def extrair_tipo_produto(descricao_web):
-    """Extrai o tipo de produto da descrição"""
-    if not descricao_web:
-        return None, 'desconhecido'
-    
-    descricao_upper = descricao_web.upper()
-    
-    padroes = {
-        'capsula': ['CAPSULA', 'CAP'],
-        'sache': ['SACHE', 'SACHÊ', 'ENVELOPE'],
-        'liquido_pediatrico': ['ML', 'LIQUIDO', 'LÍQUIDO', 'XAROPE', 'TCM LIQUIDO'],
-        'creme': ['CREME', 'POMADA', 'PENTRAVAN', 'GEL'],
-        'lotion': ['LOÇÃO', 'LOCION'],
-        'shampoo': ['SHAMPOO'],
-        'shot': ['SHOT'],
-        'ovulo': ['ÓVULO', 'OVULO'],
-        'comprimido_sublingual': ['SUBLINGUAL', 'PASTILHA'],
-        'capsula_oleosa': ['OLEOSA', 'OLEOSO'],
-        'goma': ['GOMA', 'GUMMY'],
-        'chocolate': ['CHOCOLATE'],
-        'filme': ['FILME'],
-    }
-    
-    for tipo_chave, palavras in padroes.items():
-        for palavra in palavras:
-            if palavra in descricao_upper:
-                try:
-                    tipo_obj = TipoProduto.objects.get(tipo=tipo_chave)
-                    return tipo_obj, tipo_chave
-                except TipoProduto.DoesNotExist:
-                    return None, tipo_chave
-    
-    return None, 'desconhecido'
-
-
-def extrair_volume(descricao_web):
-    """Extrai o volume em ML da descrição"""
-    if not descricao_web:
-        return None
-    
-    # Busca padrões como "10ML", "60 ML", etc
-    match = re.search(r'(\d+)\s*ML', descricao_web.upper())
-    if match:
-        return f"{match.group(1)}ML"
-    
-    return None
-
-
 class Command(BaseCommand):
     help = 'Sincroniza pedidos da API (novo fluxo com FormulaItem)'
     
@@ -75,8 +29,26 @@ class Command(BaseCommand):
         parser.add_argument('--api_id', type=int, help='ID da API a sincronizar (se não informado, usa todas ativas)')
         parser.add_argument('--pagina', type=int, default=1, help='Página inicial')
         parser.add_argument('--tamanho', type=int, default=50, help='Tamanho da página')
+        parser.add_argument(
+            '--replay',
+            metavar='CAMINHO',
+            help='Reprocessa páginas gravadas (arquivo .jsonl.gz ou diretório de cassetes) em vez de chamar a API',
+        )
+        parser.add_argument(
+            '--staging',
+            action='store_true',
+            help='Ingestão via LinhaBrutaAPI + mesclagem em SQL (INSERT ... ON CONFLICT), para cargas grandes',
+        )
     
     def handle(self, *args, **options):
+        pipeline = pipeline_padrao
+        if options.get('staging'):
+            pipeline = pipeline_staging
+            limpar_linhas_brutas()
+        
+        if options.get('replay'):
+            return self.reproduzir(options['replay'], options.get('api_id'), pipeline)
+        
         try:
             api_id = options.get('api_id')
             pagina_inicial = options.get('pagina', 1)
@@ -92,147 +64,61 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.WARNING('Nenhuma API ativa encontrada'))
                 return
             
-            total_criados = 0
-            total_atualizados = 0
-            total_erros = 0
+            paginacoes = [{'pagina': pagina_inicial, 'tamanho': tamanho_pagina}]
             
-            for api in apis:
-                resultado = self.sincronizar_api(api, pagina_inicial, tamanho_pagina)
-                total_criados += resultado['criados']
-                total_atualizados += resultado['atualizados']
-                total_erros += resultado['erros']
+            # APIs em paralelo (até SYNC_APIS_PARALELAS), cada uma com seus erros e totais
+            self.stdout.write(f'Sincronizando {apis.count()} API(s) (página {pagina_inicial}, tamanho {tamanho_pagina})...')
+            trabalhos = [
+                (api.nome, lambda api=api: SincronizadorAPI.sincronizar_api(api, paginacoes, incremental=False, pipeline=pipeline))
+                for api in apis
+            ]
+            for resultado in SincronizadorAPI.sincronizar_em_paralelo(trabalhos):
+                nome, tempo = resultado['api'], resultado['tempo_segundos']
+                if resultado['erro']:
+                    self.stdout.write(self.style.ERROR(f'\n[ERRO] {nome} ({tempo:.1f}s): {resultado["erro"]}'))
+                    continue
+                # Circuito aberto ou API já em sincronização em outro processo
+                if resultado['ignorada']:
+                    self.stdout.write(self.style.WARNING(f'\n[IGNORADO] {nome}: circuito aberto ou sincronização em andamento'))
+                    continue
                 
-                self.stdout.write(self.style.SUCCESS(f'\n[OK] Sincronização de {api.nome} concluída!'))
-                self.stdout.write(f'   Pedidos Mestres criados: {resultado["pedidos_mestres_criados"]}')
-                self.stdout.write(f'   Formulas criadas: {resultado["formulas_criadas"]}')
-                self.stdout.write(f'   Formulas atualizadas: {total_atualizados}')
-                if total_erros > 0:
-                    self.stdout.write(self.style.WARNING(f'   Erros: {total_erros}'))
+                total = resultado['totais']
+                self.stdout.write(self.style.SUCCESS(f'\n[OK] Sincronização de {nome} concluída em {tempo:.1f}s!'))
+                self.stdout.write(f'   Itens recebidos: {total["itens"]}')
+                self.stdout.write(f'   Criados (pedidos + fórmulas): {total["criados"]}')
+                self.stdout.write(f'   Formulas atualizadas: {total["atualizados"]}')
+                self.stdout.write(f'   Formulas sem mudanças: {total["sem_mudancas"]}')
+                if total['erros'] or total['paginas_com_falha']:
+                    self.stdout.write(self.style.WARNING(
+                        f'   Erros: {total["erros"]} item(ns), {total["paginas_com_falha"]} página(s) com falha'
+                    ))
         
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Erro geral: {str(e)}'))
     
-    def sincronizar_api(self, api, pagina, tamanho):
-        """Sincroniza uma API específica"""
-        resultado = {
-            'criados': 0,
-            'atualizados': 0,
-            'erros': 0,
-            'pedidos_mestres_criados': 0,
-            'formulas_criadas': 0,
-        }
-        
-        try:
-            url = f"{api.url_base}?pagina={pagina}&tamanho={tamanho}"
-            headers = api.obter_headers_requisicao()
-            
-            self.stdout.write(f'Sincronizando {api.nome} ({url})...')
-            
-            response = requests.get(url, headers=headers, timeout=api.timeout)
-            response.raise_for_status()
-            
-            dados = response.json()
-            pedidos_data = dados.get('dados', [])
-            
-            if not pedidos_data:
-                self.stdout.write(self.style.WARNING('Nenhum pedido encontrado na API'))
-                return resultado
-            
-            # Agrupar dados por NRORC
-            pedidos_por_nrorc = {}
-            for item in pedidos_data:
-                nrorc = item.get('NRORC')
-                if nrorc:
-                    if nrorc not in pedidos_por_nrorc:
-                        pedidos_por_nrorc[nrorc] = []
-                    pedidos_por_nrorc[nrorc].append(item)
-            
-            # Processar cada NRORC (que é um PedidoMestre com N FormulaItems)
-            for nrorc, items_formula in pedidos_por_nrorc.items():
-                try:
-                    with transaction.atomic():
-                        # Obter ou criar PedidoMestre
-                        pedido_mestre, created = PedidoMestre.objects.get_or_create(
-                            nrorc=nrorc,
-                            defaults={'status': 'em_processamento'}
-                        )
-                        
-                        if created:
-                            resultado['pedidos_mestres_criados'] += 1
-                        
-                        # Processar cada fórmula deste pedido
-                        for item in items_formula:
-                            try:
-                                id_api = item.get('ID')
-                                descricao = item.get('DESCRICAOWEB', '')
-                                quantidade = item.get('QUANT', 1)
-                                serieo = item.get('SERIEO', '')
-                                pruni = item.get('PRUNI')
-                                vrtot = item.get('VRTOT')
-                                dtalt = item.get('DTALT')
-                                hralt = item.get('HRALT')
-                                
-                                if not id_api:
-                                    continue  # Pular item sem ID
-                                
-                                # Extrair volume
-                                volume_ml = extrair_volume(descricao)
-                                
-                                # Extrair tipo de produto
-                                tipo_produto, tipo_identificado = extrair_tipo_produto(descricao)
-                                
-                                # Obter etapa inicial (triagem)
-                                etapa_inicial = Etapa.objects.filter(
-                                    sequencia=1, ativa=True
-                                ).first()
-                                
-                                if not etapa_inicial:
-                                    etapa_inicial = Etapa.objects.filter(ativa=True).order_by('sequencia').first()
-                                
-                                # Obter ou criar FormulaItem
-                                formula, formula_created = FormulaItem.objects.get_or_create(
-                                    id_api=str(id_api),
-                                    defaults={
-                                        'pedido_mestre': pedido_mestre,
-                                        'descricao': descricao[:200] if descricao else f'Formula {id_api}',
-                                        'quantidade': quantidade,
-                                        'volume_ml': volume_ml or '',
-                                        'serieo': serieo,
-                                        'price_unit': Decimal(str(pruni)) if pruni else None,
-                                        'price_total': Decimal(str(vrtot)) if vrtot else None,
-                                        'status': 'em_triagem',
-                                        'etapa_atual': etapa_inicial,
-                                    }
-                                )
-                                
-                                # Sincronizar datetime da API (DTALT + HRALT)
-                                if dtalt or hralt:
-                                    sincronizar_datetime_api(formula, dtalt, hralt)
-                                
-                                if formula_created:
-                                    resultado['formulas_criadas'] += 1
-                                else:
-                                    # Atualizar fórmula existente
-                                    formula.descricao = descricao[:200] if descricao else formula.descricao
-                                    formula.quantidade = quantidade
-                                    formula.price_unit = Decimal(str(pruni)) if pruni else formula.price_unit
-                                    formula.price_total = Decimal(str(vrtot)) if vrtot else formula.price_total
-                                    formula.save()
-                                    resultado['atualizados'] += 1
-                                
-                                resultado['criados'] += 1
-                            
-                            except Exception as e:
-                                resultado['erros'] += 1
-                                logger.warning(f'Erro ao processar fórmula {id_api}: {str(e)}')
-                
-                except Exception as e:
-                    resultado['erros'] += 1
-                    logger.warning(f'Erro ao processar NRORC {nrorc}: {str(e)}')
+    def reproduzir(self, caminho, api_id=None, pipeline=pipeline_padrao):
+        """
+        Passa as páginas gravadas pelo mesmo pipeline da sincronização agendada
+        (cassete como fonte, parser em streaming, mesma gravação), sem pausas, e mede a vazão
+        """
+        self.stdout.write(f'Reproduzindo cassetes de {caminho}...')
+        inicio = perf_counter()
+        resultados = list(pipeline.processar_paginas(paginas_de_cassetes(caminho, api_id=api_id)))
+        tempo_total = perf_counter() - inicio
         
-        except Exception as e:
-            resultado['erros'] += 1
-            logger.error(f'Erro ao sincronizar API {api.nome}: {str(e)}')
-            self.stdout.write(self.style.ERROR(f'Erro: {str(e)}'))
+        if not resultados:
+            self.stdout.write(self.style.WARNING('Nenhuma página encontrada nos cassetes'))
+            return
         
-        return resultado
+        totais = totalizar(resultados)
+        # Páginas com corpo inválido voltam sem tempo de gravação
+        tempo_gravacao = sum(r.get('tempo_gravacao_ms', 0) for r in resultados) / 1000
+        self.stdout.write(self.style.SUCCESS(f'\n[OK] Reprodução concluída: {totais["paginas"]} páginas, {totais["itens"]} itens'))
+        self.stdout.write(f'   Criados: {totais["criados"]}, atualizados: {totais["atualizados"]}, sem mudanças: {totais["sem_mudancas"]}')
+        self.stdout.write(f'   Decodificação + gravação: {tempo_gravacao:.2f}s')
+        if tempo_total:
+            self.stdout.write(f'   Vazão: {totais["itens"] / tempo_total:.0f} itens/s')
+        if totais['erros'] or totais['paginas_com_falha']:
+            self.stdout.write(self.style.WARNING(
+                f'   Erros: {totais["erros"]} item(ns), {totais["paginas_com_falha"]} página(s) com falha'
+            ))
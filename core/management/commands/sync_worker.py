@@ -0,0 +1,112 @@
+"""
+Processo dedicado de sincronização com a API
+Executa os agendamentos de AgendamentoSincronizacao fora do servidor web, para que
+a sincronização não dispute CPU e banco com as requisições e não morra a cada deploy do web.
+
+Uso:
+    python manage.py sync_worker                 # roda até receber SIGTERM/SIGINT
+    python manage.py sync_worker --verificar     # healthcheck: sai com erro se o worker parou de responder
+
+Com vários workers, apenas o líder (trava 'lider_agendador') executa os jobs; os demais
+ficam de reserva. No SIGTERM a sincronização em andamento termina a página atual e para.
+"""
+
+import json
+import os
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.scheduler import AgendadorSincronizacao, SincronizadorAPI
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Executa o scheduler de sincronização da API como processo dedicado'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--arquivo-vida',
+            default=settings.SYNC_WORKER_ARQUIVO_VIDA,
+            help='Arquivo JSON reescrito a cada intervalo enquanto o worker está vivo',
+        )
+        parser.add_argument(
+            '--intervalo-vida',
+            type=int,
+            default=settings.SYNC_WORKER_INTERVALO_VIDA,
+            help='Segundos entre as atualizações do arquivo de vida',
+        )
+        parser.add_argument(
+            '--verificar',
+            action='store_true',
+            help='Apenas verifica se o worker está vivo (arquivo de vida recente) e sai',
+        )
+
+    def handle(self, *args, **options):
+        arquivo_vida = options['arquivo_vida']
+        intervalo = max(1, options['intervalo_vida'])
+
+        if options['verificar']:
+            return self.verificar_vida(arquivo_vida, intervalo)
+
+        parar = threading.Event()
+
+        def solicitar_parada(signum, frame):
+            logger.info(f"[SYNC_WORKER] Sinal {signal.Signals(signum).name} recebido, encerrando após a página atual...")
+            parar.set()
+            SincronizadorAPI.parada_solicitada.set()
+
+        signal.signal(signal.SIGTERM, solicitar_parada)
+        signal.signal(signal.SIGINT, solicitar_parada)
+
+        AgendadorSincronizacao.iniciar()
+        self.stdout.write(self.style.SUCCESS(f'[OK] sync_worker iniciado (pid {os.getpid()})'))
+
+        try:
+            self.registrar_vida(arquivo_vida)
+            while not parar.wait(intervalo):
+                self.registrar_vida(arquivo_vida)
+        finally:
+            # shutdown aguarda o job em andamento, que para ao fim da página atual
+            AgendadorSincronizacao.parar()
+            if os.path.exists(arquivo_vida):
+                os.remove(arquivo_vida)
+            self.stdout.write(self.style.SUCCESS('[OK] sync_worker encerrado'))
+
+    def registrar_vida(self, arquivo_vida):
+        """Reescreve o arquivo de vida (troca atômica para o healthcheck nunca ler meio arquivo)"""
+        status = AgendadorSincronizacao.obter_status()
+        conteudo = {
+            'pid': os.getpid(),
+            'processo': status['processo'],
+            'lider': status['lider'],
+            'jobs': len(status['jobs']),
+            'atualizado_em': timezone.now().isoformat(),
+        }
+        temporario = f'{arquivo_vida}.tmp'
+        with open(temporario, 'w') as arquivo:
+            json.dump(conteudo, arquivo)
+        os.replace(temporario, arquivo_vida)
+
+    def verificar_vida(self, arquivo_vida, intervalo):
+        """Healthcheck: falha se o arquivo de vida não existir ou tiver mais de 3 intervalos"""
+        try:
+            idade = time.time() - os.path.getmtime(arquivo_vida)
+            with open(arquivo_vida) as arquivo:
+                conteudo = json.load(arquivo)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'sync_worker sem arquivo de vida válido: {e}')
+
+        if idade > intervalo * 3:
+            raise CommandError(f'sync_worker sem sinal de vida há {idade:.0f}s')
+
+        papel = 'líder' if conteudo.get('lider') else 'reserva'
+        self.stdout.write(self.style.SUCCESS(
+            f"[OK] sync_worker vivo (pid {conteudo.get('pid')}, {papel}, {conteudo.get('jobs')} jobs, há {idade:.0f}s)"
+        ))
@@ -0,0 +1,81 @@
+"""
+Resumo das últimas execuções de sincronização (ExecucaoSincronizacao/PaginaSincronizacao)
+Usado pela view de status do scheduler e pelo comando `scheduler status`
+"""
+
+import math
+
+from core.models import ExecucaoSincronizacao, PaginaSincronizacao
+
+
+def percentil(valores, p):
+    """
+    Percentil p (0-100) por interpolação linear entre os vizinhos
+    Retorna None para lista vazia
+    """
+    valores = sorted(v for v in valores if v is not None)
+    if not valores:
+        return None
+    posicao = (len(valores) - 1) * p / 100
+    abaixo = math.floor(posicao)
+    acima = math.ceil(posicao)
+    if abaixo == acima:
+        return valores[abaixo]
+    return valores[abaixo] + (valores[acima] - valores[abaixo]) * (posicao - abaixo)
+
+
+def _arredondar(valor, casas=1):
+    return round(valor, casas) if valor is not None else None
+
+
+def resumo_execucoes(limite=20):
+    """
+    Últimas `limite` execuções com totais e os percentis p50/p95 por página
+    de latência HTTP e de tempo de gravação (separa lentidão da API da do banco)
+    """
+    execucoes = list(
+        ExecucaoSincronizacao.objects.select_related('api', 'agendamento')[:limite]
+    )
+    tempos = list(
+        PaginaSincronizacao.objects
+        .filter(execucao__in=[e.pk for e in execucoes])
+        .values_list('latencia_http_ms', 'tempo_gravacao_ms')
+    )
+    latencias = [latencia for latencia, _ in tempos]
+    gravacoes = [gravacao for _, gravacao in tempos]
+
+    return {
+        'quantidade': len(execucoes),
+        'paginas': len(tempos),
+        'latencia_http_ms': {
+            'p50': _arredondar(percentil(latencias, 50)),
+            'p95': _arredondar(percentil(latencias, 95)),
+        },
+        'tempo_gravacao_ms': {
+            'p50': _arredondar(percentil(gravacoes, 50)),
+            'p95': _arredondar(percentil(gravacoes, 95)),
+        },
+        'execucoes': [
+            {
+                'id': e.pk,
+                'api': e.api.nome,
+                'agendamento': e.agendamento.nome if e.agendamento else None,
+                'status': e.status,
+                'iniciada_em': e.iniciada_em.isoformat(),
+                'finalizada_em': e.finalizada_em.isoformat() if e.finalizada_em else None,
+                'duracao_segundos': _arredondar(e.duracao_segundos, 2),
+                'paginas': e.total_paginas,
+                'bytes_recebidos': e.bytes_recebidos,
+                'itens_recebidos': e.itens_recebidos,
+                'criados': e.criados,
+                'atualizados': e.atualizados,
+                'sem_mudancas': e.sem_mudancas,
+                'erros': e.erros,
+                'antigos': e.antigos,
+                'tempo_http_ms': _arredondar(e.tempo_http_ms),
+                'tempo_gravacao_ms': _arredondar(e.tempo_gravacao_ms),
+                'itens_por_segundo': _arredondar(e.itens_por_segundo),
+            }
+            for e in execucoes
+        ],
+    }
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-17 21:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_add_delegacao_tarefa'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='configuracaoapi',
+            name='sincronizacao_incremental',
+            field=models.BooleanField(default=True, help_text="Ignora itens com DTALT/HRALT até a marca d'água e para a paginação quando uma página só tem itens antigos"),
+        ),
+        migrations.AddField(
+            model_name='configuracaoapi',
+            name='ultima_atualizacao_api',
+            field=models.DateTimeField(blank=True, help_text="Marca d'água: maior DTALT + HRALT já sincronizado (limpe para forçar uma sincronização completa)", null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-17 21:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_configuracaoapi_marca_dagua'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='configuracaoapi',
+            name='requisicoes_paralelas',
+            field=models.PositiveSmallIntegerField(default=4, help_text='Quantidade máxima de páginas buscadas ao mesmo tempo (conexões mantidas abertas na sessão)'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.1 on 2026-10-17 21:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_configuracaoapi_requisicoes_paralelas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agendamentosincronizacao',
+            name='limite_paginas',
+            field=models.PositiveIntegerField(default=1000, help_text='Máximo de páginas por execução no modo automático (proteção contra API que ignora a paginação)'),
+        ),
+        migrations.AddField(
+            model_name='agendamentosincronizacao',
+            name='modo_paginacao',
+            field=models.CharField(choices=[('fixa', 'Fixa (lista de paginações)'), ('automatica', 'Automática (até a API retornar página vazia)')], default='fixa', help_text="Fixa usa a lista de paginações; automática busca da página 1 até a API retornar 'dados' vazio", max_length=20),
+        ),
+        migrations.AddField(
+            model_name='agendamentosincronizacao',
+            name='tamanho_pagina',
+            field=models.PositiveIntegerField(default=50, help_text='Itens por página no modo automático'),
+        ),
+        migrations.AlterField(
+            model_name='agendamentosincronizacao',
+            name='paginacoes',
+            field=models.JSONField(blank=True, default=list, help_text='Lista de dicts com paginações (ex: [{"pagina": 1, "tamanho": 50}, {"pagina": 2, "tamanho": 50}])'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-17 21:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_agendamento_paginacao_automatica'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='formulaitem',
+            name='forma',
+            field=models.CharField(blank=True, db_index=True, help_text='Forma farmacêutica identificada na descrição (ex: Cápsula, Sachê)', max_length=30),
+        ),
+        migrations.AddField(
+            model_name='formulaitem',
+            name='quantidade_unidades',
+            field=models.PositiveIntegerField(blank=True, help_text='Unidades extraídas da descrição (ex: CAPSULA: 60CAP -> 60)', null=True),
+        ),
+        migrations.AddField(
+            model_name='formulaitem',
+            name='tipo_produto',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='formulas', to='core.tipoproduto'),
+        ),
+    ]
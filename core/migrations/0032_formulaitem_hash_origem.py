@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-17 21:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0031_formulaitem_atributos_derivados'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='formulaitem',
+            name='hash_origem',
+            field=models.CharField(blank=True, default='', help_text='Hash (sha1) da linha de origem na API; se não mudar, a sincronização ignora o item', max_length=40),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.0.1 on 2026-10-17 21:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_formulaitem_hash_origem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExecucaoSincronizacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('em_andamento', 'Em andamento'), ('concluida', 'Concluída'), ('com_erros', 'Concluída com erros'), ('falhou', 'Falhou')], db_index=True, default='em_andamento', max_length=20)),
+                ('iniciada_em', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('finalizada_em', models.DateTimeField(blank=True, null=True)),
+                ('total_paginas', models.PositiveIntegerField(default=0)),
+                ('bytes_recebidos', models.PositiveBigIntegerField(default=0)),
+                ('itens_recebidos', models.PositiveIntegerField(default=0)),
+                ('criados', models.PositiveIntegerField(default=0)),
+                ('atualizados', models.PositiveIntegerField(default=0)),
+                ('sem_mudancas', models.PositiveIntegerField(default=0)),
+                ('erros', models.PositiveIntegerField(default=0)),
+                ('antigos', models.PositiveIntegerField(default=0)),
+                ('tempo_http_ms', models.FloatField(default=0, help_text='Soma da latência HTTP das páginas (ms)')),
+                ('tempo_gravacao_ms', models.FloatField(default=0, help_text='Soma do tempo de gravação no banco das páginas (ms)')),
+                ('mensagem_erro', models.TextField(blank=True)),
+                ('agendamento', models.ForeignKey(blank=True, help_text='Agendamento que originou a execução', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='execucoes', to='core.agendamentosincronizacao')),
+                ('api', models.ForeignKey(help_text='API sincronizada', on_delete=django.db.models.deletion.CASCADE, related_name='execucoes', to='core.configuracaoapi')),
+            ],
+            options={
+                'verbose_name': 'Execução de Sincronização',
+                'verbose_name_plural': 'Execuções de Sincronização',
+                'ordering': ['-iniciada_em'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PaginaSincronizacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pagina', models.PositiveIntegerField()),
+                ('sucesso', models.BooleanField(default=True)),
+                ('status_http', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('erro', models.CharField(blank=True, max_length=500)),
+                ('latencia_http_ms', models.FloatField(blank=True, help_text='Da requisição até o fim da leitura do corpo (ms)', null=True)),
+                ('bytes_recebidos', models.PositiveIntegerField(default=0)),
+                ('itens_recebidos', models.PositiveIntegerField(default=0)),
+                ('criados', models.PositiveIntegerField(default=0)),
+                ('atualizados', models.PositiveIntegerField(default=0)),
+                ('sem_mudancas', models.PositiveIntegerField(default=0)),
+                ('erros', models.PositiveIntegerField(default=0)),
+                ('antigos', models.PositiveIntegerField(default=0)),
+                ('tempo_gravacao_ms', models.FloatField(blank=True, help_text='Tempo de processamento e gravação no banco (ms)', null=True)),
+                ('registrada_em', models.DateTimeField(auto_now_add=True)),
+                ('execucao', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='paginas', to='core.execucaosincronizacao')),
+            ],
+            options={
+                'verbose_name': 'Página de Sincronização',
+                'verbose_name_plural': 'Páginas de Sincronização',
+                'ordering': ['execucao', 'id'],
+            },
+        ),
+    ]
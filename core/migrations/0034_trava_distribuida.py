@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-17 21:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0033_execucao_sincronizacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TravaDistribuida',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=100, unique=True)),
+                ('dono', models.CharField(help_text='Processo que detém a trava (host:pid:id)', max_length=200)),
+                ('expira_em', models.DateTimeField(help_text='Após este instante qualquer processo pode assumir a trava')),
+                ('adquirida_em', models.DateTimeField()),
+                ('renovada_em', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Trava Distribuída',
+                'verbose_name_plural': 'Travas Distribuídas',
+                'ordering': ['nome'],
+            },
+        ),
+    ]
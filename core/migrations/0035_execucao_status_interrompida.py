@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-17 21:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0034_trava_distribuida'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='execucaosincronizacao',
+            name='status',
+            field=models.CharField(choices=[('em_andamento', 'Em andamento'), ('concluida', 'Concluída'), ('com_erros', 'Concluída com erros'), ('interrompida', 'Interrompida'), ('falhou', 'Falhou')], db_index=True, default='em_andamento', max_length=20),
+        ),
+    ]
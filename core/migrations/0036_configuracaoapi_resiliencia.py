@@ -0,0 +1,48 @@
+# Generated by Django 5.0.1 on 2026-10-17 21:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0035_execucao_status_interrompida'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='configuracaoapi',
+            name='circuito_aberto_ate',
+            field=models.DateTimeField(blank=True, help_text='Circuito aberto: a API não é chamada até este instante (limpe para liberar)', null=True),
+        ),
+        migrations.AddField(
+            model_name='configuracaoapi',
+            name='falhas_consecutivas',
+            field=models.PositiveIntegerField(default=0, help_text='Páginas com falha seguidas desde o último sucesso'),
+        ),
+        migrations.AddField(
+            model_name='configuracaoapi',
+            name='falhas_para_abrir_circuito',
+            field=models.PositiveSmallIntegerField(default=3, help_text='Páginas com falha seguidas (após as tentativas) que abrem o circuito e suspendem a API'),
+        ),
+        migrations.AddField(
+            model_name='configuracaoapi',
+            name='pausa_circuito_segundos',
+            field=models.PositiveIntegerField(default=300, help_text='Tempo em que a API fica suspensa após abrir o circuito'),
+        ),
+        migrations.AddField(
+            model_name='configuracaoapi',
+            name='requisicoes_condicionais',
+            field=models.BooleanField(default=True, help_text='Envia If-None-Match/If-Modified-Since; páginas sem mudança voltam 304 e não são processadas'),
+        ),
+        migrations.AddField(
+            model_name='configuracaoapi',
+            name='tentativas_por_execucao',
+            field=models.PositiveSmallIntegerField(default=6, help_text='Novas tentativas (com espera crescente e aleatória) disponíveis para todas as páginas de uma execução'),
+        ),
+        migrations.AddField(
+            model_name='configuracaoapi',
+            name='validadores_paginas',
+            field=models.JSONField(blank=True, default=dict, help_text='ETag/Last-Modified por página ("pagina:tamanho"), gravados após processar a página sem erros. Limpe junto com a marca d\'água para forçar uma sincronização completa'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-17 21:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0036_configuracaoapi_resiliencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='configuracaoapi',
+            name='gravar_respostas',
+            field=models.BooleanField(default=False, help_text='Grava o corpo bruto de cada página em CASSETES_API_DIR (.jsonl.gz) para reprodução com sincronizar_formulas_api --replay'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.0.1 on 2026-10-17 21:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0037_configuracaoapi_gravar_respostas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LinhaBrutaAPI',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lote', models.CharField(db_index=True, help_text='Identificador do lote (uma página) mesclado de uma vez', max_length=32)),
+                ('pagina', models.PositiveIntegerField(blank=True, null=True)),
+                ('dados', models.JSONField(help_text='Linha original da API (FC0M100)')),
+                ('id_api', models.CharField(max_length=100)),
+                ('nrorc', models.BigIntegerField()),
+                ('hash_origem', models.CharField(max_length=40)),
+                ('descricao', models.TextField(blank=True)),
+                ('quantidade', models.IntegerField(default=1)),
+                ('volume_ml', models.CharField(blank=True, max_length=20)),
+                ('serieo', models.CharField(blank=True, max_length=20)),
+                ('price_unit', models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True)),
+                ('price_total', models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True)),
+                ('datetime_atualizacao_api', models.DateTimeField(blank=True, null=True)),
+                ('forma', models.CharField(blank=True, max_length=30)),
+                ('quantidade_unidades', models.PositiveIntegerField(blank=True, null=True)),
+                ('recebida_em', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('mesclada_em', models.DateTimeField(blank=True, null=True)),
+                ('api', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='linhas_brutas', to='core.configuracaoapi')),
+                ('tipo_produto', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.tipoproduto')),
+            ],
+            options={
+                'verbose_name': 'Linha Bruta da API',
+                'verbose_name_plural': 'Linhas Brutas da API',
+                'ordering': ['-recebida_em', 'id'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='linhabrutaapi',
+            constraint=models.UniqueConstraint(fields=('lote', 'id_api'), name='linha_bruta_unica_por_lote'),
+        ),
+    ]
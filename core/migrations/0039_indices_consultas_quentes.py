@@ -0,0 +1,47 @@
+# Generated by Django 5.0.1 on 2026-10-17 22:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0038_linha_bruta_api'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='formulaitem',
+            index=models.Index(fields=['funcionario_na_etapa', 'status', 'eh_tarefa_ativa'], name='formula_func_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='formulaitem',
+            index=models.Index(condition=models.Q(('funcionario_na_etapa__isnull', True)), fields=['status', 'pedido_mestre'], name='formula_disponivel_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historicoetapaformula',
+            index=models.Index(fields=['formula', 'etapa'], name='historico_formula_etapa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historicoetapaformula',
+            index=models.Index(fields=['funcionario', 'timestamp_inicio'], name='historico_func_inicio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='logauditoria',
+            index=models.Index(fields=['timestamp'], name='log_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='logauditoria',
+            index=models.Index(fields=['acao', 'timestamp'], name='log_acao_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='penalizacao',
+            index=models.Index(fields=['funcionario', 'timestamp'], name='penalizacao_func_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pontuacaofuncionario',
+            index=models.Index(fields=['funcionario', 'mes_referencia'], name='pontuacao_func_mes_idx'),
+        ),
+    ]
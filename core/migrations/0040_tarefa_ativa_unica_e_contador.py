@@ -0,0 +1,60 @@
+# Generated by Django 5.0.1 on 2026-10-17 22:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+STATUS_TAREFA_ABERTA = ['em_triagem', 'em_producao', 'em_qualidade']
+
+# Mesma regra de core.models.OCUPA_VAGA: fórmula em aberto numa etapa que não é a expedição
+OCUPA_VAGA = Q(status__in=STATUS_TAREFA_ABERTA, etapa_atual__isnull=False) & ~Q(etapa_atual__nome__iexact='expedição')
+
+
+def corrigir_ativas_e_preencher_contadores(apps, schema_editor):
+    """Deixa uma ativa por funcionário (a mais recente) e conta as fórmulas que ocupam vaga de cada um"""
+    FormulaItem = apps.get_model('core', 'FormulaItem')
+    ContadorTarefasFuncionario = apps.get_model('core', 'ContadorTarefasFuncionario')
+    abertas = FormulaItem.objects.filter(funcionario_na_etapa__isnull=False, status__in=STATUS_TAREFA_ABERTA)
+
+    duplicados = (
+        abertas.filter(eh_tarefa_ativa=True).values('funcionario_na_etapa')
+        .annotate(total=Count('id')).filter(total__gt=1).values_list('funcionario_na_etapa', flat=True)
+    )
+    for funcionario_id in list(duplicados):
+        ativas = abertas.filter(funcionario_na_etapa_id=funcionario_id, eh_tarefa_ativa=True).order_by('-criado_em')
+        FormulaItem.objects.filter(pk__in=list(ativas.values_list('pk', flat=True)[1:])).update(eh_tarefa_ativa=False)
+
+    ocupam_vaga = FormulaItem.objects.filter(OCUPA_VAGA, funcionario_na_etapa__isnull=False)
+    ContadorTarefasFuncionario.objects.bulk_create(
+        ContadorTarefasFuncionario(funcionario_id=funcionario_id, tarefas=total)
+        for funcionario_id, total in ocupam_vaga.values_list('funcionario_na_etapa').annotate(total=Count('id'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0039_indices_consultas_quentes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorTarefasFuncionario',
+            fields=[
+                ('funcionario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='contador_tarefas', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('tarefas', models.PositiveIntegerField(default=0, help_text='Fórmulas em aberto assumidas pelo funcionário (ativa + pendentes)')),
+            ],
+            options={
+                'verbose_name': 'Contador de Tarefas do Funcionário',
+                'verbose_name_plural': 'Contadores de Tarefas dos Funcionários',
+            },
+        ),
+        migrations.RunPython(corrigir_ativas_e_preencher_contadores, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='formulaitem',
+            constraint=models.UniqueConstraint(condition=models.Q(('eh_tarefa_ativa', True), ('status__in', ['em_triagem', 'em_producao', 'em_qualidade'])), fields=('funcionario_na_etapa',), name='uma_tarefa_ativa_por_funcionario'),
+        ),
+    ]
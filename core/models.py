@@ -1,8 +1,11 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from decimal import Decimal
+from functools import partial
+from core.classificador_produto import ROTULOS_FORMA, classificar_tipo, extrair_unidades, rotulo_forma
 
 class Etapa(models.Model):
     nome = models.CharField(max_length=200)
@@ -211,6 +214,10 @@ class PontuacaoFuncionario(models.Model):
         ordering = ['-timestamp']
         verbose_name = 'Pontuação do Funcionário'
         verbose_name_plural = 'Pontuações dos Funcionários'
+        indexes = [
+            # Pontos do funcionário no mês (rankings, dashboard)
+            models.Index(fields=['funcionario', 'mes_referencia'], name='pontuacao_func_mes_idx'),
+        ]
     
     def __str__(self):
         return f"{self.funcionario.username} - {self.pontos} pts ({self.origem})"
@@ -241,6 +248,9 @@ class Penalizacao(models.Model):
         ordering = ['-timestamp']
         verbose_name = 'Penalização'
         verbose_name_plural = 'Penalizações'
+        indexes = [
+            models.Index(fields=['funcionario', 'timestamp'], name='penalizacao_func_ts_idx'),
+        ]
     
     def __str__(self):
         status = '(REVERTIDA)' if self.revertida else ''
@@ -429,6 +439,10 @@ class LogAuditoria(models.Model):
         ordering = ['-timestamp']
         verbose_name = 'Log de Auditoria'
         verbose_name_plural = 'Logs de Auditoria'
+        indexes = [
+            models.Index(fields=['timestamp'], name='log_timestamp_idx'),
+            models.Index(fields=['acao', 'timestamp'], name='log_acao_ts_idx'),
+        ]
     
     def __str__(self):
         usuario_nome = self.usuario.username if self.usuario else 'Sistema'
@@ -634,10 +648,63 @@ class ConfiguracaoAPI(models.Model):
         default=30,
         help_text="Timeout em segundos para requisições"
     )
+    requisicoes_paralelas = models.PositiveSmallIntegerField(
+        default=4,
+        help_text="Quantidade máxima de páginas buscadas ao mesmo tempo (conexões mantidas abertas na sessão)"
+    )
     ativa = models.BooleanField(
         default=True,
         help_text="Se a API está ativa para sincronização"
     )
+    
+    # Sincronização incremental
+    sincronizacao_incremental = models.BooleanField(
+        default=True,
+        help_text="Ignora itens com DTALT/HRALT até a marca d'água e para a paginação quando uma página só tem itens antigos"
+    )
+    ultima_atualizacao_api = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Marca d'água: maior DTALT + HRALT já sincronizado (limpe para forçar uma sincronização completa)"
+    )
+    
+    # Resiliência: circuit breaker, tentativas e requisições condicionais
+    falhas_para_abrir_circuito = models.PositiveSmallIntegerField(
+        default=3,
+        help_text="Páginas com falha seguidas (após as tentativas) que abrem o circuito e suspendem a API"
+    )
+    pausa_circuito_segundos = models.PositiveIntegerField(
+        default=300,
+        help_text="Tempo em que a API fica suspensa após abrir o circuito"
+    )
+    tentativas_por_execucao = models.PositiveSmallIntegerField(
+        default=6,
+        help_text="Novas tentativas (com espera crescente e aleatória) disponíveis para todas as páginas de uma execução"
+    )
+    requisicoes_condicionais = models.BooleanField(
+        default=True,
+        help_text="Envia If-None-Match/If-Modified-Since; páginas sem mudança voltam 304 e não são processadas"
+    )
+    falhas_consecutivas = models.PositiveIntegerField(
+        default=0,
+        help_text="Páginas com falha seguidas desde o último sucesso"
+    )
+    circuito_aberto_ate = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Circuito aberto: a API não é chamada até este instante (limpe para liberar)"
+    )
+    validadores_paginas = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="ETag/Last-Modified por página (\"pagina:tamanho\"), gravados após processar a página sem erros. Limpe junto com a marca d'água para forçar uma sincronização completa"
+    )
+    
+    # Cassetes (core/cassetes_api.py)
+    gravar_respostas = models.BooleanField(
+        default=False,
+        help_text="Grava o corpo bruto de cada página em CASSETES_API_DIR (.jsonl.gz) para reprodução com sincronizar_formulas_api --replay"
+    )
     criado_em = models.DateTimeField(auto_now_add=True)
     atualizado_em = models.DateTimeField(auto_now=True)
     
@@ -705,10 +772,29 @@ class AgendamentoSincronizacao(models.Model):
     )
     
     # Paginações (configuração de quantas páginas buscar)
+    MODOS_PAGINACAO = [
+        ('fixa', 'Fixa (lista de paginações)'),
+        ('automatica', 'Automática (até a API retornar página vazia)'),
+    ]
+    modo_paginacao = models.CharField(
+        max_length=20,
+        choices=MODOS_PAGINACAO,
+        default='fixa',
+        help_text="Fixa usa a lista de paginações; automática busca da página 1 até a API retornar 'dados' vazio"
+    )
     paginacoes = models.JSONField(
         default=list,
+        blank=True,
         help_text="Lista de dicts com paginações (ex: [{\"pagina\": 1, \"tamanho\": 50}, {\"pagina\": 2, \"tamanho\": 50}])"
     )
+    tamanho_pagina = models.PositiveIntegerField(
+        default=50,
+        help_text="Itens por página no modo automático"
+    )
+    limite_paginas = models.PositiveIntegerField(
+        default=1000,
+        help_text="Máximo de páginas por execução no modo automático (proteção contra API que ignora a paginação)"
+    )
     
     # Status
     ativo = models.BooleanField(
@@ -734,6 +820,247 @@ class AgendamentoSincronizacao(models.Model):
     def clean(self):
         if not self.executar_todos_os_dias and not self.dias_semana:
             raise ValidationError("Se não executar todos os dias, selecione pelo menos um dia da semana")
+    
+    def obter_paginacoes(self):
+        """
+        Retorna as paginações a buscar
+        No modo automático é uma sequência sob demanda (1, 2, 3...) até limite_paginas;
+        quem consome para ao receber uma página vazia
+        """
+        if self.modo_paginacao == 'automatica':
+            return (
+                {'pagina': pagina, 'tamanho': self.tamanho_pagina}
+                for pagina in range(1, self.limite_paginas + 1)
+            )
+        return self.paginacoes if self.paginacoes else [{'pagina': 1, 'tamanho': 50}]
+
+
+class ExecucaoSincronizacao(models.Model):
+    """
+    Registro de uma execução de sincronização com a API
+    Guarda início/fim e os totais das páginas; o detalhe fica em PaginaSincronizacao
+    """
+    STATUS_CHOICES = [
+        ('em_andamento', 'Em andamento'),
+        ('concluida', 'Concluída'),
+        ('com_erros', 'Concluída com erros'),
+        ('interrompida', 'Interrompida'),
+        ('falhou', 'Falhou'),
+    ]
+    
+    api = models.ForeignKey(
+        ConfiguracaoAPI,
+        on_delete=models.CASCADE,
+        related_name='execucoes',
+        help_text="API sincronizada"
+    )
+    agendamento = models.ForeignKey(
+        AgendamentoSincronizacao,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='execucoes',
+        help_text="Agendamento que originou a execução"
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='em_andamento', db_index=True)
+    iniciada_em = models.DateTimeField(auto_now_add=True, db_index=True)
+    finalizada_em = models.DateTimeField(null=True, blank=True)
+    
+    # Totais das páginas
+    total_paginas = models.PositiveIntegerField(default=0)
+    bytes_recebidos = models.PositiveBigIntegerField(default=0)
+    itens_recebidos = models.PositiveIntegerField(default=0)
+    criados = models.PositiveIntegerField(default=0)
+    atualizados = models.PositiveIntegerField(default=0)
+    sem_mudancas = models.PositiveIntegerField(default=0)
+    erros = models.PositiveIntegerField(default=0)
+    antigos = models.PositiveIntegerField(default=0)
+    tempo_http_ms = models.FloatField(default=0, help_text="Soma da latência HTTP das páginas (ms)")
+    tempo_gravacao_ms = models.FloatField(default=0, help_text="Soma do tempo de gravação no banco das páginas (ms)")
+    mensagem_erro = models.TextField(blank=True)
+    
+    class Meta:
+        ordering = ['-iniciada_em']
+        verbose_name = 'Execução de Sincronização'
+        verbose_name_plural = 'Execuções de Sincronização'
+    
+    def __str__(self):
+        return f"{self.api.nome} - {self.iniciada_em:%d/%m/%Y %H:%M:%S} ({self.get_status_display()})"
+    
+    @property
+    def duracao_segundos(self):
+        """Duração total da execução (None enquanto em andamento)"""
+        if not self.finalizada_em:
+            return None
+        return (self.finalizada_em - self.iniciada_em).total_seconds()
+    
+    @property
+    def itens_por_segundo(self):
+        """Vazão da execução: itens recebidos por segundo de duração"""
+        duracao = self.duracao_segundos
+        if not duracao:
+            return None
+        return self.itens_recebidos / duracao
+    
+    def registrar_pagina(self, resultado):
+        """
+        Grava a PaginaSincronizacao de um resultado de SincronizadorAPI.processar_pagina
+        e acumula os totais em memória (gravados em finalizar)
+        """
+        processamento = resultado.get('processamento') or {}
+        pagina = PaginaSincronizacao.objects.create(
+            execucao=self,
+            pagina=resultado.get('pagina') or 0,
+            sucesso=bool(resultado.get('sucesso')),
+            status_http=resultado.get('status'),
+            erro=str(resultado.get('erro') or '')[:500],
+            latencia_http_ms=resultado.get('latencia_ms'),
+            bytes_recebidos=resultado.get('bytes_recebidos') or 0,
+            itens_recebidos=resultado.get('items_recebidos') or 0,
+            criados=processamento.get('criados', 0),
+            atualizados=processamento.get('atualizados', 0),
+            sem_mudancas=processamento.get('sem_mudancas', 0),
+            erros=processamento.get('erros', 0) if resultado.get('sucesso') else 1,
+            antigos=processamento.get('antigos', 0),
+            tempo_gravacao_ms=resultado.get('tempo_gravacao_ms'),
+        )
+        
+        self.total_paginas += 1
+        self.bytes_recebidos += pagina.bytes_recebidos
+        self.itens_recebidos += pagina.itens_recebidos
+        self.criados += pagina.criados
+        self.atualizados += pagina.atualizados
+        self.sem_mudancas += pagina.sem_mudancas
+        self.erros += pagina.erros
+        self.antigos += pagina.antigos
+        self.tempo_http_ms += pagina.latencia_http_ms or 0
+        self.tempo_gravacao_ms += pagina.tempo_gravacao_ms or 0
+        return pagina
+    
+    def finalizar(self, mensagem_erro='', interrompida=False):
+        """Fecha a execução gravando fim, totais e status"""
+        self.finalizada_em = timezone.now()
+        if mensagem_erro:
+            self.status = 'falhou'
+            self.mensagem_erro = mensagem_erro[:2000]
+        elif interrompida:
+            self.status = 'interrompida'
+        else:
+            self.status = 'com_erros' if self.erros else 'concluida'
+        self.save()
+
+
+class PaginaSincronizacao(models.Model):
+    """Uma página buscada e gravada dentro de uma ExecucaoSincronizacao"""
+    execucao = models.ForeignKey(
+        ExecucaoSincronizacao,
+        on_delete=models.CASCADE,
+        related_name='paginas'
+    )
+    pagina = models.PositiveIntegerField()
+    sucesso = models.BooleanField(default=True)
+    status_http = models.PositiveSmallIntegerField(null=True, blank=True)
+    erro = models.CharField(max_length=500, blank=True)
+    
+    latencia_http_ms = models.FloatField(null=True, blank=True, help_text="Da requisição até o fim da leitura do corpo (ms)")
+    bytes_recebidos = models.PositiveIntegerField(default=0)
+    itens_recebidos = models.PositiveIntegerField(default=0)
+    criados = models.PositiveIntegerField(default=0)
+    atualizados = models.PositiveIntegerField(default=0)
+    sem_mudancas = models.PositiveIntegerField(default=0)
+    erros = models.PositiveIntegerField(default=0)
+    antigos = models.PositiveIntegerField(default=0)
+    tempo_gravacao_ms = models.FloatField(null=True, blank=True, help_text="Tempo de processamento e gravação no banco (ms)")
+    registrada_em = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['execucao', 'id']
+        verbose_name = 'Página de Sincronização'
+        verbose_name_plural = 'Páginas de Sincronização'
+    
+    def __str__(self):
+        return f"Execução {self.execucao_id} - Página {self.pagina}"
+
+
+class LinhaBrutaAPI(models.Model):
+    """
+    Linha da API como chegou, em lotes da ingestão via staging (core.ingestao.pipeline_staging)
+    Cada lote é mesclado em PedidoMestre/FormulaItem com INSERT ... ON CONFLICT e fica
+    guardado como trilha de auditoria do que o ERP enviou (limpo após LINHAS_BRUTAS_RETENCAO_DIAS)
+    """
+    lote = models.CharField(max_length=32, db_index=True, help_text="Identificador do lote (uma página) mesclado de uma vez")
+    api = models.ForeignKey(
+        ConfiguracaoAPI,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        db_constraint=False,
+        related_name='linhas_brutas'
+    )
+    pagina = models.PositiveIntegerField(null=True, blank=True)
+    dados = models.JSONField(help_text="Linha original da API (FC0M100)")
+    
+    # Valores normalizados da linha, no formato de FormulaItem (usados pela mesclagem em SQL)
+    id_api = models.CharField(max_length=100)
+    nrorc = models.BigIntegerField()
+    hash_origem = models.CharField(max_length=40)
+    descricao = models.TextField(blank=True)
+    quantidade = models.IntegerField(default=1)
+    volume_ml = models.CharField(max_length=20, blank=True)
+    serieo = models.CharField(max_length=20, blank=True)
+    price_unit = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
+    price_total = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
+    datetime_atualizacao_api = models.DateTimeField(null=True, blank=True)
+    tipo_produto = models.ForeignKey(
+        TipoProduto,
+        on_delete=models.DO_NOTHING,
+        null=True,
+        blank=True,
+        db_constraint=False,
+        related_name='+'
+    )
+    forma = models.CharField(max_length=30, blank=True)
+    quantidade_unidades = models.PositiveIntegerField(null=True, blank=True)
+    
+    recebida_em = models.DateTimeField(auto_now_add=True, db_index=True)
+    mesclada_em = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-recebida_em', 'id']
+        verbose_name = 'Linha Bruta da API'
+        verbose_name_plural = 'Linhas Brutas da API'
+        constraints = [
+            # ON CONFLICT DO UPDATE não aceita o mesmo id_api duas vezes no mesmo comando
+            models.UniqueConstraint(fields=['lote', 'id_api'], name='linha_bruta_unica_por_lote'),
+        ]
+    
+    def __str__(self):
+        return f"{self.id_api} (lote {self.lote})"
+
+
+class TravaDistribuida(models.Model):
+    """
+    Trava com prazo (lease) compartilhada pelos processos através do banco
+    O dono renova expira_em periodicamente; se o processo morrer, outro assume após expirar
+    Usada em core/trava_distribuida.py (liderança do scheduler e sincronização por API)
+    """
+    nome = models.CharField(max_length=100, unique=True)
+    dono = models.CharField(max_length=200, help_text="Processo que detém a trava (host:pid:id)")
+    expira_em = models.DateTimeField(help_text="Após este instante qualquer processo pode assumir a trava")
+    adquirida_em = models.DateTimeField()
+    renovada_em = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['nome']
+        verbose_name = 'Trava Distribuída'
+        verbose_name_plural = 'Travas Distribuídas'
+    
+    def __str__(self):
+        return f"{self.nome} ({self.dono} até {self.expira_em:%H:%M:%S})"
+    
+    @property
+    def ativa(self):
+        return self.expira_em > timezone.now()
 
 
 # ========== NOVOS MODELOS PARA FLUXO COM MÚLTIPLAS FÓRMULAS ==========
@@ -816,6 +1143,22 @@ class PedidoMestre(models.Model):
         self.save()
 
 
+# Status em que a fórmula conta como tarefa do funcionário (ativa ou pendente)
+STATUS_TAREFA_ABERTA = ['em_triagem', 'em_producao', 'em_qualidade']
+# Na Expedição a fórmula assumida não ocupa vaga no limite de tarefas
+ETAPA_SEM_VAGA = 'expedição'
+# Fórmulas que ocupam vaga do funcionário que as assumiu: mesma regra de ocupa_vaga, em consulta
+OCUPA_VAGA = Q(status__in=STATUS_TAREFA_ABERTA, etapa_atual__isnull=False) & ~Q(etapa_atual__nome__iexact=ETAPA_SEM_VAGA)
+
+
+def ocupa_vaga(formula):
+    """Em aberto e fora da Expedição a fórmula é tarefa ativa/pendente e conta no limite do funcionário"""
+    return bool(
+        formula.status in STATUS_TAREFA_ABERTA and formula.etapa_atual
+        and formula.etapa_atual.nome.lower() != ETAPA_SEM_VAGA
+    )
+
+
 class FormulaItem(models.Model):
     """
     Representa uma fórmula específica dentro de um pedido
@@ -830,7 +1173,6 @@ class FormulaItem(models.Model):
         ('expedido', 'Expedido'),
         ('cancelado', 'Cancelado'),
     ]
-    
     pedido_mestre = models.ForeignKey(PedidoMestre, on_delete=models.CASCADE, related_name='formulas')
     
     # Dados da fórmula
@@ -838,6 +1180,11 @@ class FormulaItem(models.Model):
     quantidade = models.IntegerField(default=1, help_text="Quantidade de unidades")
     volume_ml = models.CharField(max_length=20, blank=True, help_text="Volume em ML se aplicável (ex: 10ML, 60ML)")
     
+    # Atributos derivados da descrição (calculados na sincronização)
+    tipo_produto = models.ForeignKey(TipoProduto, on_delete=models.SET_NULL, null=True, blank=True, related_name='formulas')
+    forma = models.CharField(max_length=30, blank=True, db_index=True, help_text="Forma farmacêutica identificada na descrição (ex: Cápsula, Sachê)")
+    quantidade_unidades = models.PositiveIntegerField(null=True, blank=True, help_text="Unidades extraídas da descrição (ex: CAPSULA: 60CAP -> 60)")
+    
     # Dados da API
     id_api = models.CharField(max_length=100, unique=True, db_index=True, help_text="ID único da fórmula vindo da API")
     serieo = models.CharField(max_length=20, blank=True, help_text="Série do item (SERIEO)")
@@ -862,6 +1209,7 @@ class FormulaItem(models.Model):
     data_criacao_api = models.DateField(null=True, blank=True, help_text="Data de criação no sistema da API")
     data_atualizacao_api = models.DateField(null=True, blank=True, help_text="Data de atualização no sistema da API")
     datetime_atualizacao_api = models.DateTimeField(null=True, blank=True, db_index=True, help_text="Data + Hora de atualização na API (DTALT + HRALT)")
+    hash_origem = models.CharField(max_length=40, blank=True, default='', help_text="Hash (sha1) da linha de origem na API; se não mudar, a sincronização ignora o item")
     
     criado_em = models.DateTimeField(auto_now_add=True)
     atualizado_em = models.DateTimeField(auto_now=True)
@@ -871,68 +1219,63 @@ class FormulaItem(models.Model):
         ordering = ['pedido_mestre', 'criado_em']
         verbose_name = 'Item de Fórmula'
         verbose_name_plural = 'Itens de Fórmula'
+        indexes = [
+            # Tarefas do funcionário (minhas fórmulas, assumir, ativar/pausar)
+            models.Index(fields=['funcionario_na_etapa', 'status', 'eh_tarefa_ativa'], name='formula_func_status_idx'),
+            # Fórmulas disponíveis: só as sem funcionário entram no índice
+            models.Index(
+                fields=['status', 'pedido_mestre'],
+                condition=models.Q(funcionario_na_etapa__isnull=True),
+                name='formula_disponivel_idx',
+            ),
+        ]
+        constraints = [
+            # No máximo uma tarefa ativa por funcionário (fórmulas sem funcionário não conflitam)
+            models.UniqueConstraint(
+                fields=['funcionario_na_etapa'],
+                condition=models.Q(eh_tarefa_ativa=True, status__in=STATUS_TAREFA_ABERTA),
+                name='uma_tarefa_ativa_por_funcionario',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.pedido_mestre.nrorc} - {self.descricao[:50]}"
     
     def get_tipo_forma(self):
         """Extrai o tipo de forma (cápsula, líquido, etc.) da descrição"""
+        if self.forma:
+            return self.forma
+        
+        # Fórmula ainda sem atributos gravados (ver preencher_atributos_formulas)
         if not self.descricao:
             return "Desconhecido"
         
-        desc_upper = self.descricao.upper()
-        
-        if "CAPSULA" in desc_upper or "CAP" in desc_upper:
-            return "Cápsula"
-        elif "SACHE" in desc_upper or "SACHÊ" in desc_upper or "ENVELOPE" in desc_upper:
-            return "Sachê"
-        elif "ML" in desc_upper or "LIQUIDO" in desc_upper or "LÍQUIDO" in desc_upper or "XAROPE" in desc_upper or "TCM LIQUIDO" in desc_upper:
-            return "Líquido"
-        elif "CREME" in desc_upper or "POMADA" in desc_upper or "GEL" in desc_upper:
-            return "Creme"
-        elif "LOÇÃO" in desc_upper or "LOCION" in desc_upper:
-            return "Loção"
-        elif "SHAMPOO" in desc_upper:
-            return "Shampoo"
-        elif "SHOT" in desc_upper:
-            return "Shot"
-        elif "ÓVULO" in desc_upper or "OVULO" in desc_upper:
-            return "Óvulo"
-        elif "SUBLINGUAL" in desc_upper or "PASTILHA" in desc_upper:
-            return "Comprimido"
-        elif "OLEOSA" in desc_upper or "OLEOSO" in desc_upper:
-            return "Oleosa"
-        elif "GOMA" in desc_upper or "GUMMY" in desc_upper:
-            return "Goma"
-        elif "CHOCOLATE" in desc_upper:
-            return "Chocolate"
-        elif "FILME" in desc_upper:
-            return "Filme"
-        else:
-            return "Outro"
+        return rotulo_forma(classificar_tipo(self.descricao))
     
     def get_volume_display(self):
         """Retorna o volume/quantidade formatado dependendo do tipo de forma"""
-        import re
-        
         if not self.descricao:
             return self.volume_ml or "-"
         
-        desc_upper = self.descricao.upper()
+        if self.forma:
+            forma = self.forma
+            unidades = self.quantidade_unidades
+        else:
+            tipo_chave = classificar_tipo(self.descricao)
+            forma = rotulo_forma(tipo_chave)
+            unidades = extrair_unidades(self.descricao, tipo_chave)
         
-        # Para cápsulas, buscar padrão NNNCAP (ex: 30CAP)
-        if "CAPSULA" in desc_upper or "CAP" in desc_upper:
-            # Procura por padrão como "30CAP", "60CAP", etc.
-            match = re.search(r'(\d+)\s*CAP(?:SULA)?', desc_upper)
-            if match:
-                return f"{match.group(1)} cápsulas"
+        # Para cápsulas, unidades da descrição (ex: 30CAP)
+        if forma == ROTULOS_FORMA['capsula']:
+            if unidades:
+                return f"{unidades} cápsulas"
             # Se tiver quantidade de unidades, retorna
             if self.quantidade:
                 return f"{self.quantidade} unidades"
             return "-"
         
         # Para sachês, retorna quantidade
-        elif "SACHE" in desc_upper or "SACHÊ" in desc_upper or "ENVELOPE" in desc_upper:
+        elif forma == ROTULOS_FORMA['sache']:
             if self.quantidade:
                 return f"{self.quantidade} sachês"
             return "-"
@@ -944,6 +1287,8 @@ class FormulaItem(models.Model):
     def avancar_etapa(self):
         """Avança a fórmula para a próxima etapa"""
         if self.etapa_atual:
+            if self.funcionario_na_etapa_id and ocupa_vaga(self):
+                ContadorTarefasFuncionario.liberar(self.funcionario_na_etapa_id)
             proxima = self.etapa_atual.proxima_etapa()
             if proxima:
                 self.etapa_atual = proxima
@@ -960,18 +1305,92 @@ class FormulaItem(models.Model):
                     self.pedido_mestre.validar_e_atualizar_status()
                 
                 self.funcionario_na_etapa = None
+                self.eh_tarefa_ativa = False
                 self.save()
             else:
                 # Não há próxima etapa - fórmula expedida
                 self.status = 'expedido'
                 self.etapa_atual = None
                 self.funcionario_na_etapa = None
+                self.eh_tarefa_ativa = False
                 self.concluido_em = timezone.now()
                 self.save()
                 # Validar pedido mestre
                 self.pedido_mestre.validar_e_atualizar_status()
 
 
+class ContadorTarefasFuncionario(models.Model):
+    """
+    Quantas tarefas (ativa + pendentes) cada funcionário tem em triagem, produção ou qualidade
+    O limite é aplicado por UPDATE condicional (tarefas < LIMITE_TAREFAS) na linha do
+    funcionário: dois "assumir" simultâneos não passam do limite. Se o contador divergir
+    (edição pelo admin, por exemplo), recalcular() refaz a contagem a partir das fórmulas
+    """
+    LIMITE_TAREFAS = 5
+    
+    funcionario = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='contador_tarefas')
+    tarefas = models.PositiveIntegerField(default=0, help_text="Fórmulas em aberto assumidas pelo funcionário (ativa + pendentes)")
+    
+    class Meta:
+        verbose_name = 'Contador de Tarefas do Funcionário'
+        verbose_name_plural = 'Contadores de Tarefas dos Funcionários'
+    
+    def __str__(self):
+        return f"{self.funcionario.username}: {self.tarefas}/{self.LIMITE_TAREFAS}"
+    
+    @classmethod
+    def reservar(cls, funcionario, quantidade=1):
+        """Ocupa vagas do funcionário; False (nada ocupado) se passariam do limite"""
+        if quantidade > cls.LIMITE_TAREFAS:
+            return False
+        abaixo_do_limite = cls.objects.filter(funcionario=funcionario, tarefas__lte=cls.LIMITE_TAREFAS - quantidade)
+        if abaixo_do_limite.update(tarefas=F('tarefas') + quantidade):
+            return True
+        # Primeira tarefa do funcionário: a linha ainda não existe
+        _, criado = cls.objects.get_or_create(funcionario=funcionario, defaults={'tarefas': quantidade})
+        return criado or bool(abaixo_do_limite.update(tarefas=F('tarefas') + quantidade))
+    
+    @classmethod
+    def vagas(cls, funcionario):
+        """Quantas tarefas o funcionário ainda pode assumir"""
+        tarefas = cls.objects.filter(funcionario=funcionario).values_list('tarefas', flat=True).first() or 0
+        return max(cls.LIMITE_TAREFAS - tarefas, 0)
+    
+    @classmethod
+    def liberar(cls, funcionario, quantidade=1):
+        """Devolve vagas do funcionário (fórmula finalizada ou tirada dele)"""
+        cls.objects.filter(funcionario=funcionario, tarefas__gte=quantidade).update(tarefas=F('tarefas') - quantidade)
+    
+    @classmethod
+    def recalcular(cls, funcionarios_ids=None):
+        """Refaz os contadores (todos ou só dos ids dados) a partir das fórmulas que ocupam vaga; retorna quantos mudaram"""
+        usuarios = User.objects.all()
+        if funcionarios_ids is not None:
+            usuarios = usuarios.filter(pk__in=[pk for pk in funcionarios_ids if pk])
+        contagens = dict(
+            FormulaItem.objects.filter(OCUPA_VAGA, funcionario_na_etapa__in=usuarios).values_list('funcionario_na_etapa').annotate(total=models.Count('id'))
+        )
+        atuais = dict(cls.objects.filter(funcionario__in=usuarios).values_list('funcionario', 'tarefas'))
+        corrigidos = 0
+        for usuario_id in set(contagens) | set(atuais):
+            total = contagens.get(usuario_id, 0)
+            if atuais.get(usuario_id) != total:
+                cls.objects.update_or_create(funcionario_id=usuario_id, defaults={'tarefas': total})
+                corrigidos += 1
+        return corrigidos
+    
+    @classmethod
+    def recalcular_apos_excluir(cls, formulas):
+        """
+        Chamar antes de excluir fórmulas (queryset, inclusive em cascata pelo pedido): agenda um único
+        recálculo dos funcionários que elas ocupavam, depois do commit, quando a exclusão já está visível
+        Sem signal de post_delete em FormulaItem, que faria o Django carregar cada fórmula excluída
+        """
+        funcionarios_ids = set(formulas.filter(OCUPA_VAGA, funcionario_na_etapa__isnull=False).values_list('funcionario_na_etapa', flat=True))
+        if funcionarios_ids:
+            transaction.on_commit(partial(cls.recalcular, sorted(funcionarios_ids)))
+
+
 class HistoricoEtapaFormula(models.Model):
     """
     Rastreia cada passagem de uma fórmula por uma etapa
@@ -1001,6 +1420,10 @@ class HistoricoEtapaFormula(models.Model):
         ordering = ['-timestamp_inicio']
         verbose_name = 'Histórico de Etapa da Fórmula'
         verbose_name_plural = 'Históricos de Etapas das Fórmulas'
+        indexes = [
+            models.Index(fields=['formula', 'etapa'], name='historico_formula_etapa_idx'),
+            models.Index(fields=['funcionario', 'timestamp_inicio'], name='historico_func_inicio_idx'),
+        ]
     
     def __str__(self):
         return f"{self.formula.pedido_mestre.nrorc} - {self.etapa.nome} - {self.funcionario.username}"
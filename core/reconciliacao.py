@@ -0,0 +1,165 @@
+"""
+Reconciliação com o ERP: fórmulas em triagem que sumiram da API são canceladas
+Lê a listagem completa de todas as APIs ativas (sem marca d'água nem requisições
+condicionais), junta os IDs vistos e compara em memória com os id_api das fórmulas
+em triagem, lidos em blocos. As ausentes são canceladas em blocos numa única transação.
+
+Nada é cancelado se a leitura de alguma API ficou incompleta (página com falha,
+parada, limite de páginas) ou se a fração de ausentes passar de RECONCILIACAO_FRACAO_MAXIMA.
+Fórmulas já assumidas por um funcionário não são canceladas automaticamente, nem as criadas
+depois do início da leitura (ex: por outra sincronização, em páginas que o coletor já passou).
+"""
+
+import logging
+from itertools import count, islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.ingestao import itens_da_pagina
+from core.models import ConfiguracaoAPI, FormulaItem
+
+logger = logging.getLogger(__name__)
+
+# IDs por consulta (leitura das abertas e UPDATE ... IN): abaixo do limite de variáveis do SQLite
+TAMANHO_BLOCO = 5000
+
+
+class ColetorIds:
+    """IDs vistos numa leitura da API; completo só se a listagem foi lida até o fim sem falhas"""
+
+    def __init__(self):
+        self.ids = set()
+        self.paginas = 0
+        self.falhas = 0
+        self.fim_alcancado = False
+        self.interrompida = False
+
+    def registrar_pagina(self, pagina_buscada):
+        """Conta a página e, se buscada, passa a observar os itens dela durante a gravação"""
+        self.paginas += 1
+        if not pagina_buscada['sucesso']:
+            self.falhas += 1
+            return
+        pagina_buscada['itens'] = self.observar(itens_da_pagina(pagina_buscada), pagina_buscada.get('tamanho') or 0)
+
+    def observar(self, itens, tamanho):
+        """Repassa os itens guardando os IDs; o corpo inválido interrompe antes de marcar o fim"""
+        quantidade = 0
+        for item in itens:
+            quantidade += 1
+            if item.get('ID'):
+                self.ids.add(str(item['ID']))
+            yield item
+        # Página com menos itens que o tamanho pedido: fim da listagem
+        if quantidade < tamanho:
+            self.fim_alcancado = True
+
+    @property
+    def completo(self):
+        return self.fim_alcancado and not self.falhas and not self.interrompida
+
+    def motivo_incompleto(self):
+        if self.falhas:
+            return f'{self.falhas} página(s) com falha'
+        if self.interrompida:
+            return 'sincronização interrompida'
+        if not self.fim_alcancado:
+            return f'fim da listagem não alcançado em {self.paginas} página(s)'
+        return ''
+
+
+def formulas_abertas(criadas_antes=None):
+    """Fórmulas que a reconciliação pode cancelar: em triagem, sem funcionário e anteriores à leitura"""
+    formulas = FormulaItem.objects.filter(status='em_triagem', funcionario_na_etapa__isnull=True)
+    if criadas_antes is not None:
+        formulas = formulas.filter(criado_em__lt=criadas_antes)
+    return formulas
+
+
+def ids_ausentes(ids_erp, tamanho_bloco=TAMANHO_BLOCO, criadas_antes=None):
+    """id_api das fórmulas abertas que não estão em ids_erp (lidos em blocos, sem instanciar modelos)"""
+    abertas = formulas_abertas(criadas_antes).values_list('id_api', flat=True).iterator(chunk_size=tamanho_bloco)
+    for id_api in abertas:
+        if id_api not in ids_erp:
+            yield id_api
+
+
+def cancelar_ausentes(ids_erp, simular=False, fracao_maxima=None, tamanho_bloco=TAMANHO_BLOCO, criadas_antes=None):
+    """
+    Cancela as fórmulas abertas ausentes de ids_erp
+    criadas_antes: início da leitura da API; fórmulas criadas depois não estavam no retrato e ficam
+    Retorna dict com abertas, ausentes, canceladas e abortada (fração acima do limite)
+    """
+    fracao_maxima = settings.RECONCILIACAO_FRACAO_MAXIMA if fracao_maxima is None else fracao_maxima
+    abertas = formulas_abertas(criadas_antes).count()
+    ausentes = list(ids_ausentes(ids_erp, tamanho_bloco, criadas_antes))
+    resultado = {'abertas': abertas, 'ausentes': len(ausentes), 'canceladas': 0, 'abortada': False}
+
+    if abertas and len(ausentes) / abertas > fracao_maxima:
+        logger.error(
+            f'[RECONCILIACAO] {len(ausentes)} de {abertas} fórmulas abertas ausentes da API '
+            f'(acima de {fracao_maxima:.0%}), nada cancelado'
+        )
+        resultado['abortada'] = True
+        return resultado
+
+    if simular or not ausentes:
+        return resultado
+
+    agora = timezone.now()
+    iterador = iter(ausentes)
+    with transaction.atomic():
+        while bloco := list(islice(iterador, tamanho_bloco)):
+            # Refiltra o status: a fórmula pode ter sido assumida durante a leitura
+            resultado['canceladas'] += formulas_abertas(criadas_antes).filter(id_api__in=bloco).update(
+                status='cancelado', eh_tarefa_ativa=False, atualizado_em=agora,
+            )
+
+    logger.info(f"[RECONCILIACAO] {resultado['canceladas']} fórmula(s) ausente(s) da API cancelada(s)")
+    return resultado
+
+
+def reconciliar_apis_ativas(tamanho_pagina=500, limite_paginas=10000, simular=False, fracao_maxima=None):
+    """
+    Sincroniza a listagem completa de todas as APIs ativas e cancela as fórmulas ausentes
+    Os IDs de todas as APIs são somados: uma fórmula só some se não estiver em nenhuma
+    Retorna dict com o resultado por API, o total de IDs e o resultado do cancelamento
+    """
+    from core.scheduler import SincronizadorAPI
+
+    apis = list(ConfiguracaoAPI.objects.filter(ativa=True))
+    resultado = {'apis': {}, 'ids_erp': 0, 'cancelamento': None, 'motivo': ''}
+    if not apis:
+        resultado['motivo'] = 'nenhuma API ativa'
+        return resultado
+
+    # Retrato do ERP começa aqui: o que for criado durante a leitura não pode ser dado como ausente
+    inicio = timezone.now()
+    ids_erp = set()
+    for api in apis:
+        coletor = ColetorIds()
+        paginacoes = ({'pagina': pagina, 'tamanho': tamanho_pagina} for pagina in islice(count(1), limite_paginas))
+        resultados = SincronizadorAPI.sincronizar_api(
+            api, paginacoes, paginacao_automatica=True, incremental=False, coletor=coletor,
+        )
+        if resultados is None:
+            motivo = f"API '{api.nome}' ignorada (circuito aberto ou sincronização em andamento)"
+        elif not coletor.completo:
+            motivo = f"leitura de '{api.nome}' incompleta: {coletor.motivo_incompleto()}"
+        else:
+            motivo = ''
+
+        resultado['apis'][api.nome] = {'paginas': coletor.paginas, 'ids': len(coletor.ids)}
+        if motivo:
+            logger.warning(f'[RECONCILIACAO] Abortada, {motivo}')
+            resultado['motivo'] = motivo
+            return resultado
+        ids_erp |= coletor.ids
+
+    resultado['ids_erp'] = len(ids_erp)
+    resultado['cancelamento'] = cancelar_ausentes(
+        ids_erp, simular=simular, fracao_maxima=fracao_maxima, criadas_antes=inicio,
+    )
+    return resultado
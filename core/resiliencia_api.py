@@ -0,0 +1,106 @@
+"""
+Resiliência das chamadas à API por ConfiguracaoAPI
+- Circuit breaker: após N páginas com falha seguidas a API fica suspensa por um tempo
+- Orçamento de tentativas: novas tentativas por página, limitadas por execução
+- Espera com jitter entre tentativas, para não sincronizar retries de várias páginas
+O estado do circuito fica no banco (ConfiguracaoAPI), compartilhado entre processos.
+"""
+
+import logging
+import random
+import threading
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+
+from core.models import ConfiguracaoAPI
+
+logger = logging.getLogger(__name__)
+
+# Respostas que valem nova tentativa (sobrecarga/indisponibilidade momentânea)
+STATUS_REPETIVEIS = {429, 500, 502, 503, 504}
+
+# Limite de tentativas de uma mesma página, mesmo com orçamento sobrando
+MAX_TENTATIVAS_PAGINA = 3
+
+# Timeout de conexão: host fora do ar falha em segundos, não no timeout de leitura
+TIMEOUT_CONEXAO = 5
+
+
+class OrcamentoTentativas:
+    """Total de novas tentativas de uma execução, compartilhado pelas threads de busca"""
+
+    def __init__(self, total):
+        self.restantes = total
+        self._lock = threading.Lock()
+
+    def consumir(self):
+        """Reserva uma tentativa; False quando o orçamento acabou"""
+        with self._lock:
+            if self.restantes <= 0:
+                return False
+            self.restantes -= 1
+            return True
+
+
+def espera_com_jitter(tentativa, base=0.5, maximo=8.0):
+    """Backoff exponencial com 'full jitter': aleatório entre 0 e base * 2^tentativa"""
+    return random.uniform(0, min(maximo, base * (2 ** tentativa)))
+
+
+def timeout_requisicao(api_config):
+    """(conexão, leitura) para o requests"""
+    return (min(TIMEOUT_CONEXAO, api_config.timeout), api_config.timeout)
+
+
+def circuito_aberto(api_config):
+    """True se a API está suspensa pelo circuit breaker"""
+    return api_config.circuito_aberto_ate is not None and api_config.circuito_aberto_ate > timezone.now()
+
+
+def registrar_falha(api_config):
+    """
+    Conta uma página com falha; abre o circuito ao atingir falhas_para_abrir_circuito
+    Retorna True se o circuito foi aberto por esta falha
+    """
+    ConfiguracaoAPI.objects.filter(pk=api_config.pk).update(falhas_consecutivas=F('falhas_consecutivas') + 1)
+    falhas = ConfiguracaoAPI.objects.values_list('falhas_consecutivas', flat=True).get(pk=api_config.pk)
+    api_config.falhas_consecutivas = falhas
+
+    if falhas < max(1, api_config.falhas_para_abrir_circuito):
+        return False
+
+    aberto_ate = timezone.now() + timedelta(seconds=api_config.pausa_circuito_segundos)
+    ConfiguracaoAPI.objects.filter(pk=api_config.pk).update(circuito_aberto_ate=aberto_ate, falhas_consecutivas=0)
+    api_config.circuito_aberto_ate = aberto_ate
+    api_config.falhas_consecutivas = 0
+    logger.error(
+        f"[CIRCUITO] API '{api_config.nome}' suspensa até {aberto_ate:%H:%M:%S} após {falhas} falha(s) seguida(s)"
+    )
+    return True
+
+
+def registrar_sucesso(api_config):
+    """Zera as falhas seguidas e fecha o circuito (uma consulta, só se havia algo a limpar)"""
+    if api_config.falhas_consecutivas or api_config.circuito_aberto_ate:
+        ConfiguracaoAPI.objects.filter(pk=api_config.pk).update(falhas_consecutivas=0, circuito_aberto_ate=None)
+        api_config.falhas_consecutivas = 0
+        api_config.circuito_aberto_ate = None
+
+
+def chave_validador(pagina, tamanho):
+    """Chave de ConfiguracaoAPI.validadores_paginas"""
+    return f'{pagina}:{tamanho}'
+
+
+def cabecalhos_condicionais(validador):
+    """Headers If-None-Match/If-Modified-Since a partir do validador salvo da página"""
+    if not validador:
+        return {}
+    cabecalhos = {}
+    if validador.get('etag'):
+        cabecalhos['If-None-Match'] = validador['etag']
+    if validador.get('last_modified'):
+        cabecalhos['If-Modified-Since'] = validador['last_modified']
+    return cabecalhos
@@ -3,359 +3,716 @@ Scheduler para sincronização automática da API
 Chama a API em intervalos configuráveis sem usar Celery
 """
 
+import atexit
+import hashlib
 import logging
 import requests
-import re
-from datetime import datetime, time
-from decimal import Decimal
+import tempfile
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+from itertools import islice
+from time import perf_counter, sleep
 from apscheduler.schedulers.background import BackgroundScheduler
+from requests.adapters import HTTPAdapter
 from django.conf import settings
-from django.db import IntegrityError
+from django.db import close_old_connections, connection, connections
+from django.db.models import Q
 from django.utils import timezone
-from django.core.management import call_command
-from core.models import PedidoMestre, FormulaItem, Etapa, TipoProduto, ConfiguracaoAPI, AgendamentoSincronizacao
+from core.cassetes_api import GravadorCassete
+from core.ingestao import fechar_corpo, novos_contadores, pipeline_padrao, totalizar
+from core.resiliencia_api import (
+    MAX_TENTATIVAS_PAGINA, STATUS_REPETIVEIS, OrcamentoTentativas, cabecalhos_condicionais,
+    chave_validador, circuito_aberto, espera_com_jitter, registrar_falha, registrar_sucesso,
+    timeout_requisicao,
+)
+from core.trava_distribuida import Trava, TravaDistribuida, trava_sincronizacao_api
+from core.models import ConfiguracaoAPI, AgendamentoSincronizacao, ExecucaoSincronizacao
 
 logger = logging.getLogger(__name__)
 
+# Tamanho dos blocos lidos da resposta HTTP
+TAMANHO_BLOCO_RESPOSTA = 64 * 1024
+# Corpo da página guardado em memória até este tamanho; acima, vai para um arquivo temporário
+TAMANHO_CORPO_EM_MEMORIA = 1024 * 1024
+# Campos dos agendamentos cuja alteração o líder percebe em verificar_alteracoes
+CAMPOS_ASSINATURA_AGENDAMENTO = (
+    'id', 'ativo', 'nome', 'executar_todos_os_dias', 'dias_semana',
+    'horario_execucao', 'modo_paginacao', 'paginacoes',
+)
 
-def extrair_tipo_produto(descricao_web):
-    """Extrai o tipo de produto da descrição"""
-    if not descricao_web:
-        return None, 'desconhecido'
-    
-    descricao_upper = descricao_web.upper()
-    
-    padroes = {
-        'capsula': ['CAPSULA', 'CAP'],
-        'sache': ['SACHE', 'SACHÊ', 'ENVELOPE'],
-        'liquido_pediatrico': ['ML', 'LIQUIDO', 'LÍQUIDO', 'XAROPE', 'TCM LIQUIDO'],
-        'creme': ['CREME', 'POMADA', 'PENTRAVAN', 'GEL'],
-        'lotion': ['LOÇÃO', 'LOCION'],
-        'shampoo': ['SHAMPOO'],
-        'shot': ['SHOT'],
-        'ovulo': ['ÓVULO', 'OVULO'],
-        'comprimido_sublingual': ['SUBLINGUAL', 'PASTILHA'],
-        'capsula_oleosa': ['OLEOSA', 'OLEOSO'],
-        'goma': ['GOMA', 'GUMMY'],
-        'chocolate': ['CHOCOLATE'],
-        'filme': ['FILME'],
-    }
-    
-    for tipo_chave, palavras in padroes.items():
-        for palavra in palavras:
-            if palavra in descricao_upper:
-                try:
-                    tipo_obj = TipoProduto.objects.get(tipo=tipo_chave)
-                    return tipo_obj, tipo_chave
-                except TipoProduto.DoesNotExist:
-                    return None, tipo_chave
-    
-    return None, 'desconhecido'
 
-
-def extrair_quantidade_produto(descricao_web):
-    """
-    Extrai a quantidade de unidades do produto APENAS de CAPSULA e ENVELOPE
-    Busca pelos padrões: "CAPSULA: XXcap" ou "ENVELOPE: XXenv"
-    Retorna: int ou None se não encontrar
-    """
-    if not descricao_web:
-        return None
-    
-    descricao_upper = descricao_web.upper()
-    
-    # Padrão 1: "CAPSULA: XXcap" (apenas após a palavra CAPSULA:)
-    match = re.search(r'CAPSULA\s*:\s*(\d+)\s*CAP', descricao_upper)
-    if match:
-        try:
-            quantidade = int(match.group(1))
-            return quantidade if quantidade > 0 else None
-        except (ValueError, AttributeError):
-            return None
-    
-    # Padrão 2: "ENVELOPE: XXenv" (apenas após a palavra ENVELOPE:)
-    match = re.search(r'ENVELOPE\s*:\s*(\d+)\s*ENV', descricao_upper)
-    if match:
-        try:
-            quantidade = int(match.group(1))
-            return quantidade if quantidade > 0 else None
-        except (ValueError, AttributeError):
-            return None
-    
-    return None
-
-
-def processar_e_salvar_pedidos(dados_api):
+def processar_e_salvar_pedidos(dados_api, marca_dagua=None):
     """
     Processa dados da API e salva no banco usando PedidoMestre e FormulaItem
     Agrupa por NRORC: cada NRORC = PedidoMestre, cada item diferente = FormulaItem
+    Atalho para o pipeline de ingestão (core.ingestao) com um dict {'dados': [...]}
     """
     if not dados_api or 'dados' not in dados_api:
-        return {'criados': 0, 'atualizados': 0, 'sem_mudancas': 0, 'erros': 0}
-    
-    criados = 0
-    atualizados = 0
-    sem_mudancas = 0
-    erros = 0
-    
-    try:
-        # Obter etapa padrão (triagem)
-        etapa_inicial = Etapa.objects.filter(sequencia=1, ativa=True).first()
-        if not etapa_inicial:
-            etapa_inicial = Etapa.objects.filter(ativa=True).order_by('sequencia').first()
-    except:
-        etapa_inicial = None
-    
-    # Agrupar dados por NRORC
-    pedidos_por_nrorc = {}
-    for item in dados_api.get('dados', []):
-        nrorc = item.get('NRORC')
-        if nrorc:
-            if nrorc not in pedidos_por_nrorc:
-                pedidos_por_nrorc[nrorc] = []
-            pedidos_por_nrorc[nrorc].append(item)
-    
-    # Processar cada grupo NRORC (cada um é um PedidoMestre)
-    for nrorc, items in pedidos_por_nrorc.items():
-        try:
-            # Criar ou obter PedidoMestre
-            pedido_mestre, pm_created = PedidoMestre.objects.get_or_create(
-                nrorc=nrorc,
-                defaults={'status': 'em_processamento'}
-            )
-            
-            if pm_created:
-                criados += 1
-            
-            # Processar cada fórmula (item) deste NRORC
-            for item in items:
-                try:
-                    id_api = item.get('ID')
-                    if not id_api:
-                        continue
-                    
-                    descricao = item.get('DESCRICAOWEB', '')
-                    quantidade = item.get('QUANT', 1)
-                    serieo = item.get('SERIEO', '')
-                    pruni = item.get('PRUNI')
-                    vrtot = item.get('VRTOT')
-                    dtalt = item.get('DTALT')
-                    hralt = item.get('HRALT')
-                    
-                    # Extrair volume (ex: "10ML")
-                    volume_ml = extrair_volume(descricao) if descricao else None
-                    
-                    # Extrair tipo de produto
-                    tipo_produto, tipo_identificado = extrair_tipo_produto(descricao)
-                    
-                    # Obter ou criar FormulaItem
-                    formula, formula_created = FormulaItem.objects.get_or_create(
-                        id_api=str(id_api),
-                        defaults={
-                            'pedido_mestre': pedido_mestre,
-                            'descricao': descricao[:200] if descricao else f'Formula {id_api}',
-                            'quantidade': quantidade,
-                            'volume_ml': volume_ml or '',
-                            'serieo': serieo,
-                            'price_unit': Decimal(str(pruni)) if pruni else None,
-                            'price_total': Decimal(str(vrtot)) if vrtot else None,
-                            'status': 'em_triagem',
-                            'etapa_atual': etapa_inicial,
-                        }
-                    )
-                    
-                    if formula_created:
-                        criados += 1
-                    else:
-                        # Verificar se houve mudanças
-                        houve_mudanca = False
-                        novo_descricao = descricao[:200] if descricao else formula.descricao
-                        novo_price_unit = Decimal(str(pruni)) if pruni else None
-                        novo_price_total = Decimal(str(vrtot)) if vrtot else None
-                        
-                        if formula.descricao != novo_descricao:
-                            houve_mudanca = True
-                        elif formula.quantidade != quantidade:
-                            houve_mudanca = True
-                        elif formula.price_unit != novo_price_unit:
-                            houve_mudanca = True
-                        elif formula.price_total != novo_price_total:
-                            houve_mudanca = True
-                        elif formula.serieo != serieo:
-                            houve_mudanca = True
-                        
-                        if houve_mudanca:
-                            formula.descricao = novo_descricao
-                            formula.quantidade = quantidade
-                            formula.volume_ml = volume_ml or formula.volume_ml
-                            formula.serieo = serieo
-                            formula.price_unit = novo_price_unit
-                            formula.price_total = novo_price_total
-                            formula.save()
-                            atualizados += 1
-                        else:
-                            sem_mudancas += 1
-                
-                except IntegrityError as e:
-                    logger.warning(f'Registro duplicado ID {id_api}: {str(e)[:80]}')
-                    erros += 1
-                except Exception as e:
-                    logger.error(f'Erro ao processar formula {id_api}: {str(e)}')
-                    erros += 1
-        
-        except Exception as e:
-            logger.error(f'Erro ao processar NRORC {nrorc}: {str(e)}')
-            erros += 1
-    
-    logger.info(f'[PROCESSAMENTO] Pedidos: {criados} criados, {atualizados} atualizados, {sem_mudancas} sem mudancas, {erros} erros')
-    return {'criados': criados, 'atualizados': atualizados, 'sem_mudancas': sem_mudancas, 'erros': erros}
-
-
-def extrair_volume(descricao):
-    """Extrai o volume em ML da descrição (ex: '10ML' from 'VITAMINA A + TCM | 10ML')"""
-    if not descricao:
-        return None
-    
-    match = re.search(r'(\d+)\s*ML', descricao.upper())
-    if match:
-        return f"{match.group(1)}ML"
-    
-    return None
-
-
-logger = logging.getLogger(__name__)
+        return novos_contadores()
+    contadores, _ = pipeline_padrao.processar_itens(dados_api.get('dados', []), marca_dagua=marca_dagua)
+    return contadores
 
 
 class SincronizadorAPI:
     """Gerencia a sincronização automática da API"""
     
-    @staticmethod
-    def chamar_api(api_config, pagina, tamanho):
-        """Faz a chamada HTTP para a API e processa os dados"""
+    # Uma sessão HTTP (keep-alive + pool de conexões) por ConfiguracaoAPI
+    _sessoes = {}
+    _sessoes_lock = threading.Lock()
+    
+    # Sinalizado pelo sync_worker ao receber SIGTERM: a sincronização termina a página atual e para
+    parada_solicitada = threading.Event()
+    
+    # APIs sincronizadas em paralelo (sincronizar_em_paralelo): no SQLite só uma conexão escreve
+    # por vez, então a gravação das páginas é serializada entre as threads deste processo
+    _gravacao_lock = threading.Lock()
+    
+    @classmethod
+    def gravacao_serializada(cls):
+        """Trava da gravação de uma página: exclusiva no SQLite, sem efeito nos demais bancos"""
+        return cls._gravacao_lock if connection.vendor == 'sqlite' else nullcontext()
+    
+    @classmethod
+    def obter_sessao(cls, api_config):
+        """Retorna a sessão HTTP reutilizável da API, criando-a na primeira chamada"""
+        chave = (api_config.pk, api_config.url_base)
+        with cls._sessoes_lock:
+            sessao = cls._sessoes.get(chave)
+            if sessao is None:
+                conexoes = max(1, api_config.requisicoes_paralelas)
+                adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=conexoes)
+                sessao = requests.Session()
+                sessao.mount('http://', adaptador)
+                sessao.mount('https://', adaptador)
+                cls._sessoes[chave] = sessao
+            return sessao
+    
+    @classmethod
+    def buscar_pagina(cls, api_config, pagina, tamanho, orcamento=None, cancelado=None, validador=None):
+        """
+        Busca e decodifica uma página da API, sem gravar nada no banco
+        Falhas momentâneas (timeout, conexão, 429/5xx) são repetidas com espera aleatória
+        enquanto houver orcamento (OrcamentoTentativas da execução) e cancelado não for sinalizado.
+        Com validador (ETag/Last-Modified salvos) a requisição é condicional: 304 = página sem mudanças.
+        """
+        tentativa = 0
+        while True:
+            resultado = cls._buscar_pagina_uma_vez(api_config, pagina, tamanho, validador)
+            resultado['tentativas'] = tentativa + 1
+            if resultado['sucesso'] or not resultado.pop('repetir', False):
+                return resultado
+            if tentativa + 1 >= MAX_TENTATIVAS_PAGINA or orcamento is None or not orcamento.consumir():
+                return resultado
+            
+            espera = espera_com_jitter(tentativa)
+            tentativa += 1
+            logger.warning(f"[RETRY] API '{api_config.nome}' página {pagina}: nova tentativa em {espera:.1f}s")
+            if cancelado is not None:
+                if cancelado.wait(espera):
+                    return resultado
+            else:
+                sleep(espera)
+    
+    @classmethod
+    def _buscar_pagina_uma_vez(cls, api_config, pagina, tamanho, validador=None):
+        """
+        Uma requisição da página
+        O corpo é copiado em blocos para um arquivo temporário (em memória até TAMANHO_CORPO_EM_MEMORIA)
+        e só é decodificado na gravação, item a item (core.ingestao.itens_da_pagina): a memória
+        não cresce com o tamanho da página, e a resposta pode ser repetida até chegar inteira.
+        Inclui no resultado a latência (da requisição ao fim do corpo) e os bytes lidos
+        """
+        inicio = perf_counter()
+        bytes_lidos = 0
+        repetir = False
+        corpo = None
+        
         try:
             url = f"{api_config.url_base}?pagina={pagina}&tamanho={tamanho}"
             
             # Obter headers de autenticação
             headers = api_config.obter_headers_requisicao()
+            headers.update(cabecalhos_condicionais(validador))
             
-            response = requests.get(
+            # stream=True: o corpo é lido em blocos, sem montar a resposta inteira na memória
+            with cls.obter_sessao(api_config).get(
                 url,
-                timeout=api_config.timeout,
-                headers=headers
-            )
-            response.raise_for_status()
+                timeout=timeout_requisicao(api_config),
+                headers=headers,
+                stream=True,
+            ) as response:
+                if response.status_code == 304:
+                    logger.info(f"[304] API '{api_config.nome}' página {pagina} sem mudanças")
+                    return {
+                        'sucesso': True, 'status': 304, 'pagina': pagina, 'tamanho': tamanho, 'nao_modificada': True,
+                        'validador': validador,
+                        'latencia_ms': (perf_counter() - inicio) * 1000, 'bytes_recebidos': 0,
+                    }
+                
+                response.raise_for_status()
+                corpo = tempfile.SpooledTemporaryFile(max_size=TAMANHO_CORPO_EM_MEMORIA)
+                for bloco in response.iter_content(chunk_size=TAMANHO_BLOCO_RESPOSTA):
+                    bytes_lidos += len(bloco)
+                    corpo.write(bloco)
+                corpo.seek(0)
+                validador_novo = {
+                    'etag': response.headers.get('ETag', ''),
+                    'last_modified': response.headers.get('Last-Modified', ''),
+                }
             
-            dados = response.json()
             logger.info(f"[OK] API '{api_config.nome}' chamada com sucesso - Página {pagina}, Tamanho {tamanho}")
-            
-            # Processar e salvar os pedidos
-            resultado_processamento = processar_e_salvar_pedidos(dados)
-            
-            logger.debug(f"Dados recebidos: {len(dados.get('dados', []))} itens")
+            logger.debug(f"Bytes recebidos: {bytes_lidos}")
             
             return {
-                'sucesso': True,
-                'status': response.status_code,
-                'items_recebidos': len(dados.get('dados', [])),
-                'processamento': resultado_processamento,
-                'timestamp': datetime.now().isoformat()
+                'sucesso': True, 'status': response.status_code, 'pagina': pagina, 'tamanho': tamanho, 'corpo': corpo,
+                'encoding': response.encoding or 'utf-8',
+                'validador': validador_novo if any(validador_novo.values()) else None,
+                'latencia_ms': (perf_counter() - inicio) * 1000, 'bytes_recebidos': bytes_lidos,
             }
             
         except requests.exceptions.Timeout:
             logger.error(f"[ERRO] Timeout na chamada da API '{api_config.nome}' (página {pagina})")
-            return {'sucesso': False, 'erro': 'Timeout', 'pagina': pagina}
+            erro = 'Timeout'
+            repetir = True
         except requests.exceptions.ConnectionError:
             logger.error(f"[ERRO] Erro de conexão com a API '{api_config.nome}' (página {pagina})")
-            return {'sucesso': False, 'erro': 'Conexão recusada', 'pagina': pagina}
+            erro = 'Conexão recusada'
+            repetir = True
+        except requests.exceptions.HTTPError as e:
+            logger.error(f"[ERRO] Erro na requisição '{api_config.nome}' (página {pagina}): {str(e)}")
+            erro = str(e)
+            repetir = e.response is not None and e.response.status_code in STATUS_REPETIVEIS
         except requests.exceptions.RequestException as e:
             logger.error(f"[ERRO] Erro na requisição '{api_config.nome}' (página {pagina}): {str(e)}")
-            return {'sucesso': False, 'erro': str(e), 'pagina': pagina}
+            erro = str(e)
         except Exception as e:
             logger.error(f"[ERRO] Erro inesperado '{api_config.nome}' (página {pagina}): {str(e)}")
-            return {'sucesso': False, 'erro': str(e), 'pagina': pagina}
+            erro = str(e)
+        
+        if corpo is not None:
+            corpo.close()
+        return {
+            'sucesso': False, 'erro': erro, 'pagina': pagina, 'tamanho': tamanho, 'repetir': repetir,
+            'latencia_ms': (perf_counter() - inicio) * 1000, 'bytes_recebidos': bytes_lidos,
+        }
+    
+    @classmethod
+    def buscar_paginas(cls, api_config, paginacoes, orcamento=None, validadores=None):
+        """
+        Busca as páginas em paralelo (no máximo requisicoes_paralelas ao mesmo tempo)
+        e as entrega na ordem de paginacoes, com o corpo ainda por decodificar.
+        Interromper a iteração cancela as páginas que ainda não começaram,
+        interrompe as esperas entre tentativas, aguarda as requisições em andamento
+        e descarta os corpos das páginas buscadas e não entregues.
+        """
+        trabalhadores = max(1, api_config.requisicoes_paralelas)
+        executor = ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix='sync-api')
+        cancelado = threading.Event()
+        validadores = validadores or {}
+        pendentes = deque()
+        paginacoes = iter(paginacoes)
+        
+        def enviar(paginacao):
+            validador = validadores.get(chave_validador(paginacao['pagina'], paginacao['tamanho']))
+            pendentes.append(executor.submit(
+                cls.buscar_pagina, api_config, paginacao['pagina'], paginacao['tamanho'],
+                orcamento, cancelado, validador,
+            ))
+        
+        try:
+            # Janela de uma página por trabalhador: páginas baixadas não se acumulam se a gravação
+            # for mais lenta (a próxima só é pedida quando a mais antiga é entregue)
+            for paginacao in islice(paginacoes, trabalhadores):
+                enviar(paginacao)
+            while pendentes:
+                resultado = pendentes.popleft().result()
+                for paginacao in islice(paginacoes, 1):
+                    enviar(paginacao)
+                yield resultado
+        finally:
+            cancelado.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+            for futuro in pendentes:
+                if not futuro.cancelled() and futuro.exception() is None:
+                    fechar_corpo(futuro.result())
     
     @staticmethod
-    def sincronizar_agendamento(agendamento):
+    def processar_pagina(pagina_buscada, marca_dagua=None, pipeline=None):
+        """Grava uma página já buscada e monta o resultado da chamada"""
+        return (pipeline or pipeline_padrao).processar_pagina(pagina_buscada, marca_dagua=marca_dagua)
+    
+    @classmethod
+    def chamar_api(cls, api_config, pagina, tamanho, marca_dagua=None):
+        """Faz a chamada HTTP para a API e processa os dados"""
+        return cls.processar_pagina(cls.buscar_pagina(api_config, pagina, tamanho), marca_dagua=marca_dagua)
+    
+    @classmethod
+    def sincronizar_agendamento(cls, agendamento):
         """Executa a sincronização de um agendamento específico"""
-        api_config = agendamento.api
+        # Recarregar a API: o agendamento do job pode estar com a marca d'água desatualizada
+        api_config = ConfiguracaoAPI.objects.get(pk=agendamento.api_id)
         
         if not api_config.ativa or not agendamento.ativo:
             logger.info(f"Agendamento '{agendamento.nome}' está desativado")
             return
         
+        return cls.sincronizar_api(
+            api_config,
+            agendamento.obter_paginacoes(),
+            agendamento=agendamento,
+            paginacao_automatica=agendamento.modo_paginacao == 'automatica',
+        )
+    
+    @classmethod
+    def sincronizar_api(cls, api_config, paginacoes, agendamento=None, paginacao_automatica=False, incremental=True,
+                        pipeline=None, coletor=None, prazo_segundos=None):
+        """
+        Sincroniza as páginas de uma API pelo pipeline de ingestão (core.ingestao)
+        Entrada comum do scheduler, do comando sincronizar_formulas_api e das tasks Celery.
+        incremental=False ignora a marca d'água (sem filtrar nem avançar): para páginas avulsas,
+        que não cobrem a listagem inteira e não podem decidir até onde ela já foi lida.
+        pipeline: PipelineIngestao usado na gravação (padrão: core.ingestao.pipeline_padrao)
+        coletor: ColetorIds da reconciliação (core.reconciliacao); recebe todas as páginas e
+        desliga marca d'água e requisições condicionais, para a leitura ver todos os IDs
+        prazo_segundos: tempo máximo da sincronização (padrão: settings.SYNC_PRAZO_API_SEGUNDOS,
+        0 = sem prazo); estourado, para após a página atual como numa parada
+        Retorna a lista de resultados por página, ou None se a API foi ignorada
+        (circuito aberto ou sincronização em andamento em outro processo)
+        """
+        if circuito_aberto(api_config):
+            logger.warning(f"[CIRCUITO] API '{api_config.nome}' suspensa até {api_config.circuito_aberto_ate:%H:%M:%S}, sincronização ignorada")
+            return
+        
+        # Uma sincronização por API por vez, em qualquer processo (scheduler, Celery, comando)
+        with trava_sincronizacao_api(api_config.pk).manter_durante() as adquirida:
+            if not adquirida:
+                logger.warning(f"[IGNORADO] API '{api_config.nome}' já está sendo sincronizada por outro processo")
+                return
+            return cls._sincronizar_api(api_config, paginacoes, agendamento, paginacao_automatica, incremental, pipeline,
+                                        coletor, prazo_segundos)
+    
+    @classmethod
+    def _sincronizar_api(cls, api_config, paginacoes, agendamento, paginacao_automatica, incremental, pipeline, coletor,
+                         prazo_segundos):
+        """Corpo da sincronização, executado com a trava da API adquirida"""
+        if prazo_segundos is None:
+            prazo_segundos = settings.SYNC_PRAZO_API_SEGUNDOS
+        inicio = perf_counter()
         logger.info(f"\n{'='*60}")
-        logger.info(f"SINCRONIZAÇÃO: {agendamento.nome} - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        logger.info(f"SINCRONIZAÇÃO: {agendamento.nome if agendamento else 'manual'} - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         logger.info(f"API: {api_config.nome}")
         logger.info(f"{'='*60}")
         
         resultados = []
-        paginacoes = agendamento.paginacoes if agendamento.paginacoes else [{'pagina': 1, 'tamanho': 50}]
+        incremental = incremental and api_config.sincronizacao_incremental and coletor is None
+        marca_dagua = api_config.ultima_atualizacao_api if incremental else None
+        execucao = ExecucaoSincronizacao.objects.create(api=api_config, agendamento=agendamento)
+        interrompida = False
+        orcamento = OrcamentoTentativas(api_config.tentativas_por_execucao)
+        condicionais = api_config.requisicoes_condicionais and coletor is None
+        validadores = api_config.validadores_paginas if condicionais else None
         
-        for paginacao in paginacoes:
-            resultado = SincronizadorAPI.chamar_api(
-                api_config,
-                paginacao['pagina'],
-                paginacao['tamanho']
-            )
-            resultados.append(resultado)
+        gravador = GravadorCassete(api_config) if api_config.gravar_respostas else None
         
-        logger.info(f"[FINALIZADO] Sincronização com {len(resultados)} chamada(s)")
+        # Busca em paralelo, gravação em ordem nesta thread
+        paginas = cls.buscar_paginas(api_config, paginacoes, orcamento=orcamento, validadores=validadores)
+        try:
+            for pagina_buscada in paginas:
+                if coletor is not None:
+                    coletor.registrar_pagina(pagina_buscada)
+                
+                resultado = pagina_buscada
+                if pagina_buscada['sucesso']:
+                    if gravador is not None and pagina_buscada.get('corpo') is not None:
+                        gravador.gravar(pagina_buscada['pagina'], pagina_buscada['tamanho'], pagina_buscada['status'],
+                                        pagina_buscada['corpo'], pagina_buscada.get('encoding'))
+                    # Os itens são decodificados do corpo durante a gravação
+                    pagina_buscada['api_id'] = api_config.pk
+                    with cls.gravacao_serializada():
+                        resultado = cls.processar_pagina(pagina_buscada, marca_dagua=marca_dagua, pipeline=pipeline)
+                
+                # Falha na busca ou corpo inválido
+                if not resultado['sucesso']:
+                    resultados.append(resultado)
+                    with cls.gravacao_serializada():
+                        execucao.registrar_pagina(resultado)
+                    # Circuito aberto: não insiste nas páginas restantes
+                    if registrar_falha(api_config) or paginacao_automatica:
+                        break
+                    continue
+                
+                registrar_sucesso(api_config)
+                
+                # Modo automático: página vazia encerra a paginação (304 não é vazia: só não mudou)
+                if paginacao_automatica and not resultado['nao_modificada'] and not resultado['items_recebidos']:
+                    logger.info(f"[AUTOMATICA] Página {pagina_buscada['pagina']} vazia, fim da paginação")
+                    break
+                
+                with cls.gravacao_serializada():
+                    execucao.registrar_pagina(resultado)
+                resultados.append(resultado)
+                
+                prazo_estourado = prazo_segundos and perf_counter() - inicio > prazo_segundos
+                if cls.parada_solicitada.is_set() or prazo_estourado:
+                    if prazo_estourado:
+                        logger.warning(f"[PRAZO] API '{api_config.nome}' passou de {prazo_segundos}s, interrompida após a página {pagina_buscada['pagina']}")
+                    else:
+                        logger.warning(f"[PARADA] Sincronização interrompida após a página {pagina_buscada['pagina']}")
+                    interrompida = True
+                    if coletor is not None:
+                        coletor.interrompida = True
+                    break
+                
+                # Página só com itens já sincronizados: as seguintes também são antigas
+                if marca_dagua is not None and resultado.get('sucesso'):
+                    antigos = resultado['processamento'].get('antigos', 0)
+                    if antigos and antigos == resultado['items_recebidos']:
+                        logger.info(f"[INCREMENTAL] Página {pagina_buscada['pagina']} só tem itens antigos, parando paginação")
+                        break
+        except Exception as e:
+            execucao.finalizar(mensagem_erro=str(e))
+            raise
+        finally:
+            paginas.close()
+            if gravador is not None:
+                gravador.fechar()
+                if gravador.paginas:
+                    logger.info(f"[CASSETE] {gravador.paginas} página(s) gravada(s) em {gravador.caminho}")
+        
+        with cls.gravacao_serializada():
+            # Interrompida: as páginas seguintes não foram lidas, a marca d'água não pode avançar
+            if incremental and not interrompida:
+                cls.avancar_marca_dagua(api_config, resultados)
+            
+            if api_config.requisicoes_condicionais:
+                cls.salvar_validadores(api_config, resultados)
+            
+            execucao.finalizar(interrompida=interrompida)
+        logger.info(f"[FINALIZADO] Sincronização com {len(resultados)} chamada(s) em {execucao.duracao_segundos:.1f}s")
         logger.info(f"{'='*60}")
         
         return resultados
+    
+    @staticmethod
+    def salvar_validadores(api_config, resultados):
+        """
+        Guarda ETag/Last-Modified das páginas gravadas sem erros, para a próxima
+        execução pedir só o que mudou. Páginas com erro perdem o validador
+        (serão buscadas e processadas por inteiro de novo)
+        """
+        validadores = dict(api_config.validadores_paginas or {})
+        for resultado in resultados:
+            chave = chave_validador(resultado.get('pagina'), resultado.get('tamanho'))
+            gravada_sem_erros = resultado.get('sucesso') and not resultado['processamento'].get('erros')
+            if gravada_sem_erros and resultado.get('validador'):
+                validadores[chave] = resultado['validador']
+            else:
+                validadores.pop(chave, None)
+        
+        if validadores != (api_config.validadores_paginas or {}):
+            ConfiguracaoAPI.objects.filter(pk=api_config.pk).update(validadores_paginas=validadores)
+            api_config.validadores_paginas = validadores
+    
+    @staticmethod
+    def avancar_marca_dagua(api_config, resultados):
+        """
+        Avança a marca d'água da API para o maior DTALT + HRALT visto
+        Só avança se todas as páginas foram buscadas e gravadas sem erros,
+        para não pular itens de uma página que falhou
+        """
+        if any(
+            not r.get('sucesso') or r['processamento'].get('erros')
+            for r in resultados
+        ):
+            logger.warning(f"[INCREMENTAL] Marca d'água de '{api_config.nome}' mantida: houve erros na sincronização")
+            return
+        
+        datas = [
+            r['processamento']['maior_atualizacao_api']
+            for r in resultados
+            if r['processamento'].get('maior_atualizacao_api')
+        ]
+        if not datas:
+            return
+        
+        nova_marca = max(datas)
+        atualizou = ConfiguracaoAPI.objects.filter(pk=api_config.pk).filter(
+            Q(ultima_atualizacao_api__isnull=True) | Q(ultima_atualizacao_api__lt=nova_marca)
+        ).update(ultima_atualizacao_api=nova_marca)
+        if atualizou:
+            api_config.ultima_atualizacao_api = nova_marca
+            logger.info(f"[INCREMENTAL] Marca d'água de '{api_config.nome}' avançada para {nova_marca}")
+    
+    @classmethod
+    def sincronizar_em_paralelo(cls, trabalhos, max_paralelas=None):
+        """
+        Executa a sincronização de várias APIs ao mesmo tempo, uma thread por API
+        trabalhos: lista de (nome, função sem argumentos que retorna a lista de resultados por
+        página, ou None se a API foi ignorada), ex: lambda: sincronizar_api(api, paginacoes)
+        max_paralelas: limite de APIs simultâneas (padrão: settings.SYNC_APIS_PARALELAS)
+        Erros de uma API não interrompem as outras. Retorna, na ordem de trabalhos, um dict
+        por API com api, sucesso, ignorada, erro, tempo_segundos (tempo de parede) e totais
+        """
+        max_paralelas = max(1, min(max_paralelas or settings.SYNC_APIS_PARALELAS, len(trabalhos) or 1))
+        if max_paralelas == 1:
+            return [cls._executar_sincronizacao(nome, funcao) for nome, funcao in trabalhos]
+        
+        with ThreadPoolExecutor(max_workers=max_paralelas, thread_name_prefix='sync-api') as executor:
+            futuros = [executor.submit(cls._executar_em_thread, nome, funcao) for nome, funcao in trabalhos]
+            return [futuro.result() for futuro in futuros]
+    
+    @classmethod
+    def _executar_em_thread(cls, nome, funcao):
+        """Executa uma sincronização numa thread do pool e fecha as conexões dela com o banco"""
+        try:
+            return cls._executar_sincronizacao(nome, funcao)
+        finally:
+            connections.close_all()
+    
+    @staticmethod
+    def _executar_sincronizacao(nome, funcao):
+        """Executa a sincronização de uma API isolando erros e medindo o tempo de parede"""
+        resultado = {'api': nome, 'sucesso': False, 'ignorada': False, 'erro': '', 'tempo_segundos': 0, 'totais': None}
+        inicio = perf_counter()
+        try:
+            resultados = funcao()
+            if resultados is None:
+                resultado['ignorada'] = True
+            else:
+                resultado['totais'] = totalizar(resultados)
+                resultado['sucesso'] = not resultado['totais']['paginas_com_falha']
+        except Exception as e:
+            logger.error(f"[ERRO] Sincronização de '{nome}' falhou: {str(e)}")
+            resultado['erro'] = str(e)
+        resultado['tempo_segundos'] = round(perf_counter() - inicio, 3)
+        return resultado
 
 
 class AgendadorSincronizacao:
-    """Gerencia o scheduler de background baseado em agendamentos configuráveis"""
+    """
+    Gerencia o scheduler de background baseado em agendamentos configuráveis
+    
+    Todo processo que chama iniciar() candidata-se à liderança: um job de heartbeat
+    mantém a trava 'lider_agendador' no banco e só o líder carrega os jobs de
+    sincronização. Os demais ficam passivos e assumem se o líder parar de renovar.
+    
+    Alterações nos agendamentos (admin, servidor web, outro processo) chegam ao líder
+    pela assinatura da tabela, consultada a cada AGENDAMENTOS_DEBOUNCE_SEGUNDOS. Quando ela
+    para de mudar, reconciliar_jobs() compara os agendamentos com os jobs e só adiciona,
+    substitui ou remove os jobs afetados.
+    """
+    
+    NOME_TRAVA_LIDER = 'lider_agendador'
+    PREFIXO_JOB = 'agend_'
     
     scheduler = None
+    trava_lider = None
+    lider = False
+    assinatura_agendamentos = None
+    # Assinatura vista na última verificação e ainda não aplicada (debounce)
+    assinatura_pendente = None
+    # Campos de cada job carregado (id do job -> chave_job), para a reconciliação por diferença
+    chaves_jobs = {}
     
     @classmethod
     def iniciar(cls):
-        """Inicia o scheduler de background com todos os agendamentos ativos"""
+        """Inicia o scheduler de background e a disputa pela liderança"""
         if cls.scheduler is not None and cls.scheduler.running:
             logger.warning("Scheduler já está em execução")
             return
         
         try:
             cls.scheduler = BackgroundScheduler(daemon=True)
+            if cls.trava_lider is None:
+                cls.trava_lider = Trava(cls.NOME_TRAVA_LIDER)
+                atexit.register(cls.parar)
             
-            # Buscar todos os agendamentos ativos
-            agendamentos = AgendamentoSincronizacao.objects.filter(ativo=True)
-            
-            if not agendamentos.exists():
-                logger.warning("[AVISO] Nenhum agendamento ativo encontrado!")
+            # Heartbeat a cada 1/3 do prazo: renova a liderança ou tenta assumi-la
+            cls.scheduler.add_job(
+                cls.verificar_lideranca,
+                'interval',
+                seconds=max(1, cls.trava_lider.duracao / 3),
+                id='lider_heartbeat',
+                name='Heartbeat da liderança',
+                next_run_time=timezone.now(),
+                max_instances=1,
+                coalesce=True,
+            )
             
-            for agendamento in agendamentos:
-                cls.adicionar_job(agendamento)
+            # Verificação das alterações nos agendamentos (só age no líder)
+            cls.scheduler.add_job(
+                cls.verificar_alteracoes,
+                'interval',
+                seconds=max(1, settings.AGENDAMENTOS_DEBOUNCE_SEGUNDOS),
+                id='verificar_agendamentos',
+                name='Verificação de alterações nos agendamentos',
+                max_instances=1,
+                coalesce=True,
+            )
             
             cls.scheduler.start()
-            logger.info(f"[INICIADO] Scheduler rodando! {agendamentos.count()} agendamento(s) carregado(s)")
+            logger.info(f"[INICIADO] Scheduler rodando (processo {cls.trava_lider.dono}), aguardando liderança")
             
         except Exception as e:
             logger.error(f"[ERRO] Falha ao iniciar scheduler: {str(e)}")
     
+    @classmethod
+    def verificar_lideranca(cls):
+        """Mantém a trava de líder e carrega/descarta os jobs conforme o resultado"""
+        try:
+            eh_lider = cls.trava_lider.manter()
+        except Exception as e:
+            logger.error(f"[LIDER] Erro ao verificar liderança: {str(e)}")
+            eh_lider = False
+        finally:
+            close_old_connections()
+        
+        if eh_lider and not cls.lider:
+            cls.lider = True
+            logger.info(f"[LIDER] Processo {cls.trava_lider.dono} assumiu a liderança do scheduler")
+            cls.carregar_jobs()
+        elif not eh_lider and cls.lider:
+            cls.lider = False
+            logger.warning(f"[LIDER] Processo {cls.trava_lider.dono} perdeu a liderança do scheduler")
+            cls.remover_jobs()
+    
+    @classmethod
+    def verificar_alteracoes(cls):
+        """
+        Reconcilia os jobs quando a assinatura dos agendamentos muda (apenas no líder)
+        Debounce: espera a assinatura ficar igual por uma verificação inteira, para uma
+        rajada de alterações (ex: vários agendamentos salvos no admin) virar uma reconciliação só
+        """
+        if not cls.lider:
+            return
+        try:
+            assinatura = cls.obter_assinatura_agendamentos()
+            if assinatura == cls.assinatura_agendamentos:
+                cls.assinatura_pendente = None
+            elif assinatura != cls.assinatura_pendente:
+                cls.assinatura_pendente = assinatura
+            else:
+                logger.info("[LIDER] Agendamentos alterados no banco, reconciliando jobs")
+                cls.reconciliar_jobs()
+        except Exception as e:
+            logger.error(f"[ERRO] Falha ao verificar alterações nos agendamentos: {str(e)}")
+        finally:
+            close_old_connections()
+    
+    @staticmethod
+    def obter_assinatura_agendamentos():
+        """
+        Resumo da tabela de agendamentos: muda quando algum é criado, excluído ou tem
+        alterado um campo que os jobs usam, mesmo via QuerySet.update (que não mexe em atualizado_em)
+        """
+        linhas = AgendamentoSincronizacao.objects.order_by('id').values_list(*CAMPOS_ASSINATURA_AGENDAMENTO)
+        return hashlib.sha1(repr(list(linhas)).encode('utf-8')).hexdigest()
+    
+    @classmethod
+    def carregar_jobs(cls):
+        """Adiciona um job por agendamento ativo (apenas no líder)"""
+        total = cls.reconciliar_jobs()
+        if not total:
+            logger.warning("[AVISO] Nenhum agendamento ativo encontrado!")
+        logger.info(f"[LIDER] {total} agendamento(s) carregado(s)")
+    
+    @staticmethod
+    def chave_job(agendamento):
+        """
+        Campos do agendamento que o job usa: gatilho e nome
+        Os demais (paginações, modo, API) são lidos do banco a cada execução e não exigem trocar o job
+        """
+        return (
+            agendamento.nome, agendamento.executar_todos_os_dias,
+            tuple(agendamento.dias_semana or ()), agendamento.horario_execucao,
+        )
+    
+    @classmethod
+    def reconciliar_jobs(cls):
+        """
+        Leva os jobs ao estado dos agendamentos ativos mexendo só no que mudou:
+        adiciona os novos, substitui os de gatilho ou nome alterado e remove os que
+        foram desativados ou excluídos. Retorna o número de agendamentos ativos
+        """
+        # Assinatura antes da leitura: uma alteração no meio é vista na próxima verificação
+        assinatura = cls.obter_assinatura_agendamentos()
+        desejados = {
+            f'{cls.PREFIXO_JOB}{agendamento.id}': agendamento
+            for agendamento in AgendamentoSincronizacao.objects.filter(ativo=True)
+        }
+        
+        for job_id in set(cls.chaves_jobs) - set(desejados):
+            cls.remover_job(job_id)
+            logger.info(f"[JOB] Removido o job {job_id}")
+        
+        for job_id, agendamento in desejados.items():
+            chave = cls.chave_job(agendamento)
+            if cls.chaves_jobs.get(job_id) == chave:
+                continue
+            if not cls.adicionar_job(agendamento):
+                cls.remover_job(job_id)
+            cls.chaves_jobs[job_id] = chave
+        
+        cls.assinatura_agendamentos = assinatura
+        cls.assinatura_pendente = None
+        return len(desejados)
+    
+    @classmethod
+    def remover_job(cls, job_id):
+        """Remove o job de um agendamento, se existir"""
+        cls.chaves_jobs.pop(job_id, None)
+        if cls.scheduler.get_job(job_id) is not None:
+            cls.scheduler.remove_job(job_id)
+    
+    @classmethod
+    def remover_jobs(cls):
+        """Remove os jobs de sincronização, mantendo o heartbeat"""
+        for job in cls.scheduler.get_jobs():
+            if job.id.startswith(cls.PREFIXO_JOB):
+                job.remove()
+        cls.chaves_jobs = {}
+        cls.assinatura_agendamentos = None
+        cls.assinatura_pendente = None
+    
+    @staticmethod
+    def executar_agendamento(agendamento_id):
+        """Job de um agendamento: relê o agendamento do banco, para usar a configuração atual"""
+        close_old_connections()
+        try:
+            agendamento = AgendamentoSincronizacao.objects.get(id=agendamento_id)
+        except AgendamentoSincronizacao.DoesNotExist:
+            logger.warning(f"[JOB] Agendamento {agendamento_id} não existe mais, execução ignorada")
+            return
+        try:
+            SincronizadorAPI.sincronizar_agendamento(agendamento)
+        finally:
+            close_old_connections()
+    
     @classmethod
     def adicionar_job(cls, agendamento):
-        """Adiciona um job para um agendamento específico"""
+        """Adiciona (ou substitui) o job de um agendamento; retorna False se não há job a agendar"""
         try:
             horario = agendamento.horario_execucao
             
             if agendamento.executar_todos_os_dias:
                 # Executar todos os dias no horário especificado
                 cls.scheduler.add_job(
-                    SincronizadorAPI.sincronizar_agendamento,
+                    cls.executar_agendamento,
                     'cron',
                     hour=horario.hour,
                     minute=horario.minute,
                     second=0,
-                    args=[agendamento],
+                    args=[agendamento.id],
                     id=f'agend_{agendamento.id}',
                     name=f'{agendamento.nome} (Todos os dias)',
                     replace_existing=True,
                     max_instances=1,
                 )
                 logger.info(f"[JOB] Agendado '{agendamento.nome}' para todos os dias às {horario.strftime('%H:%M')}")
+                return True
             else:
                 # Executar em dias específicos
                 dias_semana_map = {
@@ -372,69 +729,121 @@ class AgendadorSincronizacao:
                 
                 if dias_cron:
                     cls.scheduler.add_job(
-                        SincronizadorAPI.sincronizar_agendamento,
+                        cls.executar_agendamento,
                         'cron',
                         day_of_week=','.join(dias_cron),
                         hour=horario.hour,
                         minute=horario.minute,
                         second=0,
-                        args=[agendamento],
+                        args=[agendamento.id],
                         id=f'agend_{agendamento.id}',
                         name=f'{agendamento.nome} ({", ".join(agendamento.dias_semana)})',
                         replace_existing=True,
                         max_instances=1,
                     )
                     logger.info(f"[JOB] Agendado '{agendamento.nome}' para {', '.join(agendamento.dias_semana)} às {horario.strftime('%H:%M')}")
+                    return True
         except Exception as e:
             logger.error(f"[ERRO] Falha ao adicionar job para agendamento {agendamento.id}: {str(e)}")
-
-
+        return False
     
     @classmethod
     def parar(cls):
-        """Para o scheduler"""
+        """Para o scheduler e libera a liderança para outro processo assumir"""
         if cls.scheduler and cls.scheduler.running:
             cls.scheduler.shutdown()
             logger.info("[PARADO] Scheduler encerrado")
+        
+        if cls.lider:
+            cls.lider = False
+            try:
+                cls.trava_lider.liberar()
+                logger.info(f"[LIDER] Liderança liberada pelo processo {cls.trava_lider.dono}")
+            except Exception as e:
+                logger.error(f"[LIDER] Erro ao liberar liderança: {str(e)}")
     
     @classmethod
     def sincronizar_agora(cls, agendamento_id=None):
-        """Força uma sincronização imediata de um ou todos os agendamentos"""
+        """
+        Força uma sincronização imediata de um ou todos os agendamentos
+        Todos: as APIs rodam em paralelo (SincronizadorAPI.sincronizar_em_paralelo) e os
+        agendamentos de uma mesma API, em sequência na thread dela
+        Retorna a lista de resultados por API (ver sincronizar_em_paralelo)
+        """
         if agendamento_id:
             try:
-                agendamento = AgendamentoSincronizacao.objects.get(id=agendamento_id)
-                logger.info(f"Sincronização manual solicitada para '{agendamento.nome}'...")
-                SincronizadorAPI.sincronizar_agendamento(agendamento)
+                agendamento = AgendamentoSincronizacao.objects.select_related('api').get(id=agendamento_id)
             except AgendamentoSincronizacao.DoesNotExist:
                 logger.error(f"Agendamento {agendamento_id} não encontrado")
+                return []
+            logger.info(f"Sincronização manual solicitada para '{agendamento.nome}'...")
+            agendamentos = [agendamento]
         else:
             logger.info("Sincronização manual solicitada para todos os agendamentos...")
-            for agendamento in AgendamentoSincronizacao.objects.filter(ativo=True):
-                SincronizadorAPI.sincronizar_agendamento(agendamento)
+            agendamentos = AgendamentoSincronizacao.objects.filter(ativo=True).select_related('api')
+        
+        por_api = defaultdict(list)
+        for agendamento in agendamentos:
+            por_api[agendamento.api].append(agendamento)
+        
+        def sincronizar_da_api(agendamentos_api):
+            resultados, ignorada = [], True
+            for agendamento in agendamentos_api:
+                parcial = SincronizadorAPI.sincronizar_agendamento(agendamento)
+                if parcial is not None:
+                    resultados.extend(parcial)
+                    ignorada = False
+            return None if ignorada else resultados
+        
+        trabalhos = [
+            (api.nome, lambda agendamentos_api=agendamentos_api: sincronizar_da_api(agendamentos_api))
+            for api, agendamentos_api in por_api.items()
+        ]
+        resultados = SincronizadorAPI.sincronizar_em_paralelo(trabalhos)
+        for resultado in resultados:
+            logger.info(f"[TEMPO] API '{resultado['api']}': {resultado['tempo_segundos']:.1f}s")
+        return resultados
     
     @classmethod
     def recarregar_agendamentos(cls):
-        """Recarrega todos os agendamentos do banco de dados"""
-        if cls.scheduler and cls.scheduler.running:
-            cls.parar()
-        cls.iniciar()
-        logger.info("[RECARREGADO] Agendamentos recarregados do banco de dados")
+        """
+        Reconcilia já os jobs com os agendamentos do banco no processo líder (o sync_worker)
+        Em outros processos (ex: servidor web) não faz nada: o líder percebe a
+        alteração em verificar_alteracoes
+        """
+        if cls.lider and cls.scheduler is not None and cls.scheduler.running:
+            cls.reconciliar_jobs()
+            logger.info("[RECARREGADO] Agendamentos reconciliados com o banco de dados")
+    
+    @classmethod
+    def obter_lider_atual(cls):
+        """Processo que detém a liderança segundo o banco (None se expirada)"""
+        trava = TravaDistribuida.objects.filter(nome=cls.NOME_TRAVA_LIDER).first()
+        if trava is None or not trava.ativa:
+            return None
+        return {'dono': trava.dono, 'expira_em': trava.expira_em.isoformat()}
     
     @classmethod
     def obter_status(cls):
-        """Retorna o status do scheduler"""
-        if cls.scheduler is None:
-            return {'ativo': False, 'jobs': []}
+        """Retorna o status do scheduler e da liderança"""
+        status = {
+            'ativo': False,
+            'jobs': [],
+            'lider': cls.lider,
+            'processo': cls.trava_lider.dono if cls.trava_lider else None,
+            'lider_atual': cls.obter_lider_atual(),
+        }
         
-        if cls.scheduler.running:
-            jobs = [
+        if cls.scheduler is not None and cls.scheduler.running:
+            status['ativo'] = True
+            status['jobs'] = [
                 {
                     'id': job.id,
                     'nome': job.name,
                     'next_run_time': str(job.next_run_time),
                 }
                 for job in cls.scheduler.get_jobs()
+                if job.id.startswith(cls.PREFIXO_JOB)
             ]
-            return {'ativo': True, 'jobs': jobs}
         
-        return {'ativo': False, 'jobs': []}
+        return status
@@ -1,40 +1,34 @@
 """
-Signals para sincronização automática do scheduler quando agendamentos são modificados
+Signals que invalidam caches quando modelos de configuração são modificados
+e que ajustam as conexões SQLite ao abrir (settings.SQLITE_PRAGMAS)
+
+FormulaItem não tem signal de exclusão (desligaria o fast delete do Django): quem exclui
+fórmulas chama ContadorTarefasFuncionario.recalcular_apos_excluir antes
+
+Agendamentos (AgendamentoSincronizacao) não têm signal: o líder do scheduler percebe as
+alterações pela assinatura da tabela e reconcilia só os jobs afetados
+(AgendadorSincronizacao.verificar_alteracoes), em qualquer processo que as tenha feito
 """
-import logging
+from django.conf import settings
+from django.db.backends.signals import connection_created
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from core.models import AgendamentoSincronizacao
-
-logger = logging.getLogger(__name__)
+from core.classificador_produto import invalidar_cache_tipos_produto
+from core.models import TipoProduto
 
 
-@receiver(post_save, sender=AgendamentoSincronizacao)
-def recarregar_scheduler_ao_salvar(sender, instance, created, **kwargs):
-    """Recarrega o scheduler automaticamente quando um agendamento é criado/modificado"""
-    try:
-        from core.scheduler import AgendadorSincronizacao
-        
-        acao = "criado" if created else "modificado"
-        logger.info(f"Agendamento '{instance.nome}' foi {acao}. Recarregando scheduler...")
-        
-        AgendadorSincronizacao.recarregar_agendamentos()
-        logger.info(f"[OK] Scheduler recarregado com sucesso apos {acao} o agendamento '{instance.nome}'")
-        
-    except Exception as e:
-        logger.error(f"[ERRO] Falha ao recarregar scheduler apos salvar agendamento: {str(e)}")
+@receiver(post_save, sender=TipoProduto)
+@receiver(post_delete, sender=TipoProduto)
+def invalidar_cache_tipo_produto(sender, instance, **kwargs):
+    """Descarta o cache do classificador quando um TipoProduto muda (ex: pelo admin)"""
+    invalidar_cache_tipos_produto()
 
 
-@receiver(post_delete, sender=AgendamentoSincronizacao)
-def recarregar_scheduler_ao_deletar(sender, instance, **kwargs):
-    """Recarrega o scheduler automaticamente quando um agendamento é deletado"""
-    try:
-        from core.scheduler import AgendadorSincronizacao
-        
-        logger.info(f"Agendamento '{instance.nome}' foi deletado. Recarregando scheduler...")
-        
-        AgendadorSincronizacao.recarregar_agendamentos()
-        logger.info(f"[OK] Scheduler recarregado com sucesso apos deletar o agendamento '{instance.nome}'")
-        
-    except Exception as e:
-        logger.error(f"[ERRO] Falha ao recarregar scheduler apos deletar agendamento: {str(e)}")
+@receiver(connection_created)
+def ajustar_conexao_sqlite(sender, connection, **kwargs):
+    """Aplica os PRAGMAs do perfil SQLite (WAL, synchronous, mmap, busy_timeout) em cada conexão aberta"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, valor in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {valor}')
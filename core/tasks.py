@@ -1,11 +1,44 @@
-import requests
-from celery import shared_task
-from django.core.management import call_command
+from celery import chord, group, shared_task
+from datetime import timedelta
 from django.utils import timezone
 import logging
 
+from core.ingestao import CONTADORES, totalizar
+from core.models import ConfiguracaoAPI, ExecucaoSincronizacao, TravaDistribuida
+from core.reconciliacao import reconciliar_apis_ativas
+from core.resiliencia_api import OrcamentoTentativas, circuito_aberto, registrar_falha, registrar_sucesso
+from core.scheduler import AgendadorSincronizacao, SincronizadorAPI
+from core.trava_distribuida import trava_sincronizacao_api
+
 logger = logging.getLogger(__name__)
 
+# Prazo da trava da API durante o fan-out: cobre a espera das páginas na fila; cada página a renova
+DURACAO_TRAVA_PAGINAS = 10 * 60
+
+
+def sincronizar_apis_ativas(paginacoes):
+    """
+    Sincroniza as páginas em todas as APIs ativas pelo mesmo pipeline do scheduler
+    As APIs rodam em paralelo (SincronizadorAPI.sincronizar_em_paralelo); o erro de uma não para as outras
+    Retorna os totais e o tempo de parede por API (APIs ignoradas por circuito aberto ou trava ficam de fora)
+    Falha só se todas as APIs falharem, para a task poder tentar de novo
+    """
+    trabalhos = [
+        (api.nome, lambda api=api: SincronizadorAPI.sincronizar_api(api, paginacoes, incremental=False))
+        for api in ConfiguracaoAPI.objects.filter(ativa=True)
+    ]
+    resultados = SincronizadorAPI.sincronizar_em_paralelo(trabalhos)
+    if resultados and all(resultado['erro'] for resultado in resultados):
+        raise RuntimeError('; '.join(f"{resultado['api']}: {resultado['erro']}" for resultado in resultados))
+    
+    totais = {}
+    for resultado in resultados:
+        if resultado['erro']:
+            totais[resultado['api']] = {'erro': resultado['erro'], 'tempo_segundos': resultado['tempo_segundos']}
+        elif not resultado['ignorada']:
+            totais[resultado['api']] = {**resultado['totais'], 'tempo_segundos': resultado['tempo_segundos']}
+    return totais
+
 
 @shared_task(bind=True, max_retries=3)
 def sincronizar_pedidos_da_api(self):
@@ -16,11 +49,10 @@ def sincronizar_pedidos_da_api(self):
     try:
         logger.info(f"[{timezone.now()}] Iniciando sincronização de pedidos da API (novo fluxo)...")
         
-        # Chamar o novo comando de management com fluxo de fórmulas
-        call_command('sincronizar_formulas_api', pagina=1, tamanho=50, verbosity=2)
+        totais = sincronizar_apis_ativas([{'pagina': 1, 'tamanho': 50}])
         
         logger.info(f"[{timezone.now()}] [OK] Sincronização concluída com sucesso!")
-        return {"status": "sucesso", "timestamp": str(timezone.now())}
+        return {"status": "sucesso", "timestamp": str(timezone.now()), "apis": totais}
         
     except Exception as exc:
         logger.error(f"Erro na sincronização: {str(exc)}")
@@ -29,22 +61,172 @@ def sincronizar_pedidos_da_api(self):
 
 
 @shared_task
-def sincronizar_multiplas_paginas(total_paginas=10):
+def sincronizar_agendamentos_agora(agendamento_id=None):
+    """
+    Sincronização manual de um ou de todos os agendamentos, pedida pela web (view e admin)
+    Roda no worker Celery: a requisição só enfileira e retorna, sem ocupar o processo web
+    Retorna o resultado por API (ver SincronizadorAPI.sincronizar_em_paralelo)
+    """
+    return AgendadorSincronizacao.sincronizar_agora(agendamento_id)
+
+
+@shared_task
+def sincronizar_multiplas_paginas(total_paginas=10, tamanho=50):
     """
     Task para sincronizar múltiplas páginas da API
     Útil para sincronização inicial ou limpeza completa
     Usa o novo fluxo com PedidoMestre e FormulaItem
+    
+    Fan-out: por API ativa, um chord com uma task por página (sincronizar_pagina_da_api) e
+    consolidar_paginas_da_api como callback, que grava a ExecucaoSincronizacao da API.
+    As páginas rodam em workers diferentes e a falha de uma não interrompe as outras.
+    A trava da API é adquirida aqui e liberada pelo callback: scheduler e comandos não
+    sincronizam a API no meio do fan-out. O orçamento de novas tentativas da execução é
+    dividido entre as páginas. APIs já em sincronização por outro processo são ignoradas.
+    Retorna o id da ExecucaoSincronizacao e do resultado do callback de cada API
+    """
+    disparadas = {}
+    for api in ConfiguracaoAPI.objects.filter(ativa=True):
+        trava = trava_sincronizacao_api(api.pk, duracao=DURACAO_TRAVA_PAGINAS)
+        if not trava.adquirir():
+            logger.warning(f"[IGNORADO] API '{api.nome}' já está sendo sincronizada por outro processo")
+            continue
+        execucao = ExecucaoSincronizacao.objects.create(api=api)
+        tentativas = dividir_tentativas(api.tentativas_por_execucao, total_paginas)
+        paginas = group(
+            sincronizar_pagina_da_api.s(api.pk, pagina, tamanho, trava.dono, tentativas[pagina - 1])
+            for pagina in range(1, total_paginas + 1)
+        )
+        resultado = chord(paginas)(consolidar_paginas_da_api.s(execucao.pk, trava.dono))
+        disparadas[api.nome] = {'execucao': execucao.pk, 'resultado': resultado.id}
+    
+    logger.info(f"[FAN-OUT] {total_paginas} página(s) disparada(s) para {len(disparadas)} API(s)")
+    return {"status": "disparada", "paginas": total_paginas, "apis": disparadas}
+
+
+def dividir_tentativas(total, paginas):
+    """Divide o orçamento de novas tentativas da execução entre as páginas (as primeiras ficam com o resto)"""
+    base, resto = divmod(total, max(paginas, 1))
+    return [base + (1 if pagina < resto else 0) for pagina in range(paginas)]
+
+
+def resumo_pagina(resultado):
+    """Resultado de uma página reduzido ao que o callback usa, serializável em JSON"""
+    processamento = resultado.get('processamento') or {}
+    return {
+        'sucesso': bool(resultado.get('sucesso')),
+        'status': resultado.get('status'),
+        'erro': resultado.get('erro', ''),
+        'pagina': resultado.get('pagina'),
+        'tamanho': resultado.get('tamanho'),
+        'latencia_ms': resultado.get('latencia_ms'),
+        'bytes_recebidos': resultado.get('bytes_recebidos', 0),
+        'items_recebidos': resultado.get('items_recebidos', 0),
+        'tempo_gravacao_ms': resultado.get('tempo_gravacao_ms'),
+        'processamento': {campo: processamento.get(campo, 0) for campo in CONTADORES},
+    }
+
+
+@shared_task
+def sincronizar_pagina_da_api(api_id, pagina, tamanho=50, dono_trava=None, tentativas=None):
+    """
+    Busca e grava uma página de uma API (parte do chord de sincronizar_multiplas_paginas)
+    dono_trava: dono da trava da API adquirida pelo fan-out; a página a renova e não roda se
+    ela expirou e foi assumida por outro processo. Sem dono (chamada avulsa) a página adquire a trava.
+    tentativas: parte da página no orçamento de novas tentativas (padrão: o da API inteiro)
+    Não levanta exceção: a falha vira um resultado sem sucesso, para o callback rodar mesmo assim
     """
     try:
-        logger.info(f"Iniciando sincronização de {total_paginas} páginas (novo fluxo)...")
-        
-        for pagina in range(1, total_paginas + 1):
-            logger.info(f"Sincronizando página {pagina}/{total_paginas}...")
-            call_command('sincronizar_formulas_api', pagina=pagina, tamanho=50, verbosity=1)
-        
-        logger.info("[OK] Sincronização de múltiplas páginas concluída!")
-        return {"status": "sucesso", "paginas": total_paginas}
-        
+        if dono_trava:
+            if not trava_sincronizacao_api(api_id, duracao=DURACAO_TRAVA_PAGINAS, dono=dono_trava).renovar():
+                return resumo_pagina({'pagina': pagina, 'tamanho': tamanho, 'erro': 'Trava da API perdida'})
+            return buscar_e_gravar_pagina(api_id, pagina, tamanho, tentativas)
+        with trava_sincronizacao_api(api_id).manter_durante() as adquirida:
+            if not adquirida:
+                return resumo_pagina({'pagina': pagina, 'tamanho': tamanho, 'erro': 'API em sincronização por outro processo'})
+            return buscar_e_gravar_pagina(api_id, pagina, tamanho, tentativas)
     except Exception as e:
-        logger.error(f"Erro na sincronização de múltiplas páginas: {str(e)}")
-        raise
+        logger.error(f"[ERRO] Falha na página {pagina} da API {api_id}: {str(e)}")
+        return resumo_pagina({'pagina': pagina, 'tamanho': tamanho, 'erro': str(e)})
+
+
+def buscar_e_gravar_pagina(api_id, pagina, tamanho, tentativas=None):
+    """Corpo de sincronizar_pagina_da_api, executado com a trava da API"""
+    api_config = ConfiguracaoAPI.objects.get(pk=api_id)
+    if circuito_aberto(api_config):
+        return resumo_pagina({'pagina': pagina, 'tamanho': tamanho, 'erro': 'Circuito aberto'})
+    
+    if tentativas is None:
+        tentativas = api_config.tentativas_por_execucao
+    pagina_buscada = SincronizadorAPI.buscar_pagina(api_config, pagina, tamanho, orcamento=OrcamentoTentativas(tentativas))
+    if not pagina_buscada['sucesso']:
+        registrar_falha(api_config)
+        return resumo_pagina(pagina_buscada)
+    registrar_sucesso(api_config)
+    
+    pagina_buscada['api_id'] = api_config.pk
+    with SincronizadorAPI.gravacao_serializada():
+        return resumo_pagina(SincronizadorAPI.processar_pagina(pagina_buscada))
+
+
+@shared_task
+def consolidar_paginas_da_api(resultados, execucao_id, dono_trava=None):
+    """
+    Callback do chord: registra as páginas na ExecucaoSincronizacao, finaliza-a,
+    libera a trava da API adquirida pelo fan-out e retorna os totais consolidados da API
+    """
+    execucao = ExecucaoSincronizacao.objects.select_related('api').get(pk=execucao_id)
+    resultados = sorted(resultados, key=lambda resultado: resultado.get('pagina') or 0)
+    for resultado in resultados:
+        execucao.registrar_pagina(resultado)
+    execucao.finalizar()
+    if dono_trava:
+        trava = trava_sincronizacao_api(execucao.api_id, duracao=DURACAO_TRAVA_PAGINAS, dono=dono_trava)
+        # Renovar confirma que a trava ainda é do fan-out antes de liberá-la
+        if trava.renovar():
+            trava.liberar()
+    
+    logger.info(f"[OK] {execucao.api.nome}: {execucao.total_paginas} página(s), status {execucao.status}")
+    return {
+        'api': execucao.api.nome,
+        'execucao': execucao.pk,
+        'status': execucao.status,
+        'tempo_segundos': execucao.duracao_segundos,
+        **totalizar(resultados),
+    }
+
+
+@shared_task
+def reconciliar_formulas_da_api(tamanho_pagina=500):
+    """
+    Task para cancelar fórmulas em triagem que sumiram do ERP
+    Lê a listagem completa das APIs ativas; não cancela nada se a leitura ficar incompleta
+    """
+    resultado = reconciliar_apis_ativas(tamanho_pagina=tamanho_pagina)
+    if resultado['motivo']:
+        logger.warning(f"Reconciliação abortada: {resultado['motivo']}")
+        return {"status": "abortada", "motivo": resultado['motivo']}
+    return {"status": "sucesso", "ids_erp": resultado['ids_erp'], **resultado['cancelamento']}
+
+
+@shared_task
+def encerrar_execucoes_paradas(minutos=30):
+    """
+    Fecha como falha as ExecucaoSincronizacao em andamento há mais de `minutos` cuja API não
+    tem a trava de sincronização ativa: o processo ou o callback do fan-out morreu sem finalizá-las
+    Retorna quantas foram encerradas
+    """
+    agora = timezone.now()
+    travas_ativas = set(TravaDistribuida.objects.filter(expira_em__gt=agora).values_list('nome', flat=True))
+    paradas = ExecucaoSincronizacao.objects.filter(
+        status='em_andamento', iniciada_em__lt=agora - timedelta(minutes=minutos),
+    ).select_related('api')
+    encerradas = 0
+    for execucao in paradas:
+        if trava_sincronizacao_api(execucao.api_id).nome in travas_ativas:
+            continue
+        execucao.finalizar(mensagem_erro='Execução abandonada: não foi finalizada e a trava da API expirou')
+        encerradas += 1
+    if encerradas:
+        logger.warning(f"[EXECUCOES] {encerradas} execução(ões) parada(s) encerrada(s) como falha")
+    return encerradas
@@ -1,3 +1,1407 @@
-from django.test import TestCase
+import json
+import os
+import signal
+import tempfile
+import threading
+import tracemalloc
+from datetime import date, time, timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from math import ceil
+from time import perf_counter, sleep
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import requests
+from apscheduler.schedulers.background import BackgroundScheduler
+from django.apps import apps as django_apps
+from django.contrib.admin import site
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models.signals import post_delete
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.api_simulada import DadosSimulados, ServidorSimulado
+from core.api_sync_helpers import calcular_hash_origem, converter_datetime_api
+from core.cassetes_api import GravadorCassete, ler_cassetes
+from core.classificador_produto import (
+    TIPO_DESCONHECIDO, classificar_tipo, extrair_tipo_produto, invalidar_cache_tipos_produto, obter_tipo_produto,
+)
+from core.ingestao import (
+    limpar_linhas_brutas, lotes_por_nrorc, pipeline_padrao, pipeline_staging, totalizar, valores_formula_api,
+)
+from core.json_stream import JSONInvalido, iterar_itens_json
+from core.metricas_sincronizacao import percentil, resumo_execucoes
+from core.models import (
+    AgendamentoSincronizacao, ConfiguracaoAPI, ContadorTarefasFuncionario, Etapa, ExecucaoSincronizacao, FormulaItem,
+    HistoricoEtapaFormula, LinhaBrutaAPI, LogAuditoria, Penalizacao, PedidoMestre, PontuacaoFuncionario,
+    TipoProduto, TravaDistribuida, ocupa_vaga,
+)
+from core.reconciliacao import reconciliar_apis_ativas
+from core.resiliencia_api import MAX_TENTATIVAS_PAGINA, circuito_aberto
+from core.scheduler import AgendadorSincronizacao, SincronizadorAPI
+from core.tasks import (
+    encerrar_execucoes_paradas, sincronizar_agendamentos_agora, sincronizar_multiplas_paginas, sincronizar_pedidos_da_api,
+)
+from core.trava_distribuida import Trava, trava_sincronizacao_api
+from producao_gamificada.celery import app
+
+
+class FanOutPaginasTests(TestCase):
+    """sincronizar_multiplas_paginas: chord de uma task por página, sem Redis (broker em memória, modo eager)"""
+
+    CONFIGURACAO_CELERY = {
+        'broker_url': 'memory://',
+        'result_backend': 'cache+memory://',
+        'task_always_eager': True,
+        'task_eager_propagates': True,
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.configuracao_original = {chave: app.conf[chave] for chave in cls.CONFIGURACAO_CELERY}
+        app.conf.update(cls.CONFIGURACAO_CELERY)
+
+    @classmethod
+    def tearDownClass(cls):
+        app.conf.update(cls.configuracao_original)
+        super().tearDownClass()
+
+    def sincronizar(self, total_paginas=3, tamanho=10):
+        # 25 itens: páginas de 10, 10 e 5
+        with ServidorSimulado(DadosSimulados(25, 0.0, semente=1), latencia=0) as servidor:
+            ConfiguracaoAPI.objects.create(
+                nome='simulada', url_base=servidor.url_base, timeout=5, requisicoes_condicionais=False,
+            )
+            retorno = sincronizar_multiplas_paginas.delay(total_paginas=total_paginas, tamanho=tamanho).get()
+        return ExecucaoSincronizacao.objects.get(pk=retorno['apis']['simulada']['execucao'])
+
+    def test_callback_consolida_as_paginas_numa_execucao(self):
+        execucao = self.sincronizar()
+
+        self.assertEqual(execucao.status, 'concluida')
+        self.assertEqual(execucao.total_paginas, 3)
+        self.assertEqual(execucao.itens_recebidos, 25)
+        self.assertEqual(FormulaItem.objects.filter(id_api__startswith='SIM-').count(), 25)
+        self.assertEqual(list(execucao.paginas.values_list('pagina', flat=True).order_by('pagina')), [1, 2, 3])
+
+    def test_falha_de_uma_pagina_nao_interrompe_as_outras(self):
+        buscar_pagina = SincronizadorAPI.buscar_pagina
+
+        def falhar_pagina_2(api_config, pagina, tamanho, **kwargs):
+            if pagina == 2:
+                raise RuntimeError('falha simulada')
+            return buscar_pagina(api_config, pagina, tamanho, **kwargs)
+
+        with mock.patch.object(SincronizadorAPI, 'buscar_pagina', side_effect=falhar_pagina_2):
+            execucao = self.sincronizar()
+
+        self.assertEqual(execucao.status, 'com_erros')
+        self.assertEqual(execucao.total_paginas, 3)
+        self.assertEqual(execucao.itens_recebidos, 15)
+        pagina_com_falha = execucao.paginas.get(sucesso=False)
+        self.assertEqual(pagina_com_falha.pagina, 2)
+        self.assertIn('falha simulada', pagina_com_falha.erro)
+
+    def test_paginas_rodam_sob_a_trava_da_api_com_o_orcamento_dividido(self):
+        buscar_pagina = SincronizadorAPI.buscar_pagina
+        durante = []
+
+        def observar(api_config, pagina, tamanho, **kwargs):
+            # Outro processo (scheduler, comando) não consegue a trava da API no meio do fan-out
+            durante.append((pagina, trava_sincronizacao_api(api_config.pk).adquirir(), kwargs['orcamento'].restantes))
+            return buscar_pagina(api_config, pagina, tamanho, **kwargs)
+
+        with mock.patch.object(SincronizadorAPI, 'buscar_pagina', side_effect=observar):
+            execucao = self.sincronizar()
+
+        # tentativas_por_execucao = 6 dividido entre 3 páginas
+        self.assertEqual(sorted(durante), [(1, False, 2), (2, False, 2), (3, False, 2)])
+        self.assertEqual(execucao.status, 'concluida')
+        # O callback libera a trava
+        self.assertTrue(trava_sincronizacao_api(execucao.api_id).adquirir())
+
+    def test_api_ja_em_sincronizacao_e_ignorada(self):
+        api = ConfiguracaoAPI.objects.create(nome='ocupada', url_base='http://127.0.0.1:9/tabelas/FC0M100')
+        self.assertTrue(trava_sincronizacao_api(api.pk).adquirir())
+
+        retorno = sincronizar_multiplas_paginas.delay(total_paginas=2, tamanho=10).get()
+
+        self.assertEqual(retorno['apis'], {})
+        self.assertFalse(ExecucaoSincronizacao.objects.exists())
+
+    def test_execucao_abandonada_e_encerrada(self):
+        livre = ConfiguracaoAPI.objects.create(nome='livre', url_base='http://127.0.0.1:9/a')
+        ocupada = ConfiguracaoAPI.objects.create(nome='em-uso', url_base='http://127.0.0.1:9/b')
+        abandonada = ExecucaoSincronizacao.objects.create(api=livre)
+        em_andamento = ExecucaoSincronizacao.objects.create(api=ocupada)
+        recente = ExecucaoSincronizacao.objects.create(api=livre)
+        ExecucaoSincronizacao.objects.exclude(pk=recente.pk).update(iniciada_em=timezone.now() - timedelta(hours=1))
+        trava_sincronizacao_api(ocupada.pk).adquirir()
+
+        self.assertEqual(encerrar_execucoes_paradas(minutos=30), 1)
+
+        status = dict(ExecucaoSincronizacao.objects.values_list('pk', 'status'))
+        self.assertEqual(
+            (status[abandonada.pk], status[em_andamento.pk], status[recente.pk]),
+            ('falhou', 'em_andamento', 'em_andamento'),
+        )
+
+
+class IngestaoEmLotesTests(TestCase):
+    """PipelineIngestao com tamanho_lote: memória limitada pelo lote, não pelo tamanho da página"""
+
+    ITENS = 6_000
+    LOTE = 250
+
+    @staticmethod
+    def itens_sinteticos(total):
+        # Três itens por NRORC, gerados sob demanda como no parser em streaming
+        for i in range(total):
+            yield {
+                'NRORC': 500000 + i // 3, 'ID': f'LOTE-{i}', 'DESCRICAOWEB': f'CAPSULA {i} | 30ML', 'QUANT': 1,
+                'SERIEO': 'A', 'PRUNI': 10.5, 'VRTOT': 10.5, 'DTALT': '2026-03-02', 'HRALT': '10:00:00',
+            }
+
+    def test_lotes_nao_separam_itens_do_mesmo_nrorc(self):
+        fluxo = ((item['ID'], item) for item in self.itens_sinteticos(20))
+        lotes = list(lotes_por_nrorc(fluxo, 4))
+
+        self.assertEqual([len(lote) for lote in lotes], [6, 6, 6, 2])
+        nrorcs_por_lote = [{item['NRORC'] for _, item in lote} for lote in lotes]
+        for anterior, seguinte in zip(nrorcs_por_lote, nrorcs_por_lote[1:]):
+            self.assertFalse(anterior & seguinte)
+
+    def test_pico_de_memoria_de_pagina_grande_na_sincronizacao(self):
+        # Caminho real: busca HTTP (servidor simulado, corpo em blocos), decodificação em
+        # streaming e pipeline padrão (ORM), com lotes menores para o teste ser rápido
+        with ServidorSimulado(DadosSimulados(self.ITENS, semente=2)) as servidor:
+            api = ConfiguracaoAPI.objects.create(
+                nome='pagina-grande', url_base=servidor.url_base, timeout=60, requisicoes_condicionais=False,
+            )
+            tracemalloc.start()
+            try:
+                with mock.patch.object(pipeline_padrao, 'tamanho_lote', self.LOTE):
+                    resultados = SincronizadorAPI.sincronizar_api(
+                        api, [{'pagina': 1, 'tamanho': self.ITENS}], incremental=False,
+                    )
+                _, pico = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+        totais = totalizar(resultados)
+        self.assertEqual((totais['itens'], totais['criados'] > 0, totais['erros']), (self.ITENS, True, 0))
+        self.assertEqual(FormulaItem.objects.filter(id_api__startswith='SIM-').count(), self.ITENS)
+        # A página decodificada inteira (corpo + lista de dicts) passaria de 6 MB; em streaming
+        # o pico fica no tamanho de um lote
+        self.assertLess(pico, 4 * 1024 * 1024)
+
+
+class GravacaoPorConjuntoTests(TestCase):
+    """gravar: consultas fixas por página e gravação item a item quando a transação da página falha"""
+
+    @staticmethod
+    def itens(inicio, total, **campos):
+        return [
+            {
+                'NRORC': 700000 + i // 3, 'ID': f'CONJ-{i}', 'DESCRICAOWEB': f'CAPSULA {i} | 30ML', 'QUANT': 1,
+                'SERIEO': 'A', 'PRUNI': 10.5, 'VRTOT': 10.5, 'DTALT': '2026-03-02', 'HRALT': '10:00:00', **campos,
+            }
+            for i in range(inicio, inicio + total)
+        ]
+
+    def processar(self, itens):
+        return pipeline_padrao.processar_pagina({'sucesso': True, 'status': 200, 'pagina': 1, 'itens': itens})
+
+    @staticmethod
+    def lotes_insert(modelo, total):
+        # INSERTs que o banco exige por limite de parâmetros (SQLite: 999); nos demais, um só
+        campos = [campo for campo in modelo._meta.concrete_fields if not campo.primary_key]
+        return ceil(total / connection.ops.bulk_batch_size(campos, [None] * total))
+
+    def test_paginas_de_10_e_100_itens_com_as_mesmas_consultas(self):
+        # Primeira página cria a etapa inicial; as medidas começam depois dela
+        self.processar(self.itens(1000, 3))
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self.processar(self.itens(0, 10))['processamento']['criados'], 14)
+        lotes_extras = self.lotes_insert(FormulaItem, 100) - self.lotes_insert(FormulaItem, 10)
+
+        with self.assertNumQueries(len(consultas) + lotes_extras):
+            self.assertEqual(self.processar(self.itens(10, 100))['processamento']['criados'], 133)
+
+    def test_item_que_falha_nao_derruba_a_pagina(self):
+        itens = self.itens(0, 5)
+        # Inteiro fora do intervalo do banco: o bulk_create da página inteira falha
+        itens[2]['QUANT'] = 10 ** 20
+
+        resultado = self.processar(itens)
+
+        self.assertTrue(resultado['sucesso'])
+        self.assertEqual((resultado['processamento']['criados'], resultado['processamento']['erros']), (6, 1))
+        self.assertEqual(
+            sorted(FormulaItem.objects.filter(id_api__startswith='CONJ-').values_list('id_api', flat=True)),
+            ['CONJ-0', 'CONJ-1', 'CONJ-3', 'CONJ-4'],
+        )
+
+
+class MesclagemStagingTests(TestCase):
+    """pipeline_staging: LinhaBrutaAPI mesclada por SQL em PedidoMestre/FormulaItem"""
+
+    @staticmethod
+    def item(id_api, quant=1, preco=10.5, descricao='CAPSULA | 60CAP'):
+        return {
+            'NRORC': 880001, 'ID': id_api, 'DESCRICAOWEB': descricao, 'QUANT': quant, 'SERIEO': 'B',
+            'PRUNI': preco, 'VRTOT': round(preco * quant, 2), 'DTALT': '2026-03-02', 'HRALT': '10:00:00',
+        }
+
+    def processar(self, itens):
+        resultado = pipeline_staging.processar_pagina({'sucesso': True, 'status': 200, 'pagina': 1, 'itens': itens})
+        return resultado['processamento']
+
+    def test_mescla_novas_alteradas_e_iguais(self):
+        primeira = self.processar([self.item('STG-1'), self.item('STG-2')])
+        self.assertEqual((primeira['criados'], primeira['atualizados'], primeira['sem_mudancas']), (3, 0, 0))
+
+        segunda = self.processar([
+            self.item('STG-1'), self.item('STG-2', quant=3, preco=12.0, descricao=''), self.item('STG-3'),
+        ])
+
+        self.assertEqual((segunda['criados'], segunda['atualizados'], segunda['sem_mudancas']), (1, 1, 1))
+        formulas = FormulaItem.objects.select_related('pedido_mestre').in_bulk(field_name='id_api')
+        self.assertEqual(set(formulas), {'STG-1', 'STG-2', 'STG-3'})
+        self.assertEqual({f.pedido_mestre.nrorc for f in formulas.values()}, {880001})
+        alterada = formulas['STG-2']
+        # Descrição vazia na API mantém a gravada
+        self.assertEqual(
+            (alterada.quantidade, alterada.price_unit, alterada.price_total, alterada.descricao, alterada.serieo),
+            (3, Decimal('12.00'), Decimal('36.00'), 'CAPSULA | 60CAP', 'B'),
+        )
+        self.assertEqual(alterada.hash_origem, LinhaBrutaAPI.objects.filter(id_api='STG-2').latest('id').hash_origem)
+        self.assertEqual((formulas['STG-3'].status, formulas['STG-3'].quantidade_unidades), ('em_triagem', 60))
+
+    def test_linhas_brutas_marcadas_e_removidas_apos_a_retencao(self):
+        self.processar([self.item('STG-1'), self.item('STG-2')])
+        self.processar([self.item('STG-1', quant=2)])
+
+        # Mescladas ficam como registro do que a API enviou, até a retenção
+        self.assertEqual(LinhaBrutaAPI.objects.count(), 3)
+        self.assertFalse(LinhaBrutaAPI.objects.filter(mesclada_em__isnull=True).exists())
+        self.assertEqual(limpar_linhas_brutas(dias=30), 0)
+
+        LinhaBrutaAPI.objects.exclude(id_api='STG-1', quantidade=2).update(
+            recebida_em=timezone.now() - timedelta(days=31),
+        )
+        self.assertEqual(limpar_linhas_brutas(dias=30), 2)
+        self.assertEqual(list(LinhaBrutaAPI.objects.values_list('id_api', 'quantidade')), [('STG-1', 2)])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN é do SQLite')
+class IndicesConsultasQuentesTests(TestCase):
+    """As consultas mais frequentes das telas e rankings usam índice (sem varrer a tabela)"""
+
+    STATUS_ABERTOS = ['em_triagem', 'em_producao', 'em_qualidade']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('funcionario-indices')
+        cls.etapa = Etapa.objects.create(nome='Triagem', sequencia=1)
+        pedido = PedidoMestre.objects.create(nrorc=123)
+        cls.formula = FormulaItem.objects.create(pedido_mestre=pedido, id_api='IDX-1', descricao='CAPSULA')
+        cls.inicio_mes = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    def assertUsaIndice(self, queryset, *indices):
+        """O plano não varre a tabela do queryset e usa um dos índices esperados"""
+        plano = queryset.explain()
+        tabela = queryset.model._meta.db_table
+        self.assertNotRegex(plano, rf'SCAN {tabela}\b(?! USING)', f'Varredura de {tabela}:\n{plano}')
+        self.assertTrue(any(indice in plano for indice in indices), f'Plano sem {" / ".join(indices)}:\n{plano}')
+
+    def test_tarefas_do_funcionario(self):
+        self.assertUsaIndice(
+            FormulaItem.objects.filter(
+                funcionario_na_etapa=self.usuario, status__in=self.STATUS_ABERTOS, eh_tarefa_ativa=True,
+            ),
+            'formula_func_status_idx',
+        )
+
+    def test_formulas_disponiveis(self):
+        self.assertUsaIndice(
+            FormulaItem.objects.filter(
+                funcionario_na_etapa__isnull=True, status__in=self.STATUS_ABERTOS,
+            ).select_related('pedido_mestre', 'etapa_atual').order_by('-pedido_mestre__nrorc', 'serieo'),
+            # O SQLite também resolve IS NULL pelo índice composto; o parcial é o menor dos dois
+            'formula_disponivel_idx', 'formula_func_status_idx',
+        )
+
+    def test_pontos_do_funcionario_no_mes(self):
+        self.assertUsaIndice(
+            PontuacaoFuncionario.objects.filter(funcionario=self.usuario, mes_referencia=date.today().replace(day=1)),
+            'pontuacao_func_mes_idx',
+        )
+
+    def test_historico_da_formula_na_etapa(self):
+        self.assertUsaIndice(
+            HistoricoEtapaFormula.objects.filter(formula=self.formula, etapa=self.etapa),
+            'historico_formula_etapa_idx',
+        )
+
+    def test_historico_do_funcionario_no_mes(self):
+        self.assertUsaIndice(
+            HistoricoEtapaFormula.objects.filter(funcionario=self.usuario, timestamp_inicio__gte=self.inicio_mes),
+            'historico_func_inicio_idx',
+        )
+
+    def test_penalizacoes_do_funcionario_no_mes(self):
+        self.assertUsaIndice(
+            Penalizacao.objects.filter(
+                funcionario=self.usuario, timestamp__gte=self.inicio_mes, revertida=False,
+            ).order_by('-timestamp'),
+            'penalizacao_func_ts_idx',
+        )
+
+    def test_logs_recentes(self):
+        self.assertUsaIndice(LogAuditoria.objects.order_by('-timestamp')[:50], 'log_timestamp_idx')
+
+    def test_logs_por_acao_no_periodo(self):
+        self.assertUsaIndice(
+            LogAuditoria.objects.filter(
+                acao='assumir_etapa', timestamp__gte=timezone.now() - timedelta(days=7),
+            ).order_by('-timestamp'),
+            'log_acao_ts_idx',
+        )
+
+
+class TarefasDoFuncionarioTests(TestCase):
+    """Invariantes no banco: uma tarefa ativa por funcionário e limite de tarefas pelo contador"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('funcionario-tarefas')
+        cls.triagem = Etapa.objects.create(nome='Triagem', sequencia=1)
+        cls.expedicao = Etapa.objects.create(nome='Expedição', sequencia=4)
+        pedido = PedidoMestre.objects.create(nrorc=456)
+        cls.formulas = [
+            FormulaItem.objects.create(pedido_mestre=pedido, id_api=f'TAREFA-{i}', descricao='CAPSULA', etapa_atual=cls.triagem)
+            for i in range(2)
+        ]
+
+    def test_segunda_tarefa_ativa_e_recusada_pelo_banco(self):
+        primeira, segunda = self.formulas
+        FormulaItem.objects.filter(pk=primeira.pk).update(funcionario_na_etapa=self.usuario, eh_tarefa_ativa=True)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            FormulaItem.objects.filter(pk=segunda.pk).update(funcionario_na_etapa=self.usuario, eh_tarefa_ativa=True)
+
+        # Fora dos status em aberto a fórmula não conta como tarefa ativa
+        FormulaItem.objects.filter(pk=primeira.pk).update(status='cancelado')
+        FormulaItem.objects.filter(pk=segunda.pk).update(funcionario_na_etapa=self.usuario, eh_tarefa_ativa=True)
+
+    def test_reserva_para_no_limite_e_volta_ao_liberar(self):
+        limite = ContadorTarefasFuncionario.LIMITE_TAREFAS
+        reservas = [ContadorTarefasFuncionario.reservar(self.usuario) for _ in range(limite + 1)]
+
+        self.assertEqual(reservas, [True] * limite + [False])
+        ContadorTarefasFuncionario.liberar(self.usuario)
+        self.assertTrue(ContadorTarefasFuncionario.reservar(self.usuario))
+
+    def test_recalcular_conta_as_formulas_em_aberto(self):
+        FormulaItem.objects.filter(pk__in=[f.pk for f in self.formulas]).update(funcionario_na_etapa=self.usuario)
+        ContadorTarefasFuncionario.objects.create(funcionario=self.usuario, tarefas=5)
+
+        self.assertEqual(ContadorTarefasFuncionario.recalcular([self.usuario.pk]), 1)
+        self.assertEqual(ContadorTarefasFuncionario.objects.get(funcionario=self.usuario).tarefas, 2)
+
+    def test_recalcular_e_ocupa_vaga_usam_a_mesma_regra(self):
+        primeira, segunda = self.formulas
+        FormulaItem.objects.filter(pk=primeira.pk).update(funcionario_na_etapa=self.usuario, etapa_atual=None)
+        FormulaItem.objects.filter(pk=segunda.pk).update(funcionario_na_etapa=self.usuario, etapa_atual=self.expedicao)
+        terceira = FormulaItem.objects.create(
+            pedido_mestre=primeira.pedido_mestre, id_api='TAREFA-2', descricao='CAPSULA',
+            etapa_atual=self.triagem, funcionario_na_etapa=self.usuario,
+        )
+
+        ContadorTarefasFuncionario.recalcular([self.usuario.pk])
+
+        formulas = FormulaItem.objects.select_related('etapa_atual').filter(funcionario_na_etapa=self.usuario)
+        self.assertEqual([f.id_api for f in formulas if ocupa_vaga(f)], [terceira.id_api])
+        self.assertEqual(ContadorTarefasFuncionario.objects.get(funcionario=self.usuario).tarefas, 1)
+
+    def test_excluir_formula_assumida_devolve_a_vaga(self):
+        FormulaItem.objects.filter(pk__in=[f.pk for f in self.formulas]).update(funcionario_na_etapa=self.usuario)
+        ContadorTarefasFuncionario.reservar(self.usuario, 2)
+
+        # Sem signal de exclusão: o Django não precisa carregar cada fórmula excluída
+        self.assertFalse(post_delete.has_listeners(FormulaItem))
+
+        with self.captureOnCommitCallbacks(execute=True) as recalculos:
+            site._registry[FormulaItem].delete_queryset(None, FormulaItem.objects.filter(pk=self.formulas[0].pk))
+        self.assertEqual(len(recalculos), 1)
+        self.assertEqual(ContadorTarefasFuncionario.vagas(self.usuario), ContadorTarefasFuncionario.LIMITE_TAREFAS - 1)
+
+        # Exclusão do pedido leva as fórmulas em cascata
+        with self.captureOnCommitCallbacks(execute=True) as recalculos:
+            site._registry[PedidoMestre].delete_model(None, PedidoMestre.objects.get(nrorc=456))
+        self.assertEqual(len(recalculos), 1)
+        self.assertEqual(ContadorTarefasFuncionario.vagas(self.usuario), ContadorTarefasFuncionario.LIMITE_TAREFAS)
+
+    def test_migracao_preenche_contadores_com_a_regra_de_vaga(self):
+        migracao = import_module('core.migrations.0040_tarefa_ativa_unica_e_contador')
+        primeira, segunda = self.formulas
+        FormulaItem.objects.filter(pk=primeira.pk).update(funcionario_na_etapa=self.usuario)
+        FormulaItem.objects.filter(pk=segunda.pk).update(funcionario_na_etapa=self.usuario, etapa_atual=self.expedicao)
+        FormulaItem.objects.create(
+            pedido_mestre=primeira.pedido_mestre, id_api='TAREFA-2', descricao='CAPSULA', funcionario_na_etapa=self.usuario,
+        )
+        ContadorTarefasFuncionario.objects.all().delete()
+
+        migracao.corrigir_ativas_e_preencher_contadores(django_apps, None)
+
+        # Só a fórmula na triagem: expedição e fórmula sem etapa não ocupam vaga
+        self.assertEqual(ContadorTarefasFuncionario.objects.get(funcionario=self.usuario).tarefas, 1)
+        self.assertEqual(ContadorTarefasFuncionario.recalcular([self.usuario.pk]), 0)
+
+    def test_limpar_formulas_recalcula_uma_vez(self):
+        outro = User.objects.create_user('funcionario-tarefas-2')
+        FormulaItem.objects.filter(pk=self.formulas[0].pk).update(funcionario_na_etapa=self.usuario)
+        FormulaItem.objects.filter(pk=self.formulas[1].pk).update(funcionario_na_etapa=outro)
+        ContadorTarefasFuncionario.reservar(self.usuario)
+        ContadorTarefasFuncionario.reservar(outro)
+
+        with self.captureOnCommitCallbacks(execute=True) as recalculos:
+            call_command('limpar_formulas', '--confirmar', stdout=StringIO())
+
+        self.assertEqual(len(recalculos), 1)
+        self.assertEqual(
+            [ContadorTarefasFuncionario.vagas(funcionario) for funcionario in (self.usuario, outro)],
+            [ContadorTarefasFuncionario.LIMITE_TAREFAS] * 2,
+        )
+
+
+class DecodificacaoJSONTests(SimpleTestCase):
+    """iterar_itens_json: itens da lista "dados" com o corpo chegando em blocos de qualquer tamanho"""
+
+    CORPO = (
+        '{"total": 3, "meta": {"filtros": [1, [2, 3]], "texto": "a}b]\\"c"}, "dados": ['
+        '{"ID": "A-1", "DESCRICAOWEB": "ÓLEO \\"PURO\\" \\\\ 10ML\\n\\t", "PRUNI": 12.5}, '
+        '{"ID": "A-2", "LISTA": [[1, 2], [], {"x": [null, true, false]}], "QUANT": 100}, '
+        '{"ID": "A-3\\u00e7\\ud83d\\ude00", "VRTOT": -1.5e2}'
+        '], "fim": "]"}'
+    )
+
+    @staticmethod
+    def em_blocos(corpo, tamanho):
+        dados = corpo.encode('utf-8')
+        return [dados[i:i + tamanho] for i in range(0, len(dados), tamanho)]
+
+    def test_blocos_que_cortam_tokens_e_caracteres(self):
+        esperado = json.loads(self.CORPO)['dados']
+        # Todos os pontos de corte: no meio de strings, escapes, números, literais e UTF-8 multibyte
+        for tamanho in range(1, len(self.CORPO.encode('utf-8')) + 1):
+            with self.subTest(bloco=tamanho):
+                self.assertEqual(list(iterar_itens_json(self.em_blocos(self.CORPO, tamanho))), esperado)
+
+    def test_numeros_cortados_no_fim_do_bloco(self):
+        corpo = '{"dados": [10, 2.5, -300, 1e3]}'
+        for tamanho in range(1, len(corpo) + 1):
+            with self.subTest(bloco=tamanho):
+                self.assertEqual(list(iterar_itens_json(self.em_blocos(corpo, tamanho))), [10, 2.5, -300, 1000.0])
+
+    def test_escapes(self):
+        itens = list(iterar_itens_json(self.em_blocos(self.CORPO, 7)))
+
+        self.assertEqual(itens[0]['DESCRICAOWEB'], 'ÓLEO "PURO" \\ 10ML\n\t')
+        self.assertEqual(itens[2]['ID'], 'A-3ç\U0001F600')
+
+    def test_listas_aninhadas_nao_encerram_a_lista_de_dados(self):
+        corpo = '{"antes": [["dados"]], "dados": [[1, [2]], {"a": [3]}, []], "depois": [4]}'
+
+        self.assertEqual(list(iterar_itens_json([corpo])), [[1, [2]], {'a': [3]}, []])
+
+    def test_lista_vazia_ou_ausente(self):
+        for corpo in ('{"dados": []}', '{ "total": 0, "dados" : [ ] }', '{}', '{"outros": [1]}'):
+            with self.subTest(corpo=corpo):
+                self.assertEqual(list(iterar_itens_json(self.em_blocos(corpo, 3))), [])
+
+    def test_corpo_truncado_ou_malformado(self):
+        itens = iterar_itens_json(['{"dados": [{"ID": 1}, {"ID"'])
+        self.assertEqual(next(itens), {'ID': 1})
+        with self.assertRaises(JSONInvalido):
+            next(itens)
+
+        for corpo in ('[1, 2]', '{"dados": [1 2]}', ''):
+            with self.subTest(corpo=corpo), self.assertRaises(JSONInvalido):
+                list(iterar_itens_json([corpo]))
+
+
+class PaginaComCorpoInvalidoTests(TestCase):
+    """Corpo que não decodifica vira página com falha, não exceção na sincronização"""
+
+    def test_pagina_truncada_e_falha(self):
+        corpo = b'{"dados": [{"NRORC": 1, "ID": "INV-1", "DESCRICAOWEB": "CAPSULA"}, {"NRORC": 1, "ID": "INV'
+
+        resultado = pipeline_padrao.processar_pagina({'sucesso': True, 'status': 200, 'pagina': 1, 'corpo': corpo})
+
+        self.assertFalse(resultado['sucesso'])
+        self.assertIn('JSON inválido', resultado['erro'])
+
+
+class ReconciliacaoTests(TestCase):
+    """reconciliar_apis_ativas: cancela as fórmulas em triagem que sumiram da listagem da API"""
+
+    def setUp(self):
+        self.pedido = PedidoMestre.objects.create(nrorc=990001)
+        # Já sincronizadas antes: as 10 da API e uma que sumiu dela
+        for i in range(10):
+            FormulaItem.objects.create(pedido_mestre=self.pedido, id_api=f'SIM-{i}', descricao='CAPSULA')
+        self.sumida = FormulaItem.objects.create(pedido_mestre=self.pedido, id_api='SUMIU-1', descricao='CAPSULA')
+
+    def reconciliar(self, antes_da_leitura=None, **opcoes):
+        # 10 itens em páginas de 4: três páginas, a última incompleta marca o fim da listagem
+        with ServidorSimulado(DadosSimulados(10, semente=3)) as servidor:
+            ConfiguracaoAPI.objects.create(nome='reconciliacao', url_base=servidor.url_base)
+            sincronizar_api = SincronizadorAPI.sincronizar_api
+
+            def sincronizar(*args, **kwargs):
+                if antes_da_leitura:
+                    antes_da_leitura()
+                return sincronizar_api(*args, **kwargs)
+
+            with mock.patch.object(SincronizadorAPI, 'sincronizar_api', side_effect=sincronizar):
+                return reconciliar_apis_ativas(tamanho_pagina=4, **opcoes)
+
+    def test_formula_ausente_da_api_e_cancelada(self):
+        resultado = self.reconciliar()
+
+        self.assertEqual(resultado['ids_erp'], 10)
+        self.assertEqual(resultado['cancelamento']['canceladas'], 1)
+        self.sumida.refresh_from_db()
+        self.assertEqual(self.sumida.status, 'cancelado')
+        self.assertFalse(FormulaItem.objects.filter(id_api__startswith='SIM-').exclude(status='em_triagem').exists())
+
+    def test_formula_criada_durante_a_leitura_e_mantida(self):
+        def criar_durante_a_leitura():
+            FormulaItem.objects.create(pedido_mestre=self.pedido, id_api='NOVA-1', descricao='CAPSULA')
+
+        resultado = self.reconciliar(antes_da_leitura=criar_durante_a_leitura)
+
+        self.assertEqual(resultado['cancelamento']['canceladas'], 1)
+        self.assertEqual(FormulaItem.objects.get(id_api='NOVA-1').status, 'em_triagem')
+        self.assertEqual(FormulaItem.objects.get(id_api='SUMIU-1').status, 'cancelado')
+
+    def test_fracao_maxima_aborta_sem_cancelar(self):
+        resultado = self.reconciliar(fracao_maxima=0.05)
+
+        self.assertTrue(resultado['cancelamento']['abortada'])
+        self.assertEqual(resultado['cancelamento']['ausentes'], 1)
+        self.assertFalse(FormulaItem.objects.filter(status='cancelado').exists())
+
+    def test_simular_nao_grava(self):
+        resultado = self.reconciliar(simular=True)
+
+        self.assertEqual((resultado['cancelamento']['ausentes'], resultado['cancelamento']['canceladas']), (1, 0))
+        self.assertFalse(FormulaItem.objects.filter(status='cancelado').exists())
+
+
+class ResilienciaAPITests(TestCase):
+    """Circuit breaker, orçamento de novas tentativas e ETag/304 contra o servidor simulado"""
+
+    def criar_api(self, servidor, **campos):
+        return ConfiguracaoAPI.objects.create(nome='resiliencia', url_base=servidor.url_base, timeout=5, **campos)
+
+    @staticmethod
+    def paginas(total, tamanho=5):
+        return [{'pagina': pagina, 'tamanho': tamanho} for pagina in range(1, total + 1)]
+
+    def test_circuito_abre_ignora_e_fecha_apos_a_pausa(self):
+        with ServidorSimulado(DadosSimulados(10), taxa_erro=1.0) as fora_do_ar:
+            api = self.criar_api(fora_do_ar, falhas_para_abrir_circuito=2, tentativas_por_execucao=0)
+            resultados = SincronizadorAPI.sincronizar_api(api, self.paginas(4), incremental=False)
+
+            # Aberto na segunda falha seguida: as páginas restantes não são pedidas
+            self.assertEqual([r['sucesso'] for r in resultados], [False, False])
+            api.refresh_from_db()
+            self.assertTrue(circuito_aberto(api))
+            self.assertIsNone(SincronizadorAPI.sincronizar_api(api, self.paginas(1), incremental=False))
+
+        # Pausa vencida: a próxima execução é a tentativa (meio aberto); o sucesso fecha o circuito
+        with ServidorSimulado(DadosSimulados(10)) as de_volta:
+            ConfiguracaoAPI.objects.filter(pk=api.pk).update(
+                url_base=de_volta.url_base, circuito_aberto_ate=timezone.now() - timedelta(seconds=1),
+            )
+            api.refresh_from_db()
+            self.assertFalse(circuito_aberto(api))
+            resultados = SincronizadorAPI.sincronizar_api(api, self.paginas(2), incremental=False)
+
+        self.assertEqual([r['sucesso'] for r in resultados], [True, True])
+        api.refresh_from_db()
+        self.assertEqual((api.circuito_aberto_ate, api.falhas_consecutivas), (None, 0))
+
+    @mock.patch('core.scheduler.espera_com_jitter', return_value=0)
+    def test_orcamento_de_tentativas_por_execucao(self, _espera):
+        with ServidorSimulado(DadosSimulados(10), taxa_erro=1.0) as servidor:
+            # Três páginas dividem duas novas tentativas
+            api = self.criar_api(servidor, tentativas_por_execucao=2, falhas_para_abrir_circuito=10)
+            resultados = SincronizadorAPI.sincronizar_api(api, self.paginas(3), incremental=False)
+            self.assertEqual(sum(r['tentativas'] for r in resultados), 3 + 2)
+
+            # Com orçamento sobrando, cada página para em MAX_TENTATIVAS_PAGINA
+            ConfiguracaoAPI.objects.filter(pk=api.pk).update(tentativas_por_execucao=20)
+            api.refresh_from_db()
+            resultados = SincronizadorAPI.sincronizar_api(api, self.paginas(1), incremental=False)
+            self.assertEqual([r['tentativas'] for r in resultados], [MAX_TENTATIVAS_PAGINA])
+
+    def test_etag_repetido_responde_304_sem_regravar(self):
+        dados = DadosSimulados(10, taxa_mudanca=0.0)
+        with ServidorSimulado(dados) as servidor:
+            api = self.criar_api(servidor)
+            primeira = SincronizadorAPI.sincronizar_api(api, self.paginas(2), incremental=False)
+            api.refresh_from_db()
+            self.assertEqual(set(api.validadores_paginas), {'1:5', '2:5'})
+
+            segunda = SincronizadorAPI.sincronizar_api(api, self.paginas(2), incremental=False)
+
+            # Itens mudaram na origem: ETag diferente, página lida e gravada de novo
+            dados.taxa_mudanca = 1.0
+            terceira = SincronizadorAPI.sincronizar_api(api, self.paginas(1), incremental=False)
+
+        self.assertEqual([r['status'] for r in primeira], [200, 200])
+        self.assertEqual([(r['status'], r['nao_modificada'], r['items_recebidos']) for r in segunda], [(304, True, 0)] * 2)
+        self.assertEqual((terceira[0]['status'], terceira[0]['processamento']['atualizados']), (200, 5))
+
+
+class TravaDistribuidaTests(TestCase):
+    """Trava com prazo no banco: um dono por vez, renovação e troca de dono após expirar"""
+
+    def expirar(self, nome):
+        TravaDistribuida.objects.filter(nome=nome).update(expira_em=timezone.now() - timedelta(seconds=1))
+
+    def test_adquirir_renovar_e_liberar(self):
+        primeiro, segundo = Trava('teste', duracao=60), Trava('teste', duracao=60)
+
+        self.assertTrue(primeiro.adquirir())
+        self.assertFalse(segundo.adquirir())
+        expira_em = TravaDistribuida.objects.get(nome='teste').expira_em
+        self.assertTrue(primeiro.renovar())
+        self.assertGreaterEqual(TravaDistribuida.objects.get(nome='teste').expira_em, expira_em)
+
+        primeiro.liberar()
+        self.assertTrue(segundo.adquirir())
+        self.assertEqual(TravaDistribuida.objects.get(nome='teste').dono, segundo.dono)
+
+    def test_outro_processo_assume_depois_de_expirar(self):
+        primeiro, segundo = Trava('teste', duracao=60), Trava('teste', duracao=60)
+        primeiro.adquirir()
+        self.expirar('teste')
+
+        self.assertTrue(segundo.adquirir())
+        # O antigo dono não renova nem readquire enquanto o novo estiver no prazo
+        self.assertFalse(primeiro.renovar())
+        self.assertFalse(primeiro.manter())
+
+    def test_lideranca_do_agendador_passa_ao_outro_processo(self):
+        outro_processo = Trava(AgendadorSincronizacao.NOME_TRAVA_LIDER, duracao=60)
+        outro_processo.adquirir()
+        scheduler = BackgroundScheduler()
+        scheduler.start(paused=True)
+        self.addCleanup(scheduler.shutdown, wait=False)
+        agendamento = AgendamentoSincronizacao.objects.create(
+            api=ConfiguracaoAPI.objects.create(nome='lider', url_base='http://127.0.0.1:9/a'),
+            nome='diario', horario_execucao=time(8, 0),
+        )
+
+        with mock.patch.multiple(
+            AgendadorSincronizacao, scheduler=scheduler, lider=False, chaves_jobs={},
+            trava_lider=Trava(AgendadorSincronizacao.NOME_TRAVA_LIDER, duracao=60),
+        ):
+            AgendadorSincronizacao.verificar_lideranca()
+            self.assertFalse(AgendadorSincronizacao.lider)
+            self.assertIsNone(scheduler.get_job(f'agend_{agendamento.pk}'))
+
+            self.expirar(AgendadorSincronizacao.NOME_TRAVA_LIDER)
+            AgendadorSincronizacao.verificar_lideranca()
+            self.assertTrue(AgendadorSincronizacao.lider)
+            self.assertIsNotNone(scheduler.get_job(f'agend_{agendamento.pk}'))
+            self.assertFalse(outro_processo.manter())
+
+
+class ReconciliacaoJobsTests(TestCase):
+    """AgendadorSincronizacao.reconciliar_jobs: só o que mudou nos agendamentos mexe nos jobs"""
+
+    def setUp(self):
+        self.scheduler = BackgroundScheduler()
+        self.scheduler.start(paused=True)
+        self.addCleanup(self.scheduler.shutdown, wait=False)
+        estado = mock.patch.multiple(
+            AgendadorSincronizacao, scheduler=self.scheduler, chaves_jobs={},
+            assinatura_agendamentos=None, assinatura_pendente=None, lider=True,
+        )
+        estado.start()
+        self.addCleanup(estado.stop)
+
+        api = ConfiguracaoAPI.objects.create(nome='jobs', url_base='http://127.0.0.1:9/a')
+        self.manha = AgendamentoSincronizacao.objects.create(api=api, nome='manha', horario_execucao=time(8, 0))
+        self.tarde = AgendamentoSincronizacao.objects.create(api=api, nome='tarde', horario_execucao=time(14, 0))
+        self.inativo = AgendamentoSincronizacao.objects.create(
+            api=api, nome='inativo', horario_execucao=time(20, 0), ativo=False,
+        )
+
+    def jobs(self):
+        return {job.id: str(job.trigger) for job in self.scheduler.get_jobs()}
+
+    def reconciliar(self):
+        with mock.patch.object(
+            AgendadorSincronizacao, 'adicionar_job', wraps=AgendadorSincronizacao.adicionar_job,
+        ) as adicionar_job:
+            AgendadorSincronizacao.reconciliar_jobs()
+        return sorted(chamada.args[0].nome for chamada in adicionar_job.call_args_list)
+
+    def test_adiciona_reagenda_e_remove_so_o_que_mudou(self):
+        self.assertEqual(self.reconciliar(), ['manha', 'tarde'])
+        self.assertEqual(set(self.jobs()), {f'agend_{self.manha.pk}', f'agend_{self.tarde.pk}'})
+
+        # Sem alterações: nenhum job mexido
+        self.assertEqual(self.reconciliar(), [])
+
+        self.manha.horario_execucao = time(9, 30)
+        self.manha.save()
+        self.tarde.descricao = 'só descrição'
+        self.tarde.save()
+        self.assertEqual(self.reconciliar(), ['manha'])
+        self.assertIn("hour='9', minute='30'", self.jobs()[f'agend_{self.manha.pk}'])
+
+        AgendamentoSincronizacao.objects.filter(pk=self.tarde.pk).update(ativo=False)
+        AgendamentoSincronizacao.objects.filter(pk=self.inativo.pk).update(ativo=True)
+        self.assertEqual(self.reconciliar(), ['inativo'])
+        self.assertEqual(set(self.jobs()), {f'agend_{self.manha.pk}', f'agend_{self.inativo.pk}'})
+
+    def test_alteracoes_aplicadas_quando_a_assinatura_para_de_mudar(self):
+        AgendadorSincronizacao.reconciliar_jobs()
+        job_manha = f'agend_{self.manha.pk}'
+        self.manha.delete()
+
+        # Primeira verificação só anota a assinatura nova (debounce); a seguinte reconcilia
+        AgendadorSincronizacao.verificar_alteracoes()
+        self.assertIn(job_manha, self.jobs())
+        AgendadorSincronizacao.verificar_alteracoes()
+        self.assertEqual(set(self.jobs()), {f'agend_{self.tarde.pk}'})
+
+    def test_update_em_massa_tambem_e_percebido(self):
+        AgendadorSincronizacao.reconciliar_jobs()
+        # QuerySet.update não passa pelo save: atualizado_em fica igual
+        AgendamentoSincronizacao.objects.filter(pk=self.tarde.pk).update(horario_execucao=time(15, 45))
+        AgendamentoSincronizacao.objects.filter(pk=self.manha.pk).update(ativo=False)
+
+        AgendadorSincronizacao.verificar_alteracoes()
+        AgendadorSincronizacao.verificar_alteracoes()
+        jobs = self.jobs()
+        self.assertEqual(set(jobs), {f'agend_{self.tarde.pk}'})
+        self.assertIn("hour='15', minute='45'", jobs[f'agend_{self.tarde.pk}'])
+
+
+class MarcaDaguaTests(TestCase):
+    """Sincronização incremental: a marca d'água (DTALT + HRALT) só avança quando todas as páginas gravaram"""
+
+    PAGINAS = [{'pagina': 1, 'tamanho': 5}, {'pagina': 2, 'tamanho': 5}]
+
+    def test_avanca_filtra_antigos_e_mantem_quando_uma_pagina_falha(self):
+        dados = DadosSimulados(10)
+        with ServidorSimulado(dados) as servidor:
+            api = ConfiguracaoAPI.objects.create(nome='incremental', url_base=servidor.url_base, requisicoes_condicionais=False)
+
+            SincronizadorAPI.sincronizar_api(api, self.PAGINAS)
+            api.refresh_from_db()
+            self.assertEqual(api.ultima_atualizacao_api, converter_datetime_api('2026-01-05', '08:00:09'))
+
+            # Nada novo: a primeira página só tem itens antigos e a paginação para nela
+            resultados = SincronizadorAPI.sincronizar_api(api, self.PAGINAS)
+            self.assertEqual([r['processamento']['antigos'] for r in resultados], [5])
+
+            # Todos os itens mudam (terceira rodada do servidor: DTALT 08:30), mas a página 2 falha
+            dados.taxa_mudanca = 1.0
+            buscar_pagina = SincronizadorAPI.buscar_pagina
+
+            def falhar_pagina_2(api_config, pagina, tamanho, *args, **kwargs):
+                if pagina == 2:
+                    return {'sucesso': False, 'erro': 'falha simulada', 'pagina': pagina, 'tamanho': tamanho}
+                return buscar_pagina(api_config, pagina, tamanho, *args, **kwargs)
+
+            with mock.patch.object(SincronizadorAPI, 'buscar_pagina', side_effect=falhar_pagina_2):
+                resultados = SincronizadorAPI.sincronizar_api(api, self.PAGINAS)
+            self.assertEqual([r['sucesso'] for r in resultados], [True, False])
+            api.refresh_from_db()
+            self.assertEqual(api.ultima_atualizacao_api, converter_datetime_api('2026-01-05', '08:00:09'))
+
+            # A execução seguinte relê a página 2 e a marca avança
+            dados.taxa_mudanca = 0.0
+            resultados = SincronizadorAPI.sincronizar_api(api, self.PAGINAS)
+
+        self.assertEqual([r['processamento']['atualizados'] for r in resultados], [0, 5])
+        api.refresh_from_db()
+        self.assertEqual(api.ultima_atualizacao_api, converter_datetime_api('2026-01-05', '08:30:09'))
+
+    def test_itens_do_mesmo_segundo_da_marca_nao_sao_perdidos(self):
+        def item(id_api, hora):
+            return {'NRORC': 550001, 'ID': id_api, 'DESCRICAOWEB': 'CAPSULA | 60CAP', 'QUANT': 1,
+                    'PRUNI': 10.5, 'VRTOT': 10.5, 'DTALT': '2026-03-02', 'HRALT': hora}
+
+        def processar(itens, marca_dagua):
+            pagina = {'sucesso': True, 'status': 200, 'pagina': 1, 'itens': itens}
+            return pipeline_padrao.processar_pagina(pagina, marca_dagua=marca_dagua)['processamento']
+
+        processar([item('SEG-1', '10:00:05')], None)
+        marca = converter_datetime_api('2026-03-02', '10:00:05')
+
+        # SEG-2 mudou no mesmo segundo de SEG-1, depois da leitura que fixou a marca
+        processamento = processar([item('SEG-0', '10:00:04'), item('SEG-1', '10:00:05'), item('SEG-2', '10:00:05')], marca)
+
+        self.assertEqual(
+            (processamento['antigos'], processamento['sem_mudancas'], processamento['criados']), (1, 1, 1),
+        )
+        self.assertTrue(FormulaItem.objects.filter(id_api='SEG-2').exists())
+
+
+class HashOrigemTests(TestCase):
+    """diferenciar: itens com o mesmo hash da linha de origem não são reclassificados nem regravados"""
+
+    def test_so_a_linha_alterada_e_regravada(self):
+        dados = DadosSimulados(10)
+        paginas = [{'pagina': 1, 'tamanho': 10}]
+        with ServidorSimulado(dados) as servidor:
+            api = ConfiguracaoAPI.objects.create(nome='hash', url_base=servidor.url_base, requisicoes_condicionais=False)
+            SincronizadorAPI.sincronizar_api(api, paginas, incremental=False)
+            gravadas = dict(FormulaItem.objects.values_list('id_api', 'atualizado_em'))
+
+            # Preço de um item muda sem mudar DTALT/HRALT: só o hash percebe
+            dados.itens[3][3] += 100
+            with mock.patch('core.ingestao.valores_formula_api', wraps=valores_formula_api) as classificar:
+                resultado, = SincronizadorAPI.sincronizar_api(api, paginas, incremental=False)
+
+        processamento = resultado['processamento']
+        self.assertEqual((processamento['atualizados'], processamento['sem_mudancas'], processamento['criados']), (1, 9, 0))
+        self.assertEqual(classificar.call_count, 1)
+        self.assertEqual(
+            [id_api for id_api, atualizado_em in FormulaItem.objects.values_list('id_api', 'atualizado_em')
+             if atualizado_em != gravadas[id_api]],
+            ['SIM-3'],
+        )
+        self.assertEqual(
+            FormulaItem.objects.get(id_api='SIM-3').hash_origem, calcular_hash_origem(dados.linha(3)),
+        )
+
+
+class RegistroExecucoesTests(TestCase):
+    """ExecucaoSincronizacao/PaginaSincronizacao: uma execução por sincronização, com os tempos de cada página"""
+
+    def test_sincronizacao_registra_execucao_e_paginas(self):
+        with ServidorSimulado(DadosSimulados(12)) as servidor:
+            api = ConfiguracaoAPI.objects.create(nome='ledger', url_base=servidor.url_base)
+            SincronizadorAPI.sincronizar_api(
+                api, [{'pagina': pagina, 'tamanho': 5} for pagina in (1, 2, 3)], incremental=False,
+            )
+
+        execucao = ExecucaoSincronizacao.objects.get(api=api)
+        self.assertEqual(
+            (execucao.status, execucao.total_paginas, execucao.itens_recebidos, execucao.criados),
+            ('concluida', 3, 12, 12 + 4),
+        )
+        self.assertIsNotNone(execucao.finalizada_em)
+        paginas = list(execucao.paginas.order_by('pagina'))
+        self.assertEqual([pagina.itens_recebidos for pagina in paginas], [5, 5, 2])
+        self.assertTrue(all(pagina.latencia_http_ms > 0 and pagina.tempo_gravacao_ms > 0 for pagina in paginas))
+        self.assertEqual(execucao.bytes_recebidos, sum(pagina.bytes_recebidos for pagina in paginas))
+
+    def test_percentis_das_paginas(self):
+        self.assertIsNone(percentil([], 50))
+        self.assertEqual(percentil([None, 7], 95), 7)
+        # Interpolação linear: 10, 20, ..., 100
+        self.assertEqual((percentil(range(10, 101, 10), 50), round(percentil(range(10, 101, 10), 95), 1)), (55, 95.5))
+
+        api = ConfiguracaoAPI.objects.create(nome='percentis', url_base='http://127.0.0.1:9/a')
+        execucao = ExecucaoSincronizacao.objects.create(api=api)
+        for pagina, latencia in enumerate(range(10, 101, 10), start=1):
+            execucao.registrar_pagina({
+                'sucesso': True, 'pagina': pagina, 'latencia_ms': latencia, 'tempo_gravacao_ms': latencia / 10,
+                'items_recebidos': 1, 'processamento': {'criados': 1},
+            })
+        execucao.finalizar()
+
+        resumo = resumo_execucoes()
+        self.assertEqual((resumo['quantidade'], resumo['paginas']), (1, 10))
+        self.assertEqual(resumo['latencia_http_ms'], {'p50': 55.0, 'p95': 95.5})
+        self.assertEqual(resumo['tempo_gravacao_ms'], {'p50': 5.5, 'p95': 9.6})
+        self.assertEqual(resumo['execucoes'][0]['criados'], 10)
+
+
+class CassetesAPITests(TestCase):
+    """gravar_respostas grava as páginas brutas; --replay as reprocessa sem chamar a API"""
+
+    def test_grava_e_reproduz_cassete(self):
+        with tempfile.TemporaryDirectory() as diretorio, override_settings(CASSETES_API_DIR=diretorio):
+            with ServidorSimulado(DadosSimulados(12)) as servidor:
+                api = ConfiguracaoAPI.objects.create(
+                    nome='cassete', url_base=servidor.url_base, gravar_respostas=True,
+                )
+                SincronizadorAPI.sincronizar_api(
+                    api, [{'pagina': pagina, 'tamanho': 5} for pagina in (1, 2, 3)], incremental=False,
+                )
+                linhas_servidas = [servidor.dados.linha(i) for i in range(12)]
+
+            registros = list(ler_cassetes(diretorio))
+            self.assertEqual([(r['api_id'], r['pagina'], r['tamanho'], r['status']) for r in registros],
+                             [(api.pk, pagina, 5, 200) for pagina in (1, 2, 3)])
+            self.assertEqual([linha for r in registros for linha in json.loads(r['corpo'])['dados']], linhas_servidas)
+            self.assertEqual(list(ler_cassetes(diretorio, api_id=api.pk + 1)), [])
+
+            FormulaItem.objects.filter(id_api__startswith='SIM-').delete()
+            saida = StringIO()
+            call_command('sincronizar_formulas_api', '--replay', diretorio, stdout=saida)
+
+        self.assertIn('3 páginas, 12 itens', saida.getvalue())
+        self.assertEqual(
+            sorted(FormulaItem.objects.filter(id_api__startswith='SIM-').values_list('id_api', flat=True)),
+            sorted(linha['ID'] for linha in linhas_servidas),
+        )
+
+    def test_replay_com_pagina_corrompida(self):
+        dados = DadosSimulados(10)
+        api = ConfiguracaoAPI.objects.create(nome='corrompida', url_base='http://127.0.0.1:9/a')
+        with tempfile.TemporaryDirectory() as diretorio, override_settings(CASSETES_API_DIR=diretorio):
+            with GravadorCassete(api) as gravador:
+                gravador.gravar(1, 5, 200, json.dumps({'dados': dados.pagina(1, 5)}))
+                gravador.gravar(2, 5, 200, '<html>oops</html>')
+                gravador.gravar(3, 5, 200, json.dumps({'dados': dados.pagina(2, 5)}))
+            saida = StringIO()
+            call_command('sincronizar_formulas_api', '--replay', diretorio, stdout=saida)
+
+        self.assertIn('3 páginas, 10 itens', saida.getvalue())
+        self.assertIn('1 página(s) com falha', saida.getvalue())
+        self.assertEqual(FormulaItem.objects.filter(id_api__startswith='SIM-').count(), 10)
+
+
+class SincronizacaoEmParaleloTests(SimpleTestCase):
+    """SincronizadorAPI.sincronizar_em_paralelo: APIs simultâneas, resultados na ordem e erros isolados"""
+
+    def trabalhos(self, barreira=None):
+        def esperar():
+            if barreira:
+                # Só passa quando as três APIs estão rodando ao mesmo tempo
+                barreira.wait()
+
+        def com_erro():
+            esperar()
+            raise RuntimeError('API fora do ar')
+
+        def ignorada():
+            esperar()
+            return None
+
+        def com_paginas():
+            esperar()
+            return [
+                {'sucesso': True, 'items_recebidos': 5, 'processamento': {'criados': 3, 'atualizados': 2}},
+                {'sucesso': False, 'erro': 'HTTP 503'},
+            ]
+
+        return [('erro', com_erro), ('ignorada', ignorada), ('paginas', com_paginas)]
+
+    def verificar(self, resultados):
+        self.assertEqual([resultado['api'] for resultado in resultados], ['erro', 'ignorada', 'paginas'])
+        erro, ignorada, paginas = resultados
+        self.assertEqual((erro['sucesso'], erro['erro'], erro['totais']), (False, 'API fora do ar', None))
+        self.assertEqual((ignorada['ignorada'], ignorada['erro'], ignorada['totais']), (True, '', None))
+        self.assertEqual((paginas['erro'], paginas['sucesso']), ('', False))
+        self.assertEqual(
+            {campo: paginas['totais'][campo] for campo in ('paginas', 'paginas_com_falha', 'itens', 'criados', 'atualizados')},
+            {'paginas': 2, 'paginas_com_falha': 1, 'itens': 5, 'criados': 3, 'atualizados': 2},
+        )
+
+    def test_apis_rodam_ao_mesmo_tempo(self):
+        barreira = threading.Barrier(3, timeout=5)
+        self.verificar(SincronizadorAPI.sincronizar_em_paralelo(self.trabalhos(barreira), max_paralelas=3))
+        self.assertFalse(barreira.broken)
+
+    def test_uma_por_vez_com_limite_1(self):
+        self.verificar(SincronizadorAPI.sincronizar_em_paralelo(self.trabalhos(), max_paralelas=1))
+        self.assertEqual(SincronizadorAPI.sincronizar_em_paralelo([]), [])
+
+
+class BuscaPaginasConcorrenteTests(TestCase):
+    """buscar_paginas: até requisicoes_paralelas páginas ao mesmo tempo, entregues na ordem, numa sessão keep-alive"""
+
+    class DadosContandoRequisicoes(DadosSimulados):
+        """Conta quantas páginas o servidor está montando ao mesmo tempo"""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.em_andamento = self.maximo_simultaneas = 0
+            self.lock_contagem = threading.Lock()
+
+        def etag(self, pagina, tamanho):
+            with self.lock_contagem:
+                self.em_andamento += 1
+                self.maximo_simultaneas = max(self.maximo_simultaneas, self.em_andamento)
+            sleep(0.2)
+            with self.lock_contagem:
+                self.em_andamento -= 1
+            return super().etag(pagina, tamanho)
+
+    def test_busca_em_paralelo_e_entrega_na_ordem(self):
+        dados = self.DadosContandoRequisicoes(30)
+        with ServidorSimulado(dados) as servidor:
+            conexoes = []
+            aceitar = servidor.servidor.process_request
+            servidor.servidor.process_request = lambda *args: (conexoes.append(args[1]), aceitar(*args))
+            api = ConfiguracaoAPI.objects.create(
+                nome='concorrente', url_base=servidor.url_base, requisicoes_paralelas=3, requisicoes_condicionais=False,
+            )
+            sessao = SincronizadorAPI.obter_sessao(api)
+
+            paginas = []
+            for pagina_buscada in SincronizadorAPI.buscar_paginas(api, [{'pagina': p, 'tamanho': 5} for p in range(1, 7)]):
+                with pagina_buscada['corpo'] as corpo:
+                    paginas.append((pagina_buscada['pagina'], [item['ID'] for item in json.load(corpo)['dados']]))
+
+        self.assertEqual(paginas, [(p, [f'SIM-{i}' for i in range(5 * (p - 1), 5 * p)]) for p in range(1, 7)])
+        self.assertEqual(dados.maximo_simultaneas, 3)
+        # Keep-alive: as 6 páginas reaproveitam as conexões do pool da sessão da API
+        self.assertLessEqual(len(conexoes), 3)
+        self.assertIs(SincronizadorAPI.obter_sessao(api), sessao)
+
+
+class ClassificadorProdutoTests(TestCase):
+    """classificar_tipo pela DESCRICAOWEB e cache de TipoProduto invalidado pelos signals"""
+
+    def setUp(self):
+        invalidar_cache_tipos_produto()
+        self.addCleanup(invalidar_cache_tipos_produto)
+
+    def test_primeiro_tipo_da_lista_vence(self):
+        casos = {
+            'VITAMINA D3 10.000UI | CAPSULA: 60CAP': 'capsula',
+            'COLAGENO TIPO II 40MG + VIT C | SACHE | ENVELOPE: 30ENV': 'sache',
+            'VITAMINA A + TCM | 10ML': 'liquido_pediatrico',
+            # "GEL" é creme, mas "ML" tem prioridade
+            'GEL HIDRATANTE | 50ML': 'liquido_pediatrico',
+            'pomada cicatrizante | 30g': 'creme',
+            'OMEGA 3 OLEOSA 1000MG | 60 UNIDADES': 'capsula_oleosa',
+            'FILME ORODISPERSIVEL B12 | 30 UNIDADES': 'filme',
+            'PRODUTO SEM FORMA': TIPO_DESCONHECIDO,
+            '': TIPO_DESCONHECIDO,
+            None: TIPO_DESCONHECIDO,
+        }
+        self.assertEqual({descricao: classificar_tipo(descricao) for descricao in casos}, casos)
+        self.assertEqual(extrair_tipo_produto('PRODUTO SEM FORMA'), (None, TIPO_DESCONHECIDO))
+
+    def test_cache_de_tipo_produto_invalidado_ao_salvar_e_excluir(self):
+        capsula = TipoProduto.objects.create(tipo='capsula', nome='Cápsula')
+        with self.assertNumQueries(1):
+            self.assertEqual(extrair_tipo_produto('MAGNESIO | CAPSULA: 60CAP'), (capsula, 'capsula'))
+            self.assertEqual(obter_tipo_produto('capsula'), capsula)
+            self.assertIsNone(obter_tipo_produto('sache'))
+
+        sache = TipoProduto.objects.create(tipo='sache', nome='Sachê')
+        self.assertEqual(obter_tipo_produto('sache'), sache)
+        capsula.nome = 'Cápsula gelatinosa'
+        capsula.save()
+        self.assertEqual(obter_tipo_produto('capsula').nome, 'Cápsula gelatinosa')
+        sache.delete()
+        self.assertIsNone(obter_tipo_produto('sache'))
+
+    @override_settings(TIPOS_PRODUTO_CACHE_SEGUNDOS=60)
+    def test_cache_expira_para_ver_edicoes_de_outro_processo(self):
+        with mock.patch('core.classificador_produto.monotonic', return_value=1000.0):
+            self.assertIsNone(obter_tipo_produto('goma'))
+            # bulk_create não dispara signals, como um cadastro feito no processo web
+            TipoProduto.objects.bulk_create([TipoProduto(tipo='goma', nome='Goma')])
+            self.assertIsNone(obter_tipo_produto('goma'))
+        with mock.patch('core.classificador_produto.monotonic', return_value=1061.0):
+            self.assertEqual(obter_tipo_produto('goma').nome, 'Goma')
+
+
+class AtributosDerivadosTests(TestCase):
+    """tipo_produto, forma e quantidade_unidades gravados na ingestão e pelo backfill"""
+
+    DESCRICOES = {
+        'DER-1': 'VITAMINA D3 10.000UI | CAPSULA: 60CAP',
+        'DER-2': 'COLAGENO TIPO II | SACHE | ENVELOPE: 30ENV',
+        'DER-3': 'MELATONINA 3MG 120CAP',
+        'DER-4': 'XAROPE DE GUACO | 100ML',
+        'DER-5': 'PRODUTO SEM FORMA',
+    }
+
+    def setUp(self):
+        invalidar_cache_tipos_produto()
+        self.addCleanup(invalidar_cache_tipos_produto)
+        self.capsula = TipoProduto.objects.create(tipo='capsula', nome='Cápsula')
+        self.sache = TipoProduto.objects.create(tipo='sache', nome='Sachê')
+
+    def processar(self, descricoes):
+        itens = [
+            {'NRORC': 660001, 'ID': id_api, 'DESCRICAOWEB': descricao, 'QUANT': 1, 'SERIEO': 'A',
+             'PRUNI': 10.5, 'VRTOT': 10.5, 'DTALT': '2026-03-02', 'HRALT': '10:00:00'}
+            for id_api, descricao in descricoes.items()
+        ]
+        return pipeline_padrao.processar_pagina({'sucesso': True, 'status': 200, 'pagina': 1, 'itens': itens})
+
+    def atributos(self):
+        return {
+            formula.id_api: (formula.tipo_produto, formula.forma, formula.quantidade_unidades)
+            for formula in FormulaItem.objects.filter(id_api__startswith='DER-').select_related('tipo_produto')
+        }
+
+    def esperados(self):
+        return {
+            'DER-1': (self.capsula, 'Cápsula', 60),
+            'DER-2': (self.sache, 'Sachê', 30),
+            'DER-3': (self.capsula, 'Cápsula', 120),
+            'DER-4': (None, 'Líquido', None),
+            'DER-5': (None, 'Outro', None),
+        }
+
+    def test_ingestao_grava_os_atributos_e_os_atualiza(self):
+        self.processar(self.DESCRICOES)
+        self.assertEqual(self.atributos(), self.esperados())
+        self.assertEqual(FormulaItem.objects.get(id_api='DER-3').get_volume_display(), '120 cápsulas')
+
+        resultado = self.processar({'DER-4': 'CREME HIDRATANTE | 50G'})
+        self.assertEqual(resultado['processamento']['atualizados'], 1)
+        self.assertEqual(self.atributos()['DER-4'], (None, 'Creme', None))
+
+    def test_backfill_preenche_formulas_sem_atributos(self):
+        self.processar(self.DESCRICOES)
+        FormulaItem.objects.filter(id_api__in=['DER-1', 'DER-2']).update(
+            tipo_produto=None, forma='', quantidade_unidades=None,
+        )
+        self.assertEqual(FormulaItem.objects.get(id_api='DER-1').get_tipo_forma(), 'Cápsula')
+
+        saida = StringIO()
+        call_command('preencher_atributos_formulas', '--lote', '1', stdout=saida)
+
+        self.assertIn('[OK] 2 fórmulas atualizadas', saida.getvalue())
+        self.assertEqual(self.atributos(), self.esperados())
+
+    def test_backfill_refaz_tipo_cadastrado_depois_da_ingestao(self):
+        self.processar(self.DESCRICOES)
+        liquido = TipoProduto.objects.create(tipo='liquido_pediatrico', nome='Líquido')
+        # Mesmo conteúdo: a sincronização não recalcula a fórmula gravada sem tipo
+        self.assertEqual(self.processar(self.DESCRICOES)['processamento']['sem_mudancas'], 5)
+        self.assertIsNone(self.atributos()['DER-4'][0])
+
+        saida = StringIO()
+        call_command('preencher_atributos_formulas', stdout=saida)
+
+        # Só DER-4: DER-5 não tem forma conhecida
+        self.assertIn('[OK] 1 fórmulas atualizadas', saida.getvalue())
+        self.assertEqual(self.atributos(), {**self.esperados(), 'DER-4': (liquido, 'Líquido', None)})
+
+
+class SyncWorkerTests(TestCase):
+    """sync_worker: arquivo de vida, encerramento por SIGTERM e parada da sincronização após a página atual"""
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.arquivo_vida = os.path.join(diretorio.name, 'sync_worker.json')
+        self.addCleanup(SincronizadorAPI.parada_solicitada.clear)
+
+    def test_sigterm_encerra_o_worker(self):
+        for sinal in (signal.SIGTERM, signal.SIGINT):
+            self.addCleanup(signal.signal, sinal, signal.getsignal(sinal))
+
+        def enviar_sigterm():
+            # Espera o worker gravar o arquivo de vida antes de pedir a parada
+            for _ in range(100):
+                if os.path.exists(self.arquivo_vida):
+                    break
+                sleep(0.05)
+            os.kill(os.getpid(), signal.SIGTERM)
+
+        saida = StringIO()
+        status = {'processo': 'teste', 'lider': True, 'jobs': []}
+        with mock.patch.object(AgendadorSincronizacao, 'iniciar') as iniciar, \
+                mock.patch.object(AgendadorSincronizacao, 'parar') as parar, \
+                mock.patch.object(AgendadorSincronizacao, 'obter_status', return_value=status):
+            threading.Thread(target=enviar_sigterm).start()
+            call_command('sync_worker', '--arquivo-vida', self.arquivo_vida, '--intervalo-vida', '1', stdout=saida)
+
+        iniciar.assert_called_once_with()
+        parar.assert_called_once_with()
+        self.assertTrue(SincronizadorAPI.parada_solicitada.is_set())
+        self.assertFalse(os.path.exists(self.arquivo_vida))
+        self.assertIn('[OK] sync_worker encerrado', saida.getvalue())
+
+    def test_verificar_usa_a_idade_do_arquivo_de_vida(self):
+        with self.assertRaisesMessage(CommandError, 'sem arquivo de vida'):
+            call_command('sync_worker', '--verificar', '--arquivo-vida', self.arquivo_vida)
+
+        with open(self.arquivo_vida, 'w') as arquivo:
+            json.dump({'pid': 123, 'lider': False, 'jobs': 2}, arquivo)
+        saida = StringIO()
+        call_command('sync_worker', '--verificar', '--arquivo-vida', self.arquivo_vida, '--intervalo-vida', '10', stdout=saida)
+        self.assertIn('sync_worker vivo (pid 123, reserva, 2 jobs', saida.getvalue())
+
+        antigo = os.path.getmtime(self.arquivo_vida) - 31
+        os.utime(self.arquivo_vida, (antigo, antigo))
+        with self.assertRaisesMessage(CommandError, 'sem sinal de vida'):
+            call_command('sync_worker', '--verificar', '--arquivo-vida', self.arquivo_vida, '--intervalo-vida', '10')
+
+    def test_parada_solicitada_interrompe_apos_a_pagina_atual(self):
+        SincronizadorAPI.parada_solicitada.set()
+        with ServidorSimulado(DadosSimulados(15)) as servidor:
+            api = ConfiguracaoAPI.objects.create(nome='parada', url_base=servidor.url_base)
+            resultados = SincronizadorAPI.sincronizar_api(api, [{'pagina': p, 'tamanho': 5} for p in (1, 2, 3)])
+
+        self.assertEqual([resultado['pagina'] for resultado in resultados], [1])
+        execucao = ExecucaoSincronizacao.objects.get(api=api)
+        self.assertEqual((execucao.status, execucao.total_paginas), ('interrompida', 1))
+        api.refresh_from_db()
+        self.assertIsNone(api.ultima_atualizacao_api)
+
+
+class SincronizarAgoraWebTests(TestCase):
+    """A sincronização manual pedida pela web roda no worker: a requisição só enfileira a task"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('operador', password='x'))
+
+    def test_view_enfileira_e_nao_espera_a_sincronizacao(self):
+        def sincronizacao_lenta(*args):
+            sleep(0.5)
+            return []
+
+        tarefa = mock.Mock(id='tarefa-1')
+        latencias = []
+        with mock.patch.object(AgendadorSincronizacao, 'sincronizar_agora', side_effect=sincronizacao_lenta) as sincronizar, \
+                mock.patch.object(sincronizar_agendamentos_agora, 'delay', return_value=tarefa) as delay:
+            for _ in range(20):
+                inicio = perf_counter()
+                resposta = self.client.post(reverse('core:scheduler_sincronizar'))
+                latencias.append(perf_counter() - inicio)
+
+        self.assertEqual(resposta.status_code, 202)
+        self.assertEqual(resposta.json()['tarefa'], 'tarefa-1')
+        self.assertEqual(delay.call_count, 20)
+        sincronizar.assert_not_called()
+        # p95 da view bem abaixo da duração de uma sincronização (0,5s)
+        self.assertLess(percentil(latencias, 95), 0.2)
+
+    def test_task_executa_a_sincronizacao_do_agendamento(self):
+        with mock.patch.object(AgendadorSincronizacao, 'sincronizar_agora', return_value=[{'api': 'a'}]) as sincronizar:
+            self.assertEqual(sincronizar_agendamentos_agora(7), [{'api': 'a'}])
+        sincronizar.assert_called_once_with(7)
+
+
+class APISimuladaTests(TestCase):
+    """FC0M100 simulado (paginação, rodadas, ETag/304, erros 503) e benchmark_ingestao"""
+
+    def test_servidor_segue_a_semantica_da_api(self):
+        dados = DadosSimulados(12, taxa_mudanca=0.25)
+        with ServidorSimulado(dados) as servidor:
+            primeira = requests.get(servidor.url_base, params={'pagina': 1, 'tamanho': 5}, timeout=5)
+            self.assertEqual(primeira.json()['dados'], [dados.linha(i) for i in range(5)])
+            self.assertEqual(len(requests.get(servidor.url_base, params={'pagina': 3, 'tamanho': 5}, timeout=5).json()['dados']), 2)
+            self.assertEqual(requests.get(servidor.url_base, params={'pagina': 4, 'tamanho': 5}, timeout=5).json(), {'dados': []})
+
+            # Sem nova rodada a página 2 não muda: 304 com o ETag recebido
+            segunda = requests.get(servidor.url_base, params={'pagina': 2, 'tamanho': 5}, timeout=5)
+            condicional = requests.get(
+                servidor.url_base, params={'pagina': 2, 'tamanho': 5}, headers={'If-None-Match': segunda.headers['ETag']}, timeout=5,
+            )
+            self.assertEqual(condicional.status_code, 304)
+
+        # Cada pedido da página 1 abriu uma rodada que alterou 25% dos itens
+        self.assertEqual(dados.rodada, 1)
+        self.assertEqual(sum(1 for item in dados.itens if item[4] == 1), 3)
+
+        with ServidorSimulado(DadosSimulados(5), taxa_erro=1.0) as servidor:
+            self.assertEqual(requests.get(servidor.url_base, timeout=5).status_code, 503)
+
+    def test_benchmark_mede_as_rodadas_e_desfaz_a_gravacao(self):
+        saida = StringIO()
+        call_command(
+            'benchmark_ingestao', '--itens', '40', '--tamanho', '10', '--rodadas', '2', '--taxa-mudanca', '0.25',
+            # Uma requisição por vez: a página 1 abre a rodada antes das outras serem servidas
+            '--paralelas', '1', '--json', stdout=saida,
+        )
+        resultado = json.loads(saida.getvalue())
+
+        primeira, segunda = resultado['rodadas']
+        # 40 fórmulas em 14 pedidos (3 itens por pedido) na carga inicial
+        self.assertEqual((primeira['itens'], primeira['criados'], primeira['paginas_com_falha']), (40, 54, 0))
+        self.assertEqual((segunda['criados'], segunda['atualizados'], segunda['sem_mudancas']), (0, 10, 30))
+        self.assertTrue(all(rodada['consultas'] > 0 and rodada['itens_por_segundo'] > 0 for rodada in resultado['rodadas']))
+        self.assertGreater(resultado['pico_rss_mb'], 0)
+        self.assertFalse(FormulaItem.objects.filter(id_api__startswith='SIM-').exists())
+        self.assertFalse(ConfiguracaoAPI.objects.exists())
+
+    def test_benchmark_conta_pagina_ilegivel_como_falha(self):
+        dados = DadosSimulados(10)
+
+        def buscar_paginas(*args, **kwargs):
+            return iter([
+                {'sucesso': True, 'status': 200, 'pagina': 1, 'tamanho': 5, 'corpo': json.dumps({'dados': dados.pagina(1, 5)})},
+                {'sucesso': True, 'status': 200, 'pagina': 2, 'tamanho': 5, 'corpo': '<html>oops</html>'},
+                {'sucesso': False, 'status': 503, 'pagina': 3, 'tamanho': 5, 'erro': 'HTTP 503'},
+            ])
+
+        saida = StringIO()
+        with mock.patch.object(SincronizadorAPI, 'buscar_paginas', side_effect=buscar_paginas):
+            call_command('benchmark_ingestao', '--itens', '15', '--tamanho', '5', '--rodadas', '1', '--json', stdout=saida)
+        rodada, = json.loads(saida.getvalue())['rodadas']
+
+        self.assertEqual((rodada['itens'], rodada['paginas_com_falha']), (5, 2))
+        self.assertGreater(rodada['criados'], 0)
+
+
+class PipelineUnicoTests(TestCase):
+    """Scheduler, comando, task Celery e --replay passam pelo mesmo pipeline: mesmos contadores e mesmas fórmulas"""
+
+    def gravadas(self):
+        return list(FormulaItem.objects.order_by('id_api').values_list(
+            'id_api', 'pedido_mestre__nrorc', 'descricao', 'quantidade', 'price_unit', 'price_total', 'forma',
+            'quantidade_unidades', 'datetime_atualizacao_api', 'hash_origem',
+        ))
+
+    def contadores(self):
+        execucao = ExecucaoSincronizacao.objects.latest('id')
+        return (execucao.itens_recebidos, execucao.criados, execucao.atualizados, execucao.sem_mudancas, execucao.erros)
+
+    def test_todos_os_caminhos_gravam_o_mesmo(self):
+        def pelo_scheduler():
+            agendamento = AgendamentoSincronizacao.objects.create(api=api, nome='pipeline', horario_execucao=time(8, 0))
+            SincronizadorAPI.sincronizar_agendamento(agendamento)
+
+        def pelo_comando():
+            call_command('sincronizar_formulas_api', '--api_id', api.pk, stdout=StringIO())
+
+        def pela_task():
+            self.assertEqual(sincronizar_pedidos_da_api.apply().get()['status'], 'sucesso')
+
+        caminhos = {'scheduler': pelo_scheduler, 'comando': pelo_comando, 'task': pela_task}
+        contadores, gravadas = {}, {}
+        with tempfile.TemporaryDirectory() as diretorio, override_settings(CASSETES_API_DIR=diretorio):
+            with ServidorSimulado(DadosSimulados(12)) as servidor:
+                api = ConfiguracaoAPI.objects.create(
+                    nome='pipeline', url_base=servidor.url_base, sincronizacao_incremental=False,
+                    requisicoes_condicionais=False, gravar_respostas=True,
+                )
+                for nome, sincronizar in caminhos.items():
+                    # Cada caminho parte do banco vazio
+                    PedidoMestre.objects.all().delete()
+                    sincronizar()
+                    contadores[nome], gravadas[nome] = self.contadores(), self.gravadas()
+
+            PedidoMestre.objects.all().delete()
+            call_command('sincronizar_formulas_api', '--replay', diretorio, stdout=StringIO())
+            gravadas['replay'] = self.gravadas()
+
+        # 12 fórmulas em 4 pedidos
+        self.assertEqual(contadores, dict.fromkeys(caminhos, (12, 16, 0, 0, 0)))
+        self.assertEqual(len(gravadas['scheduler']), 12)
+        # O replay lê os 3 cassetes gravados: o 1º cria, os outros dois não mudam nada
+        self.assertEqual(gravadas, dict.fromkeys(['scheduler', 'comando', 'task', 'replay'], gravadas['scheduler']))
@@ -0,0 +1,140 @@
+"""
+Travas distribuídas com prazo (lease) gravadas no banco (TravaDistribuida)
+Garantem que apenas um processo execute algo por vez entre workers do daphne,
+do Celery e comandos manuais, sem depender de Redis.
+
+A aquisição é um UPDATE condicional (dono = eu OU expirada), atômico no SQLite
+e no PostgreSQL. O dono renova a trava antes de expirar; se o processo morrer,
+a trava expira e outro processo assume.
+"""
+
+import logging
+import os
+import socket
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import TravaDistribuida
+
+logger = logging.getLogger(__name__)
+
+# Identificador deste processo (o sufixo distingue processos com o mesmo pid em containers)
+ID_PROCESSO = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+def duracao_padrao():
+    """Prazo das travas em segundos (settings.TRAVA_DURACAO_SEGUNDOS, padrão 60)"""
+    return getattr(settings, 'TRAVA_DURACAO_SEGUNDOS', 60)
+
+
+class Trava:
+    """
+    Trava nomeada com prazo
+
+    Uso pontual (tarefa única por vez, com renovação automática):
+        with Trava('sincronizacao_api_1').manter_durante() as adquirida:
+            if not adquirida:
+                return  # outro processo já está executando
+            ...
+
+    Uso contínuo (liderança): chamar manter() periodicamente, em intervalo menor que o prazo
+    """
+
+    def __init__(self, nome, duracao=None, dono=None):
+        self.nome = nome
+        self.duracao = duracao or duracao_padrao()
+        # O dono inclui a instância para que duas travas do mesmo processo não se confundam
+        self.dono = dono or f'{ID_PROCESSO}:{uuid.uuid4().hex[:6]}'
+        self.adquirida = False
+
+    def adquirir(self):
+        """Tenta adquirir (ou renovar) a trava; retorna True se este dono a detém"""
+        agora = timezone.now()
+        expira_em = agora + timedelta(seconds=self.duracao)
+
+        atualizou = TravaDistribuida.objects.filter(nome=self.nome).filter(
+            Q(dono=self.dono) | Q(expira_em__lt=agora)
+        ).update(dono=self.dono, expira_em=expira_em, adquirida_em=agora, renovada_em=agora)
+
+        if not atualizou:
+            try:
+                with transaction.atomic():
+                    TravaDistribuida.objects.create(
+                        nome=self.nome, dono=self.dono, expira_em=expira_em,
+                        adquirida_em=agora, renovada_em=agora,
+                    )
+            except IntegrityError:
+                # Já existe e pertence a outro processo ainda dentro do prazo
+                self.adquirida = False
+                return False
+
+        self.adquirida = True
+        return True
+
+    def renovar(self):
+        """Estende o prazo; retorna False se a trava expirou e foi assumida por outro"""
+        agora = timezone.now()
+        renovou = TravaDistribuida.objects.filter(nome=self.nome, dono=self.dono).update(
+            expira_em=agora + timedelta(seconds=self.duracao), renovada_em=agora,
+        )
+        self.adquirida = bool(renovou)
+        return self.adquirida
+
+    def manter(self):
+        """Renova se já detém a trava, senão tenta adquiri-la"""
+        if self.adquirida and self.renovar():
+            return True
+        return self.adquirir()
+
+    def liberar(self):
+        """Libera a trava (expira agora) para que outro processo assuma sem esperar o prazo"""
+        if not self.adquirida:
+            return
+        TravaDistribuida.objects.filter(nome=self.nome, dono=self.dono).update(
+            expira_em=timezone.now() - timedelta(seconds=1),
+        )
+        self.adquirida = False
+
+    @contextmanager
+    def manter_durante(self):
+        """
+        Adquire a trava e a renova numa thread a cada 1/3 do prazo até o fim do bloco
+        O bloco recebe True/False; com False a trava é de outro processo
+        """
+        if not self.adquirir():
+            yield False
+            return
+
+        parar = threading.Event()
+
+        def renovar_periodicamente():
+            try:
+                while not parar.wait(self.duracao / 3):
+                    if not self.renovar():
+                        logger.warning(f"[TRAVA] '{self.nome}' perdida durante a execução")
+                        return
+            except Exception as e:
+                logger.error(f"[TRAVA] Erro ao renovar '{self.nome}': {str(e)}")
+            finally:
+                connection.close()
+
+        renovador = threading.Thread(target=renovar_periodicamente, name=f'trava-{self.nome}', daemon=True)
+        renovador.start()
+        try:
+            yield True
+        finally:
+            parar.set()
+            renovador.join()
+            self.liberar()
+
+
+def trava_sincronizacao_api(api_id, duracao=None, dono=None):
+    """Trava que impede duas sincronizações simultâneas da mesma API"""
+    return Trava(f'sincronizacao_api_{api_id}', duracao=duracao, dono=dono)
@@ -6,56 +6,55 @@ Opcional - você pode usar via linha de comando se preferir
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
-from core.scheduler import AgendadorSincronizacao, SincronizadorAPI
+from core.metricas_sincronizacao import resumo_execucoes
+from core.models import AgendamentoSincronizacao
+from core.scheduler import AgendadorSincronizacao
+from core.tasks import sincronizar_agendamentos_agora
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+MENSAGEM_SYNC_WORKER = (
+    'O scheduler roda no processo dedicado "python manage.py sync_worker" '
+    'e não é iniciado nem parado pelo servidor web'
+)
+
+
 @login_required
 @require_http_methods(["POST"])
 def iniciar_scheduler(request):
-    """Inicia o scheduler"""
-    try:
-        AgendadorSincronizacao.iniciar()
-        return JsonResponse({
-            'sucesso': True,
-            'mensagem': 'Scheduler iniciado com sucesso'
-        })
-    except Exception as e:
-        return JsonResponse({
-            'sucesso': False,
-            'erro': str(e)
-        }, status=500)
+    """O servidor web não inicia o scheduler (ver sync_worker)"""
+    return JsonResponse({
+        'sucesso': False,
+        'erro': MENSAGEM_SYNC_WORKER
+    }, status=409)
 
 
 @login_required
 @require_http_methods(["POST"])
 def parar_scheduler(request):
-    """Para o scheduler"""
-    try:
-        AgendadorSincronizacao.parar()
-        return JsonResponse({
-            'sucesso': True,
-            'mensagem': 'Scheduler parado com sucesso'
-        })
-    except Exception as e:
-        return JsonResponse({
-            'sucesso': False,
-            'erro': str(e)
-        }, status=500)
+    """O servidor web não para o scheduler (ver sync_worker)"""
+    return JsonResponse({
+        'sucesso': False,
+        'erro': MENSAGEM_SYNC_WORKER
+    }, status=409)
 
 
 @login_required
 @require_http_methods(["POST"])
 def sincronizar_agora(request):
-    """Força uma sincronização imediata"""
+    """
+    Enfileira uma sincronização imediata de todos os agendamentos e retorna sem esperá-la
+    A sincronização roda no worker Celery, fora do processo web; o resultado aparece nas execuções do status
+    """
     try:
-        AgendadorSincronizacao.sincronizar_agora()
+        tarefa = sincronizar_agendamentos_agora.delay()
         return JsonResponse({
             'sucesso': True,
-            'mensagem': 'Sincronização executada com sucesso'
-        })
+            'mensagem': 'Sincronização enviada ao worker',
+            'tarefa': tarefa.id,
+        }, status=202)
     except Exception as e:
         return JsonResponse({
             'sucesso': False,
@@ -66,20 +65,36 @@ def sincronizar_agora(request):
 @login_required
 @require_http_methods(["GET"])
 def status_scheduler(request):
-    """Retorna o status do scheduler"""
+    """
+    Retorna o status do scheduler, os agendamentos configurados e as últimas
+    execuções de sincronização com p50/p95 de latência HTTP e de gravação
+    Parâmetro opcional: ?execucoes=N (padrão 20)
+    """
     try:
         status = AgendadorSincronizacao.obter_status()
-        config = SincronizadorAPI.CONFIG
+        try:
+            limite = max(1, min(int(request.GET.get('execucoes', 20)), 200))
+        except ValueError:
+            limite = 20
+        
+        agendamentos = AgendamentoSincronizacao.objects.select_related('api').filter(ativo=True, api__ativa=True)
         
         return JsonResponse({
             'sucesso': True,
             'scheduler': status,
-            'configuracao': {
-                'url_base': config['url_base'],
-                'intervalo_minutos': config['intervalo_minutos'],
-                'paginacoes': config['paginacoes'],
-                'ativo': config['ativo'],
-            }
+            'configuracao': [
+                {
+                    'api': agendamento.api.nome,
+                    'url_base': agendamento.api.url_base,
+                    'agendamento': agendamento.nome,
+                    'horario_execucao': agendamento.horario_execucao.strftime('%H:%M'),
+                    'modo_paginacao': agendamento.modo_paginacao,
+                    'paginacoes': agendamento.paginacoes,
+                    'ativo': agendamento.ativo,
+                }
+                for agendamento in agendamentos
+            ],
+            'execucoes': resumo_execucoes(limite),
         })
     except Exception as e:
         return JsonResponse({
@@ -1,3 +1,325 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import Group, User
+from django.db import connection
 from django.test import TestCase
+from django.urls import reverse
+
+from core.models import (
+    Checklist, ChecklistExecucaoFormula, ContadorTarefasFuncionario, Etapa, FormulaItem, HistoricoEtapaFormula,
+    LogAuditoria, PedidoMestre, PontuacaoFuncionario,
+)
+from dashboard.transicoes import TransicaoRecusada, TransicoesTarefa
+
+# No SQLite (sem SELECT ... FOR UPDATE) a trava da fórmula é um UPDATE a mais
+TRAVA = 0 if connection.features.has_select_for_update else 1
+# SAVEPOINT e RELEASE da transação da transição (o TestCase já abriu a externa)
+SAVEPOINTS = 2
+
+
+class TransicoesTarefaTests(TestCase):
+    """Transições do fluxo de fórmulas: resultado e número fixo de consultas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.triagem = Etapa.objects.create(nome='Triagem', sequencia=1, pontos_fixos_etapa=Decimal('2'))
+        cls.producao = Etapa.objects.create(nome='Produção', sequencia=2)
+        cls.usuario = User.objects.create_user('funcionario-transicoes', first_name='Ana')
+        cls.colega = User.objects.create_user('colega-transicoes', first_name='Bia')
+        for usuario in (cls.usuario, cls.colega):
+            ContadorTarefasFuncionario.objects.create(funcionario=usuario)
+        cls.pedido = PedidoMestre.objects.create(nrorc=789)
+
+    def setUp(self):
+        self.transicoes = TransicoesTarefa(self.usuario, ip='127.0.0.1')
+
+    def nova_formula(self, **campos):
+        campos.setdefault('etapa_atual', self.triagem)
+        return FormulaItem.objects.create(
+            pedido_mestre=self.pedido, id_api=f'TRANS-{FormulaItem.objects.count()}', descricao='CAPSULA', **campos,
+        )
+
+    def assumida(self, usuario=None, ativa=True):
+        return self.nova_formula(funcionario_na_etapa=usuario or self.usuario, eh_tarefa_ativa=ativa)
+
+    def test_assumir(self):
+        anterior = self.assumida()
+        formula = self.nova_formula()
+
+        # leitura, contador, pausa da ativa, UPDATE condicional e log
+        with self.assertNumQueries(SAVEPOINTS + TRAVA + 5):
+            self.transicoes.assumir(formula.pk)
+
+        formula.refresh_from_db()
+        anterior.refresh_from_db()
+        self.assertEqual((formula.funcionario_na_etapa, formula.eh_tarefa_ativa), (self.usuario, True))
+        self.assertFalse(anterior.eh_tarefa_ativa)
+        self.assertEqual(ContadorTarefasFuncionario.objects.get(funcionario=self.usuario).tarefas, 1)
+
+    def test_formula_assumida_nao_e_assumida_de_novo(self):
+        formula = self.nova_formula()
+        TransicoesTarefa(self.colega).assumir(formula.pk)
+
+        with self.assertRaises(TransicaoRecusada) as recusa:
+            self.transicoes.assumir(formula.pk)
+
+        self.assertEqual(recusa.exception.motivo, 'assumida')
+        self.assertEqual(ContadorTarefasFuncionario.objects.get(funcionario=self.usuario).tarefas, 0)
+
+    def test_limite_de_tarefas_recusa_sem_gravar(self):
+        ContadorTarefasFuncionario.objects.filter(funcionario=self.usuario).update(tarefas=ContadorTarefasFuncionario.LIMITE_TAREFAS)
+        formula = self.nova_formula()
+
+        with self.assertRaises(TransicaoRecusada) as recusa:
+            self.transicoes.assumir(formula.pk)
+
+        self.assertEqual(recusa.exception.motivo, 'limite')
+        formula.refresh_from_db()
+        self.assertIsNone(formula.funcionario_na_etapa)
+
+    def test_delegar(self):
+        formula = self.nova_formula()
+
+        with self.assertNumQueries(SAVEPOINTS + TRAVA + 6):
+            TransicoesTarefa(self.usuario).delegar(formula.pk, self.colega)
+
+        formula.refresh_from_db()
+        self.assertEqual((formula.funcionario_na_etapa, formula.eh_tarefa_ativa), (self.colega, True))
+        self.assertTrue(formula.delegacoes.filter(delegado_por=self.usuario, delegado_para=self.colega).exists())
+
+    def test_pausar_e_ativar(self):
+        pendente = self.assumida(ativa=False)
+        ativa = self.assumida()
+
+        with self.assertNumQueries(SAVEPOINTS + TRAVA + 3):
+            self.transicoes.pausar(ativa.pk)
+        with self.assertNumQueries(SAVEPOINTS + TRAVA + 4):
+            _, pausou = self.transicoes.ativar(pendente.pk)
+
+        self.assertFalse(pausou)
+        self.assertEqual(
+            list(FormulaItem.objects.filter(funcionario_na_etapa=self.usuario, eh_tarefa_ativa=True)), [pendente],
+        )
+        with self.assertRaises(TransicaoRecusada) as recusa:
+            self.transicoes.pausar(ativa.pk)
+        self.assertEqual(recusa.exception.motivo, 'nao_ativa')
+
+    def test_transicao_em_formula_de_outro_funcionario(self):
+        formula = self.assumida(usuario=self.colega)
+
+        with self.assertRaises(TransicaoRecusada) as recusa:
+            self.transicoes.pausar(formula.pk)
+        self.assertEqual(recusa.exception.motivo, 'inexistente')
+
+        with self.assertRaises(TransicaoRecusada) as recusa:
+            self.transicoes.finalizar(formula.pk)
+        self.assertEqual(recusa.exception.motivo, 'sem_permissao')
+
+    def finalizar_com_checklists(self, quantidade):
+        formula = self.assumida()
+        historico = HistoricoEtapaFormula.objects.create(formula=formula, etapa=self.triagem, funcionario=self.usuario)
+        for ordem in range(quantidade):
+            checklist = Checklist.objects.create(
+                etapa=self.triagem, nome=f'Conferir {ordem}', pontos_do_check=Decimal('1.5'), ordem=ordem,
+            )
+            ChecklistExecucaoFormula.objects.create(
+                historico_etapa=historico, checklist=checklist, marcado=True, pontos_gerados=checklist.pontos_do_check,
+            )
+        ContadorTarefasFuncionario.objects.filter(funcionario=self.usuario).update(tarefas=1)
+
+        # leitura, histórico, checklists, execuções, fim do histórico, pontos, próxima etapa,
+        # avanço da fórmula, contador, status do pedido e log
+        with self.assertNumQueries(SAVEPOINTS + TRAVA + 11):
+            self.transicoes.finalizar(formula.pk)
+
+        Checklist.objects.filter(etapa=self.triagem).delete()
+        return formula
+
+    def test_finalizar_com_consultas_fixas(self):
+        for quantidade in (1, 10):
+            with self.subTest(checklists=quantidade):
+                formula = self.finalizar_com_checklists(quantidade)
+
+                formula.refresh_from_db()
+                self.assertEqual((formula.etapa_atual, formula.status), (self.producao, 'em_producao'))
+                self.assertIsNone(formula.funcionario_na_etapa)
+                pontos = PontuacaoFuncionario.objects.filter(funcionario=self.usuario).latest('id').pontos
+                self.assertEqual(pontos, Decimal('2') + Decimal('1.5') * quantidade)
+                self.assertEqual(ContadorTarefasFuncionario.objects.get(funcionario=self.usuario).tarefas, 0)
+
+    def test_finalizar_com_checklist_obrigatorio_pendente_nao_grava(self):
+        formula = self.assumida()
+        HistoricoEtapaFormula.objects.create(formula=formula, etapa=self.triagem, funcionario=self.usuario)
+        Checklist.objects.create(etapa=self.triagem, nome='Conferir lote', pontos_do_check=Decimal('1'))
+
+        with self.assertRaises(TransicaoRecusada) as recusa:
+            self.transicoes.finalizar(formula.pk)
+
+        self.assertEqual(recusa.exception.motivo, 'checklists_pendentes')
+        self.assertIn('Conferir lote', recusa.exception.mensagem)
+        formula.refresh_from_db()
+        self.assertEqual(formula.funcionario_na_etapa, self.usuario)
+        self.assertFalse(PontuacaoFuncionario.objects.exists())
+        self.assertFalse(LogAuditoria.objects.filter(acao='concluir_etapa').exists())
+
+    def test_assumir_lote_com_consultas_fixas(self):
+        limite = ContadorTarefasFuncionario.LIMITE_TAREFAS
+        for quantidade in (1, limite):
+            with self.subTest(formulas=quantidade):
+                formulas = [self.nova_formula() for _ in range(quantidade)]
+
+                # leitura, vagas, contador, pausa da ativa, UPDATE das fórmulas, ativação e logs
+                with self.assertNumQueries(SAVEPOINTS + TRAVA + 7):
+                    resultados = self.transicoes.assumir_lote([formula.pk for formula in formulas])
+
+                self.assertTrue(all(resultado['sucesso'] for resultado in resultados))
+                self.assertEqual(
+                    list(FormulaItem.objects.filter(funcionario_na_etapa=self.usuario, eh_tarefa_ativa=True)), [formulas[0]],
+                )
+                self.assertEqual(LogAuditoria.objects.filter(acao='assumir_etapa').count(), quantidade)
+                FormulaItem.objects.filter(funcionario_na_etapa=self.usuario).delete()
+                LogAuditoria.objects.all().delete()
+                ContadorTarefasFuncionario.objects.filter(funcionario=self.usuario).update(tarefas=0)
+
+    def test_assumir_lote_para_no_limite_de_tarefas(self):
+        self.assumida()
+        ContadorTarefasFuncionario.objects.filter(funcionario=self.usuario).update(tarefas=1)
+        assumida_pelo_colega = self.assumida(usuario=self.colega)
+        formulas = [self.nova_formula() for _ in range(ContadorTarefasFuncionario.LIMITE_TAREFAS + 1)]
+        ids = [assumida_pelo_colega.pk] + [formula.pk for formula in formulas] + [formulas[-1].pk + 1000]
+
+        resultados = self.transicoes.assumir_lote(ids)
+
+        self.assertEqual([resultado['formula'] for resultado in resultados], ids)
+        self.assertEqual(
+            [resultado['motivo'] for resultado in resultados],
+            ['assumida'] + [''] * 4 + ['limite', 'limite', 'inexistente'],
+        )
+        self.assertEqual(ContadorTarefasFuncionario.objects.get(funcionario=self.usuario).tarefas, 5)
+        self.assertEqual(FormulaItem.objects.filter(funcionario_na_etapa=self.usuario).count(), 5)
+        self.assertIsNone(FormulaItem.objects.get(pk=formulas[-1].pk).funcionario_na_etapa)
+
+    def preparar_para_finalizar(self, quantidade, marcado=True):
+        """Fórmulas do usuário com histórico e um checklist obrigatório (marcado ou não) na triagem"""
+        checklist, _ = Checklist.objects.get_or_create(
+            etapa=self.triagem, nome='Conferir rótulo', defaults={'pontos_do_check': Decimal('1.5')},
+        )
+        formulas = []
+        for _ in range(quantidade):
+            formula = self.assumida(ativa=False)
+            historico = HistoricoEtapaFormula.objects.create(formula=formula, etapa=self.triagem, funcionario=self.usuario)
+            ChecklistExecucaoFormula.objects.create(
+                historico_etapa=historico, checklist=checklist, marcado=marcado, pontos_gerados=checklist.pontos_do_check,
+            )
+            formulas.append(formula)
+        ContadorTarefasFuncionario.objects.filter(funcionario=self.usuario).update(
+            tarefas=FormulaItem.objects.filter(funcionario_na_etapa=self.usuario).count(),
+        )
+        return formulas
+
+    def test_finalizar_lote_com_consultas_fixas(self):
+        for quantidade in (1, 10):
+            with self.subTest(formulas=quantidade):
+                formulas = self.preparar_para_finalizar(quantidade)
+
+                # leitura, históricos, checklists, execuções, etapas, fim dos históricos, pontos,
+                # avanço das fórmulas, contador, status dos pedidos e logs
+                with self.assertNumQueries(SAVEPOINTS + TRAVA + 11):
+                    resultados = self.transicoes.finalizar_lote([formula.pk for formula in formulas])
+
+                self.assertTrue(all(resultado['sucesso'] for resultado in resultados))
+                self.assertFalse(FormulaItem.objects.filter(funcionario_na_etapa=self.usuario).exists())
+                self.assertEqual(
+                    set(FormulaItem.objects.filter(pk__in=[f.pk for f in formulas]).values_list('etapa_atual', 'status')),
+                    {(self.producao.pk, 'em_producao')},
+                )
+                self.assertEqual(PontuacaoFuncionario.objects.filter(pontos=Decimal('3.5')).count(), quantidade)
+                self.assertEqual(ContadorTarefasFuncionario.objects.get(funcionario=self.usuario).tarefas, 0)
+                PontuacaoFuncionario.objects.all().delete()
+
+    def test_finalizar_lote_mantem_as_com_checklist_pendente(self):
+        prontas = self.preparar_para_finalizar(2)
+        pendente, = self.preparar_para_finalizar(1, marcado=False)
+        sem_historico = self.assumida(ativa=False)
+        ContadorTarefasFuncionario.objects.filter(funcionario=self.usuario).update(tarefas=4)
+
+        resultados = self.transicoes.finalizar_lote([pendente.pk] + [formula.pk for formula in prontas] + [sem_historico.pk])
+
+        self.assertEqual(
+            [resultado['motivo'] for resultado in resultados], ['checklists_pendentes', '', '', 'sem_historico'],
+        )
+        self.assertIn('Conferir rótulo', resultados[0]['mensagem'])
+        self.assertEqual(
+            set(FormulaItem.objects.filter(funcionario_na_etapa=self.usuario).values_list('pk', flat=True)),
+            {pendente.pk, sem_historico.pk},
+        )
+        self.assertEqual(PontuacaoFuncionario.objects.count(), 2)
+        self.assertEqual(LogAuditoria.objects.filter(acao='concluir_etapa').count(), 2)
+        self.assertEqual(ContadorTarefasFuncionario.objects.get(funcionario=self.usuario).tarefas, 2)
+
+    def test_finalizar_libera_so_as_vagas_que_a_formula_ocupava(self):
+        # Status fora do fluxo (ex: alterado pelo admin): a fórmula não ocupa vaga, como no assumir
+        fora_do_fluxo, = self.preparar_para_finalizar(1)
+        FormulaItem.objects.filter(pk=fora_do_fluxo.pk).update(status='pronto_para_expedicao')
+        self.assumida(ativa=False)
+        ContadorTarefasFuncionario.recalcular([self.usuario.pk])
+
+        self.transicoes.finalizar(fora_do_fluxo.pk)
+        self.assertEqual(ContadorTarefasFuncionario.objects.get(funcionario=self.usuario).tarefas, 1)
+
+        FormulaItem.objects.filter(funcionario_na_etapa=self.usuario).delete()
+        formulas = self.preparar_para_finalizar(3)
+        FormulaItem.objects.filter(pk=formulas[0].pk).update(status='pronto_para_expedicao')
+        ContadorTarefasFuncionario.recalcular([self.usuario.pk])
+
+        self.transicoes.finalizar_lote([formula.pk for formula in formulas])
+        self.assertEqual(ContadorTarefasFuncionario.objects.get(funcionario=self.usuario).tarefas, 0)
+
+
+class ViewsTransicoesTests(TestCase):
+    """As views só chamam o serviço e traduzem o resultado em mensagem e redirecionamento"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.etapa = Etapa.objects.create(nome='Triagem', sequencia=1)
+        cls.usuario = User.objects.create_user('funcionario-views')
+        cls.usuario.groups.add(Group.objects.create(name='Funcionário'))
+        pedido = PedidoMestre.objects.create(nrorc=790)
+        cls.formula = FormulaItem.objects.create(
+            pedido_mestre=pedido, id_api='VIEW-1', descricao='CAPSULA', etapa_atual=cls.etapa,
+        )
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def test_assumir_redireciona_para_a_formula(self):
+        resposta = self.client.get(reverse('dashboard:assumir_formula', args=[self.formula.pk]))
+
+        self.assertRedirects(
+            resposta, reverse('dashboard:detalhe_formula', args=[self.formula.pk]), fetch_redirect_response=False,
+        )
+        self.formula.refresh_from_db()
+        self.assertEqual(self.formula.funcionario_na_etapa, self.usuario)
+
+    def test_formula_inexistente_e_404(self):
+        resposta = self.client.get(reverse('dashboard:pausar_tarefa', args=[self.formula.pk + 1000]))
+
+        self.assertEqual(resposta.status_code, 404)
+
+    def test_lote_em_json(self):
+        resposta = self.client.post(
+            reverse('dashboard:assumir_formulas_lote'), {'formula_ids': [self.formula.pk, self.formula.pk + 1000]},
+            HTTP_ACCEPT='application/json',
+        )
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['sucessos'], 1)
+        self.assertEqual(
+            [(resultado['formula'], resultado['motivo']) for resultado in resposta.json()['resultados']],
+            [(self.formula.pk, ''), (self.formula.pk + 1000, 'inexistente')],
+        )
+
+    def test_lote_vazio_volta_com_mensagem(self):
+        resposta = self.client.post(reverse('dashboard:finalizar_formulas_lote'))
 
-# Create your tests here.
+        self.assertRedirects(resposta, reverse('dashboard:minhas_formulas'), fetch_redirect_response=False)
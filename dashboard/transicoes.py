@@ -0,0 +1,471 @@
+"""
+Transições de tarefa do fluxo de fórmulas: assumir, delegar, pausar, ativar e finalizar
+Cada transição roda numa transação: lê a fórmula com trava de linha (SELECT ... FOR UPDATE
+onde o banco suporta; no SQLite a trava de escrita do banco, ver travar) e grava com UPDATE
+condicional, então dois funcionários não assumem nem finalizam a mesma fórmula. Se a
+transição não pode ser aplicada nada é gravado e TransicaoRecusada sai com a mensagem.
+
+O número de consultas de cada transição é fixo (não cresce com checklists nem tarefas);
+os limites estão nos testes em dashboard/tests.py. As views só traduzem para mensagens.
+
+assumir_lote e finalizar_lote aplicam a mesma transição a várias fórmulas numa transação,
+com leituras e gravações em bloco, e retornam um resultado por fórmula (ver resultado_lote).
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, Exists, F, OuterRef, Value, When
+from django.utils import timezone
+
+from core.models import (
+    STATUS_TAREFA_ABERTA, Checklist, ChecklistExecucaoFormula, ContadorTarefasFuncionario,
+    DelegacaoTarefa, Etapa, FormulaItem, HistoricoEtapaFormula, LogAuditoria, PedidoMestre, PontuacaoFuncionario,
+    ocupa_vaga,
+)
+
+MENSAGEM_CONFLITO = 'Outra tarefa foi ativada ao mesmo tempo. Tente novamente.'
+# Fórmulas por requisição de lote (assumir_lote/finalizar_lote)
+LIMITE_LOTE = 50
+
+
+class TransicaoRecusada(Exception):
+    """Transição não aplicada; motivo orienta o redirecionamento da view"""
+
+    def __init__(self, mensagem, motivo='indisponivel'):
+        super().__init__(mensagem)
+        self.mensagem = mensagem
+        self.motivo = motivo
+
+
+def status_da_etapa(etapa, status_atual):
+    """Status da fórmula ao entrar na etapa (pelo nome), ou o atual se o nome não é reconhecido"""
+    nome = etapa.nome.lower()
+    for trecho, status in (
+        ('triagem', 'em_triagem'), ('produção', 'em_producao'),
+        ('qualidade', 'em_qualidade'), ('expedição', 'pronto_para_expedicao'),
+    ):
+        if trecho in nome:
+            return status
+    return status_atual
+
+
+def atualizar_status_pedido(*pedidos_ids):
+    """validar_e_atualizar_status dos PedidoMestre num único UPDATE (pronto se todas as fórmulas estão prontas)"""
+    nao_prontas = FormulaItem.objects.filter(pedido_mestre=OuterRef('pk')).exclude(status='pronto_para_expedicao')
+    PedidoMestre.objects.filter(pk__in=pedidos_ids).update(
+        status=Case(When(Exists(nao_prontas), then=Value('em_processamento')), default=Value('pronto_para_expedicao')),
+        atualizado_em=timezone.now(),
+    )
+
+
+def resultado_lote(formula_id, formula=None, recusa=None):
+    """Resultado de uma fórmula no lote (serializável em JSON)"""
+    return {
+        'formula': formula_id,
+        'nrorc': formula.pedido_mestre.nrorc if formula else None,
+        'sucesso': recusa is None,
+        'motivo': recusa.motivo if recusa else '',
+        'mensagem': recusa.mensagem if recusa else '',
+    }
+
+
+@contextmanager
+def transacao(mensagem_conflito=MENSAGEM_CONFLITO):
+    """transaction.atomic que traduz a constraint de tarefa ativa única em TransicaoRecusada"""
+    try:
+        with transaction.atomic():
+            yield
+    except IntegrityError as e:
+        raise TransicaoRecusada(mensagem_conflito, 'conflito') from e
+
+
+class TransicoesTarefa:
+    """
+    Transições de um usuário sobre as fórmulas
+
+        transicoes = TransicoesTarefa(request.user, ip=request.META.get('REMOTE_ADDR'))
+        try:
+            formula = transicoes.assumir(formula_id)
+        except TransicaoRecusada as e:
+            messages.error(request, e.mensagem)
+    """
+
+    def __init__(self, usuario, ip=None):
+        self.usuario = usuario
+        self.ip = ip
+
+    # ----------------------------
+    # Transições
+    # ----------------------------
+
+    def assumir(self, formula_id):
+        """Assume a fórmula; fora da Expedição ela vira a tarefa ativa e as outras são pausadas"""
+        with transacao():
+            formula = self.travar(formula_id)
+            self.validar_disponivel(formula, 'Esta fórmula não está disponível para ser assumida.')
+            self.entregar(
+                formula, self.usuario,
+                f'Você atingiu o máximo de {ContadorTarefasFuncionario.LIMITE_TAREFAS} tarefas. '
+                'Conclua ou pause uma tarefa antes de assumir outra.',
+            )
+            self.registrar(
+                'assumir_etapa',
+                f'Assumiu fórmula NRORC {formula.pedido_mestre.nrorc} na etapa {formula.etapa_atual.nome} '
+                f'({"ativa" if formula.eh_tarefa_ativa else "pendente"})',
+            )
+        return formula
+
+    def delegar(self, formula_id, funcionario):
+        """Entrega a fórmula a outro funcionário, com as mesmas regras do assumir"""
+        with transacao(f'{funcionario.get_full_name()} ativou outra tarefa ao mesmo tempo. Tente novamente.'):
+            formula = self.travar(formula_id)
+            self.validar_disponivel(formula, 'Esta fórmula não está disponível.')
+            self.entregar(
+                formula, funcionario,
+                f'{funcionario.get_full_name()} já tem o máximo de {ContadorTarefasFuncionario.LIMITE_TAREFAS} '
+                'tarefas. Não é possível delegar.',
+            )
+            DelegacaoTarefa.objects.create(
+                formula=formula, delegado_por=self.usuario, delegado_para=funcionario, etapa=formula.etapa_atual,
+            )
+            self.registrar(
+                'delegar_tarefa',
+                f'Delegou fórmula NRORC {formula.pedido_mestre.nrorc} na etapa {formula.etapa_atual.nome} para '
+                f'{funcionario.get_full_name()} ({"ativa" if formula.eh_tarefa_ativa else "pendente"})',
+            )
+        return formula
+
+    def pausar(self, formula_id):
+        """Pausa a tarefa ativa do usuário, sem ativar outra"""
+        with transacao():
+            formula = self.travar(formula_id, funcionario_na_etapa=self.usuario)
+            if not formula.eh_tarefa_ativa:
+                raise TransicaoRecusada('Esta tarefa não está ativa para ser pausada.', 'nao_ativa')
+            self.gravar(formula, eh_tarefa_ativa=False)
+            self.registrar(
+                'pausar_tarefa',
+                f'Pausou tarefa NRORC {formula.pedido_mestre.nrorc} na etapa {formula.etapa_atual.nome}',
+            )
+        return formula
+
+    def ativar(self, formula_id):
+        """Ativa uma tarefa pendente do usuário; retorna (fórmula, se outra ativa foi pausada)"""
+        with transacao():
+            formula = self.travar(formula_id, funcionario_na_etapa=self.usuario)
+            if formula.eh_tarefa_ativa:
+                raise TransicaoRecusada('Esta tarefa já está ativa.', 'ja_ativa')
+            pausadas = pausar_tarefas_ativas(self.usuario)
+            self.gravar(formula, eh_tarefa_ativa=True)
+            self.registrar(
+                'ativar_tarefa',
+                f'Ativou tarefa NRORC {formula.pedido_mestre.nrorc} na etapa {formula.etapa_atual.nome}',
+            )
+        return formula, bool(pausadas)
+
+    def finalizar(self, formula_id):
+        """Conclui a etapa atual (checklists obrigatórios marcados), registra os pontos e avança a fórmula"""
+        with transacao():
+            formula = self.travar(formula_id)
+            self.validar_finalizavel(formula)
+            etapa = formula.etapa_atual
+            # Avaliada antes do avanço: a vaga liberada é a que foi reservada ao assumir
+            ocupava_vaga = ocupa_vaga(formula)
+            historico = HistoricoEtapaFormula.objects.filter(formula=formula, etapa=etapa).first()
+            if not historico:
+                raise TransicaoRecusada('Histórico não encontrado.', 'sem_historico')
+            pontos = pontos_da_etapa(etapa, sincronizar_checklists([historico])[historico.pk])
+
+            agora = timezone.now()
+            HistoricoEtapaFormula.objects.filter(pk=historico.pk).update(timestamp_fim=agora, pontos_gerados=pontos)
+            PontuacaoFuncionario.objects.create(
+                funcionario=self.usuario, etapa=etapa, pontos=pontos, origem='etapa',
+                mes_referencia=agora.date().replace(day=1),
+            )
+            self.gravar(formula, funcionario_na_etapa=None, eh_tarefa_ativa=False, **avanco(formula, etapa.proxima_etapa(), agora))
+            if ocupava_vaga:
+                ContadorTarefasFuncionario.liberar(self.usuario)
+            atualizar_status_pedido(formula.pedido_mestre_id)
+            self.registrar('concluir_etapa', descricao_conclusao(formula))
+        return formula
+
+    # ----------------------------
+    # Lotes
+    # ----------------------------
+
+    def assumir_lote(self, formula_ids):
+        """
+        Assume as fórmulas na ordem pedida até as vagas do limite de tarefas (Expedição não ocupa vaga)
+        A primeira aceita que ocupa vaga vira a tarefa ativa. Retorna um resultado_lote por fórmula
+        """
+        formula_ids, resultados = list(dict.fromkeys(formula_ids)), {}
+        with transacao():
+            formulas = self.travar_lote(formula_ids)
+            vagas = ContadorTarefasFuncionario.vagas(self.usuario)
+            aceitas = []
+            for formula_id in formula_ids:
+                formula = formulas.get(formula_id)
+                try:
+                    if formula is None:
+                        raise TransicaoRecusada('Fórmula não encontrada.', 'inexistente')
+                    self.validar_disponivel(formula, 'Esta fórmula não está disponível para ser assumida.')
+                    if ocupa_vaga(formula):
+                        if not vagas:
+                            raise TransicaoRecusada(
+                                f'Você atingiu o máximo de {ContadorTarefasFuncionario.LIMITE_TAREFAS} tarefas.', 'limite',
+                            )
+                        vagas -= 1
+                except TransicaoRecusada as recusa:
+                    resultados[formula_id] = resultado_lote(formula_id, formula, recusa)
+                    continue
+                aceitas.append(formula)
+
+            com_vaga = [formula for formula in aceitas if ocupa_vaga(formula)]
+            if com_vaga:
+                if not ContadorTarefasFuncionario.reservar(self.usuario, len(com_vaga)):
+                    raise TransicaoRecusada(MENSAGEM_CONFLITO, 'conflito')
+                pausar_tarefas_ativas(self.usuario)
+            if aceitas:
+                # Linhas travadas: o filtro só confirma que continuam livres
+                assumidas = FormulaItem.objects.filter(
+                    pk__in=[formula.pk for formula in aceitas], funcionario_na_etapa__isnull=True,
+                ).update(funcionario_na_etapa=self.usuario, eh_tarefa_ativa=False, atualizado_em=timezone.now())
+                if assumidas != len(aceitas):
+                    raise TransicaoRecusada('Uma das fórmulas foi assumida por outro funcionário. Tente novamente.', 'conflito')
+            if com_vaga:
+                FormulaItem.objects.filter(pk=com_vaga[0].pk).update(eh_tarefa_ativa=True)
+
+            for formula in aceitas:
+                formula.funcionario_na_etapa = self.usuario
+                formula.eh_tarefa_ativa = bool(com_vaga) and formula is com_vaga[0]
+                resultados[formula.pk] = resultado_lote(formula.pk, formula)
+            self.registrar_lote('assumir_etapa', [
+                f'Assumiu fórmula NRORC {formula.pedido_mestre.nrorc} na etapa {formula.etapa_atual.nome} '
+                f'({"ativa" if formula.eh_tarefa_ativa else "pendente"}, em lote)'
+                for formula in aceitas
+            ])
+        return [resultados[formula_id] for formula_id in formula_ids]
+
+    def finalizar_lote(self, formula_ids):
+        """
+        Finaliza as fórmulas do usuário com os checklists obrigatórios marcados; as outras ficam
+        como estão. Histórico, pontos e logs gravados em bloco. Retorna um resultado_lote por fórmula
+        """
+        formula_ids, resultados = list(dict.fromkeys(formula_ids)), {}
+        with transacao():
+            formulas = self.travar_lote(formula_ids)
+            candidatas = []
+            for formula_id in formula_ids:
+                formula = formulas.get(formula_id)
+                try:
+                    if formula is None:
+                        raise TransicaoRecusada('Fórmula não encontrada.', 'inexistente')
+                    self.validar_finalizavel(formula)
+                except TransicaoRecusada as recusa:
+                    resultados[formula_id] = resultado_lote(formula_id, formula, recusa)
+                    continue
+                candidatas.append(formula)
+
+            # Histórico mais recente de cada fórmula na etapa atual
+            historicos = {}
+            for historico in HistoricoEtapaFormula.objects.filter(
+                formula__in=candidatas, etapa_id__in={formula.etapa_atual_id for formula in candidatas},
+            ):
+                if historico.etapa_id == formulas[historico.formula_id].etapa_atual_id:
+                    historicos.setdefault(historico.formula_id, historico)
+            execucoes = sincronizar_checklists(list(historicos.values()))
+
+            agora = timezone.now()
+            etapas_ativas = list(Etapa.objects.filter(ativa=True))
+            finalizadas, pontuacoes, vagas_liberadas = [], [], 0
+            for formula in candidatas:
+                etapa, historico = formula.etapa_atual, historicos.get(formula.pk)
+                try:
+                    if historico is None:
+                        raise TransicaoRecusada('Histórico não encontrado.', 'sem_historico')
+                    historico.pontos_gerados = pontos_da_etapa(etapa, execucoes[historico.pk])
+                except TransicaoRecusada as recusa:
+                    resultados[formula.pk] = resultado_lote(formula.pk, formula, recusa)
+                    continue
+
+                historico.timestamp_fim = agora
+                pontuacoes.append(PontuacaoFuncionario(
+                    funcionario=self.usuario, etapa=etapa, pontos=historico.pontos_gerados, origem='etapa',
+                    mes_referencia=agora.date().replace(day=1),
+                ))
+                # Antes do avanço: a vaga liberada é a que foi reservada ao assumir
+                vagas_liberadas += ocupa_vaga(formula)
+                # Mesma regra de Etapa.proxima_etapa, sobre as etapas já lidas
+                proxima = next((outra for outra in etapas_ativas if outra.sequencia > etapa.sequencia), None)
+                campos = {'funcionario_na_etapa': None, 'eh_tarefa_ativa': False, 'atualizado_em': agora, **avanco(formula, proxima, agora)}
+                for campo, valor in campos.items():
+                    setattr(formula, campo, valor)
+                finalizadas.append((formula, etapa, historico))
+                resultados[formula.pk] = resultado_lote(formula.pk, formula)
+
+            if finalizadas:
+                HistoricoEtapaFormula.objects.bulk_update(
+                    [historico for _, _, historico in finalizadas], ['timestamp_fim', 'pontos_gerados'],
+                )
+                PontuacaoFuncionario.objects.bulk_create(pontuacoes)
+                FormulaItem.objects.bulk_update(
+                    [formula for formula, _, _ in finalizadas],
+                    ['funcionario_na_etapa', 'eh_tarefa_ativa', 'etapa_atual', 'status', 'concluido_em', 'atualizado_em'],
+                )
+                if vagas_liberadas:
+                    ContadorTarefasFuncionario.liberar(self.usuario, vagas_liberadas)
+                atualizar_status_pedido(*{formula.pedido_mestre_id for formula, _, _ in finalizadas})
+                self.registrar_lote('concluir_etapa', [descricao_conclusao(formula) for formula, _, _ in finalizadas])
+        return [resultados[formula_id] for formula_id in formula_ids]
+
+    # ----------------------------
+    # Passos comuns
+    # ----------------------------
+
+    @classmethod
+    def travar(cls, formula_id, **filtros):
+        """Lê a fórmula (com pedido e etapa) travando a linha até o fim da transação"""
+        formula = cls.travar_lote([formula_id], **filtros).get(formula_id)
+        if formula is None:
+            raise TransicaoRecusada('Fórmula não encontrada.', 'inexistente')
+        return formula
+
+    @staticmethod
+    def travar_lote(formula_ids, **filtros):
+        """travar de várias fórmulas numa consulta; retorna {id: fórmula} só das encontradas"""
+        formulas = FormulaItem.objects.select_related('pedido_mestre', 'etapa_atual')
+        if connection.features.has_select_for_update:
+            formulas = formulas.select_for_update(of=('self',) if connection.features.has_select_for_update_of else ())
+        else:
+            # SQLite: sem FOR UPDATE, e uma transação que lê antes de escrever falha com "database is
+            # locked" se outra gravou no meio (WAL). Um UPDATE que não muda nada pega a trava de escrita
+            # primeiro, esperando o busy_timeout como qualquer escrita
+            FormulaItem.objects.filter(pk__in=formula_ids).update(atualizado_em=F('atualizado_em'))
+        return formulas.filter(pk__in=formula_ids, **filtros).in_bulk()
+
+    @staticmethod
+    def validar_disponivel(formula, mensagem_status):
+        if formula.funcionario_na_etapa_id:
+            raise TransicaoRecusada('Esta fórmula já foi assumida por outro funcionário.', 'assumida')
+        if formula.status not in STATUS_TAREFA_ABERTA:
+            raise TransicaoRecusada(mensagem_status, 'indisponivel')
+
+    def validar_finalizavel(self, formula):
+        if formula.funcionario_na_etapa_id != self.usuario.pk:
+            raise TransicaoRecusada('Você não tem permissão para finalizar esta fórmula.', 'sem_permissao')
+        if not formula.etapa_atual:
+            raise TransicaoRecusada('Fórmula sem etapa atual.', 'sem_etapa')
+
+    @staticmethod
+    def entregar(formula, funcionario, mensagem_limite):
+        """Ocupa a vaga (UPDATE condicional no contador), pausa a ativa e assume a fórmula se ainda está livre"""
+        ativa = ocupa_vaga(formula)
+        if ativa:
+            if not ContadorTarefasFuncionario.reservar(funcionario):
+                raise TransicaoRecusada(mensagem_limite, 'limite')
+            pausar_tarefas_ativas(funcionario)
+
+        assumidas = FormulaItem.objects.filter(
+            pk=formula.pk, funcionario_na_etapa__isnull=True, status=formula.status,
+        ).update(funcionario_na_etapa=funcionario, eh_tarefa_ativa=ativa, atualizado_em=timezone.now())
+        if not assumidas:
+            raise TransicaoRecusada('Esta fórmula já foi assumida por outro funcionário.', 'assumida')
+        formula.funcionario_na_etapa = funcionario
+        formula.eh_tarefa_ativa = ativa
+
+    @staticmethod
+    def gravar(formula, **campos):
+        """UPDATE só dos campos alterados, condicionado ao funcionário lido na trava"""
+        alteradas = FormulaItem.objects.filter(
+            pk=formula.pk, funcionario_na_etapa_id=formula.funcionario_na_etapa_id,
+        ).update(atualizado_em=timezone.now(), **campos)
+        if not alteradas:
+            raise TransicaoRecusada('A fórmula foi alterada por outra pessoa. Tente novamente.', 'conflito')
+        for campo, valor in campos.items():
+            setattr(formula, campo, valor)
+
+    def registrar(self, acao, descricao):
+        LogAuditoria.objects.create(usuario=self.usuario, acao=acao, descricao=descricao, ip_address=self.ip)
+
+    def registrar_lote(self, acao, descricoes):
+        if descricoes:
+            LogAuditoria.objects.bulk_create(
+                LogAuditoria(usuario=self.usuario, acao=acao, descricao=descricao, ip_address=self.ip)
+                for descricao in descricoes
+            )
+
+
+def avanco(formula, proxima, agora):
+    """Campos da fórmula ao concluir a etapa: próxima etapa ou, sem próxima, expedida"""
+    if proxima:
+        return {'etapa_atual': proxima, 'status': status_da_etapa(proxima, formula.status)}
+    return {'etapa_atual': None, 'status': 'expedido', 'concluido_em': agora}
+
+
+def descricao_conclusao(formula):
+    """Descrição do log de conclusão (formula já avançada: etapa_atual é a próxima)"""
+    return (
+        f'Finalizou fórmula NRORC {formula.pedido_mestre.nrorc}'
+        + (f' na etapa {formula.etapa_atual.nome}' if formula.etapa_atual else '')
+    )
+
+
+def pontos_da_etapa(etapa, execucoes):
+    """Pontos fixos da etapa mais os checklists marcados; recusa se falta checklist obrigatório"""
+    faltantes = [checklist.nome for checklist, execucao in execucoes if checklist.obrigatorio and not execucao.marcado]
+    if faltantes:
+        raise TransicaoRecusada(
+            f'Faltam {len(faltantes)} checklist(s) obrigatório(s): {", ".join(faltantes)}', 'checklists_pendentes',
+        )
+    return sum((execucao.pontos_gerados for _, execucao in execucoes if execucao.marcado), etapa.pontos_fixos_etapa)
+
+
+def pausar_tarefas_ativas(funcionario):
+    """Pausa a tarefa ativa do funcionário (no máximo uma: constraint uma_tarefa_ativa_por_funcionario)"""
+    return FormulaItem.objects.filter(
+        funcionario_na_etapa=funcionario, eh_tarefa_ativa=True, status__in=STATUS_TAREFA_ABERTA,
+    ).update(eh_tarefa_ativa=False)
+
+
+def sincronizar_checklists(historicos):
+    """
+    Execuções dos checklists ativos da etapa de cada histórico, criando as que faltam e removendo
+    as de checklists desativados; retorna {historico.pk: [(checklist, execução)]} na ordem dos
+    checklists, em até 5 consultas para qualquer número de históricos
+    """
+    checklists_por_etapa = defaultdict(list)
+    for checklist in Checklist.objects.filter(etapa__in={historico.etapa_id for historico in historicos}, ativo=True):
+        checklists_por_etapa[checklist.etapa_id].append(checklist)
+    existentes = defaultdict(dict)
+    for execucao in ChecklistExecucaoFormula.objects.filter(historico_etapa__in=historicos):
+        existentes[execucao.historico_etapa_id][execucao.checklist_id] = execucao
+
+    novas, alteradas, obsoletas = [], [], []
+    for historico in historicos:
+        checklists, execucoes = checklists_por_etapa[historico.etapa_id], existentes[historico.pk]
+        for checklist in checklists:
+            execucao = execucoes.get(checklist.pk)
+            if execucao is None:
+                execucoes[checklist.pk] = ChecklistExecucaoFormula(
+                    historico_etapa=historico, checklist=checklist, marcado=False,
+                    pontos_gerados=checklist.pontos_do_check,
+                )
+                novas.append(execucoes[checklist.pk])
+            elif execucao.pontos_gerados != checklist.pontos_do_check:
+                # Checklist editado depois da marcação
+                execucao.pontos_gerados = checklist.pontos_do_check
+                alteradas.append(execucao)
+        ativos = {checklist.pk for checklist in checklists}
+        obsoletas.extend(execucao.pk for checklist_id, execucao in execucoes.items() if checklist_id not in ativos)
+
+    if novas:
+        ChecklistExecucaoFormula.objects.bulk_create(novas)
+    if alteradas:
+        ChecklistExecucaoFormula.objects.bulk_update(alteradas, ['pontos_gerados'])
+    if obsoletas:
+        ChecklistExecucaoFormula.objects.filter(pk__in=obsoletas).delete()
+    return {
+        historico.pk: [(checklist, existentes[historico.pk][checklist.pk]) for checklist in checklists_por_etapa[historico.etapa_id]]
+        for historico in historicos
+    }
@@ -19,6 +19,8 @@ urlpatterns = [
     path('minhas-formulas/', views_formulas.minhas_formulas, name='minhas_formulas'),
     path('assumir-formula/<int:formula_id>/', views_formulas.assumir_formula, name='assumir_formula'),
     path('delegar-formula/<int:formula_id>/', views_formulas.delegar_formula, name='delegar_formula'),
+    path('assumir-formulas/', views_formulas.assumir_formulas_lote, name='assumir_formulas_lote'),
+    path('finalizar-formulas/', views_formulas.finalizar_formulas_lote, name='finalizar_formulas_lote'),
     path('tarefas-em-andamento/', views_formulas.tarefas_em_andamento, name='tarefas_em_andamento'),
     path('api/buscar-funcionarios/', views_formulas.buscar_funcionarios_ajax, name='buscar_funcionarios_ajax'),
     path('pausar-tarefa/<int:formula_id>/', views_formulas.pausar_tarefa_formula, name='pausar_tarefa'),
@@ -8,39 +8,26 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib import messages
-from django.db.models import Q, Sum
+from django.db.models import Q
+from django.http import Http404, JsonResponse
 from django.utils import timezone
 from django.core.paginator import Paginator
-from decimal import Decimal
 from datetime import datetime
 
+from core.classificador_produto import ROTULOS_FORMA
 from core.models import (
     FormulaItem, PedidoMestre, Etapa, HistoricoEtapaFormula,
-    PontuacaoFuncionario, LogAuditoria, Checklist, ChecklistExecucaoFormula
+    LogAuditoria, Checklist, ChecklistExecucaoFormula
 )
+from dashboard.transicoes import LIMITE_LOTE, TransicaoRecusada, TransicoesTarefa
 
 
-# ===== FUNÇÃO HELPER PARA GARANTIR APENAS 1 ATIVA =====
-def _garantir_uma_so_ativa(user):
-    """
-    Garante que o funcionário tem NO MÁXIMO 1 tarefa ativa.
-    Se houver mais de 1, pausa todas menos a primeira.
-    """
-    ativas = FormulaItem.objects.filter(
-        funcionario_na_etapa=user,
-        eh_tarefa_ativa=True,
-        status__in=['em_triagem', 'em_producao', 'em_qualidade']
-    ).order_by('-criado_em')  # Mantém a mais recente como ativa
-    
-    if ativas.count() > 1:
-        # Pausa todos menos o primeiro
-        para_pausar = ativas[1:]
-        for formula in para_pausar:
-            formula.eh_tarefa_ativa = False
-            formula.save()
-        return len(para_pausar)  # Retorna quantas foram pausadas
-    
-    return 0
+def _recusar(request, recusa, destino, *args):
+    """Mensagem da transição recusada e redirecionamento; fórmula inexistente vira 404"""
+    if recusa.motivo == 'inexistente':
+        raise Http404(recusa.mensagem)
+    messages.error(request, recusa.mensagem)
+    return redirect(destino, *args)
 
 
 @login_required
@@ -56,6 +43,7 @@ def formulas_disponiveis(request):
     nrorc = request.GET.get('nrorc', '').strip()
     descricao = request.GET.get('descricao', '').strip()
     etapa_id = request.GET.get('etapa', '')
+    forma = request.GET.get('forma', '').strip()
     pedido_mestre_id = request.GET.get('pedido_mestre', '').strip()
     
     # Buscar fórmulas
@@ -78,6 +66,8 @@ def formulas_disponiveis(request):
         formulas = formulas.filter(descricao__icontains=descricao)
     if etapa_id:
         formulas = formulas.filter(etapa_atual_id=etapa_id)
+    if forma:
+        formulas = formulas.filter(forma=forma)
     if pedido_mestre_id:
         formulas = formulas.filter(pedido_mestre_id=pedido_mestre_id)
     
@@ -95,6 +85,8 @@ def formulas_disponiveis(request):
         'filtro_nrorc': nrorc,
         'filtro_descricao': descricao,
         'filtro_etapa': etapa_id,
+        'formas': list(ROTULOS_FORMA.values()) + ['Outro'],
+        'filtro_forma': forma,
         'is_funcionario': is_funcionario,
         'is_gestor': is_gestor,
     }
@@ -148,32 +140,12 @@ def pausar_tarefa_formula(request, formula_id):
     if not request.user.groups.filter(name='Funcionário').exists():
         return redirect('dashboard:home')
     
-    # PRIMEIRO: Garantir apenas 1 ativa (corrigir eventuais conflitos)
-    _garantir_uma_so_ativa(request.user)
-    
-    formula = get_object_or_404(FormulaItem, id=formula_id, funcionario_na_etapa=request.user)
-    
-    if not formula.eh_tarefa_ativa:
-        messages.error(request, 'Esta tarefa não está ativa para ser pausada.')
-        return redirect('dashboard:minhas_formulas')
-    
-    # Pausa a tarefa ativa - SEM ativar outra
-    formula.eh_tarefa_ativa = False
-    formula.save()
+    try:
+        formula = TransicoesTarefa(request.user, ip=request.META.get('REMOTE_ADDR')).pausar(formula_id)
+    except TransicaoRecusada as recusa:
+        return _recusar(request, recusa, 'dashboard:minhas_formulas')
     
     messages.success(request, f'✓ Tarefa NRORC {formula.pedido_mestre.nrorc} pausada com sucesso!')
-    
-    # Log
-    LogAuditoria.objects.create(
-        usuario=request.user,
-        acao='pausar_tarefa',
-        descricao=f'Pausou tarefa NRORC {formula.pedido_mestre.nrorc} na etapa {formula.etapa_atual.nome}',
-        ip_address=request.META.get('REMOTE_ADDR')
-    )
-    
-    # DEPOIS: Garantir apenas 1 ativa (verificação final)
-    _garantir_uma_so_ativa(request.user)
-    
     return redirect('dashboard:minhas_formulas')
 
 
@@ -183,47 +155,13 @@ def ativar_tarefa_formula(request, formula_id):
     if not request.user.groups.filter(name='Funcionário').exists():
         return redirect('dashboard:home')
     
-    # PRIMEIRO: Garantir apenas 1 ativa (corrigir eventuais conflitos)
-    _garantir_uma_so_ativa(request.user)
-    
-    formula = get_object_or_404(FormulaItem, id=formula_id, funcionario_na_etapa=request.user)
-    
-    if formula.eh_tarefa_ativa:
-        messages.error(request, 'Esta tarefa já está ativa.')
-        return redirect('dashboard:minhas_formulas')
-    
-    # Pausar QUALQUER ATIVA que exista (pode estar em qualquer etapa)
-    ativa_geral = FormulaItem.objects.filter(
-        funcionario_na_etapa=request.user,
-        eh_tarefa_ativa=True,
-        status__in=['em_triagem', 'em_producao', 'em_qualidade']
-    ).first()
-    
-    if ativa_geral:
-        # Pausa a ativa
-        ativa_geral.eh_tarefa_ativa = False
-        ativa_geral.save()
-        mensagem_pausa = f' (NRORC {ativa_geral.pedido_mestre.nrorc} foi pausada)'
-    else:
-        mensagem_pausa = ''
-    
-    # Ativa a pendente
-    formula.eh_tarefa_ativa = True
-    formula.save()
+    try:
+        formula, pausou = TransicoesTarefa(request.user, ip=request.META.get('REMOTE_ADDR')).ativar(formula_id)
+    except TransicaoRecusada as recusa:
+        return _recusar(request, recusa, 'dashboard:minhas_formulas')
     
+    mensagem_pausa = ' (a tarefa ativa anterior foi pausada)' if pausou else ''
     messages.success(request, f'✓ Tarefa NRORC {formula.pedido_mestre.nrorc} agora está ATIVA!{mensagem_pausa}')
-    
-    # Log
-    LogAuditoria.objects.create(
-        usuario=request.user,
-        acao='ativar_tarefa',
-        descricao=f'Ativou tarefa NRORC {formula.pedido_mestre.nrorc} na etapa {formula.etapa_atual.nome}',
-        ip_address=request.META.get('REMOTE_ADDR')
-    )
-    
-    # DEPOIS: Garantir apenas 1 ativa (verificação final)
-    _garantir_uma_so_ativa(request.user)
-    
     return redirect('dashboard:minhas_formulas')
 
 
@@ -233,70 +171,16 @@ def assumir_formula(request, formula_id):
     if not request.user.groups.filter(name='Funcionário').exists():
         return redirect('dashboard:home')
     
-    # PRIMEIRO: Garantir apenas 1 ativa (corrigir eventuais conflitos)
-    _garantir_uma_so_ativa(request.user)
-    
-    formula = get_object_or_404(FormulaItem, id=formula_id)
-    
-    # Validações
-    if formula.funcionario_na_etapa:
-        messages.error(request, 'Esta fórmula já foi assumida por outro funcionário.')
-        return redirect('dashboard:formulas_disponiveis')
-    
-    if formula.status not in ['em_triagem', 'em_producao', 'em_qualidade']:
-        messages.error(request, 'Esta fórmula não está disponível para ser assumida.')
-        return redirect('dashboard:formulas_disponiveis')
-    
-    # Limitar a 5 fórmulas simultâneas (ativo + pendentes)
-    if formula.etapa_atual and formula.etapa_atual.nome.lower() != 'expedição':
-        tarefas_totais = FormulaItem.objects.filter(
-            funcionario_na_etapa=request.user,
-            status__in=['em_triagem', 'em_producao', 'em_qualidade'],
-            eh_tarefa_ativa__in=[True, False]  # Ambos ativo e pendente
-        ).count()
-        
-        if tarefas_totais >= 5:
-            messages.error(request, 'Você atingiu o máximo de 5 tarefas. Conclua ou pause uma tarefa antes de assumir outra.')
-            return redirect('dashboard:formulas_disponiveis')
-        
-        # PAUSAR TODAS as ativas do funcionário
-        tarefas_ativas = FormulaItem.objects.filter(
-            funcionario_na_etapa=request.user,
-            status__in=['em_triagem', 'em_producao', 'em_qualidade'],
-            eh_tarefa_ativa=True
-        )
-        
-        if tarefas_ativas.exists():
-            # Pausar todas as ativas
-            tarefas_ativas.update(eh_tarefa_ativa=False)
-        
-        # Esta será ativa (única tarefa ativa)
-        nova_tarefa_ativa = True
-    else:
-        nova_tarefa_ativa = False  # Expedição não usa sistema de ativo/pendente
-    
-    # Assumir
-    formula.funcionario_na_etapa = request.user
-    formula.eh_tarefa_ativa = nova_tarefa_ativa
-    formula.save()
-    
-    # Log
-    status_log = "ativa" if nova_tarefa_ativa else "pendente"
-    LogAuditoria.objects.create(
-        usuario=request.user,
-        acao='assumir_etapa',
-        descricao=f'Assumiu fórmula NRORC {formula.pedido_mestre.nrorc} na etapa {formula.etapa_atual.nome} ({status_log})',
-        ip_address=request.META.get('REMOTE_ADDR')
-    )
+    try:
+        formula = TransicoesTarefa(request.user, ip=request.META.get('REMOTE_ADDR')).assumir(formula_id)
+    except TransicaoRecusada as recusa:
+        return _recusar(request, recusa, 'dashboard:formulas_disponiveis')
     
-    if nova_tarefa_ativa:
+    if formula.eh_tarefa_ativa:
         messages.success(request, f'✓ Fórmula NRORC {formula.pedido_mestre.nrorc} assumida como ATIVA! Outras tarefas foram pausadas.')
     else:
         messages.info(request, f'✓ Fórmula NRORC {formula.pedido_mestre.nrorc} adicionada como PENDENTE. Pause sua tarefa ativa para começar.')
     
-    # DEPOIS: Garantir apenas 1 ativa (verificação final)
-    _garantir_uma_so_ativa(request.user)
-    
     # Redirecionar para tela de trabalho da fórmula
     return redirect('dashboard:detalhe_formula', formula_id=formula.id)
 
@@ -449,150 +333,16 @@ def marcar_checklist_formula(request, formula_id, checklist_id):
 @login_required
 def finalizar_etapa_formula(request, formula_id):
     """Finaliza uma fórmula em sua etapa atual e avança para próxima"""
-    import logging
-    logger = logging.getLogger('django')
-    
     if not request.user.groups.filter(name='Funcionário').exists():
         return redirect('dashboard:home')
     
-    formula = get_object_or_404(FormulaItem, id=formula_id)
-    
-    # Permissão: apenas funcionário responsável pode finalizar
-    if formula.funcionario_na_etapa != request.user:
-        messages.error(request, 'Você não tem permissão para finalizar esta fórmula.')
-        return redirect('dashboard:minhas_formulas')
-    
-    etapa = formula.etapa_atual
-    if not etapa:
-        messages.error(request, 'Fórmula sem etapa atual.')
-        return redirect('dashboard:minhas_formulas')
-    
-    historico = HistoricoEtapaFormula.objects.filter(
-        formula=formula,
-        etapa=etapa
-    ).first()
-    
-    if not historico:
-        messages.error(request, 'Histórico não encontrado.')
-        return redirect('dashboard:detalhe_formula', formula_id=formula.id)
-    
-    # ----------------------------
-    # Sincronizar execuções de checklists (apenas ativos)
-    # ----------------------------
-    checklists_ativos = Checklist.objects.filter(etapa=etapa, ativo=True)
-    
-    # Criar executações apenas para checklists ativos
-    for chk in checklists_ativos:
-        execucao, created = ChecklistExecucaoFormula.objects.get_or_create(
-            historico_etapa=historico,
-            checklist=chk,
-            defaults={'marcado': False, 'pontos_gerados': chk.pontos_do_check}
-        )
-        # Atualizar pontos_gerados em caso de edição no checklist
-        if execucao.pontos_gerados != chk.pontos_do_check:
-            execucao.pontos_gerados = chk.pontos_do_check
-            execucao.save()
-    
-    # Remover execuções de checklists desativados ou deletados
-    ChecklistExecucaoFormula.objects.filter(
-        historico_etapa=historico
-    ).exclude(
-        checklist__in=checklists_ativos
-    ).delete()
-    
-    # ----------------------------
-    # Validar checklists obrigatórios
-    # ----------------------------
-    # Contar apenas checklists que são OBRIGATÓRIOS AGORA e não foram marcados
-    checklists_obrigatorios_ativos = checklists_ativos.filter(obrigatorio=True)
-    
-    logger.info(f'finalizar_etapa: checklists_ativos={list(checklists_ativos.values_list("nome", "obrigatorio"))}')
-    logger.info(f'finalizar_etapa: checklists_obrigatorios_ativos={list(checklists_obrigatorios_ativos.values_list("nome"))}')
-    
-    nao_marcados_obrigatorios = ChecklistExecucaoFormula.objects.filter(
-        historico_etapa=historico,
-        checklist__in=checklists_obrigatorios_ativos,
-        marcado=False
-    )
-    
-    logger.info(f'finalizar_etapa: nao_marcados_obrigatorios={list(nao_marcados_obrigatorios.values_list("checklist__nome", "marcado"))}')
-    logger.info(f'finalizar_etapa: nao_marcados_obrigatorios.exists()={nao_marcados_obrigatorios.exists()}')
-    
-    if nao_marcados_obrigatorios.exists():
-        lista_faltantes = ', '.join([exe.checklist.nome for exe in nao_marcados_obrigatorios])
-        total = nao_marcados_obrigatorios.count()
-        logger.warning(f'finalizar_etapa: BLOQUEADO! Faltam {total} checklists')
-        messages.error(
-            request,
-            f'Faltam {total} checklist(s) obrigatório(s): {lista_faltantes}'
-        )
-        return redirect('dashboard:detalhe_formula', formula_id=formula.id)
-    
-    logger.info(f'finalizar_etapa: Validação passou! Continuando com finalização')
-    
-    # ----------------------------
-    # Calcular pontos gerados
-    # ----------------------------
-    aggregado = ChecklistExecucaoFormula.objects.filter(
-        historico_etapa=historico,
-        marcado=True
-    ).aggregate(total=Sum('pontos_gerados'))
-    pontos_checklists = aggregado.get('total') or Decimal('0')
-    
-    pontos_fixos = etapa.pontos_fixos_etapa if etapa else Decimal('0')
-    total_pontos = Decimal(str(pontos_checklists)) + Decimal(str(pontos_fixos))
-    
-    historico.timestamp_fim = timezone.now()
-    historico.pontos_gerados = total_pontos
-    historico.save()
-    
-    # Registrar pontuação do funcionário
-    PontuacaoFuncionario.objects.create(
-        funcionario=request.user,
-        etapa=etapa,
-        pontos=total_pontos,
-        origem='etapa',
-        mes_referencia=timezone.now().date().replace(day=1),
-    )
-    
-    # ----------------------------
-    # Avançar etapa
-    # ----------------------------
-    proxima_etapa = etapa.proxima_etapa() if etapa else None
-    
-    if proxima_etapa:
-        formula.etapa_atual = proxima_etapa
-        # Atualizar status da fórmula
-        nome_lower = proxima_etapa.nome.lower()
-        if 'triagem' in nome_lower:
-            formula.status = 'em_triagem'
-        elif 'produção' in nome_lower:
-            formula.status = 'em_producao'
-        elif 'qualidade' in nome_lower:
-            formula.status = 'em_qualidade'
-        elif 'expedição' in nome_lower:
-            formula.status = 'pronto_para_expedicao'
-    else:
-        # Sem próxima etapa - fórmula expedida
-        formula.status = 'expedido'
-        formula.etapa_atual = None
-        formula.concluido_em = timezone.now()
-    
-    # Limpar funcionário da etapa
-    formula.funcionario_na_etapa = None
-    formula.save()
-    
-    # Validar PedidoMestre
-    formula.pedido_mestre.validar_e_atualizar_status()
-    
-    # Log de auditoria
-    LogAuditoria.objects.create(
-        usuario=request.user,
-        acao='concluir_etapa',
-        descricao=f'Finalizou fórmula NRORC {formula.pedido_mestre.nrorc}' +
-                  (f' na etapa {formula.etapa_atual.nome}' if formula.etapa_atual else ''),
-        ip_address=request.META.get('REMOTE_ADDR')
-    )
+    try:
+        formula = TransicoesTarefa(request.user, ip=request.META.get('REMOTE_ADDR')).finalizar(formula_id)
+    except TransicaoRecusada as recusa:
+        # Checklist pendente ou histórico ausente: volta para a tela de trabalho da fórmula
+        if recusa.motivo in ('checklists_pendentes', 'sem_historico'):
+            return _recusar(request, recusa, 'dashboard:detalhe_formula', formula_id)
+        return _recusar(request, recusa, 'dashboard:minhas_formulas')
     
     messages.success(request, 'Fórmula finalizada com sucesso!')
     
@@ -603,6 +353,59 @@ def finalizar_etapa_formula(request, formula_id):
     return redirect('dashboard:minhas_formulas')
 
 
+def _executar_lote(request, acao, destino, verbo):
+    """
+    Executa assumir_lote/finalizar_lote com os formula_ids do POST (em ordem, sem repetidos,
+    até LIMITE_LOTE). Clientes que não aceitam HTML recebem o resultado por fórmula em JSON
+    """
+    ids = []
+    for valor in request.POST.getlist('formula_ids'):
+        if valor.isdigit() and int(valor) not in ids:
+            ids.append(int(valor))
+    html = request.accepts('text/html')
+    if request.method != 'POST' or not ids or len(ids) > LIMITE_LOTE:
+        erro = f'Selecione de 1 a {LIMITE_LOTE} fórmulas.'
+        if not html:
+            return JsonResponse({'erro': erro}, status=400)
+        messages.error(request, erro)
+        return redirect(destino)
+
+    try:
+        resultados = getattr(TransicoesTarefa(request.user, ip=request.META.get('REMOTE_ADDR')), acao)(ids)
+    except TransicaoRecusada as recusa:
+        # Conflito com outra requisição: nada foi gravado
+        if not html:
+            return JsonResponse({'erro': recusa.mensagem, 'motivo': recusa.motivo}, status=409)
+        messages.error(request, recusa.mensagem)
+        return redirect(destino)
+
+    sucessos = sum(1 for resultado in resultados if resultado['sucesso'])
+    if not html:
+        return JsonResponse({'sucessos': sucessos, 'recusadas': len(resultados) - sucessos, 'resultados': resultados})
+    if sucessos:
+        messages.success(request, f'✓ {sucessos} fórmula(s) {verbo}!')
+    for resultado in resultados:
+        if not resultado['sucesso']:
+            messages.warning(request, f'NRORC {resultado["nrorc"] or resultado["formula"]}: {resultado["mensagem"]}')
+    return redirect(destino)
+
+
+@login_required
+def assumir_formulas_lote(request):
+    """Assume várias fórmulas de uma vez, até o limite de tarefas"""
+    if not request.user.groups.filter(name='Funcionário').exists():
+        return redirect('dashboard:home')
+    return _executar_lote(request, 'assumir_lote', 'dashboard:minhas_formulas', 'assumida(s)')
+
+
+@login_required
+def finalizar_formulas_lote(request):
+    """Finaliza várias fórmulas de uma vez; as com checklist pendente ficam com o funcionário"""
+    if not request.user.groups.filter(name='Funcionário').exists():
+        return redirect('dashboard:home')
+    return _executar_lote(request, 'finalizar_lote', 'dashboard:minhas_formulas', 'finalizada(s)')
+
+
 @login_required
 def formulas_expedicao_funcionario(request):
     """
@@ -1191,8 +994,6 @@ def delegar_formula(request, formula_id):
     Delegação de tarefa para outro funcionário
     Funcionários, Gerentes e Admins podem delegar uma fórmula disponível para outro funcionário
     """
-    from core.models import DelegacaoTarefa
-    
     if request.method != 'POST':
         return redirect('dashboard:formulas_disponiveis')
     
@@ -1202,18 +1003,6 @@ def delegar_formula(request, formula_id):
     if not (is_funcionario or is_gestor):
         return redirect('dashboard:home')
     
-    formula = get_object_or_404(FormulaItem, id=formula_id)
-    
-    # Validação: fórmula não pode estar já assumida
-    if formula.funcionario_na_etapa:
-        messages.error(request, 'Esta fórmula já foi assumida por outro funcionário.')
-        return redirect('dashboard:formulas_disponiveis')
-    
-    # Validação: status
-    if formula.status not in ['em_triagem', 'em_producao', 'em_qualidade']:
-        messages.error(request, 'Esta fórmula não está disponível.')
-        return redirect('dashboard:formulas_disponiveis')
-    
     # Obter funcionário delegado
     funcionario_delegado_id = request.POST.get('funcionario_id')
     if not funcionario_delegado_id:
@@ -1229,64 +1018,12 @@ def delegar_formula(request, formula_id):
         messages.error(request, 'Funcionário inexistente.')
         return redirect('dashboard:formulas_disponiveis')
     
-    # Validar limite de tarefas do funcionário delegado
-    if formula.etapa_atual and formula.etapa_atual.nome.lower() != 'expedição':
-        tarefas_totais = FormulaItem.objects.filter(
-            funcionario_na_etapa=funcionario_delegado,
-            status__in=['em_triagem', 'em_producao', 'em_qualidade'],
-            eh_tarefa_ativa__in=[True, False]
-        ).count()
-        
-        if tarefas_totais >= 5:
-            messages.error(
-                request,
-                f'{funcionario_delegado.get_full_name()} já tem o máximo de 5 tarefas. Não é possível delegar.'
-            )
-            return redirect('dashboard:formulas_disponiveis')
-        
-        # CORRIGIDO: Pausar TODAS as tarefas ativas do funcionário delegado
-        # e ativar apenas a nova
-        tarefas_ativas = FormulaItem.objects.filter(
-            funcionario_na_etapa=funcionario_delegado,
-            status__in=['em_triagem', 'em_producao', 'em_qualidade'],
-            eh_tarefa_ativa=True
-        )
-        
-        if tarefas_ativas.exists():
-            # Pausar todas as ativas
-            tarefas_ativas.update(eh_tarefa_ativa=False)
-        
-        # Esta será ativa (única tarefa ativa)
-        nova_tarefa_ativa = True
-    else:
-        nova_tarefa_ativa = False
-    
-    # Assumir fórmula para o funcionário delegado
-    formula.funcionario_na_etapa = funcionario_delegado
-    formula.eh_tarefa_ativa = nova_tarefa_ativa
-    formula.save()
-    
-    # Registrar delegação
-    DelegacaoTarefa.objects.create(
-        formula=formula,
-        delegado_por=request.user,  # Quem delegou (pode ser None se for sistema)
-        delegado_para=funcionario_delegado,
-        etapa=formula.etapa_atual
-    )
-    
-    # Garantir apenas 1 ativa para o funcionário delegado
-    _garantir_uma_so_ativa(funcionario_delegado)
-    
-    # Log de auditoria
-    status_log = "ativa" if nova_tarefa_ativa else "pendente"
-    LogAuditoria.objects.create(
-        usuario=request.user,
-        acao='delegar_tarefa',
-        descricao=f'Delegou fórmula NRORC {formula.pedido_mestre.nrorc} na etapa {formula.etapa_atual.nome} para {funcionario_delegado.get_full_name()} ({status_log})',
-        ip_address=request.META.get('REMOTE_ADDR')
-    )
+    try:
+        formula = TransicoesTarefa(request.user, ip=request.META.get('REMOTE_ADDR')).delegar(formula_id, funcionario_delegado)
+    except TransicaoRecusada as recusa:
+        return _recusar(request, recusa, 'dashboard:formulas_disponiveis')
     
-    status_msg = "ATIVA" if nova_tarefa_ativa else "PENDENTE"
+    status_msg = "ATIVA" if formula.eh_tarefa_ativa else "PENDENTE"
     messages.success(
         request,
         f'✓ Fórmula NRORC {formula.pedido_mestre.nrorc} delegada para {funcionario_delegado.get_full_name()} como {status_msg}! Outras tarefas foram pausadas.'
@@ -19,4 +19,10 @@ app.conf.beat_schedule = {
         'schedule': 300.0,  # 5 minutos = 300 segundos
         'options': {'queue': 'default'}
     },
+    # Fecha execuções cujo processo ou callback do fan-out morreu antes de finalizá-las
+    'encerrar-execucoes-paradas-a-cada-10-minutos': {
+        'task': 'core.tasks.encerrar_execucoes_paradas',
+        'schedule': 600.0,
+        'options': {'queue': 'default'}
+    },
 }
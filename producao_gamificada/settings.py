@@ -5,6 +5,7 @@ Django settings for producao_gamificada project.
 import os
 from pathlib import Path
 import environ
+from django.core.exceptions import ImproperlyConfigured
 
 env = environ.Env(
     DEBUG=(bool, True)
@@ -79,15 +80,46 @@ WSGI_APPLICATION = 'producao_gamificada.wsgi.application'
 ASGI_APPLICATION = 'producao_gamificada.asgi.application'
 
 # Database - SQLite (local e produção)
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-        'CONN_MAX_AGE': 600,
-        'OPTIONS': {
-            'timeout': 30,
+# Banco de dados: DB_PERFIL=sqlite (arquivo local, padrão) ou postgres (DATABASE_URL)
+DB_PERFIL = env('DB_PERFIL', default='sqlite')
+
+if DB_PERFIL == 'postgres':
+    # Conexões persistentes (uma por thread, reaproveitada entre requisições) verificadas antes
+    # do reuso, para não falhar numa conexão derrubada pelo servidor ou por um pooler (PgBouncer)
+    DATABASES = {'default': env.db('DATABASE_URL')}
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': env.int('DB_CONN_MAX_AGE', default=600),
+        'CONN_HEALTH_CHECKS': True,
+    })
+    DATABASES['default'].setdefault('OPTIONS', {})['connect_timeout'] = env.int('DB_CONNECT_TIMEOUT', default=10)
+elif DB_PERFIL == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': env('SQLITE_ARQUIVO', default=str(BASE_DIR / 'db.sqlite3')),
+            'CONN_MAX_AGE': 600,
+            'OPTIONS': {
+                'timeout': 30,
+            }
         }
     }
+else:
+    raise ImproperlyConfigured(f"DB_PERFIL inválido: '{DB_PERFIL}' (use 'sqlite' ou 'postgres')")
+
+# PRAGMAs aplicados a cada conexão SQLite aberta (core.signals): WAL deixa leitores e o escritor
+# trabalharem ao mesmo tempo, synchronous=NORMAL é seguro com WAL (fsync só no checkpoint),
+# mmap evita cópias nas leituras e busy_timeout espera (ms) em vez de falhar com "database is locked"
+# journal_mode=WAL fica gravado no arquivo: por padrão não é aplicado ao db.sqlite3 versionado no
+# repositório, que mudaria a cada execução (use SQLITE_ARQUIVO para um banco fora do git, ou SQLITE_WAL)
+SQLITE_ARQUIVO_VERSIONADO = str(BASE_DIR / 'db.sqlite3')
+SQLITE_WAL = env.bool(
+    'SQLITE_WAL', default=DB_PERFIL == 'sqlite' and DATABASES['default']['NAME'] != SQLITE_ARQUIVO_VERSIONADO,
+)
+SQLITE_PRAGMAS = {
+    **({'journal_mode': 'WAL'} if SQLITE_WAL else {}),
+    'synchronous': 'NORMAL',
+    'mmap_size': env.int('SQLITE_MMAP_BYTES', default=256 * 1024 * 1024),
+    'busy_timeout': env.int('SQLITE_BUSY_TIMEOUT_MS', default=30000),
 }
 
 # Redis Configuration
@@ -102,14 +134,50 @@ CHANNEL_LAYERS = {
     },
 }
 
-# Celery
-CELERY_BROKER_URL = REDIS_URL
-CELERY_RESULT_BACKEND = REDIS_URL
+# Celery (broker e resultados no Redis; sobrescrevíveis, ex: memory:// e cache+memory:// sem Redis)
+CELERY_BROKER_URL = env('CELERY_BROKER_URL', default=REDIS_URL)
+CELERY_RESULT_BACKEND = env('CELERY_RESULT_BACKEND', default=REDIS_URL)
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'America/Sao_Paulo'
 
+# Travas distribuídas (core.trava_distribuida): prazo do lease em segundos.
+# O líder do scheduler renova a cada 1/3 do prazo; se morrer, outro processo assume após o prazo
+TRAVA_DURACAO_SEGUNDOS = env.int('TRAVA_DURACAO_SEGUNDOS', default=60)
+
+# Alterações nos agendamentos: o líder do scheduler consulta a tabela a cada N segundos e
+# reconcilia os jobs quando ela fica uma verificação inteira sem mudar (debounce)
+AGENDAMENTOS_DEBOUNCE_SEGUNDOS = env.int('AGENDAMENTOS_DEBOUNCE_SEGUNDOS', default=5)
+
+# Processo de sincronização (python manage.py sync_worker): arquivo de vida para healthcheck
+SYNC_WORKER_ARQUIVO_VIDA = env('SYNC_WORKER_ARQUIVO_VIDA', default=os.path.join(BASE_DIR, 'sync_worker.vida.json'))
+SYNC_WORKER_INTERVALO_VIDA = env.int('SYNC_WORKER_INTERVALO_VIDA', default=15)
+
+# Sincronização de várias APIs (sincronizar_agora, sincronizar_formulas_api, Celery): quantas APIs
+# rodam ao mesmo tempo (1 = uma após a outra) e prazo por API em segundos (0 = sem prazo).
+# Estourado o prazo, a API para após a página atual, como numa parada, sem avançar a marca d'água
+SYNC_APIS_PARALELAS = env.int('SYNC_APIS_PARALELAS', default=4)
+SYNC_PRAZO_API_SEGUNDOS = env.int('SYNC_PRAZO_API_SEGUNDOS', default=0)
+
+# Cassetes de respostas da API (ConfiguracaoAPI.gravar_respostas / sincronizar_formulas_api --replay)
+CASSETES_API_DIR = env('CASSETES_API_DIR', default=os.path.join(BASE_DIR, 'cassetes_api'))
+
+# Ingestão (core.ingestao): itens gravados por lote/transação numa página da API. Páginas maiores
+# são gravadas em lotes, sem separar um NRORC, para a memória não crescer com o tamanho da página
+INGESTAO_TAMANHO_LOTE = env.int('INGESTAO_TAMANHO_LOTE', default=2000)
+
+# Cache de TipoProduto do classificador (core.classificador_produto): os signals só limpam o cache do
+# processo que salvou; sync_worker e Celery recarregam a tabela após N segundos para ver edições do admin
+TIPOS_PRODUTO_CACHE_SEGUNDOS = env.int('TIPOS_PRODUTO_CACHE_SEGUNDOS', default=60)
+
+# Ingestão via staging (sincronizar_formulas_api --staging): dias que as LinhaBrutaAPI ficam como auditoria
+LINHAS_BRUTAS_RETENCAO_DIAS = env.int('LINHAS_BRUTAS_RETENCAO_DIAS', default=30)
+
+# Reconciliação com o ERP (reconciliar_formulas_api): acima desta fração de fórmulas abertas
+# ausentes da API nada é cancelado (protege contra uma listagem vazia ou truncada pelo ERP)
+RECONCILIACAO_FRACAO_MAXIMA = env.float('RECONCILIACAO_FRACAO_MAXIMA', default=0.3)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',